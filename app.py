@@ -4,29 +4,39 @@ from flask_cors import CORS
 import os
 from config import DevelopmentConfig, ProductionConfig # 導入配置類
 
-# --- Flask 應用程式 ---
-app = Flask(__name__)
+# --- Flask 應用程式工廠 ---
+def create_app(config_object=None) -> Flask:
+    """
+    建立 Flask 應用程式。
 
-# 🚨 載入配置：根據環境變數決定使用開發或生產配置
-if os.environ.get('FLASK_ENV') == 'production':
-    app.config.from_object(ProductionConfig)
-else:
-    # 預設使用開發配置 (本地運行)
-    app.config.from_object(DevelopmentConfig)
+    模型服務在匯入 routes 模組時即完成載入 (模組層級)，因此 gunicorn 以 preload_app 匯入本模組時，
+    模型、Explainer 與全局 SHAP 圖只在 master 載入一次，再由 fork 出的 worker 共用 (見 gunicorn.conf.py)。
+    """
+    app = Flask(__name__)
 
-CORS(app) # 啟用 CORS
+    # 🚨 載入配置：根據環境變數決定使用開發或生產配置
+    if config_object is None:
+        config_object = ProductionConfig if os.environ.get('FLASK_ENV') == 'production' else DevelopmentConfig
+    app.config.from_object(config_object)
 
-# 註冊 Blueprint
-app.register_blueprint(customer_churn_bank_blueprint, url_prefix='/api/customer_churn_bank')
+    CORS(app) # 啟用 CORS
 
-# --- 前端頁面路由 ---
-@app.route('/')
-def index():
-    return render_template('index.html')
+    # 註冊 Blueprint
+    app.register_blueprint(customer_churn_bank_blueprint, url_prefix='/api/customer_churn_bank')
 
-@app.route('/customer_churn_bank_model')
-def customer_churn_bank_page():
-    return render_template('customer_churn_bank.html')
+    # --- 前端頁面路由 ---
+    @app.route('/')
+    def index():
+        return render_template('index.html')
+
+    @app.route('/customer_churn_bank_model')
+    def customer_churn_bank_page():
+        return render_template('customer_churn_bank.html')
+
+    return app
+
+
+app = create_app()
 
 # --- 啟動服務 (Gunicorn 會忽略此區塊，但保留供本地開發使用) ---
 if __name__ == '__main__':
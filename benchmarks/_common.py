@@ -0,0 +1,50 @@
+# benchmarks\_common.py
+# 效能基準測試共用工具 (路徑設定、資料載入、計時統計)
+import time
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+from typing import Callable, Dict
+
+# --- 專案路徑 (讓 benchmarks/ 下的腳本可以直接導入 services / routes) ---
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from config import Config  # noqa: E402
+
+MODEL_PATH = Config.MODEL_BANK_PATH
+MODEL_DIR = os.path.dirname(MODEL_PATH)
+TEST_CSV_PATH = os.path.join(MODEL_DIR, 'customer_churn_bank_test.csv')
+
+
+def load_test_frame(n_rows: int = 0) -> pd.DataFrame:
+    """載入測試 CSV；n_rows > 0 時以重複抽樣放大或截斷至指定筆數。"""
+    df = pd.read_csv(TEST_CSV_PATH)
+    if n_rows and n_rows != len(df):
+        df = df.sample(n=n_rows, replace=n_rows > len(df), random_state=42).reset_index(drop=True)
+        df['id'] = np.arange(len(df))
+    return df
+
+
+def time_call(func: Callable[[], object], repeat: int) -> np.ndarray:
+    """重複呼叫 func，回傳每次耗時 (秒)。"""
+    timings = np.empty(repeat, dtype=np.float64)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def summarize_latency(timings: np.ndarray) -> Dict[str, float]:
+    """將耗時陣列整理為 p50 / p99 / 平均 (微秒)。"""
+    micros = timings * 1e6
+    return {
+        'p50_us': float(np.percentile(micros, 50)),
+        'p99_us': float(np.percentile(micros, 99)),
+        'mean_us': float(micros.mean()),
+    }
@@ -0,0 +1,59 @@
+# benchmarks\bench_async_chart.py
+# 比較 /predict 同步繪圖與背景繪圖 (async_chart=1) 的首個結果時間 (time-to-first-result) 及取圖時間
+import argparse
+import time
+import os
+
+import numpy as np
+
+import _common  # noqa: F401  (設定 sys.path)
+
+os.environ.setdefault('CHURN_ASYNC_CHART', '1')  # 後端未啟用時會忽略 async_chart=1
+from app import app  # noqa: E402
+
+
+def request_body(i: int) -> dict:
+    # 每次改變 CreditScore，避免命中結果快取
+    return {"CreditScore": 400 + i, "Age": 45, "Tenure": 3, "Balance": 0, "NumOfProducts": 2, "HasCrCard": 1,
+            "IsActiveMember": 0, "EstimatedSalary": 50000, "Geography": 2, "Gender": 1}
+
+
+def run(client, chart_format: str, async_chart: bool, n: int, offset: int) -> dict:
+    first_result = []
+    chart_ready = []
+    for i in range(n):
+        start = time.perf_counter()
+        response = client.post(f'/api/customer_churn_bank/predict?chart={chart_format}&async_chart={int(async_chart)}',
+                               json=request_body(offset + i))
+        first_result.append(time.perf_counter() - start)
+        local_chart = response.get_json()['charts'][-1]
+        if 'url' in local_chart:
+            client.get(local_chart['url'])
+        chart_ready.append(time.perf_counter() - start)
+    return {
+        'ttfr_p50_ms': float(np.percentile(first_result, 50)) * 1e3,
+        'ttfr_p99_ms': float(np.percentile(first_result, 99)) * 1e3,
+        'chart_p50_ms': float(np.percentile(chart_ready, 50)) * 1e3,
+    }
+
+
+def main(n: int):
+    client = app.test_client()
+    client.post('/api/customer_churn_bank/predict', json=request_body(-1))  # 暖機
+
+    print(f"{'format':<8}{'mode':<8}{'first result p50 (ms)':>24}{'p99 (ms)':>10}{'chart ready p50 (ms)':>22}")
+    offset = 0
+    for chart_format in ['png', 'svg']:
+        for async_chart in [False, True]:
+            stats = run(client, chart_format, async_chart, n, offset)
+            offset += n
+            mode = 'async' if async_chart else 'sync'
+            print(f"{chart_format:<8}{mode:<8}{stats['ttfr_p50_ms']:>24.2f}{stats['ttfr_p99_ms']:>10.2f}{stats['chart_p50_ms']:>22.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/predict 同步 vs 背景圖表繪製")
+    parser.add_argument("--requests", type=int, default=50, help="每種模式的請求數")
+    args = parser.parse_args()
+
+    main(args.requests)
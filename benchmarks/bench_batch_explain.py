@@ -0,0 +1,57 @@
+# benchmarks\bench_batch_explain.py
+# 批次預測附帶 SHAP 前 k 名驅動因子 (explain=topk) 的一致性檢查與吞吐量比較
+import argparse
+import time
+
+import numpy as np
+
+from _common import MODEL_PATH, MODEL_DIR, load_test_frame
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES
+from services.customer_churn_bank_service import CustomerChurnBankService
+
+
+def check_parity(service: CustomerChurnBankService, n_rows: int, k: int):
+    """top_k_shap (argpartition) 與 get_local_shap_batch (逐列 dict 排序) 的結果應一致。"""
+    df = ensure_required_columns(load_test_frame(n_rows), REQUIRED_RAW_FEATURES)
+    X_predict = service._align_features(FeatureEngineerForAPI.run_v2_batch(df))
+    indices, values = service.top_k_shap(X_predict, k=k, chunk_size=97)
+    expected = service.get_local_shap_batch(X_predict)
+    feature_names = list(X_predict.columns)
+
+    mismatched = 0
+    max_diff = 0.0
+    for row, reference in enumerate(expected):
+        names = [feature_names[i] for i in indices[row]]
+        if names != list(reference.keys())[:k]:
+            mismatched += 1
+            continue
+        max_diff = max(max_diff, float(np.max(np.abs(values[row] - np.array(list(reference.values())[:k])))))
+    print(f"一致性檢查：{n_rows} 筆中特徵排序不同 {mismatched} 筆，SHAP 值最大誤差 {max_diff:.1e} (float32)")
+    if mismatched:
+        raise SystemExit("top_k_shap 與 get_local_shap_batch 結果不一致！")
+
+
+def main(n_rows: int, k: int, repeat: int):
+    service = CustomerChurnBankService(model_path=MODEL_PATH, model_dir=MODEL_DIR)
+    check_parity(service, 2000, k)
+
+    df = ensure_required_columns(load_test_frame(n_rows), REQUIRED_RAW_FEATURES)
+    print(f"{'mode':<16}{'time (s)':>10}{'rows/sec':>12}")
+    for label, top_k in [('probability', 0), (f'explain top{k}', k)]:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            service.predict_batch_csv(df, FeatureEngineerForAPI.run_v2_batch, explain_top_k=top_k)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(f"{label:<16}{best:>10.2f}{n_rows / best:>12.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批次預測 + SHAP 前 k 名驅動因子效能")
+    parser.add_argument("--rows", type=int, default=100000, help="批次筆數")
+    parser.add_argument("--top_k", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    main(args.rows, args.top_k, args.repeat)
@@ -0,0 +1,149 @@
+# benchmarks\bench_batch_jobs.py
+# 大型批次在請求中同步執行 vs 非同步批次工作 (/predict_batch?mode=job)：實際啟動 gunicorn，
+# 批次進行期間持續送出 /predict，比較即時請求的延遲分位數與批次總耗時
+import argparse
+import subprocess
+import threading
+import tempfile
+import json
+import os
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+from _common import PROJECT_ROOT, load_test_frame
+from bench_gunicorn_preload import WRAPPER_CONF, SAMPLE_RECORD, free_port
+
+API = '/api/customer_churn_bank'
+
+
+def http(port: int, method: str, path: str, body: bytes = None, content_type: str = 'application/json') -> tuple:
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', data=body, method=method,
+                                     headers={'Content-Type': content_type} if body is not None else {})
+    try:
+        with urllib.request.urlopen(request, timeout=600) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def measure_predict_latency(port: int, until: threading.Event, min_seconds: float) -> list:
+    """持續送出 /predict (每筆輸入不同，避開結果快取)，直到 until 被設定且已量測至少 min_seconds 秒。"""
+    latencies = []
+    start = time.perf_counter()
+    i = 0
+    while not until.is_set() or time.perf_counter() - start < min_seconds:
+        record = dict(SAMPLE_RECORD, id=i, Age=18.0 + i % 70, Balance=float(i % 997) * 100)
+        t0 = time.perf_counter()
+        status, _ = http(port, 'POST', f'{API}/predict?chart=json', json.dumps(record).encode())
+        latencies.append(time.perf_counter() - t0)
+        if status != 200:
+            raise RuntimeError(f"/predict 回傳 {status}")
+        i += 1
+    return latencies
+
+
+def run_sync(port: int, csv_body: bytes) -> dict:
+    done = threading.Event()
+    result = {}
+
+    def batch():
+        t0 = time.perf_counter()
+        status, _ = http(port, 'POST', f'{API}/predict_batch', csv_body, 'text/csv')
+        result.update(status=status, batch_s=time.perf_counter() - t0)
+        done.set()
+
+    worker = threading.Thread(target=batch)
+    worker.start()
+    time.sleep(0.2)
+    result['latencies'] = measure_predict_latency(port, done, 0)
+    worker.join()
+    return result
+
+
+def run_job(port: int, csv_body: bytes) -> dict:
+    t0 = time.perf_counter()
+    status, body = http(port, 'POST', f'{API}/predict_batch?mode=job', csv_body, 'text/csv')
+    if status != 202:
+        raise RuntimeError(f"建立批次工作失敗: {status} {body[:200]}")
+    job = json.loads(body)
+    result = {'status': status, 'submit_s': time.perf_counter() - t0}
+    done = threading.Event()
+
+    def poll():
+        while True:
+            state = json.loads(http(port, 'GET', job['status_url'])[1])
+            if state['state'] in ('succeeded', 'failed'):
+                result.update(job_state=state['state'], batch_s=time.perf_counter() - t0, error=state.get('error'))
+                done.set()
+                return
+            time.sleep(0.5)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    result['latencies'] = measure_predict_latency(port, done, 0)
+    poller.join()
+    result_status, result_body = http(port, 'GET', job['result_url'])
+    result['result_rows'] = result_body.count(b'\n') - 1 if result_status == 200 else -1
+    return result
+
+
+def main(n_rows: int, threads: int, baseline_seconds: float):
+    base = load_test_frame()
+    frame = pd.concat([base] * (n_rows // len(base) + 1), ignore_index=True).iloc[:n_rows]
+    frame['id'] = range(n_rows)
+    csv_body = frame.to_csv(index=False).encode()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        ready_file = os.path.join(tmp, 'ready')
+        conf_file = os.path.join(tmp, 'gunicorn_bench.conf.py')
+        with open(conf_file, 'w', encoding='utf-8') as f:
+            f.write(WRAPPER_CONF.format(conf=os.path.join(PROJECT_ROOT, 'gunicorn.conf.py'), ready_file=ready_file))
+        env = dict(os.environ, CHURN_BATCH_JOB_DIR=os.path.join(tmp, 'jobs'))
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app', '-c', conf_file, '--bind', f'127.0.0.1:{port}',
+             '--workers', '1', '--threads', str(threads)],
+            cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            while not (os.path.exists(ready_file) and open(ready_file).read().strip()):
+                if process.poll() is not None:
+                    raise RuntimeError("gunicorn 啟動失敗")
+                time.sleep(0.05)
+
+            idle = threading.Event()
+            idle.set()
+            runs = [('idle', {'latencies': measure_predict_latency(port, idle, baseline_seconds)}),
+                    ('sync batch', run_sync(port, csv_body)),
+                    ('job (1st, spawn)', run_job(port, csv_body)),
+                    ('job (warm pool)', run_job(port, csv_body))]
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+
+    print(f"{n_rows:,} 筆批次，gunicorn 1 worker x {threads} threads；批次進行期間的 /predict 延遲：")
+    print(f"{'scenario':<18}{'requests':>9}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}{'batch (s)':>11}  note")
+    for name, r in runs:
+        latencies = np.array(r['latencies']) * 1e3
+        note = ''
+        if 'submit_s' in r:
+            note = f"submit {r['submit_s']:.2f}s, state={r['job_state']}, result rows={r['result_rows']:,}"
+        elif 'status' in r:
+            note = f"HTTP {r['status']}"
+        batch_s = f"{r['batch_s']:.2f}" if 'batch_s' in r else '-'
+        print(f"{name:<18}{len(latencies):>9}{np.percentile(latencies, 50):>10.1f}{np.percentile(latencies, 99):>10.1f}"
+              f"{latencies.max():>10.1f}{batch_s:>11}  {note}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="同步批次 vs 非同步批次工作期間的 /predict 延遲")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn worker 執行緒數")
+    parser.add_argument("--baseline_seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    main(args.rows, args.threads, args.baseline_seconds)
@@ -0,0 +1,112 @@
+# benchmarks\bench_batch_pipeline.py
+# 大型 /predict_batch 上傳的逐階段記憶體與耗時剖析 (原 DataFrame FE vs 零複製批次 FE)
+import argparse
+import tempfile
+import time
+import os
+
+import numpy as np
+import pandas as pd
+
+from _common import MODEL_PATH, MODEL_DIR, load_test_frame
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES
+from services.customer_churn_bank_service import CustomerChurnBankService
+
+
+def current_rss() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def peak_rss() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def reset_peak_rss():
+    """Linux：寫入 5 到 clear_refs 可重設 VmHWM，讓每個階段各自量測峰值。"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+class StageProfiler:
+    def __init__(self, raw_bytes: int):
+        self.raw_bytes = raw_bytes
+        self.baseline = current_rss()
+        self.rows = []
+
+    def run(self, name: str, func):
+        reset_peak_rss()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        peak = peak_rss() - self.baseline
+        self.rows.append((name, elapsed, peak))
+        return result
+
+    def report(self, title: str):
+        print(f"\n[{title}] 原始檔案大小: {self.raw_bytes / 1e6:.1f} MB")
+        print(f"{'stage':<28}{'time (s)':>10}{'peak RSS over baseline (MB)':>30}{'x raw':>8}")
+        for name, elapsed, peak in self.rows:
+            print(f"{name:<28}{elapsed:>10.2f}{peak / 1e6:>30.1f}{peak / self.raw_bytes:>8.2f}")
+
+
+def run_pipeline(service: CustomerChurnBankService, csv_path: str, fe_func, title: str) -> np.ndarray:
+    raw_bytes = os.path.getsize(csv_path)
+    profiler = StageProfiler(raw_bytes)
+
+    # 與 predict_batch 相同的讀取方式 (直接解析上傳的二進位串流)
+    def read_upload():
+        with open(csv_path, 'rb') as f:
+            return pd.read_csv(f, encoding='utf-8', keep_default_na=True, na_values=['', 'NA', 'N/A'])
+
+    df = profiler.run('read_csv', read_upload)
+    df = profiler.run('ensure_required_columns', lambda: ensure_required_columns(df, REQUIRED_RAW_FEATURES))
+    processed = profiler.run('feature engineering', lambda: fe_func(df))
+    X_predict = profiler.run('alignment', lambda: service._align_features(processed))
+    proba = profiler.run('predict_proba', lambda: service._predict_positive_proba(X_predict))
+
+    def roi():
+        roi_df = pd.DataFrame({'Exited_Probability': proba})
+        for col in ['Balance', 'NumOfProducts', 'HasCrCard', 'IsActiveMember']:
+            roi_df[col] = df[col].to_numpy()
+        return service.calculate_roi_batch(roi_df)
+
+    profiler.run('calculate_roi_batch', roi)
+    profiler.report(title)
+    print(f"整體峰值 RSS (相對基準): {max(r[2] for r in profiler.rows) / raw_bytes:.2f} x 原始檔案大小")
+    return X_predict.to_numpy()
+
+
+def main(n_rows: int, compare_legacy: bool):
+    service = CustomerChurnBankService(model_path=MODEL_PATH, model_dir=MODEL_DIR)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'synthetic_upload.csv')
+        load_test_frame(n_rows).to_csv(csv_path, index=False)
+        print(f"合成資料: {n_rows:,} 筆，{os.path.getsize(csv_path) / 1e6:.1f} MB")
+
+        X_batch = run_pipeline(service, csv_path, FeatureEngineerForAPI.run_v2_batch, 'run_v2_batch (零複製)')
+        if compare_legacy:
+            X_legacy = run_pipeline(service, csv_path, FeatureEngineerForAPI.run_v2_preprocessing, 'run_v2_preprocessing (原流程)')
+            if not np.array_equal(X_batch, X_legacy, equal_nan=True):
+                raise SystemExit("批次 FE 與原 DataFrame FE 的對齊結果不一致！")
+            print("\n一致性檢查通過：兩種 FE 的對齊後特徵矩陣逐位相同。")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批次預測管道逐階段記憶體剖析")
+    parser.add_argument("--rows", type=int, default=1000000, help="合成 CSV 筆數")
+    parser.add_argument("--no_legacy", action="store_true", help="不執行原 DataFrame FE 的比較")
+    args = parser.parse_args()
+
+    main(args.rows, not args.no_legacy)
@@ -0,0 +1,82 @@
+# benchmarks\bench_batch_result_store.py
+# 批次結果一次回傳全部資料 (瀏覽器端篩選/排序) vs 伺服器端結果儲存區 (?paginate=1)：
+# 回應大小與產生耗時，以及伺服器端分頁查詢 (排序、門檻、ID 搜尋) 的延遲分位數
+import argparse
+import tempfile
+import time
+import os
+
+import numpy as np
+
+from _common import load_test_frame, time_call, summarize_latency
+from flask import jsonify
+
+os.environ.setdefault('FLASK_ENV', 'production')  # DevelopmentConfig 會縮排輸出 JSON，基準以正式環境設定量測
+from app import app  # noqa: E402
+from routes.customer_churn_bank_routes import (FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES,  # noqa: E402
+                                               MODEL_REGISTRY, format_batch_result)
+from services.batch_result_encoder import to_records  # noqa: E402
+from services.batch_result_store import BatchResultStore  # noqa: E402
+
+# 前端常見的操作：翻頁、依機率降冪 + 門檻、依 ID 排序、高/低風險、ID 搜尋
+QUERIES = [
+    ('翻頁 (原始順序)', dict(page=50)),
+    ('機率降冪, >= 50%', dict(sort='probability', order='desc', min_probability=0.5)),
+    ('機率升冪, 第 20 頁', dict(sort='probability', order='asc', page=20)),
+    ('ID 升冪, >= 30%', dict(sort='id', order='asc', min_probability=0.3)),
+    ('風險降冪', dict(sort='risk', order='desc')),
+    ('ID 搜尋 "123"', dict(id_search='123')),
+    ('ID 搜尋 + 機率降冪', dict(id_search='77', sort='probability', order='desc', min_probability=0.2)),
+]
+
+
+def json_bytes(body: dict) -> bytes:
+    with app.app_context():
+        return jsonify(body).get_data()
+
+
+def main(n_rows: int, repeat: int, page_size: int):
+    service = MODEL_REGISTRY.current
+    input_df = ensure_required_columns(load_test_frame(n_rows), REQUIRED_RAW_FEATURES)
+    result_df, roi_stats = service.predict_batch_with_roi(input_df, FeatureEngineerForAPI.run_v2_batch)
+    result_df_full = format_batch_result(input_df, result_df, 0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BatchResultStore(tmp, max_bytes=4 * 1024 ** 3)
+
+        start = time.perf_counter()
+        full_body = json_bytes({"status": "success", "data": to_records(result_df_full), "roi": roi_stats})
+        full_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result_id = store.put(result_df_full, {"roi": roi_stats})
+        put_s = time.perf_counter() - start
+        first_page = store.get(result_id).query(page=1, page_size=page_size)
+        paged_body = json_bytes({"status": "success", "result_id": result_id, "page": first_page, "roi": roi_stats})
+        paged_s = time.perf_counter() - start
+        stored_mb = sum(os.path.getsize(os.path.join(tmp, result_id, f)) for f in os.listdir(os.path.join(tmp, result_id))) / 1e6
+
+        print(f"{n_rows:,} 筆批次的回應 (不含評分)：")
+        print(f"{'mode':<28}{'time (ms)':>11}{'body (MB)':>11}")
+        print(f"{'全部資料 (records)':<24}{full_s * 1e3:>11.1f}{len(full_body) / 1e6:>11.2f}")
+        print(f"{'result_id + 第一頁':<25}{paged_s * 1e3:>11.1f}{len(paged_body) / 1e6:>11.4f}"
+              f"  (寫入儲存區 {put_s * 1e3:.1f} ms，磁碟 {stored_mb:.1f} MB)")
+
+        stored = store.get(result_id)
+        print(f"\n伺服器端分頁查詢 (page_size={page_size}，{repeat} 次)：")
+        print(f"{'query':<26}{'matched':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+        for name, params in QUERIES:
+            params = dict(params, page_size=page_size)
+            matched = stored.query(**params)['matched_rows']
+            stats = summarize_latency(time_call(lambda: json_bytes(stored.query(**params)), repeat))
+            print(f"{name:<24}{matched:>10,}{stats['p50_us'] / 1e3:>10.2f}{stats['p99_us'] / 1e3:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="一次回傳全部批次結果 vs 伺服器端分頁查詢")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--page_size", type=int, default=10)
+    args = parser.parse_args()
+
+    main(args.rows, args.repeat, args.page_size)
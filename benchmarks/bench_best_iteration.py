@@ -0,0 +1,80 @@
+# benchmarks\bench_best_iteration.py
+# 全部樹 vs 依 best_iteration 切片後的樹：預測 / SHAP 延遲與 ROC AUC 差異報告 (使用帶標籤的訓練資料)
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from sklearn.metrics import roc_auc_score
+
+from _common import PROJECT_ROOT, MODEL_PATH, MODEL_DIR
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES
+from services.customer_churn_bank_service import CustomerChurnBankService
+from services.native_contrib_explainer import NativeContribExplainer
+
+TRAIN_CSV_PATH = os.path.join(PROJECT_ROOT, 'projects', 'customer_churn_bank_code', 'customer_churn_bank_train.csv')
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(n_rows: int, shap_rows: int, repeat: int):
+    service = CustomerChurnBankService(MODEL_PATH, MODEL_DIR, explainer_backend='native')
+    raw_model = joblib.load(MODEL_PATH)  # 未切片的原始模型
+    raw_booster = raw_model.get_booster()
+    total_rounds = raw_booster.num_boosted_rounds()
+    served_rounds = service.model.get_booster().num_boosted_rounds()
+
+    df = pd.read_csv(TRAIN_CSV_PATH, nrows=n_rows)
+    labels = df.pop('Exited').to_numpy()
+    df = ensure_required_columns(df, REQUIRED_RAW_FEATURES)
+    X_predict = service._align_features(FeatureEngineerForAPI.run_v2_batch(df))
+
+    # 1. ROC AUC：全部樹 (Booster 預設) / predict_proba (best_iteration) / 切片後的服務
+    proba_all = raw_model.predict_proba(X_predict, iteration_range=(0, total_rounds))[:, 1]
+    proba_best = raw_model.predict_proba(X_predict)[:, 1]
+    proba_served = service._predict_positive_proba(X_predict)
+    print(f"best_iteration = {service.best_iteration}，原始 {total_rounds} 輪 -> 服務 {served_rounds} 輪 ({n_rows:,} 筆訓練資料)")
+    print(f"{'model':<28}{'ROC AUC':>10}")
+    print(f"{'all trees':<28}{roc_auc_score(labels, proba_all):>10.6f}")
+    print(f"{'predict_proba (best_iter)':<28}{roc_auc_score(labels, proba_best):>10.6f}")
+    print(f"{'served (trimmed)':<28}{roc_auc_score(labels, proba_served):>10.6f}")
+    print(f"切片前後機率最大差異: {np.max(np.abs(proba_best - proba_served)):.1e}，"
+          f"AUC 差異: {roc_auc_score(labels, proba_served) - roc_auc_score(labels, proba_best):+.1e}")
+
+    # 2. 延遲：批次預測 (全部樹 vs 切片) 與 SHAP (全部樹 vs 切片)
+    full_explainer = NativeContribExplainer(raw_model, iteration_range=(0, total_rounds))
+    X_shap = X_predict.iloc[:shap_rows]
+    rows = [
+        ('batch predict', n_rows,
+         best_of(lambda: raw_model.predict_proba(X_predict, iteration_range=(0, total_rounds)), repeat),
+         best_of(lambda: service._predict_positive_proba(X_predict), repeat)),
+        ('single-row predict', 1,
+         best_of(lambda: raw_model.predict_proba(X_predict.iloc[:1], iteration_range=(0, total_rounds)), repeat * 50) ,
+         best_of(lambda: service._predict_positive_proba(X_predict.iloc[:1]), repeat * 50)),
+        ('SHAP (pred_contribs)', shap_rows,
+         best_of(lambda: full_explainer.shap_values(X_shap), repeat),
+         best_of(lambda: service.explainer.shap_values(X_shap), repeat)),
+    ]
+    print(f"\n{'stage':<22}{'rows':>8}{'all trees (ms)':>16}{'trimmed (ms)':>14}{'saved':>8}")
+    for name, rows_count, full_time, trimmed_time in rows:
+        print(f"{name:<22}{rows_count:>8}{full_time * 1e3:>16.2f}{trimmed_time * 1e3:>14.2f}{1 - trimmed_time / full_time:>8.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="best_iteration 切片的延遲與 AUC 報告")
+    parser.add_argument("--rows", type=int, default=50000, help="評估使用的訓練資料筆數")
+    parser.add_argument("--shap_rows", type=int, default=5000, help="SHAP 延遲測試筆數")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    main(args.rows, args.shap_rows, args.repeat)
@@ -0,0 +1,45 @@
+# benchmarks\bench_chart_rendering.py
+# 比較局部 SHAP 圖表三種輸出格式 (png / svg / json) 的繪製延遲與回應 payload 大小
+import argparse
+import json
+
+import numpy as np
+
+from _common import MODEL_PATH, MODEL_DIR, load_test_frame, time_call, summarize_latency
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI, render_local_shap_chart, build_local_chart_payload
+from services.customer_churn_bank_service import CustomerChurnBankService
+from services.shap_chart_renderer import CHART_FORMATS
+
+
+def sample_shap_values(service: CustomerChurnBankService, n: int) -> list:
+    """以測試資料的實際局部 SHAP 值 (Top 7) 作為繪圖輸入。"""
+    frame = load_test_frame(n)
+    records = frame.to_dict('records')
+    items = [(record, FeatureEngineerForAPI.run_v2_record, FeatureEngineerForAPI.CATEGORICAL_COLUMNS) for record in records]
+    return [(result['local_shap_values'], result['probability']) for result in service.predict_records(items)]
+
+
+def main(n_samples: int, repeat: int):
+    service = CustomerChurnBankService(model_path=MODEL_PATH, model_dir=MODEL_DIR)
+    samples = sample_shap_values(service, n_samples)
+
+    print(f"{'format':<8}{'p50 (ms)':>10}{'p99 (ms)':>10}{'payload (bytes)':>18}")
+    for chart_format in CHART_FORMATS:
+        timings = []
+        sizes = []
+        for shap_data, proba in samples:
+            title = f"Individual SHAP Local Influence (Churn Probability: {proba:.4f})"
+            timings.extend(time_call(lambda: render_local_shap_chart(chart_format, shap_data, title), repeat))
+            payload = build_local_chart_payload(chart_format, render_local_shap_chart(chart_format, shap_data, title), title)
+            sizes.append(len(json.dumps(payload, ensure_ascii=False).encode('utf-8')))
+        latency = summarize_latency(np.asarray(timings))
+        print(f"{chart_format:<8}{latency['p50_us'] / 1e3:>10.2f}{latency['p99_us'] / 1e3:>10.2f}{np.mean(sizes):>18.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="局部 SHAP 圖表格式延遲與 payload 比較")
+    parser.add_argument("--samples", type=int, default=20, help="取樣的客戶數")
+    parser.add_argument("--repeat", type=int, default=10, help="每位客戶的重複繪製次數")
+    args = parser.parse_args()
+
+    main(args.samples, args.repeat)
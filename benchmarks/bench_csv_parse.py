@@ -0,0 +1,95 @@
+# benchmarks\bench_csv_parse.py
+# 批次 CSV 解析：原本的 pd.read_csv (逐欄型別推斷、讀入所有欄位) + CRITICAL_COLUMNS 缺失值檢查
+# vs 宣告式輸入結構 BATCH_INPUT_SCHEMA (usecols、float64 / category、解析時檢查)，以及選用的 pyarrow 引擎。
+# 每種方式在獨立子行程中執行，量測解析耗時、峰值 RSS 增量與 DataFrame 大小
+import argparse
+import resource
+import subprocess
+import tempfile
+import json
+import time
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+from _common import load_test_frame
+
+MODES = ('legacy', 'schema_c', 'schema_pyarrow')
+
+
+def parse_legacy(path: str) -> pd.DataFrame:
+    """改寫前的解析與檢查 (作為基準)。"""
+    from routes.customer_churn_bank_routes import BATCH_NA_VALUES, CRITICAL_COLUMNS
+    df = pd.read_csv(path, encoding='utf-8', keep_default_na=True, na_values=BATCH_NA_VALUES)
+    missing_cols = [col for col in CRITICAL_COLUMNS if col not in df.columns]
+    if missing_cols or df[CRITICAL_COLUMNS].isnull().values.any():
+        raise ValueError("檢查失敗")
+    return df
+
+
+def run_child(mode: str, path: str, repeat: int) -> None:
+    """子行程：匯入完成後記錄基準 RSS，再解析 repeat 次，輸出 JSON 結果。"""
+    from routes.customer_churn_bank_routes import BATCH_INPUT_SCHEMA
+    from services.batch_input_schema import BatchInputSchema
+    schema = BatchInputSchema(BATCH_INPUT_SCHEMA.dtypes, BATCH_INPUT_SCHEMA.required, BATCH_INPUT_SCHEMA.na_values,
+                              engine='pyarrow' if mode == 'schema_pyarrow' else 'c')
+    parse = parse_legacy if mode == 'legacy' else schema.read
+
+    base_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    df = None
+    for _ in range(repeat):
+        del df
+        start = time.perf_counter()
+        df = parse(path)
+        timings.append(time.perf_counter() - start)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "time_s": float(np.median(timings)),
+        "peak_mb": (peak_kb - base_kb) / 1024,
+        "frame_mb": df.memory_usage(deep=True).sum() / 1e6,
+        "columns": len(df.columns),
+        "engine": schema.engine,
+    }))
+
+
+def main(n_rows: int, repeat: int):
+    try:
+        import pyarrow  # noqa: F401
+        modes = MODES
+    except ImportError:
+        modes = MODES[:2]
+        print("(未安裝 pyarrow，略過 schema_pyarrow)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'batch.csv')
+        load_test_frame(n_rows).to_csv(path, index=False)
+        print(f"{n_rows:,} 筆 CSV ({os.path.getsize(path) / 1e6:.1f} MB)，解析 + 檢查 (中位數，{repeat} 次)：")
+        print(f"{'mode':<16}{'time (ms)':>11}{'speedup':>9}{'peak RSS (MB)':>15}{'frame (MB)':>12}{'cols':>6}")
+
+        baseline = None
+        for mode in modes:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, '--path', path, '--repeat', str(repeat)],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            baseline = baseline or result['time_s']
+            print(f"{mode:<16}{result['time_s'] * 1e3:>11.1f}{baseline / result['time_s']:>9.2f}"
+                  f"{result['peak_mb']:>15.1f}{result['frame_mb']:>12.1f}{result['columns']:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批次 CSV 解析耗時與記憶體：型別推斷 vs 宣告式輸入結構")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.path, args.repeat)
+    else:
+        main(args.rows, args.repeat)
@@ -0,0 +1,99 @@
+# benchmarks\bench_explainer_backends.py
+# SHAP 解釋後端比較：shap.TreeExplainer vs Booster 原生 pred_contribs / approx_contribs
+# 1) 與 TreeExplainer 的一致性 2) 吞吐量 3) worker 冷啟動時間與 RSS (各自在獨立子行程量測)
+import argparse
+import subprocess
+import json
+import sys
+import time
+
+import numpy as np
+
+from _common import PROJECT_ROOT, MODEL_PATH, MODEL_DIR, load_test_frame
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES
+from services.customer_churn_bank_service import CustomerChurnBankService
+
+# 子行程：模擬 gunicorn worker 啟動 (匯入路由模組即依 Config 建立服務 + 第一次單筆預測)，回報耗時、RSS 與是否載入 shap
+COLD_START_SCRIPT = r"""
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+os.environ['CHURN_EXPLAINER_BACKEND'] = {backend!r}
+from routes.customer_churn_bank_routes import MODEL_REGISTRY, FeatureEngineerForAPI
+service = MODEL_REGISTRY.current
+init_seconds = time.perf_counter() - start
+record = {{'id': 0, 'CreditScore': 650.0, 'Age': 40.0, 'Tenure': 5.0, 'Balance': 0.0, 'NumOfProducts': 1.0,
+          'HasCrCard': 1.0, 'IsActiveMember': 1.0, 'EstimatedSalary': 100000.0, 'Geography': 0.0, 'Gender': 0.0}}
+service.predict_records([(record, FeatureEngineerForAPI.run_v2_record, FeatureEngineerForAPI.CATEGORICAL_COLUMNS)])
+first_seconds = time.perf_counter() - start
+rss = 0
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith('VmRSS:'):
+            rss = int(line.split()[1]) * 1024
+print(json.dumps({{'init_s': init_seconds, 'first_prediction_s': first_seconds, 'rss': rss,
+                  'shap_imported': 'shap' in sys.modules}}))
+"""
+
+
+def aligned_matrix(service: CustomerChurnBankService, n_rows: int):
+    df = ensure_required_columns(load_test_frame(n_rows), REQUIRED_RAW_FEATURES)
+    return service._align_features(FeatureEngineerForAPI.run_v2_batch(df))
+
+
+def check_parity(services: dict, X_predict, k: int = 7):
+    reference = services['shap']._shap_matrix(X_predict)
+    ref_top = np.argsort(-np.abs(reference), axis=1, kind='stable')[:, :k]
+    print(f"{'backend':<15}{'max |diff|':>12}{'top-7 set match':>18}")
+    for name, service in services.items():
+        if name == 'shap':
+            continue
+        values = service._shap_matrix(X_predict)
+        top = np.argsort(-np.abs(values), axis=1, kind='stable')[:, :k]
+        match = np.mean([set(a) == set(b) for a, b in zip(top, ref_top)])
+        print(f"{name:<15}{np.max(np.abs(values - reference)):>12.2e}{match:>18.2%}")
+        if name == 'native' and not np.allclose(values, reference, atol=1e-4):
+            raise SystemExit("native pred_contribs 與 shap.TreeExplainer 結果不一致！")
+
+
+def cold_start(backend: str) -> dict:
+    script = COLD_START_SCRIPT.format(root=PROJECT_ROOT, backend=backend)
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(n_rows: int, repeat: int):
+    services = {backend: CustomerChurnBankService(MODEL_PATH, MODEL_DIR, explainer_backend=backend)
+                for backend in CustomerChurnBankService.EXPLAINER_BACKENDS}
+
+    print("== 一致性 (以 shap.TreeExplainer 為基準，2000 筆) ==")
+    check_parity(services, aligned_matrix(services['shap'], 2000))
+
+    print(f"\n== 吞吐量 ({n_rows:,} 筆，SHAP 值矩陣) ==")
+    X_predict = aligned_matrix(services['shap'], n_rows)
+    print(f"{'backend':<15}{'time (s)':>10}{'rows/sec':>12}")
+    for name, service in services.items():
+        best = min(_timed(lambda: service._shap_matrix(X_predict)) for _ in range(repeat))
+        print(f"{name:<15}{best:>10.3f}{n_rows / best:>12.0f}")
+
+    print("\n== worker 冷啟動 (獨立子行程) ==")
+    print(f"{'backend':<15}{'init (s)':>10}{'first pred (s)':>16}{'RSS (MB)':>10}{'imports shap':>14}")
+    for backend in CustomerChurnBankService.EXPLAINER_BACKENDS:
+        stats = cold_start(backend)
+        print(f"{backend:<15}{stats['init_s']:>10.2f}{stats['first_prediction_s']:>16.2f}"
+              f"{stats['rss'] / 1e6:>10.1f}{str(stats['shap_imported']):>14}")
+
+
+def _timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SHAP 解釋後端一致性、吞吐量與冷啟動比較")
+    parser.add_argument("--rows", type=int, default=20000, help="吞吐量測試筆數")
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    main(args.rows, args.repeat)
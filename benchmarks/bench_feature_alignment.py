@@ -0,0 +1,69 @@
+# benchmarks\bench_feature_alignment.py
+# 比較原本 get_dummies 對齊流程與預先編譯的 FeatureAlignmentPlan (一致性、單筆延遲、批次峰值記憶體)
+import argparse
+import tracemalloc
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from _common import load_test_frame, time_call, summarize_latency, MODEL_DIR
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES
+from services.feature_alignment_plan import FeatureAlignmentPlan
+
+
+def legacy_align(df_processed: pd.DataFrame, feature_cols: list) -> pd.DataFrame:
+    """原本 CustomerChurnBankService._align_features 的實作 (作為一致性基準)。"""
+    cat_cols = [col for col in df_processed.columns if df_processed[col].dtype.name in ['object', 'str', 'category']]
+    X_oh = pd.get_dummies(df_processed, columns=cat_cols, dummy_na=False)
+    missing_cols = set(feature_cols) - set(X_oh.columns)
+    for c in missing_cols:
+        X_oh[c] = 0.0
+    X_predict = X_oh[[col for col in feature_cols if col in X_oh.columns]]
+    return X_predict.astype(float)
+
+
+def peak_bytes(func) -> int:
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main(n_rows: int, single_repeat: int):
+    feature_cols = joblib.load(os.path.join(MODEL_DIR, 'feature_columns.joblib'))
+    plan = FeatureAlignmentPlan(feature_cols)
+
+    raw_df = ensure_required_columns(load_test_frame(n_rows), REQUIRED_RAW_FEATURES)
+    processed = FeatureEngineerForAPI.run_v2_preprocessing(raw_df)
+
+    # 1. 一致性 (逐位相等)
+    expected = legacy_align(processed, feature_cols).to_numpy(dtype=np.float32)
+    actual = plan.transform(processed)
+    if not np.array_equal(expected, actual, equal_nan=True):
+        raise SystemExit("FeatureAlignmentPlan 與 get_dummies 對齊結果不一致！")
+    print(f"一致性檢查通過：{actual.shape[0]} 筆 x {actual.shape[1]} 個特徵")
+
+    # 2. 單筆延遲
+    single = processed.iloc[[0]]
+    legacy_single = summarize_latency(time_call(lambda: legacy_align(single, feature_cols), single_repeat))
+    plan_single = summarize_latency(time_call(lambda: plan.to_frame(plan.transform(single)), single_repeat))
+
+    # 3. 批次峰值記憶體 (對齊步驟本身的額外配置)
+    legacy_peak = peak_bytes(lambda: legacy_align(processed, feature_cols))
+    plan_peak = peak_bytes(lambda: plan.to_frame(plan.transform(processed)))
+
+    print(f"{'method':<12}{'single p50 (us)':>18}{'single p99 (us)':>18}{'batch peak (MB)':>18}")
+    print(f"{'get_dummies':<12}{legacy_single['p50_us']:>18.1f}{legacy_single['p99_us']:>18.1f}{legacy_peak / 1e6:>18.1f}")
+    print(f"{'plan':<12}{plan_single['p50_us']:>18.1f}{plan_single['p99_us']:>18.1f}{plan_peak / 1e6:>18.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="特徵對齊效能比較")
+    parser.add_argument("--rows", type=int, default=200000, help="批次測試資料筆數")
+    parser.add_argument("--single_repeat", type=int, default=2000, help="單筆延遲測試重複次數")
+    args = parser.parse_args()
+
+    main(args.rows, args.single_repeat)
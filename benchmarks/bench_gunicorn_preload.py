@@ -0,0 +1,126 @@
+# benchmarks\bench_gunicorn_preload.py
+# gunicorn preload_app (master 載入一次，worker 寫入時複製共用) vs 各 worker 各自載入：
+# 不同 worker 數下的總啟動時間與每個 worker 的 RSS / USS (私有記憶體)、整體 PSS
+import argparse
+import concurrent.futures
+import subprocess
+import tempfile
+import json
+import os
+import socket
+import sys
+import time
+import urllib.request
+
+from _common import PROJECT_ROOT
+
+# 包裝專案的 gunicorn.conf.py：額外在每個 worker 載入 app 後記錄 pid，作為該 worker 就緒的訊號
+WRAPPER_CONF = r"""
+exec(open({conf!r}, encoding='utf-8').read())
+
+def post_worker_init(worker):
+    with open({ready_file!r}, 'a') as f:
+        f.write(f"{{worker.pid}}\n")
+"""
+
+SAMPLE_RECORD = {'id': 0, 'CreditScore': 650.0, 'Age': 40.0, 'Tenure': 5.0, 'Balance': 0.0, 'NumOfProducts': 1.0,
+                 'HasCrCard': 1.0, 'IsActiveMember': 1.0, 'EstimatedSalary': 100000.0, 'Geography': 0.0, 'Gender': 0.0}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def memory_of(pid: int) -> dict:
+    """從 /proc/<pid>/smaps_rollup 讀取 RSS、PSS 與 USS (Private_Clean + Private_Dirty)，單位 bytes。"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) * 1024
+    return {'rss': fields['Rss'], 'pss': fields['Pss'], 'uss': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def send_predictions(port: int, count: int, concurrency: int) -> None:
+    url = f'http://127.0.0.1:{port}/api/customer_churn_bank/predict?chart=svg'
+
+    def post(i: int):
+        record = dict(SAMPLE_RECORD, id=i, Age=30.0 + i % 40)  # 避開結果快取
+        request = urllib.request.Request(url, data=json.dumps(record).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            if response.status != 200:
+                raise RuntimeError(f"/predict 回傳 {response.status}")
+
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(post, range(count)))
+
+
+def summarize(master_pid: int, worker_pids: list) -> dict:
+    workers = [memory_of(pid) for pid in worker_pids]
+    master = memory_of(master_pid)
+    return {
+        'worker_rss': sum(w['rss'] for w in workers) / len(workers),
+        'worker_uss': sum(w['uss'] for w in workers) / len(workers),
+        'total_pss': master['pss'] + sum(w['pss'] for w in workers),
+    }
+
+
+def run(preload: bool, workers: int, requests_per_worker: int, boot_timeout: float) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        ready_file = os.path.join(tmp, 'ready')
+        conf_file = os.path.join(tmp, 'gunicorn_bench.conf.py')
+        with open(conf_file, 'w', encoding='utf-8') as f:
+            f.write(WRAPPER_CONF.format(conf=os.path.join(PROJECT_ROOT, 'gunicorn.conf.py'), ready_file=ready_file))
+
+        env = dict(os.environ, CHURN_PRELOAD_APP='1' if preload else '0')
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app', '-c', conf_file,
+             '--bind', f'127.0.0.1:{port}', '--workers', str(workers)],
+            cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            worker_pids = []
+            while len(worker_pids) < workers:
+                if time.perf_counter() - start > boot_timeout or process.poll() is not None:
+                    raise RuntimeError(f"gunicorn 未能在 {boot_timeout} 秒內啟動 {workers} 個 worker")
+                time.sleep(0.05)
+                if os.path.exists(ready_file):
+                    with open(ready_file) as f:
+                        worker_pids = [int(line) for line in f if line.strip()]
+            boot_seconds = time.perf_counter() - start
+
+            result = {'boot_s': boot_seconds, 'idle': summarize(process.pid, worker_pids)}
+            send_predictions(port, requests_per_worker * workers, concurrency=workers)
+            result['loaded'] = summarize(process.pid, worker_pids)
+            return result
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main(worker_counts: list, requests_per_worker: int, boot_timeout: float):
+    print(f"{'mode':<10}{'workers':>8}{'boot (s)':>10}{'worker RSS':>12}{'worker USS':>12}{'total PSS':>11}"
+          f"{'USS after':>11}{'PSS after':>11}   (MB；after = 每個 worker 約 {requests_per_worker} 次 /predict 之後)")
+    for workers in worker_counts:
+        for preload in (False, True):
+            stats = run(preload, workers, requests_per_worker, boot_timeout)
+            idle, loaded = stats['idle'], stats['loaded']
+            print(f"{'preload' if preload else 'per-worker':<10}{workers:>8}{stats['boot_s']:>10.2f}"
+                  f"{idle['worker_rss'] / 1e6:>12.1f}{idle['worker_uss'] / 1e6:>12.1f}{idle['total_pss'] / 1e6:>11.1f}"
+                  f"{loaded['worker_uss'] / 1e6:>11.1f}{loaded['total_pss'] / 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="gunicorn preload_app 的啟動時間與 worker 記憶體比較")
+    parser.add_argument("--workers", type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument("--requests_per_worker", type=int, default=20)
+    parser.add_argument("--boot_timeout", type=float, default=180)
+    args = parser.parse_args()
+
+    main(args.workers, args.requests_per_worker, args.boot_timeout)
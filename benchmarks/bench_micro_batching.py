@@ -0,0 +1,92 @@
+# benchmarks\bench_micro_batching.py
+# 比較單筆 /predict 在不同併發數下，逐筆處理與微批次合併的吞吐量及 p99 延遲
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from _common import MODEL_PATH, MODEL_DIR, load_test_frame
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI
+from services.customer_churn_bank_service import CustomerChurnBankService
+
+
+def build_records(n: int) -> list:
+    records = []
+    for row in load_test_frame(n).to_dict('records'):
+        record = {'id': 0}
+        for col in ['CreditScore', 'Age', 'Tenure', 'Balance', 'NumOfProducts', 'HasCrCard',
+                    'IsActiveMember', 'EstimatedSalary', 'Geography', 'Gender']:
+            record[col] = row[col]
+        record.update({'CustomerId': 0, 'Surname': 'A', 'RowNumber': 0})
+        records.append(record)
+    return records
+
+
+def run_load(service: CustomerChurnBankService, records: list, concurrency: int, requests_per_thread: int) -> dict:
+    latencies = [[] for _ in range(concurrency)]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(slot: int):
+        barrier.wait()
+        for i in range(requests_per_thread):
+            record = records[(slot * requests_per_thread + i) % len(records)]
+            start = time.perf_counter()
+            service.preprocess_and_predict_record(record, FeatureEngineerForAPI.run_v2_record,
+                                                  FeatureEngineerForAPI.CATEGORICAL_COLUMNS)
+            latencies[slot].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate([np.asarray(lat) for lat in latencies]) * 1e3
+    return {
+        'throughput': len(all_latencies) / elapsed,
+        'p50_ms': float(np.percentile(all_latencies, 50)),
+        'p99_ms': float(np.percentile(all_latencies, 99)),
+    }
+
+
+def main(levels: list, requests_per_thread: int, max_batch_size: int, max_wait_ms: float):
+    service = CustomerChurnBankService(model_path=MODEL_PATH, model_dir=MODEL_DIR)
+    records = build_records(2000)
+
+    # 一致性：微批次結果應與逐筆結果相同
+    direct = [service.preprocess_and_predict_record(r, FeatureEngineerForAPI.run_v2_record,
+                                                    FeatureEngineerForAPI.CATEGORICAL_COLUMNS) for r in records[:64]]
+    batched = service.predict_records([(r, FeatureEngineerForAPI.run_v2_record,
+                                        FeatureEngineerForAPI.CATEGORICAL_COLUMNS) for r in records[:64]])
+    max_diff = max(abs(a['probability'] - b['probability']) for a, b in zip(direct, batched))
+    if max_diff > 1e-6 or any(a['local_shap_values'].keys() != b['local_shap_values'].keys() for a, b in zip(direct, batched)):
+        raise SystemExit("微批次結果與逐筆結果不一致！")
+    print(f"一致性檢查通過 (機率最大誤差 {max_diff:.1e})")
+
+    print(f"{'concurrency':<12}{'mode':<12}{'req/sec':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'avg batch':>11}")
+    for concurrency in levels:
+        service.micro_batcher = None
+        baseline = run_load(service, records, concurrency, requests_per_thread)
+        print(f"{concurrency:<12}{'per-call':<12}{baseline['throughput']:>10.0f}{baseline['p50_ms']:>10.2f}{baseline['p99_ms']:>10.2f}{1:>11.1f}")
+
+        service.enable_micro_batching(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        batched = run_load(service, records, concurrency, requests_per_thread)
+        dispatcher = service.micro_batcher
+        avg_batch = dispatcher.requests / max(dispatcher.batches, 1)
+        print(f"{concurrency:<12}{'micro-batch':<12}{batched['throughput']:>10.0f}{batched['p50_ms']:>10.2f}{batched['p99_ms']:>10.2f}{avg_batch:>11.1f}")
+        dispatcher.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="微批次分派器效能比較")
+    parser.add_argument("--levels", type=int, nargs='+', default=[1, 4, 16, 64], help="併發執行緒數")
+    parser.add_argument("--requests_per_thread", type=int, default=100, help="每個執行緒送出的請求數")
+    parser.add_argument("--max_batch_size", type=int, default=64)
+    parser.add_argument("--max_wait_ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    main(args.levels, args.requests_per_thread, args.max_batch_size, args.max_wait_ms)
@@ -0,0 +1,98 @@
+# benchmarks\bench_model_bundle.py
+# joblib 工件 vs 版本化模型工件包：一致性、工件載入時間與 worker 冷啟動 (獨立子行程)
+import argparse
+import subprocess
+import json
+import sys
+import time
+
+import joblib
+import numpy as np
+
+from _common import PROJECT_ROOT, MODEL_PATH, MODEL_DIR, load_test_frame
+from config import Config
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES
+from services.customer_churn_bank_service import CustomerChurnBankService
+from services.model_bundle import ModelBundle
+from services.tree_inference_engine import ArrayTreeEnsemble
+
+# 子行程：模擬 worker 啟動 (建立服務 + 第一次單筆預測)；bundle_dir 為空字串時使用 joblib 工件
+COLD_START_SCRIPT = r"""
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI
+from services.customer_churn_bank_service import CustomerChurnBankService
+imported = time.perf_counter()
+service = CustomerChurnBankService({model_path!r}, {model_dir!r}, {inference!r}, {explainer!r}, bundle_dir={bundle_dir!r})
+loaded = time.perf_counter()
+record = {{'id': 0, 'CreditScore': 650.0, 'Age': 40.0, 'Tenure': 5.0, 'Balance': 0.0, 'NumOfProducts': 1.0,
+          'HasCrCard': 1.0, 'IsActiveMember': 1.0, 'EstimatedSalary': 100000.0, 'Geography': 0.0, 'Gender': 0.0}}
+service.predict_records([(record, FeatureEngineerForAPI.run_v2_record, FeatureEngineerForAPI.CATEGORICAL_COLUMNS)])
+print(json.dumps({{'service_init_s': loaded - imported, 'first_prediction_s': time.perf_counter() - start}}))
+"""
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def check_parity(bundle_dir: str, n_rows: int):
+    legacy = CustomerChurnBankService(MODEL_PATH, MODEL_DIR, 'native', 'native')
+    bundled = CustomerChurnBankService(MODEL_PATH, MODEL_DIR, 'native', 'native', bundle_dir=bundle_dir)
+    df = ensure_required_columns(load_test_frame(n_rows), REQUIRED_RAW_FEATURES)
+    X_predict = legacy._align_features(FeatureEngineerForAPI.run_v2_batch(df))
+    proba_diff = np.max(np.abs(legacy.model.predict_proba(X_predict) - bundled.model.predict_proba(X_predict)))
+    native_diff = np.max(np.abs(legacy._predict_positive_proba(X_predict) - bundled._predict_positive_proba(X_predict)))
+    shap_diff = np.max(np.abs(legacy._shap_matrix(X_predict) - bundled._shap_matrix(X_predict)))
+    print(f"一致性 ({n_rows:,} 筆)：predict_proba 最大差異 {proba_diff:.1e}，native 引擎 {native_diff:.1e}，SHAP {shap_diff:.1e}")
+    if max(proba_diff, native_diff, shap_diff) > 0:
+        raise SystemExit("工件包載入的模型與 joblib 工件結果不一致！")
+
+
+def cold_start(bundle_dir: str, inference: str, explainer: str) -> dict:
+    script = COLD_START_SCRIPT.format(root=PROJECT_ROOT, model_path=MODEL_PATH, model_dir=MODEL_DIR,
+                                      inference=inference, explainer=explainer, bundle_dir=bundle_dir)
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(bundle_dir: str, repeat: int, cold_runs: int):
+    check_parity(bundle_dir, 5000)
+
+    # 1. 工件載入 (同一行程內，排除匯入成本)
+    bundle = ModelBundle(bundle_dir)
+    rows = [
+        ('joblib model + columns', lambda: (joblib.load(MODEL_PATH), joblib.load(f"{MODEL_DIR}/feature_columns.joblib"))),
+        ('bundle (verify sha256)', lambda: ModelBundle(bundle_dir, verify=True)),
+        ('bundle (no verify)', lambda: ModelBundle(bundle_dir, verify=False)),
+        ('tree engine from booster', lambda: ArrayTreeEnsemble.from_xgb_model(bundle.model)),
+        ('tree engine from mmap', bundle.build_tree_engine),
+    ]
+    print(f"\n{'artifact load':<28}{'best (ms)':>10}")
+    for name, func in rows:
+        print(f"{name:<28}{best_of(func, repeat) * 1e3:>10.2f}")
+
+    # 2. worker 冷啟動 (每種組合取 cold_runs 次中最快的一次)
+    print(f"\n{'worker cold start':<34}{'service init (s)':>18}{'first pred (s)':>16}")
+    for inference, explainer in [('xgboost', 'shap'), ('native', 'native')]:
+        for label, directory in [('joblib', ''), ('bundle', bundle_dir)]:
+            runs = [cold_start(directory, inference, explainer) for _ in range(cold_runs)]
+            init = min(run['service_init_s'] for run in runs)
+            first = min(run['first_prediction_s'] for run in runs)
+            print(f"{f'{label} ({inference}/{explainer})':<34}{init:>18.3f}{first:>16.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="joblib 工件與模型工件包的載入時間比較")
+    parser.add_argument("--bundle_dir", type=str, default=Config.MODEL_BUNDLE_DIR)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--cold_runs", type=int, default=3)
+    args = parser.parse_args()
+
+    main(args.bundle_dir, args.repeat, args.cold_runs)
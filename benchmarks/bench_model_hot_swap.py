@@ -0,0 +1,174 @@
+# benchmarks\bench_model_hot_swap.py
+# 模型熱抽換負載測試：持續以多個執行緒呼叫 /predict，期間 1) 覆寫工件包觸發檔案監看抽換 2) 呼叫 /admin/reload，
+# 比較抽換前 / 抽換中 / 抽換後的延遲分位數、錯誤數與回應中的 model_version
+import argparse
+import shutil
+import tempfile
+import threading
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# 需在匯入 app (及 routes 中的 Config) 之前設定：服務改從暫存目錄中的工件包載入並啟用監看與管理介面
+WORK_DIR = tempfile.mkdtemp(prefix='churn_hot_swap_')
+LIVE_BUNDLE = os.path.join(WORK_DIR, 'live')
+os.environ['CHURN_MODEL_BUNDLE_DIR'] = LIVE_BUNDLE
+os.environ['CHURN_MODEL_WATCH_INTERVAL'] = '0.2'
+os.environ['CHURN_ADMIN_TOKEN'] = 'bench-token'
+
+from _common import MODEL_DIR  # noqa: E402
+from config import Config  # noqa: E402
+from services.model_bundle import ModelBundle, write_model_bundle, MANIFEST_FILE  # noqa: E402
+
+ORIGINAL_BUNDLE = os.path.join(MODEL_DIR, 'model_bundle')
+
+
+def publish_bundle(source_dir: str, target_dir: str) -> None:
+    """將工件包逐檔以 os.replace 覆寫到服務目錄 (manifest 最後寫入)，模擬部署新模型。"""
+    names = []
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            names.append(os.path.relpath(os.path.join(root, name), source_dir))
+    names.sort(key=lambda name: name == MANIFEST_FILE)
+    for name in names:
+        destination = os.path.join(target_dir, name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(os.path.join(source_dir, name), destination + '.tmp')
+        os.replace(destination + '.tmp', destination)
+
+
+def build_variant_bundle(n_trees: int) -> str:
+    """以原模型前 n_trees 棵樹建立另一個版本的工件包 (模擬重新訓練後的新模型)。"""
+    bundle = ModelBundle(ORIGINAL_BUNDLE)
+    # write_model_bundle 會依 best_iteration 切片，只保留前 n_trees 棵樹
+    bundle.model.get_booster().set_attr(best_iteration=str(n_trees - 1))
+    variant_dir = os.path.join(WORK_DIR, 'variant')
+    write_model_bundle(bundle.model, bundle.feature_cols, bundle.fe_pipeline_name, variant_dir)
+    return variant_dir
+
+
+class LoadGenerator:
+    """多個執行緒以 Flask test client 持續送出 /predict (每筆輸入不同，避開結果快取)。"""
+
+    def __init__(self, app, threads: int):
+        self.app = app
+        self.threads = threads
+        self.samples = []  # (開始時間, 延遲秒數, HTTP 狀態, model_version)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def start(self):
+        for slot in range(self.threads):
+            worker = threading.Thread(target=self._run, args=(slot,), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        self._stop.set()
+        for worker in self._workers:
+            worker.join()
+
+    def _run(self, slot: int):
+        client = self.app.test_client()
+        rng = np.random.default_rng(slot)
+        while not self._stop.is_set():
+            record = {'id': int(rng.integers(1e9)), 'CreditScore': float(rng.integers(350, 850)),
+                      'Age': float(rng.integers(18, 90)), 'Tenure': float(rng.integers(0, 10)),
+                      'Balance': float(rng.choice([0.0, rng.uniform(1e4, 2e5)])), 'NumOfProducts': float(rng.integers(1, 4)),
+                      'HasCrCard': 1.0, 'IsActiveMember': float(rng.integers(0, 2)),
+                      'EstimatedSalary': float(rng.uniform(1e4, 2e5)), 'Geography': float(rng.integers(0, 3)),
+                      'Gender': float(rng.integers(0, 2))}
+            start = time.perf_counter()
+            response = client.post('/api/customer_churn_bank/predict?chart=json', json=record)
+            latency = time.perf_counter() - start
+            version = (response.get_json() or {}).get('model_version') if response.status_code == 200 else None
+            with self._lock:
+                self.samples.append((start, latency, response.status_code, version))
+
+
+def report(samples: list, phases: list):
+    print(f"{'phase':<26}{'requests':>9}{'errors':>8}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}  model_version")
+    for name, begin, end in phases:
+        selected = [s for s in samples if begin <= s[0] < end]
+        if not selected:
+            print(f"{name:<26}{0:>9}")
+            continue
+        latencies = np.array([s[1] for s in selected]) * 1e3
+        errors = sum(1 for s in selected if s[2] != 200)
+        versions = sorted({s[3] for s in selected if s[3]})
+        print(f"{name:<26}{len(selected):>9}{errors:>8}{np.percentile(latencies, 50):>10.1f}"
+              f"{np.percentile(latencies, 99):>10.1f}{latencies.max():>10.1f}  {', '.join(versions)}")
+
+
+def wait_for_swap(registry, swaps_before: int, timeout: float) -> float:
+    deadline = time.perf_counter() + timeout
+    while registry.swaps == swaps_before:
+        if time.perf_counter() > deadline:
+            raise SystemExit(f"等待模型抽換逾時：{registry.status()}")
+        time.sleep(0.01)
+    return time.perf_counter()
+
+
+def main(threads: int, phase_seconds: float, variant_trees: int):
+    shutil.copytree(ORIGINAL_BUNDLE, LIVE_BUNDLE)
+    variant_dir = build_variant_bundle(variant_trees)
+
+    from app import app
+    from routes.customer_churn_bank_routes import MODEL_REGISTRY
+    print(f"服務模型版本 {MODEL_REGISTRY.model_version}，{threads} 個請求執行緒，每階段約 {phase_seconds}s")
+
+    load = LoadGenerator(app, threads)
+    t0 = time.perf_counter()
+    load.start()
+    time.sleep(phase_seconds)
+
+    # 1. 覆寫工件包 -> 檔案監看偵測 -> 背景載入 + canary -> 抽換
+    swaps = MODEL_REGISTRY.swaps
+    t1 = time.perf_counter()
+    publish_bundle(variant_dir, LIVE_BUNDLE)
+    t2 = wait_for_swap(MODEL_REGISTRY, swaps, Config.MODEL_RELOAD_TIMEOUT_SECONDS)
+    time.sleep(phase_seconds)
+
+    # 2. 停止監看，改以管理介面觸發：還原原模型後 POST /admin/reload
+    MODEL_REGISTRY.watch_interval = 0  # 請求會惰性啟動監看；設為 0 才能確實停用
+    MODEL_REGISTRY.stop_watching()
+    publish_bundle(ORIGINAL_BUNDLE, LIVE_BUNDLE)
+    swaps = MODEL_REGISTRY.swaps
+    t3 = time.perf_counter()
+    admin = app.test_client().post('/api/customer_churn_bank/admin/reload', headers={'X-Admin-Token': 'bench-token'})
+    if admin.status_code != 202 or not admin.get_json()['started']:
+        raise SystemExit(f"/admin/reload 失敗: {admin.status_code} {admin.get_data(as_text=True)}")
+    t4 = wait_for_swap(MODEL_REGISTRY, swaps, Config.MODEL_RELOAD_TIMEOUT_SECONDS)
+    time.sleep(phase_seconds)
+    load.stop()
+    t5 = time.perf_counter()
+
+    report(load.samples, [
+        ('before', t0, t1),
+        ('during swap (watcher)', t1, t2),
+        ('after swap 1', t2, t3),
+        ('during swap (admin)', t3, t4),
+        ('after swap 2', t4, t5),
+    ])
+    print(f"\n抽換耗時 (背景載入 + canary)：watcher {t2 - t1:.2f}s，admin {t4 - t3:.2f}s")
+    print(json.dumps(MODEL_REGISTRY.status(), ensure_ascii=False, default=str))
+    if any(s[2] != 200 for s in load.samples):
+        raise SystemExit("負載期間出現非 200 回應！")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模型熱抽換負載測試")
+    parser.add_argument("--threads", type=int, default=4, help="併發請求執行緒數")
+    parser.add_argument("--phase_seconds", type=float, default=5.0, help="每個穩定階段的持續秒數")
+    parser.add_argument("--variant_trees", type=int, default=100, help="新版本模型使用的樹數")
+    args = parser.parse_args()
+
+    try:
+        main(args.threads, args.phase_seconds, args.variant_trees)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+        sys.stdout.flush()
@@ -0,0 +1,79 @@
+# benchmarks\bench_parallel_batch.py
+# 多核心分片批次評分 (共享記憶體特徵矩陣 + 行程池) 在 1 / 2 / 4 / 8 個行程下的擴展性，
+# 以及與單行程結果的一致性 (機率、SHAP 前 k 名逐位相同；ROI 彙總在浮點誤差內)
+import argparse
+import time
+import os
+
+import numpy as np
+
+from _common import MODEL_PATH, MODEL_DIR, load_test_frame
+from config import Config
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES
+from services.customer_churn_bank_service import CustomerChurnBankService
+from services.parallel_batch_scorer import ParallelBatchScorer
+
+
+def build_service() -> CustomerChurnBankService:
+    return CustomerChurnBankService(model_path=MODEL_PATH, model_dir=MODEL_DIR,
+                                    inference_backend=Config.INFERENCE_BACKEND,
+                                    explainer_backend=Config.EXPLAINER_BACKEND,
+                                    bundle_dir=Config.MODEL_BUNDLE_DIR)
+
+
+def score(service: CustomerChurnBankService, df, top_k: int):
+    start = time.perf_counter()
+    result_df, roi = service.predict_batch_with_roi(df, FeatureEngineerForAPI.run_v2_batch, explain_top_k=top_k)
+    return time.perf_counter() - start, result_df, roi
+
+
+def compare(reference, candidate, top_k: int) -> str:
+    (_, ref_df, ref_roi), (_, df, roi) = reference, candidate
+    same_proba = np.array_equal(ref_df['Exited_Probability'].to_numpy(), df['Exited_Probability'].to_numpy())
+    same_topk = all(np.array_equal(ref_df[c].to_numpy(), df[c].to_numpy())
+                    for c in ref_df.columns if c.startswith('SHAP_Top')) if top_k else True
+    roi_diff = max(abs(ref_roi[key] - roi[key]) / max(abs(ref_roi[key]), 1e-12) for key in ref_roi)
+    return f"proba {'==' if same_proba else '!='}  top-k {'==' if same_topk else '!='}  ROI rel diff {roi_diff:.1e}"
+
+
+def main(n_rows: int, worker_counts: list, top_k: int, min_rows: int):
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    print(f"{n_rows:,} 筆合成資料，top_k={top_k}，可用 CPU 核心數: {cores}")
+    df = ensure_required_columns(load_test_frame(n_rows), REQUIRED_RAW_FEATURES)
+
+    service = build_service()
+    reference = score(service, df, top_k)
+
+    # FE 與對齊在父行程中完成 (不平行)，決定擴展上限 (Amdahl)
+    start = time.perf_counter()
+    service.alignment_plan.transform(FeatureEngineerForAPI.run_v2_batch(df))
+    serial_s = time.perf_counter() - start
+    print(f"FE + 對齊 (父行程): {serial_s:.2f}s，佔單行程總耗時 {serial_s / reference[0]:.0%}，"
+          f"理論最大加速 {reference[0] / serial_s:.1f}x")
+    print(f"{'workers':>8}{'time (s)':>10}{'rows/s':>12}{'speedup':>9}{'pool start (s)':>16}  parity vs 單行程")
+    print(f"{'serial':>8}{reference[0]:>10.2f}{n_rows / reference[0]:>12,.0f}{1.0:>9.2f}{'-':>16}")
+
+    for workers in worker_counts:
+        scorer = ParallelBatchScorer(workers=workers, min_rows=min_rows)
+        service.enable_parallel_batch(scorer)
+        # 第一次呼叫包含子行程啟動與模型載入，另外列出；之後量測常駐行程池的耗時
+        warm_start = time.perf_counter()
+        service.predict_batch_with_roi(df.iloc[:max(min_rows, workers)], FeatureEngineerForAPI.run_v2_batch,
+                                       explain_top_k=top_k)
+        pool_start = time.perf_counter() - warm_start
+        candidate = score(service, df, top_k)
+        scorer.shutdown()
+        print(f"{workers:>8}{candidate[0]:>10.2f}{n_rows / candidate[0]:>12,.0f}{reference[0] / candidate[0]:>9.2f}"
+              f"{pool_start:>16.2f}  {compare(reference, candidate, top_k)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多核心分片批次評分的擴展性與一致性")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="行程數 (1 = 單一子行程，量測分片本身的額外成本)")
+    parser.add_argument("--top_k", type=int, default=0, help="> 0 時同時計算每列前 k 個 SHAP 驅動因子")
+    parser.add_argument("--min_rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    main(args.rows, args.workers, args.top_k, args.min_rows)
@@ -0,0 +1,65 @@
+# benchmarks\bench_portfolio_stats.py
+# 可合併的投資組合統計 (roi_kernel.PortfolioStats)：整份計算 vs 分塊 update + merge vs 分片後以 to_dict / from_dict
+# 傳遞再合併 (模擬跨節點)，量測耗時並檢查人數、直方圖完全一致與金額的相對差異
+import argparse
+import json
+import time
+
+import numpy as np
+
+import _common  # noqa: F401  (設定 sys.path)
+from services.roi_kernel import PortfolioStats, RoiInputs, calculate_roi  # noqa: E402
+
+
+def timed(func) -> tuple:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main(n_rows: int, chunk_rows: int, shards: int):
+    rng = np.random.default_rng(42)
+    inputs = RoiInputs(rng.beta(1.2, 4.0, n_rows).astype(np.float32),
+                       np.where(rng.random(n_rows) < 0.35, 0.0, rng.normal(120000, 30000, n_rows).clip(0)),
+                       rng.integers(1, 5, n_rows).astype(np.float64), (rng.random(n_rows) < 0.4).astype(np.int8))
+
+    def chunked() -> PortfolioStats:
+        stats = PortfolioStats()
+        for start in range(0, n_rows, chunk_rows):
+            stats.merge(PortfolioStats().update(inputs.slice(start, start + chunk_rows)))
+        return stats
+
+    def sharded() -> PortfolioStats:
+        bounds = np.linspace(0, n_rows, shards + 1).astype(int)
+        payloads = [json.dumps(PortfolioStats().update(inputs.slice(a, b)).to_dict()) for a, b in zip(bounds[:-1], bounds[1:])]
+        return PortfolioStats.combine([PortfolioStats.from_dict(json.loads(payload)) for payload in payloads])
+
+    methods = [
+        ('calculate_roi (僅 ROI)', lambda: calculate_roi(inputs)),
+        ('PortfolioStats 整份', lambda: PortfolioStats().update(inputs)),
+        (f'分塊 update + merge ({chunk_rows:,} 筆/區塊)', chunked),
+        (f'{shards} 個分片 JSON 往返後合併', sharded),
+    ]
+    print(f"{n_rows:,} 位客戶：")
+    print(f"{'method':<40}{'time (ms)':>11}")
+    results = {}
+    for name, func in methods:
+        elapsed, results[name] = timed(func)
+        print(f"{name:<36}{elapsed * 1e3:>11.1f}")
+
+    whole, chunk, shard = (results[name] for name, _ in methods[1:])
+    exact = all(whole.actionable_count == other.actionable_count and whole.rows == other.rows
+                and np.array_equal(whole.probability_hist, other.probability_hist)
+                and np.array_equal(whole.actionable_hist, other.actionable_hist) for other in (chunk, shard))
+    worst = max(abs(whole.total_net_enr - other.total_net_enr) / abs(whole.total_net_enr) for other in (chunk, shard))
+    print(f"\n人數與直方圖完全一致: {exact}，總淨 ENR 最大相對差異: {worst:.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="可合併的投資組合統計：整份 vs 分塊 vs 分片合併")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--chunk_rows", type=int, default=5000)
+    parser.add_argument("--shards", type=int, default=8)
+    args = parser.parse_args()
+
+    main(args.rows, args.chunk_rows, args.shards)
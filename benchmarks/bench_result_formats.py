@@ -0,0 +1,93 @@
+# benchmarks\bench_result_formats.py
+# /predict_batch 一次性回應的格式化 + 序列化耗時與回應大小：原本的逐筆 JSON (逐欄 fillna/round、
+# .apply(np.floor)、to_dict('records')) vs 由欄位陣列直接編碼的 records / columnar / csv / parquet / arrow
+import argparse
+import gzip
+import time
+import os
+
+import numpy as np
+import pandas as pd
+
+from _common import load_test_frame
+from flask import jsonify
+
+os.environ.setdefault('FLASK_ENV', 'production')  # DevelopmentConfig 會縮排輸出 JSON，基準以正式環境設定量測
+from app import app  # noqa: E402
+from routes.customer_churn_bank_routes import (FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES,
+                                               BATCH_RESPONSE_COLUMNS, MODEL_REGISTRY, format_batch_result)  # noqa: E402
+from services.batch_result_encoder import BATCH_RESULT_FORMATS, encode_batch_result  # noqa: E402
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+def legacy_records(input_df: pd.DataFrame, result_df: pd.DataFrame) -> list:
+    """改寫前的回應格式化 (作為基準)。"""
+    available_cols = [col for col in BATCH_RESPONSE_COLUMNS if col in input_df.columns]
+    result_df_full = input_df[available_cols].copy()
+    result_df_full['probability'] = result_df['Exited_Probability']
+    for col in ['id', 'NumOfProducts', 'HasCrCard', 'IsActiveMember']:
+        if col in result_df_full.columns:
+            result_df_full[col] = result_df_full[col].fillna(0).astype(int)
+    for col in ['CreditScore', 'Age', 'Tenure', 'Balance', 'EstimatedSalary']:
+        if col in result_df_full.columns:
+            result_df_full[col] = result_df_full[col].fillna(0.0).astype(float).round(2)
+    result_df_full['probability'] = (result_df_full['probability'].fillna(0.0) * (10 ** 4)).apply(np.floor) / (10 ** 4)
+    result_df_full['probability'] = result_df_full['probability'].astype(float)
+    return result_df_full.to_dict('records')
+
+
+def serialize(body) -> bytes:
+    """JSON 格式與路由相同，經 Flask jsonify 輸出。"""
+    if isinstance(body, dict):
+        with app.app_context():
+            return jsonify(body).get_data()
+    return body.encode('utf-8') if isinstance(body, str) else body
+
+
+def measure(build, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = build()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)), payload
+
+
+def main(n_rows: int, repeat: int, top_k: int):
+    service = MODEL_REGISTRY.current
+    input_df = ensure_required_columns(load_test_frame(n_rows), REQUIRED_RAW_FEATURES)
+    result_df, roi_stats = service.predict_batch_with_roi(input_df, FeatureEngineerForAPI.run_v2_batch,
+                                                          explain_top_k=top_k)
+    metadata = {"status": "success", "message": "", "roi": roi_stats, "model_version": service.model_version}
+
+    print(f"{n_rows:,} 筆批次 (top_k={top_k})，格式化 + 序列化耗時 (中位數，{repeat} 次) 與回應大小：")
+    print(f"{'format':<18}{'time (ms)':>11}{'speedup':>9}{'size (MB)':>11}{'gzip (MB)':>11}")
+
+    baseline_s, payload = measure(lambda: serialize({**metadata, "data": legacy_records(input_df, result_df)}), repeat)
+    rows = [('records (legacy)', baseline_s, payload)]
+    for result_format in BATCH_RESULT_FORMATS:
+        if result_format in ('parquet', 'arrow') and not HAS_PYARROW:
+            print(f"{result_format:<18}  (未安裝 pyarrow，略過)")
+            continue
+        elapsed, payload = measure(lambda: serialize(encode_batch_result(
+            format_batch_result(input_df, result_df, top_k), result_format, metadata)[0]), repeat)
+        rows.append((result_format, elapsed, payload))
+
+    for name, elapsed, payload in rows:
+        print(f"{name:<18}{elapsed * 1e3:>11.1f}{baseline_s / elapsed:>9.2f}{len(payload) / 1e6:>11.2f}"
+              f"{len(gzip.compress(payload, 6)) / 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批次回應格式的序列化耗時與大小")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top_k", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.rows, args.repeat, args.top_k)
@@ -0,0 +1,73 @@
+# benchmarks\bench_retention_targeting.py
+# 固定預算的挽留名單：整份 DataFrame 依 ENR 排序後取前 K 名 (原本 calculate_roi_batch 的做法)
+# vs argpartition 部分選取 (單一區塊) vs 分塊的有界 top-K 累積器，量測耗時與峰值記憶體 (tracemalloc)
+import argparse
+import tracemalloc
+import time
+
+import numpy as np
+import pandas as pd
+
+import _common  # noqa: F401  (設定 sys.path)
+from services.roi_kernel import DEFAULT_ROI_PARAMS, RoiInputs, customer_enr  # noqa: E402
+from services.retention_targeting import DEFAULT_CHUNK_ROWS, contact_limit, plan_retention_targets  # noqa: E402
+
+
+def full_sort(inputs: RoiInputs, ids: np.ndarray, k: int) -> list:
+    """改寫前的做法 (作為基準)：建立 ENR 欄位、篩選 ENR > 0、整份排序後取前 K 名。"""
+    df = pd.DataFrame({'id': ids, 'ENR': customer_enr(inputs, DEFAULT_ROI_PARAMS)})
+    actionable = df[df['ENR'] > 0].sort_values(by='ENR', ascending=False, kind='stable')
+    return actionable['id'].head(k).tolist()
+
+
+def measure(func) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6, result
+
+
+def main(n_rows: int, budget: float, chunk_rows: int, repeat: int):
+    # 合成客戶：機率與餘額的分布與測試資料相近，約 15% 的客戶 ENR > 0
+    rng = np.random.default_rng(42)
+    inputs = RoiInputs(rng.beta(1.2, 4.0, n_rows), np.where(rng.random(n_rows) < 0.35, 0.0,
+                                                            rng.normal(120000, 30000, n_rows).clip(0)),
+                       rng.integers(1, 5, n_rows).astype(np.float64), rng.random(n_rows) < 0.4)
+    ids = np.arange(15000000, 15000000 + n_rows, dtype=np.int64)
+    k = contact_limit(DEFAULT_ROI_PARAMS['retention_cost'], budget)
+
+    def chunks():
+        for start in range(0, n_rows, chunk_rows):
+            yield inputs.slice(start, start + chunk_rows), ids[start:start + chunk_rows]
+
+    methods = [
+        ('DataFrame 整份排序 (原本)', lambda: full_sort(inputs, ids, k)),
+        ('argpartition (單一區塊)', lambda: plan_retention_targets([(inputs, ids)], budget=budget)['ids']),
+        (f'分塊 top-K ({chunk_rows:,} 筆/區塊)', lambda: plan_retention_targets(chunks(), budget=budget)['ids']),
+    ]
+    print(f"{n_rows:,} 位客戶，預算 {budget:,.0f} (K = {k:,})，中位數 {repeat} 次：")
+    print(f"{'method':<30}{'time (ms)':>11}{'speedup':>9}{'peak alloc (MB)':>17}")
+    baseline = None
+    reference = None
+    for name, func in methods:
+        runs = [measure(func) for _ in range(repeat)]
+        elapsed = float(np.median([run[0] for run in runs]))
+        peak = max(run[1] for run in runs)
+        baseline = baseline or elapsed
+        reference = reference if reference is not None else runs[0][2]
+        print(f"{name:<26}{elapsed * 1e3:>11.1f}{baseline / elapsed:>9.2f}{peak:>17.1f}"
+              f"  {'名單一致' if runs[0][2] == reference else '名單不一致!'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="固定預算挽留名單：整份排序 vs 部分選取 vs 分塊 top-K")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--budget", type=float, default=5000000, help="挽留預算 (K = 預算 / 挽留成本)")
+    parser.add_argument("--chunk_rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    main(args.rows, args.budget, args.chunk_rows, args.repeat)
@@ -0,0 +1,84 @@
+# benchmarks\bench_risk_summary.py
+# 批次回應的風險分布彙總 (risk_distribution.RiskSummary)：評分時逐區塊累積 vs 以完整結果表格
+# 在 pandas 中事後計算 (整體與各客群的分位數、直方圖、門檻人數)，量測耗時、結果一致性與回應大小
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+import _common  # noqa: F401  (設定 sys.path)
+from config import Config  # noqa: E402
+from services.risk_distribution import RiskSummary, DEFAULT_QUANTILES, RISK_COHORT_DIMENSIONS  # noqa: E402
+
+
+def pandas_summary(df: pd.DataFrame, thresholds: list) -> dict:
+    """對照組：已有完整結果表格時以 pandas 計算同樣的彙總 (分位數採最近秩定義)。"""
+    def describe(p: pd.Series) -> dict:
+        ordered = np.sort(p.to_numpy())
+        ranks = np.maximum(np.ceil(np.array(DEFAULT_QUANTILES) * len(ordered)), 1).astype(int) - 1
+        return {'count': len(ordered), 'quantiles': ordered[ranks].tolist(),
+                'at_least': [int((ordered >= t).sum()) for t in thresholds]}
+    return {'overall': describe(df['probability']),
+            **{dim: {str(label): describe(group) for label, group in df.groupby(dim, observed=True)['probability']}
+               for dim in RISK_COHORT_DIMENSIONS}}
+
+
+def main(n_rows: int, chunk_rows: int):
+    rng = np.random.default_rng(42)
+    probability = np.trunc(rng.beta(0.6, 2.0, n_rows) * 10000) / 10000
+    cohorts = {
+        'Geography': pd.Categorical(rng.choice(['France', 'Germany', 'Spain'], n_rows, p=[0.5, 0.25, 0.25])),
+        'Gender': pd.Categorical(rng.choice(['Male', 'Female'], n_rows)),
+        'Age_bin': pd.cut(rng.integers(18, 92, n_rows), bins=[0, 25, 35, 45, 60, np.inf],
+                          labels=['very_young', 'young', 'mid', 'mature', 'senior'], right=False),
+    }
+    thresholds = Config.RISK_SUMMARY_THRESHOLDS
+
+    def streaming() -> RiskSummary:
+        summary = RiskSummary(thresholds)
+        for start in range(0, n_rows, chunk_rows):
+            stop = start + chunk_rows
+            summary.update(probability[start:stop], {dim: labels[start:stop] for dim, labels in cohorts.items()})
+        return summary
+
+    start = time.perf_counter()
+    summary = streaming()
+    stream_s = time.perf_counter() - start
+    start = time.perf_counter()
+    payload = summary.to_dict()
+    to_dict_s = time.perf_counter() - start
+
+    df = pd.DataFrame({'probability': probability, **cohorts})
+    start = time.perf_counter()
+    reference = pandas_summary(df, thresholds)
+    pandas_s = time.perf_counter() - start
+
+    overall = payload['overall']
+    match = (overall['count'] == reference['overall']['count']
+             and list(overall['quantiles'].values()) == reference['overall']['quantiles']
+             and list(overall['at_least'].values()) == reference['overall']['at_least']
+             and all(list(payload['cohorts'][dim][label]['at_least'].values()) == ref['at_least']
+                     and list(payload['cohorts'][dim][label]['quantiles'].values()) == ref['quantiles']
+                     for dim in RISK_COHORT_DIMENSIONS for label, ref in reference[dim].items()))
+
+    rows_bytes = len(df.assign(**{dim: df[dim].astype(str) for dim in RISK_COHORT_DIMENSIONS})
+                     .to_json(orient='records').encode())
+    summary_bytes = len(json.dumps(payload).encode())
+    print(f"{n_rows:,} 筆，{len(thresholds)} 個門檻，{sum(len(v) for v in payload['cohorts'].values())} 個客群：")
+    print(f"{'method':<36}{'time (ms)':>11}")
+    print(f"{f'RiskSummary 逐區塊累積 ({chunk_rows:,} 筆/區塊)':<30}{stream_s * 1e3:>11.1f}")
+    print(f"{'RiskSummary.to_dict':<36}{to_dict_s * 1e3:>11.1f}")
+    print(f"{'pandas 事後計算 (需完整結果表格)':<27}{pandas_s * 1e3:>11.1f}")
+    print(f"\n分位數與門檻人數一致: {match}")
+    print(f"回應大小：逐筆資料 (僅機率與客群欄位) {rows_bytes / 1e6:.1f} MB vs 彙總 {summary_bytes / 1e3:.1f} KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批次風險分布彙總：逐區塊累積 vs pandas 事後計算")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--chunk_rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    main(args.rows, args.chunk_rows)
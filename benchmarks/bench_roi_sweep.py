@@ -0,0 +1,85 @@
+# benchmarks\bench_roi_sweep.py
+# ROI 計算：原本的 DataFrame 版本 (複製、7 個中間欄位、排序) vs NumPy 核心 (roi_kernel.calculate_roi)，
+# 以及業務參數網格的 what-if 試算 (逐情境重算 vs calculate_roi_surface 一次求出整個曲面)
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from _common import load_test_frame
+from routes.customer_churn_bank_routes import (FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES,
+                                               MODEL_REGISTRY)
+from services.roi_kernel import RoiInputs, calculate_roi, build_parameter_grid, calculate_roi_surface
+
+
+def legacy_roi(df_with_prob: pd.DataFrame, params: dict) -> dict:
+    """改寫前的 calculate_roi_batch (作為基準)，常數改由 params 提供。"""
+    df = df_with_prob.copy()
+    df['Churn_Prob'] = df['Exited_Probability']
+    df['ActiveCard_Flag'] = ((df['HasCrCard'] == 1) & (df['IsActiveMember'] == 1)).astype(int)
+    df['Annual_Profit'] = ((df['Balance'] * params['nim_rate']) + (df['NumOfProducts'] * params['product_profit'])
+                           + (df['ActiveCard_Flag'] * params['active_card_profit']))
+    df['Expected_Lifespan'] = np.minimum(1 / np.maximum(df['Churn_Prob'], 1e-6), params['l_max'])
+    df['LTV'] = df['Annual_Profit'] * df['Expected_Lifespan']
+    df['ENR'] = (df['LTV'] * df['Churn_Prob'] * params['success_rate']) - params['retention_cost']
+    actionable = df[df['ENR'] > 0].copy().sort_values(by='ENR', ascending=False)
+    total_enr = actionable['ENR'].sum() if not actionable.empty else 0.0
+    total_cost = len(actionable) * params['retention_cost']
+    return {'total_ltv': df['LTV'].sum(), 'actionable_count': len(actionable), 'total_net_enr': total_enr,
+            'retention_cost': total_cost, 'total_roi': (total_enr / total_cost) if total_cost > 0 else 0.0}
+
+
+def timed(func) -> tuple:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main(n_rows: int, costs: int, rates: int, nim_rates: int, legacy_scenarios: int):
+    # 以測試資料評分一次，再重複抽樣放大到 n_rows 位客戶 (ROI 只需要機率與 4 個原始欄位)
+    service = MODEL_REGISTRY.current
+    base = ensure_required_columns(load_test_frame(), REQUIRED_RAW_FEATURES)
+    result_df, _ = service.predict_batch_with_roi(base, FeatureEngineerForAPI.run_v2_batch)
+    sample = np.random.default_rng(42).integers(0, len(base), n_rows)
+    df = base.iloc[sample][['Balance', 'NumOfProducts', 'HasCrCard', 'IsActiveMember']].reset_index(drop=True)
+    df['Exited_Probability'] = result_df['Exited_Probability'].to_numpy()[sample]
+    inputs = RoiInputs.from_frame(df, df['Exited_Probability'].to_numpy())
+
+    grid = {'retention_cost': np.linspace(100, 1000, costs), 'success_rate': np.linspace(0.05, 0.5, rates)}
+    if nim_rates > 1:
+        grid['nim_rate'] = np.linspace(0.01, 0.03, nim_rates)
+    axes, scenarios = build_parameter_grid(grid, max_scenarios=10 ** 7)
+    n_scenarios = len(scenarios['retention_cost'])
+    scenario_params = [{name: scenarios[name][i] for name in scenarios} for i in range(n_scenarios)]
+
+    print(f"{n_rows:,} 位客戶 x {n_scenarios} 個情境 ({' x '.join(f'{name}={len(v)}' for name, v in axes)})：")
+    legacy_s, legacy = timed(lambda: [legacy_roi(df, params) for params in scenario_params[:legacy_scenarios]])
+    legacy_per = legacy_s / legacy_scenarios
+    kernel_s, kernel = timed(lambda: [calculate_roi(inputs, params) for params in scenario_params])
+    surface_s, surface = timed(lambda: calculate_roi_surface(inputs, scenarios))
+
+    print(f"{'method':<34}{'per scenario (ms)':>19}{'total (s)':>11}")
+    print(f"{'DataFrame (原本，推估)':<30}{legacy_per * 1e3:>19.1f}{legacy_per * n_scenarios:>11.2f}"
+          f"  (實測 {legacy_scenarios} 個情境)")
+    print(f"{'NumPy 核心，逐情境':<30}{kernel_s / n_scenarios * 1e3:>19.2f}{kernel_s:>11.2f}")
+    print(f"{'calculate_roi_surface (整個曲面)':<31}{surface_s / n_scenarios * 1e3:>19.3f}{surface_s:>11.3f}")
+
+    # 結果一致性：挽留人數完全相同，金額只有浮點捨入層級的差異
+    counts_match = all(kernel[i]['actionable_count'] == surface['actionable_count'][i] for i in range(n_scenarios)) \
+        and all(legacy[i]['actionable_count'] == kernel[i]['actionable_count'] for i in range(legacy_scenarios))
+    worst = max(abs(kernel[i]['total_net_enr'] - surface['total_net_enr'][i]) / max(abs(kernel[i]['total_net_enr']), 1.0)
+                for i in range(n_scenarios))
+    print(f"\n挽留人數一致: {counts_match}，總淨 ENR 最大相對差異: {worst:.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ROI 計算與業務參數網格試算")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--costs", type=int, default=10, help="retention_cost 的取值數")
+    parser.add_argument("--rates", type=int, default=10, help="success_rate 的取值數")
+    parser.add_argument("--nim_rates", type=int, default=1, help="nim_rate 的取值數 (> 1 時加入網格)")
+    parser.add_argument("--legacy_scenarios", type=int, default=3, help="原本的 DataFrame 版本實測的情境數")
+    args = parser.parse_args()
+
+    main(args.rows, args.costs, args.rates, args.nim_rates, args.legacy_scenarios)
@@ -0,0 +1,87 @@
+# benchmarks\bench_single_record.py
+# 單筆 /predict 快速路徑 (dict -> 特徵向量) 與 DataFrame FE 管道的一致性檢查及延遲比較
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from _common import MODEL_PATH, MODEL_DIR, load_test_frame, time_call, summarize_latency
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI
+from services.customer_churn_bank_service import CustomerChurnBankService
+
+
+def api_record(raw: dict) -> dict:
+    """依 predict_churn 的方式組裝單筆輸入 (所有數值欄位皆為 float)。"""
+    record = {'id': 0}
+    for col in ['CreditScore', 'Age', 'Tenure', 'Balance', 'NumOfProducts', 'HasCrCard',
+                'IsActiveMember', 'EstimatedSalary', 'Geography', 'Gender']:
+        record[col] = raw[col]
+    record.update({'CustomerId': 0, 'Surname': 'A', 'RowNumber': 0})
+    return record
+
+
+def edge_case_records() -> list:
+    """涵蓋分箱邊界、類別編碼、非整數旗標與缺失值等邊界情況的輸入組合。"""
+    ages = [0.0, 24.9, 25.0, 35.0, 40.0, 40.5, 45.0, 60.0, 95.0, -1.0, np.nan]
+    geographies = [0.0, 1.0, 2.0, 3.0, 'germany', ' France ', 'Spain']
+    genders = [0.0, 1.0, 'Female', 'male', 2.0]
+    actives = [0.0, 1.0, 0.5]
+    balances = [0.0, 1234.5]
+    products = [1.0, 2.0, 2.7]
+    records = []
+    for age, geo, gender, active, balance, nprod in itertools.product(ages, geographies, genders, actives, balances, products):
+        records.append(api_record({
+            'CreditScore': 650.0, 'Age': age, 'Tenure': 3.0, 'Balance': balance, 'NumOfProducts': nprod,
+            'HasCrCard': 1.0, 'IsActiveMember': active, 'EstimatedSalary': 100000.0,
+            'Geography': geo, 'Gender': gender,
+        }))
+    return records
+
+
+def dataframe_path(service: CustomerChurnBankService, record: dict) -> np.ndarray:
+    processed = FeatureEngineerForAPI.run_v2_preprocessing(pd.DataFrame([record]))
+    return service._align_features(processed).to_numpy()
+
+
+def record_path(service: CustomerChurnBankService, record: dict) -> np.ndarray:
+    features = FeatureEngineerForAPI.run_v2_record(record)
+    return service.alignment_plan.transform_records([features], FeatureEngineerForAPI.CATEGORICAL_COLUMNS)
+
+
+def main(n_csv_rows: int, repeat: int):
+    service = CustomerChurnBankService(model_path=MODEL_PATH, model_dir=MODEL_DIR)
+
+    # 1. 一致性檢查：測試 CSV 抽樣 + 邊界情況，逐筆比較兩條路徑的對齊後特徵向量
+    csv_rows = load_test_frame(n_csv_rows).to_dict('records')
+    records = [api_record(row) for row in csv_rows] + edge_case_records()
+    for record in records:
+        expected = dataframe_path(service, record)
+        actual = record_path(service, record)
+        if not np.array_equal(expected, actual, equal_nan=True):
+            raise SystemExit(f"快速路徑與 DataFrame 管道不一致！輸入: {record}\n預期: {expected}\n實際: {actual}")
+    print(f"一致性檢查通過：{len(records)} 筆輸入 (含 {len(records) - len(csv_rows)} 筆邊界情況)")
+
+    # 2. FE + 對齊延遲
+    sample = records[0]
+    df_latency = summarize_latency(time_call(lambda: dataframe_path(service, sample), repeat))
+    record_latency = summarize_latency(time_call(lambda: record_path(service, sample), repeat))
+
+    # 3. 完整 service 呼叫延遲 (含預測與 SHAP)
+    df_full = summarize_latency(time_call(lambda: service.preprocess_and_predict(
+        pd.DataFrame([sample]), FeatureEngineerForAPI.run_v2_preprocessing), repeat))
+    record_full = summarize_latency(time_call(lambda: service.preprocess_and_predict_record(
+        sample, FeatureEngineerForAPI.run_v2_record, FeatureEngineerForAPI.CATEGORICAL_COLUMNS), repeat))
+
+    print(f"{'path':<12}{'FE+align p50 (us)':>20}{'FE+align p99 (us)':>20}{'full p50 (us)':>16}")
+    print(f"{'DataFrame':<12}{df_latency['p50_us']:>20.1f}{df_latency['p99_us']:>20.1f}{df_full['p50_us']:>16.1f}")
+    print(f"{'record':<12}{record_latency['p50_us']:>20.1f}{record_latency['p99_us']:>20.1f}{record_full['p50_us']:>16.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="單筆預測快速路徑一致性與延遲")
+    parser.add_argument("--csv_rows", type=int, default=500, help="從測試 CSV 抽樣的一致性檢查筆數")
+    parser.add_argument("--repeat", type=int, default=1000, help="延遲測試重複次數")
+    args = parser.parse_args()
+
+    main(args.csv_rows, args.repeat)
@@ -0,0 +1,132 @@
+# benchmarks\bench_stream_batch.py
+# /predict_batch 一次性 JSON vs 串流 (?stream=ndjson)：實際啟動 gunicorn，以 chunked 傳輸邊產生邊上傳 CSV，
+# 量測首個結果抵達時間 (從開始上傳起算)、上傳完成時間、總耗時與 worker 峰值 RSS (VmHWM)
+import argparse
+import subprocess
+import threading
+import tempfile
+import socket
+import os
+import sys
+import time
+
+from _common import PROJECT_ROOT, load_test_frame
+from bench_gunicorn_preload import WRAPPER_CONF, free_port
+
+UPLOAD_BLOCK_ROWS = 5000
+
+
+def csv_blocks(n_rows: int):
+    """以測試資料重複產生 n_rows 筆 CSV (每塊 UPLOAD_BLOCK_ROWS 筆)，不在記憶體中保留整個檔案。"""
+    base = load_test_frame()
+    yield base.iloc[:0].to_csv(index=False).encode()
+    sent = 0
+    while sent < n_rows:
+        block = base.iloc[:min(UPLOAD_BLOCK_ROWS, n_rows - sent)].copy()
+        block['id'] = range(sent, sent + len(block))
+        yield block.to_csv(index=False, header=False).encode()
+        sent += len(block)
+
+
+def peak_rss(pid: int) -> int:
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def post_chunked(port: int, path: str, n_rows: int) -> dict:
+    """以原始 socket 送出 chunked 請求；上傳在背景執行緒進行，主執行緒同時讀取回應。"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    timings = {}
+    start = time.perf_counter()
+
+    def upload():
+        sock.sendall((f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: text/csv\r\n"
+                      "Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n").encode())
+        for block in csv_blocks(n_rows):
+            sock.sendall(f"{len(block):x}\r\n".encode() + block + b"\r\n")
+        sock.sendall(b"0\r\n\r\n")
+        timings['upload_done_s'] = time.perf_counter() - start
+
+    uploader = threading.Thread(target=upload, daemon=True)
+    uploader.start()
+
+    received = 0
+    header_end = None
+    buffer = b''
+    while True:
+        data = sock.recv(1 << 16)
+        if not data:
+            break
+        received += len(data)
+        if header_end is None:
+            buffer += data
+            header_end = buffer.find(b"\r\n\r\n")
+            if header_end < 0:
+                header_end = None
+                continue
+            timings['status'] = int(buffer.split(b" ", 2)[1])
+            body = buffer[header_end + 4:]
+            if body.strip():
+                timings['first_result_s'] = time.perf_counter() - start
+        elif 'first_result_s' not in timings:
+            timings['first_result_s'] = time.perf_counter() - start
+    timings['total_s'] = time.perf_counter() - start
+    timings['response_bytes'] = received
+    uploader.join()
+    sock.close()
+    return timings
+
+
+def run(mode: str, n_rows: int, chunk_rows: int) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        ready_file = os.path.join(tmp, 'ready')
+        conf_file = os.path.join(tmp, 'gunicorn_bench.conf.py')
+        with open(conf_file, 'w', encoding='utf-8') as f:
+            f.write(WRAPPER_CONF.format(conf=os.path.join(PROJECT_ROOT, 'gunicorn.conf.py'), ready_file=ready_file))
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app', '-c', conf_file, '--bind', f'127.0.0.1:{port}',
+             '--workers', '1', '--threads', '1'],
+            cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            while not (os.path.exists(ready_file) and open(ready_file).read().strip()):
+                if process.poll() is not None:
+                    raise RuntimeError("gunicorn 啟動失敗")
+                time.sleep(0.05)
+            worker_pid = int(open(ready_file).read().split()[0])
+            idle_rss = peak_rss(worker_pid)
+
+            path = '/api/customer_churn_bank/predict_batch'
+            if mode == 'stream':
+                path += f'?stream=ndjson&chunk_rows={chunk_rows}'
+            result = post_chunked(port, path, n_rows)
+            result['peak_rss'] = peak_rss(worker_pid)
+            result['idle_rss'] = idle_rss
+            return result
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main(sizes: list, chunk_rows: int):
+    print(f"{'mode':<8}{'rows':>10}{'status':>8}{'first result (s)':>18}{'upload done (s)':>17}{'total (s)':>11}"
+          f"{'resp MB':>9}{'peak RSS MB':>13}{'(+ over idle)':>15}")
+    for n_rows in sizes:
+        for mode in ('buffered', 'stream'):
+            r = run(mode, n_rows, chunk_rows)
+            print(f"{mode:<8}{n_rows:>10,}{r.get('status', 0):>8}{r.get('first_result_s', float('nan')):>18.2f}"
+                  f"{r['upload_done_s']:>17.2f}{r['total_s']:>11.2f}{r['response_bytes'] / 1e6:>9.1f}"
+                  f"{r['peak_rss'] / 1e6:>13.1f}{(r['peak_rss'] - r['idle_rss']) / 1e6:>15.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/predict_batch 串流模式的首個結果時間與記憶體")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[50000, 200000, 500000])
+    parser.add_argument("--chunk_rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    main(args.sizes, args.chunk_rows)
@@ -0,0 +1,57 @@
+# benchmarks\bench_tree_inference.py
+# 比較 XGBClassifier.predict_proba 與 NumPy 陣列化樹推論引擎 (native 後端) 的延遲與吞吐量
+import argparse
+import time
+
+import numpy as np
+
+from _common import MODEL_PATH, MODEL_DIR, load_test_frame, time_call, summarize_latency
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI, ensure_required_columns, REQUIRED_RAW_FEATURES
+from services.customer_churn_bank_service import CustomerChurnBankService
+
+
+def main(n_rows: int, single_repeat: int, tolerance: float):
+    service = CustomerChurnBankService(model_path=MODEL_PATH, model_dir=MODEL_DIR, inference_backend='native')
+    engine = service.tree_engine
+
+    # 使用與 API 相同的 FE + 對齊流程產生模型輸入
+    raw_df = ensure_required_columns(load_test_frame(n_rows), REQUIRED_RAW_FEATURES)
+    X_predict = service._align_features(FeatureEngineerForAPI.run_v2_preprocessing(raw_df))
+    X_array = X_predict.to_numpy(dtype=np.float32)
+
+    # 1. 一致性檢查
+    proba_xgb = service.model.predict_proba(X_predict)[:, 1]
+    proba_native = engine.predict_proba(X_array)[:, 1]
+    max_diff = float(np.abs(proba_xgb - proba_native).max())
+    print(f"樹數量: {engine.num_trees}，最大深度: {engine.max_depth}，資料筆數: {len(X_array)}")
+    print(f"predict_proba 最大絕對誤差: {max_diff:.3e} (容許值 {tolerance:.0e})")
+    if max_diff > tolerance:
+        raise SystemExit("native 後端與 XGBoost 結果不一致！")
+
+    # 2. 單筆延遲 (模擬 /predict)
+    single_df = X_predict.iloc[[0]]
+    single_array = X_array[:1]
+    xgb_single = summarize_latency(time_call(lambda: service.model.predict_proba(single_df), single_repeat))
+    native_single = summarize_latency(time_call(lambda: engine.predict_proba(single_array), single_repeat))
+
+    # 3. 批次吞吐量 (模擬 /predict_batch)
+    start = time.perf_counter()
+    service.model.predict_proba(X_predict)
+    xgb_batch = len(X_array) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    engine.predict_proba(X_array)
+    native_batch = len(X_array) / (time.perf_counter() - start)
+
+    print(f"{'backend':<10}{'single p50 (us)':>18}{'single p99 (us)':>18}{'batch rows/sec':>18}")
+    print(f"{'xgboost':<10}{xgb_single['p50_us']:>18.1f}{xgb_single['p99_us']:>18.1f}{xgb_batch:>18,.0f}")
+    print(f"{'native':<10}{native_single['p50_us']:>18.1f}{native_single['p99_us']:>18.1f}{native_batch:>18,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="樹推論引擎效能比較")
+    parser.add_argument("--rows", type=int, default=100000, help="批次測試資料筆數 (由測試 CSV 重複抽樣)")
+    parser.add_argument("--single_repeat", type=int, default=2000, help="單筆延遲測試重複次數")
+    parser.add_argument("--tolerance", type=float, default=1e-5, help="機率一致性容許誤差")
+    args = parser.parse_args()
+
+    main(args.rows, args.single_repeat, args.tolerance)
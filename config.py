@@ -17,6 +17,99 @@ class Config:
         'customer_churn_bank_model.joblib'
     )
 
+    # 版本化模型工件包 (UBJSON Booster + manifest 校驗碼 + 可 mmap 的樹陣列)；目錄不存在時退回上面的 joblib 工件。
+    # 設為空字串可強制使用 joblib
+    MODEL_BUNDLE_DIR = os.environ.get('CHURN_MODEL_BUNDLE_DIR', os.path.join(
+        BASE_DIR,
+        'projects',
+        'customer_churn_bank_code',
+        'model_bundle'
+    ))
+
+    # 模型熱抽換：每 CHURN_MODEL_WATCH_INTERVAL 秒檢查模型工件 (mtime/大小)，變更時於背景載入、canary 驗證後原子抽換
+    # (預設 0 = 不監看)；POST /admin/reload 需以 X-Admin-Token 標頭提供 CHURN_ADMIN_TOKEN (未設定時停用)
+    MODEL_WATCH_INTERVAL_SECONDS = float(os.environ.get('CHURN_MODEL_WATCH_INTERVAL', '0'))
+    ADMIN_TOKEN = os.environ.get('CHURN_ADMIN_TOKEN', '')
+    MODEL_RELOAD_TIMEOUT_SECONDS = float(os.environ.get('CHURN_MODEL_RELOAD_TIMEOUT', '120'))
+    # 啟動時的 canary 預測延後到 fork 之後 (gunicorn.conf.py 在 preload_app 時設定)：master 不執行預測
+    DEFER_STARTUP_CANARY = os.environ.get('CHURN_DEFER_CANARY', '0') == '1'
+    # /admin/reload 將重新載入世代寫入此共用檔案，每個 gunicorn worker 每 CHURN_MODEL_RELOAD_SIGNAL_INTERVAL 秒檢查一次
+    # 並各自重新載入 (只在設定 CHURN_ADMIN_TOKEN 時啟用)
+    MODEL_RELOAD_SIGNAL_FILE = os.environ.get('CHURN_MODEL_RELOAD_SIGNAL_FILE',
+                                              os.path.join(BASE_DIR, 'model_reload', 'generation'))
+    MODEL_RELOAD_SIGNAL_INTERVAL_SECONDS = float(os.environ.get('CHURN_MODEL_RELOAD_SIGNAL_INTERVAL', '1'))
+
+    # 推論後端：'xgboost' (預設，XGBClassifier.predict_proba) 或 'native' (NumPy 陣列化樹推論)
+    INFERENCE_BACKEND = os.environ.get('CHURN_INFERENCE_BACKEND', 'xgboost')
+
+    # SHAP 解釋後端：'shap' (預設，shap.TreeExplainer)、'native' (Booster pred_contribs，不匯入 shap)
+    # 或 'native_approx' (approx_contribs 近似值)
+    EXPLAINER_BACKEND = os.environ.get('CHURN_EXPLAINER_BACKEND', 'shap')
+
+    # 單筆 /predict 微批次合併 (預設關閉)：在時間窗內累積併發請求後一次完成 FE、預測與 SHAP
+    MICRO_BATCH_ENABLED = os.environ.get('CHURN_MICRO_BATCH', '0') == '1'
+    MICRO_BATCH_MAX_SIZE = int(os.environ.get('CHURN_MICRO_BATCH_MAX_SIZE', '64'))
+    MICRO_BATCH_MAX_WAIT_MS = float(os.environ.get('CHURN_MICRO_BATCH_MAX_WAIT_MS', '2'))
+    # 單筆請求等待微批次結果的上限 (秒)，逾時回應錯誤而不是無限期佔用 worker 執行緒
+    MICRO_BATCH_SUBMIT_TIMEOUT = float(os.environ.get('CHURN_MICRO_BATCH_SUBMIT_TIMEOUT', '30'))
+
+    # 單筆 /predict 結果快取 (LRU + TTL，預設關閉)：相同輸入重送時重用機率、SHAP 與已繪製圖表；設為正數 (例如 1024) 啟用
+    PREDICTION_CACHE_SIZE = int(os.environ.get('CHURN_PREDICTION_CACHE_SIZE', '0'))
+    PREDICTION_CACHE_TTL_SECONDS = float(os.environ.get('CHURN_PREDICTION_CACHE_TTL', '600'))
+
+    # 非同步圖表繪製 (預設關閉；啟用時可以 /predict?async_chart=0 逐次改回同步繪製)：/predict 先回傳機率與 SHAP，
+    # 局部 SHAP 圖在背景執行緒池繪製後寫入 CHURN_CHART_STORE_DIR (所有 worker 共用)，前端再從 /chart/<id> 取得
+    ASYNC_CHART_ENABLED = os.environ.get('CHURN_ASYNC_CHART', '0') == '1'
+    CHART_STORE_DIR = os.environ.get('CHURN_CHART_STORE_DIR', os.path.join(BASE_DIR, 'chart_store'))
+    CHART_RENDER_WORKERS = int(os.environ.get('CHURN_CHART_RENDER_WORKERS', '2'))
+    CHART_STORE_TTL_SECONDS = float(os.environ.get('CHURN_CHART_STORE_TTL', '120'))
+    CHART_STORE_MAX_ENTRIES = int(os.environ.get('CHURN_CHART_STORE_MAX_ENTRIES', '512'))
+    CHART_FETCH_WAIT_SECONDS = float(os.environ.get('CHURN_CHART_FETCH_WAIT', '10'))
+
+    # /predict_batch?stream=ndjson|csv 串流模式下每個區塊的筆數 (亦可以 ?chunk_rows= 逐次指定)
+    BATCH_STREAM_CHUNK_ROWS = int(os.environ.get('CHURN_BATCH_STREAM_CHUNK_ROWS', '5000'))
+
+    # 批次 CSV 的解析引擎：'c' (pandas 內建，預設) 或 'pyarrow' (多執行緒，需安裝 pyarrow；未安裝時退回 'c')。
+    # 只用於一次性的整份檔案解析，串流與批次工作的分塊讀取固定使用 'c'
+    BATCH_CSV_ENGINE = os.environ.get('CHURN_BATCH_CSV_ENGINE', 'c').lower()
+
+    # /predict_batch?mode=job 非同步批次工作：上傳內容、進度與結果保存在 CHURN_BATCH_JOB_DIR (worker 重啟後仍可查詢，
+    # 未完成的工作由其他 worker 接手重跑)。每個 gunicorn worker 最多 CHURN_BATCH_JOB_WORKERS 個評分子行程，
+    # 子行程以 nice CHURN_BATCH_JOB_NICE 與 CHURN_BATCH_JOB_THREADS 個 OpenMP 執行緒執行，避免拖慢即時 /predict
+    BATCH_JOB_DIR = os.environ.get('CHURN_BATCH_JOB_DIR', os.path.join(BASE_DIR, 'batch_jobs'))
+    BATCH_JOB_WORKERS = int(os.environ.get('CHURN_BATCH_JOB_WORKERS', '1'))
+    BATCH_JOB_MAX_PENDING = int(os.environ.get('CHURN_BATCH_JOB_MAX_PENDING', '8'))
+    BATCH_JOB_NICE = int(os.environ.get('CHURN_BATCH_JOB_NICE', '10'))
+    BATCH_JOB_THREADS = int(os.environ.get('CHURN_BATCH_JOB_THREADS', '1'))
+    BATCH_JOB_TTL_SECONDS = float(os.environ.get('CHURN_BATCH_JOB_TTL', '86400'))
+
+    # 大型批次的多核心分片評分：筆數 >= CHURN_BATCH_PARALLEL_MIN_ROWS 時，對齊後的特徵矩陣放入共享記憶體，
+    # 由 CHURN_BATCH_PARALLEL_WORKERS 個子行程分片完成預測、SHAP 與 ROI (預設 0 = 關閉；每個子行程各自載入一份模型)
+    BATCH_PARALLEL_WORKERS = int(os.environ.get('CHURN_BATCH_PARALLEL_WORKERS', '0'))
+    BATCH_PARALLEL_MIN_ROWS = int(os.environ.get('CHURN_BATCH_PARALLEL_MIN_ROWS', '50000'))
+
+    # /predict_batch?paginate=1：評分結果保存在伺服器端 (CHURN_BATCH_RESULT_DIR，所有 worker 共用、查詢時以 mmap 開啟)，
+    # 回應只帶 result_id 與第一頁，之後由 /batch_results/<result_id> 在伺服器端排序、篩選與分頁。
+    # 每份結果保存 CHURN_BATCH_RESULT_TTL 秒，總量超過 CHURN_BATCH_RESULT_MAX_MB 或 CHURN_BATCH_RESULT_MAX_ENTRIES 份時淘汰最舊的
+    BATCH_RESULT_DIR = os.environ.get('CHURN_BATCH_RESULT_DIR', os.path.join(BASE_DIR, 'batch_results'))
+    BATCH_RESULT_TTL_SECONDS = float(os.environ.get('CHURN_BATCH_RESULT_TTL', '1800'))
+    BATCH_RESULT_MAX_BYTES = int(float(os.environ.get('CHURN_BATCH_RESULT_MAX_MB', '512')) * 1024 * 1024)
+    BATCH_RESULT_MAX_ENTRIES = int(os.environ.get('CHURN_BATCH_RESULT_MAX_ENTRIES', '32'))
+    BATCH_RESULT_MAX_PAGE_SIZE = int(os.environ.get('CHURN_BATCH_RESULT_MAX_PAGE_SIZE', '1000'))
+
+    # POST /batch_results/<result_id>/roi_sweep：以保存的機率試算業務參數網格的 ROI 曲面。
+    # 上限為總情境數，以及 LTV 相關參數 (nim_rate、product_profit、active_card_profit、l_max) 的組合數
+    # (每組需掃描一次所有客戶；挽留成本 / 成功率的組合幾乎不增加耗時)
+    ROI_SWEEP_MAX_SCENARIOS = int(os.environ.get('CHURN_ROI_SWEEP_MAX_SCENARIOS', '10000'))
+    ROI_SWEEP_MAX_PROFILES = int(os.environ.get('CHURN_ROI_SWEEP_MAX_PROFILES', '64'))
+    # POST /batch_results/<result_id>/targets：固定預算挽留名單一次最多回傳的客戶數
+    TARGETING_MAX_CONTACTS = int(os.environ.get('CHURN_TARGETING_MAX_CONTACTS', '100000'))
+    # 批次回應的風險分布彙總 (risk_summary)：各客群回報機率 >= 這些門檻的人數 (以逗號分隔)，
+    # 以及每個客群維度 (Geography、Gender、Age_bin) 最多列出的客群數 (其餘合併為 __other__)
+    RISK_SUMMARY_THRESHOLDS = [float(value) for value in
+                               os.environ.get('CHURN_RISK_SUMMARY_THRESHOLDS', '0.3,0.5,0.7').split(',') if value.strip()]
+    RISK_SUMMARY_MAX_GROUPS = int(os.environ.get('CHURN_RISK_SUMMARY_MAX_GROUPS', '32'))
+
 class DevelopmentConfig(Config):
     DEBUG = True
 
@@ -0,0 +1,33 @@
+# gunicorn.conf.py
+# Gunicorn 設定 (gunicorn 會自動讀取工作目錄下的此檔案；命令列參數可覆寫這裡的值)
+#
+# preload_app (預設開啟，CHURN_PRELOAD_APP=0 可關閉)：
+#   master 匯入 app 時一次載入模型、SHAP Explainer、Matplotlib 與全局 SHAP 圖，
+#   fork 出的 worker 以寫入時複製 (copy-on-write) 共用這些唯讀記憶體頁面，不再各自載入。
+#   不能跨 fork 的狀態 (背景執行緒、鎖) 由 post_fork 掛鉤在每個 worker 內重建。
+#   注意：master 在 fork 前不執行任何預測，避免 XGBoost 的 OpenMP 執行緒池在 fork 前被初始化；
+#   因此 preload 時 (CHURN_DEFER_CANARY=1) 啟動 canary 延後到每個 worker 的 post_fork 才執行。
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8080')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '300'))
+preload_app = os.environ.get('CHURN_PRELOAD_APP', '1') == '1'
+if preload_app:
+    os.environ.setdefault('CHURN_DEFER_CANARY', '1')
+
+
+def when_ready(server):
+    """master 已載入 app、即將 fork worker：凍結目前所有物件，worker 的 GC 不再寫入這些共用頁面。"""
+    if server.cfg.preload_app:
+        gc.freeze()
+        server.log.info(f"preload_app: 已凍結 {gc.get_freeze_count()} 個物件，worker 將以寫入時複製方式共用模型。")
+
+
+def post_fork(server, worker):
+    """在每個 worker 內重建背景執行緒與鎖並執行延後的啟動 canary (只有 preload 模式下 master 才會先匯入 routes)。"""
+    if server.cfg.preload_app:
+        from routes.customer_churn_bank_routes import reinit_after_fork
+        reinit_after_fork()
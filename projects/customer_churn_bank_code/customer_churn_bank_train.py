@@ -6,6 +6,7 @@ import warnings
 import argparse
 import sys
 import os 
+import shutil
 from typing import Any, Callable, Tuple, Dict, List
 import joblib 
 import logging
@@ -34,6 +35,12 @@ except ImportError as e:
     logger.error(f"錯誤: 缺少必要的庫。請執行 pip install numpy pandas xgboost optuna scikit-learn shap: {e}")
     sys.exit(1)
 
+# 與服務共用的模型工件工具 (Booster 切片、版本化工件包) 位於專案根目錄的 services/
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from services.model_bundle import trim_to_best_iteration, write_model_bundle
+
 
 # --- 配置 ---
 class Config:
@@ -192,7 +199,7 @@ class HyperparameterTuner:
                 model.fit(X_tr, y_tr, **fit_params)
 
                 best_iteration = model.get_booster().best_iteration
-                proba_val = model.predict_proba(X_val, iteration_range=(0, best_iteration))[:, 1]
+                proba_val = model.predict_proba(X_val, iteration_range=(0, best_iteration + 1))[:, 1]
                 roc_auc_scores.append(roc_auc_score(y_val, proba_val))
             except Exception as e:
                 logger.error(f"Optuna Fold {fold} 訓練錯誤: {e}")
@@ -353,8 +360,8 @@ class ModelTrainer:
                         current_model.fit(X_tr, y_tr, **fit_params)
 
                         best_iteration = current_model.get_booster().best_iteration
-                        proba_val = current_model.predict_proba(X_val, iteration_range=(0, best_iteration))[:, 1]
-                        proba_test = current_model.predict_proba(X_test, iteration_range=(0, best_iteration))[:, 1]
+                        proba_val = current_model.predict_proba(X_val, iteration_range=(0, best_iteration + 1))[:, 1]
+                        proba_test = current_model.predict_proba(X_test, iteration_range=(0, best_iteration + 1))[:, 1]
                     else:
                         current_model.fit(X_tr, y_tr)
                         proba_val = current_model.predict_proba(X_val)[:, 1]
@@ -461,17 +468,21 @@ class ModelTrainer:
                     fixed_model.set_params(base_score=0.5)
                 
                 
-                # 4. 檢查並修正特徵名稱 (防止 Pylance 警告並確保兼容性)
+                # 4. 依 Early Stopping 的 best_iteration 切片 Booster，只保存實際使用的樹
+                #    (best_iteration 之後的 early_stopping_rounds 輪不會被 predict_proba 使用，保存只會增加載入與 SHAP 成本)
+                fixed_model, _ = trim_to_best_iteration(fixed_model)
+
+                # 5. 檢查並修正特徵名稱 (防止 Pylance 警告並確保兼容性)
                 if fixed_model.feature_names_in_ is not None:
                     # 將特徵名稱保存到底層 Booster 屬性中，而不是嘗試修改 scikit-learn 的只讀屬性
                     feature_names_str = ",".join([str(f) for f in fixed_model.feature_names_in_])
                     fixed_model.get_booster().set_attr(feature_names=feature_names_str)
 
 
-                # 5. 使用 joblib 保存這個「已修復元數據」的模型
+                # 6. 使用 joblib 保存這個「已修復元數據」的模型
                 joblib.dump(fixed_model, full_model_path)
                 
-                # 6. 刪除臨時文件
+                # 7. 刪除臨時文件
                 if os.path.exists(temp_model_json_path):
                     os.remove(temp_model_json_path)
                     
@@ -605,6 +616,20 @@ def main(train_file: str, test_file: str, tune: bool, n_trials: int):
     joblib.dump(feature_cols, feature_list_path) 
     logger.info(f"特徵欄位列表成功保存至: {feature_list_path}")
 
+    # 額外輸出版本化模型工件包 (服務優先載入；UBJSON Booster + 校驗碼 + 預先攤平的樹陣列)
+    # 先刪除舊的工件包：寫入失敗時不會留下與新 joblib 模型不一致的舊版本，並讓訓練直接失敗
+    bundle_dir = os.path.join(Config.MODEL_DIR, 'model_bundle')
+    model_path = os.path.join(Config.MODEL_DIR, 'customer_churn_bank_model.joblib')
+    try:
+        shutil.rmtree(bundle_dir, ignore_errors=True)
+        write_model_bundle(joblib.load(model_path), feature_cols, FE_PIPELINE_NAME, bundle_dir,
+                           source_model_path=model_path)
+        logger.info(f"模型工件包成功保存至: {bundle_dir}")
+    except Exception as e:
+        logger.error(f"保存模型工件包時發生錯誤: {e}")
+        shutil.rmtree(bundle_dir, ignore_errors=True)
+        raise
+
 
 # --- 腳本入口點 ---
 if __name__ == "__main__":
@@ -5,15 +5,33 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import logging
+import threading
 import base64
-import shap
+import hmac
 import sys
 import os
+import json
+import time
 import io
 
-from flask import Blueprint, jsonify, request, send_file, make_response
+from flask import Blueprint, Response, jsonify, request, send_file, make_response, url_for, stream_with_context
 from services.customer_churn_bank_service import CustomerChurnBankService
-from typing import Any, Dict, List, Tuple, Callable
+from services.shap_chart_renderer import CHART_FORMATS, CHART_MIME_TYPES, render_shap_svg, build_shap_chart_data
+from services.async_chart_store import AsyncChartStore
+from services.static_artifact_store import StaticArtifactStore
+from services.model_registry import ModelRegistry
+from services.parallel_batch_scorer import ParallelBatchScorer
+from services.batch_result_store import BatchResultStore, SORT_KEYS, SORT_ORDERS
+from services.batch_input_schema import BatchInputSchema, BatchSchemaError, factorize_column, decode_categorical
+from services.roi_kernel import (RoiInputs, PortfolioStats, DEFAULT_ROI_PARAMS, ROI_SURFACE_METRICS, build_parameter_grid,
+                                 calculate_roi_surface)
+from services.risk_distribution import RiskSummary
+from services.retention_targeting import DEFAULT_CHUNK_ROWS, DEFAULT_CURVE_POINTS, contact_limit, plan_retention_targets
+from services.batch_result_encoder import (ResultFormatUnavailable, negotiate_result_format, ensure_format_available,
+                                           encode_batch_result, truncate_decimals)
+from services.batch_job_store import (BatchJobStore, JobAttemptSuperseded, INPUT_FILE, RESULT_FILE, read_status,
+                                      update_status, partial_result_path)
+from typing import Any, Dict, List, Optional, Tuple, Callable
 from werkzeug.exceptions import BadRequest
 from config import Config
 
@@ -32,6 +50,7 @@ logger.info("Matplotlib font cache cleanup logic has been removed for stability.
 
 # --- Matplotlib 全局設定 ---
 plt.rcParams['axes.unicode_minus'] = False # 確保負號正常顯示
+_PYPLOT_LOCK = threading.Lock()
 
 # --- 模型與資源路徑定義 ---
 # 直接從 Config 類別中獲取已計算好的絕對路徑
@@ -66,42 +85,64 @@ def ensure_required_columns(df: pd.DataFrame, required_cols: List[str]) -> pd.Da
     
     【注意】: 核心欄位 ('id' 和 REQUIRED_PREDICT_COLUMNS) 的缺失性檢查已在 predict_batch 中完成，
     一旦發現缺失會立即拋出錯誤，不會進入這裡。
+
+    為避免大型上傳時複製整份資料，這裡直接在傳入的 DataFrame 上補齊欄位 (呼叫端擁有該 DataFrame)，
+    並回傳同一個物件。
     """
-    df_copy = df.copy()
-    
     # 這裡只專注於處理非核心但可能需要的欄位 (CustomerId, RowNumber, Surname)
     auxiliary_cols = [col for col in required_cols if col not in CRITICAL_COLUMNS]
-    missing_auxiliary_cols = set(auxiliary_cols) - set(df_copy.columns)
+    missing_auxiliary_cols = set(auxiliary_cols) - set(df.columns)
     
     # 處理 'id' 欄位（雖然在路由層已檢查，這裡為保險起見再確保處理類型）
     # 確保 'id' 已經存在且類型正確 (此時不應有 NaN)
-    if 'id' in df_copy.columns:
-        df_copy['id'] = pd.to_numeric(df_copy['id'], errors='coerce').fillna(0).astype(int)
+    # (由 BATCH_INPUT_SCHEMA 解析的 id 已是 float64，不需再經 pd.to_numeric)
+    if 'id' in df.columns:
+        ids = df['id'] if pd.api.types.is_numeric_dtype(df['id']) else pd.to_numeric(df['id'], errors='coerce')
+        df['id'] = ids.fillna(0).astype(int)
     
     if missing_auxiliary_cols:
         logger.warning(f"CSV 檔案中缺少 {len(missing_auxiliary_cols)} 個輔助欄位，已自動補齊: {missing_auxiliary_cols}")
         
-        sequential_id = df_copy.index.to_series() + 1
+        sequential_id = df.index.to_numpy() + 1
         
         for col in missing_auxiliary_cols:
             
             if col in ['CustomerId', 'RowNumber']:
-                df_copy[col] = sequential_id
+                df[col] = sequential_id
                 
             elif col == 'Surname':
-                df_copy[col] = ''
+                df[col] = ''
                 
         # 確保這些輔助 ID 欄位也是整數
         for id_col in ['CustomerId', 'RowNumber']:
-            if id_col in df_copy.columns:
-                df_copy[id_col] = pd.to_numeric(df_copy[id_col], errors='coerce').fillna(0).astype(int)
+            if id_col in df.columns:
+                df[id_col] = pd.to_numeric(df[id_col], errors='coerce').fillna(0).astype(int)
 
-    return df_copy
+    return df
 
 
 # --- 特徵工程類別 (保持不變) ---
 class FeatureEngineerForAPI:
     """用於單一或批次預測前，進行數據清洗和特徵轉換的類別。"""
+    # FE 輸出中以類別 (category) 型態提供、需在對齊時 One-Hot 展開的欄位
+    CATEGORICAL_COLUMNS = ('Geography', 'Age_bin', 'Gender')
+
+    # Age 分箱設定 (左閉右開)，DataFrame 與單筆快速路徑共用
+    AGE_BINS = [0, 25, 35, 45, 60, np.inf]
+    AGE_LABELS = ['very_young', 'young', 'mid', 'mature', 'senior']
+
+    GEOGRAPHY_CODE_MAP = {0: 'France', 1: 'Spain', 2: 'Germany'}
+
+    @staticmethod
+    def convert_gender(val: Any) -> int:
+        """將 Gender 的各種表示法 (0/1、'Male'/'Female') 統一為 0 (Male) / 1 (Female)。"""
+        s = str(val).strip().lower()
+        if s in ['1', '1.0', 'female']:
+            return 1
+        elif s in ['0', '0.0', 'male']:
+            return 0
+        return 0 # 預設為 Male
+
     @staticmethod
     def cast_columns(df: pd.DataFrame, int_cols: Any = None, cat_cols: Any = None) -> pd.DataFrame:
         """將指定欄位轉換為整數 (int) 或類別 (category) 類型，處理缺失值為 0。"""
@@ -110,7 +151,10 @@ class FeatureEngineerForAPI:
             for col in int_cols:
                 if col in df_copy.columns:
                     # 這裡假設輸入數據已經過 NaN 檢查，所以 fillna(0) 處理的是強制轉換引起的錯誤
-                    df_copy[col] = pd.to_numeric(df_copy[col], errors='coerce').fillna(0).astype(int)
+                    values = df_copy[col]
+                    if not pd.api.types.is_numeric_dtype(values):
+                        values = pd.to_numeric(values, errors='coerce')
+                    df_copy[col] = values.fillna(0).astype(int)
         if cat_cols:
             for col in cat_cols:
                 if col in df_copy.columns:
@@ -123,27 +167,18 @@ class FeatureEngineerForAPI:
         df_copy = df.copy()
         
         # --- 1. 統一 Gender 轉換邏輯 ---
-        def convert_gender(val):
-            s = str(val).strip().lower()
-            if s in ['1', '1.0', 'female']:
-                return 1
-            elif s in ['0', '0.0', 'male']:
-                return 0
-            return 0 # 預設為 Male
-
-        df_copy['Gender'] = df_copy['Gender'].apply(convert_gender).astype(int)
+        df_copy['Gender'] = df_copy['Gender'].apply(FeatureEngineerForAPI.convert_gender).astype(int)
 
         # --- 2. 修正 Geography 處理 ---
         if df_copy['Geography'].dtype in ['int64', 'float64']:
-            geo_map = {0: 'France', 1: 'Spain', 2: 'Germany'}
-            df_copy['Geography'] = df_copy['Geography'].replace(geo_map)
+            df_copy['Geography'] = df_copy['Geography'].replace(FeatureEngineerForAPI.GEOGRAPHY_CODE_MAP)
         else:
             df_copy['Geography'] = df_copy['Geography'].astype(str).str.strip().str.capitalize()
 
         # --- 3. 衍生特徵計算 (在轉成 Category 之前計算數值邏輯) ---
         # Age 分箱
-        df_copy['Age_bin'] = pd.cut(df_copy['Age'], bins=[0, 25, 35, 45, 60, np.inf],
-                                     labels=['very_young', 'young', 'mid', 'mature', 'senior'],
+        df_copy['Age_bin'] = pd.cut(df_copy['Age'], bins=FeatureEngineerForAPI.AGE_BINS,
+                                     labels=FeatureEngineerForAPI.AGE_LABELS,
                                      right=False)
         
         # 是否擁有 2 個產品
@@ -164,7 +199,7 @@ class FeatureEngineerForAPI:
         # --- 4. 統一轉換類型 (最後再轉 Category) ---
         int_cols = ['HasCrCard', 'IsActiveMember', 'NumOfProducts', 'Is_two_products',
                     'Has_Zero_Balance', 'Germany_Female', 'Germany_Inactive']
-        cat_cols = ['Geography', 'Age_bin', 'Gender']
+        cat_cols = list(FeatureEngineerForAPI.CATEGORICAL_COLUMNS)
         
         df_copy = FeatureEngineerForAPI.cast_columns(df_copy, int_cols=int_cols, cat_cols=cat_cols)
 
@@ -184,6 +219,130 @@ class FeatureEngineerForAPI:
         ).astype(int)
         return df_copy
 
+    @staticmethod
+    def _normalize_geography(values: pd.Series) -> pd.Categorical:
+        """
+        向量化的 Geography 正規化：只對不重複值做映射/字串處理，再以類別代碼回填。
+        數值型 (int64/float64，或類別全為數字的 category) 依 GEOGRAPHY_CODE_MAP 映射；
+        其他型態做 strip + capitalize (NaN 視為 'nan')。
+        """
+        codes, uniques = factorize_column(values)
+        if uniques.dtype.name in ('int64', 'float64'):
+            normalized = [FeatureEngineerForAPI.GEOGRAPHY_CODE_MAP.get(u, u) for u in uniques]
+            # 數值型的缺失值維持缺失 (category 代碼 -1)
+            category_codes, categories = pd.factorize(pd.Index(normalized, dtype=object))
+            lut = np.append(category_codes, -1)
+        else:
+            normalized = [str(u).strip().capitalize() for u in uniques] + [str(np.nan).capitalize()]
+            category_codes, categories = pd.factorize(pd.Index(normalized, dtype=object))
+            lut = category_codes
+        return pd.Categorical.from_codes(lut[codes], categories=categories)
+
+    @staticmethod
+    def run_v2_batch(df: pd.DataFrame) -> Dict[str, Any]:
+        """
+        批次預測用的零複製 FE：產生與 run_v2_preprocessing 相同的特徵，但不複製輸入 DataFrame。
+
+        - 未變動的欄位直接引用原始 Series (不複製)，衍生欄位以新的 NumPy 陣列寫入。
+        - Gender / Geography 只對不重複值做轉換，再以類別代碼向量化回填，取代逐列 .apply
+          (BATCH_INPUT_SCHEMA 解析出的 category 欄位直接使用其類別代碼)。
+        - 回傳 {欄位: 陣列} 映射，可直接交給 FeatureAlignmentPlan.transform 寫入特徵矩陣。
+        """
+        features: Dict[str, Any] = {}
+        for col in df.columns:
+            if col not in ('CustomerId', 'Tenure', 'Surname', 'RowNumber'):
+                features[col] = df[col]
+
+        # --- 1. Gender：對不重複值套用 convert_gender 後以代碼回填 (缺失值視為 Male) ---
+        gender_codes, gender_uniques = factorize_column(df['Gender'])
+        gender_lut = np.array([FeatureEngineerForAPI.convert_gender(u) for u in gender_uniques] + [0], dtype=np.int8)
+        gender = gender_lut[gender_codes]
+
+        # --- 2. Geography ---
+        geography = FeatureEngineerForAPI._normalize_geography(df['Geography'])
+        is_germany = np.asarray(geography == 'Germany')
+
+        # --- 3. 衍生特徵 (轉型前的數值計算) ---
+        age = df['Age'].to_numpy()
+        is_active_raw = df['IsActiveMember'].to_numpy()
+        features['Age_bin'] = pd.cut(age, bins=FeatureEngineerForAPI.AGE_BINS,
+                                     labels=FeatureEngineerForAPI.AGE_LABELS, right=False)
+        features['Is_two_products'] = (df['NumOfProducts'].to_numpy() == 2).astype(np.int8)
+        features['Germany_Female'] = (is_germany & (gender == 1)).astype(np.int8)
+        features['Germany_Inactive'] = (is_germany & (is_active_raw == 0)).astype(np.int8)
+        has_zero_balance = df['Balance'].to_numpy() == 0
+        features['Has_Zero_Balance'] = has_zero_balance.astype(np.int8)
+        features['Tenure_log'] = np.log1p(df['Tenure'].to_numpy(dtype=np.float64))
+
+        # --- 4. 整數欄位轉型 (與 cast_columns 相同) 與類別欄位 ---
+        for col in ['HasCrCard', 'IsActiveMember', 'NumOfProducts']:
+            values = df[col] if pd.api.types.is_numeric_dtype(df[col]) else pd.to_numeric(df[col], errors='coerce')
+            features[col] = values.fillna(0).to_numpy().astype(np.int64)
+        features['Gender'] = pd.Categorical.from_codes(gender, categories=[0, 1])
+        features['Geography'] = geography
+
+        # --- 5. V2 互動特徵 ---
+        features['is_mature_inactive_transit'] = (
+            has_zero_balance & (features['IsActiveMember'] == 0) & (age > 40)
+        ).astype(np.int8)
+        return features
+
+    @staticmethod
+    def run_v2_record(record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        單筆請求的快速路徑：直接從 dict 計算與 run_v2_preprocessing 相同的特徵，不建立 DataFrame。
+
+        每一步的順序與 DataFrame 版本一致 (衍生特徵以轉型前的數值計算，
+        is_mature_inactive_transit 則使用轉型後的 IsActiveMember)，以確保結果逐位相同。
+        回傳的 dict 中，CATEGORICAL_COLUMNS 內的欄位為類別值，其餘為數值。
+        """
+        features = dict(record)
+
+        # --- 1. Gender / Geography 正規化 ---
+        gender = FeatureEngineerForAPI.convert_gender(features['Gender'])
+        geography = features['Geography']
+        if isinstance(geography, (int, float, np.number)) and not isinstance(geography, bool):
+            geography = FeatureEngineerForAPI.GEOGRAPHY_CODE_MAP.get(geography, geography)
+        else:
+            geography = str(geography).strip().capitalize()
+        features['Gender'] = gender
+        features['Geography'] = geography
+
+        # --- 2. 衍生特徵 (轉型前計算) ---
+        age = float(features['Age'])
+        age_bin = None
+        if 0 <= age < np.inf:
+            for upper, label in zip(FeatureEngineerForAPI.AGE_BINS[1:], FeatureEngineerForAPI.AGE_LABELS):
+                if age < upper:
+                    age_bin = label
+                    break
+        features['Age_bin'] = age_bin
+
+        is_germany = geography == 'Germany'
+        features['Is_two_products'] = int(features['NumOfProducts'] == 2)
+        features['Germany_Female'] = int(is_germany and gender == 1)
+        features['Germany_Inactive'] = int(is_germany and features['IsActiveMember'] == 0)
+        features['Has_Zero_Balance'] = int(features['Balance'] == 0)
+        features['Tenure_log'] = float(np.log1p(float(features['Tenure'])))
+
+        # --- 3. 整數欄位轉型 (與 cast_columns 相同：無法轉換或缺失值視為 0，小數無條件捨去) ---
+        for col in ['HasCrCard', 'IsActiveMember', 'NumOfProducts']:
+            try:
+                value = float(features[col])
+            except (TypeError, ValueError):
+                value = np.nan
+            features[col] = int(value) if np.isfinite(value) else 0
+
+        # --- 4. 移除不必要的欄位 ---
+        for col in ['CustomerId', 'Tenure', 'Surname', 'RowNumber']:
+            features.pop(col, None)
+
+        # --- 5. V2 互動特徵 ---
+        features['is_mature_inactive_transit'] = int(
+            features['Has_Zero_Balance'] == 1 and features['IsActiveMember'] == 0 and age > 40
+        )
+        return features
+
 # --- 圖表生成輔助函式 (保持不變) ---
 def generate_local_shap_chart(shap_data: Dict[str, float], title: str) -> str:
     """
@@ -204,22 +363,24 @@ def generate_local_shap_chart(shap_data: Dict[str, float], title: str) -> str:
         # 顏色設置：紅色推高流失，綠色推低流失
         colors = ['#EF5350' if imp > 0 else '#66BB6A' for imp in importances]
         
-        plt.style.use('seaborn-v0_8-whitegrid')
+        # pyplot 的全域狀態非執行緒安全：請求執行緒與背景繪圖執行緒需序列化
+        with _PYPLOT_LOCK:
+            plt.style.use('seaborn-v0_8-whitegrid')
         
-        fig, ax = plt.subplots(figsize=(10, len(features) * 0.7 + 1))
+            fig, ax = plt.subplots(figsize=(10, len(features) * 0.7 + 1))
         
-        ax.barh(features, importances, color=colors)
+            ax.barh(features, importances, color=colors)
         
-        ax.axvline(0, color='grey', linestyle='--', linewidth=0.8)
+            ax.axvline(0, color='grey', linestyle='--', linewidth=0.8)
 
-        ax.set_xlabel("SHAP Impact (Positive Pushes for Churn / Negative Against)")
-        ax.set_title(title, fontsize=10)
-        ax.invert_yaxis()
+            ax.set_xlabel("SHAP Impact (Positive Pushes for Churn / Negative Against)")
+            ax.set_title(title, fontsize=10)
+            ax.invert_yaxis()
 
-        # 轉換為 Base64
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight')
-        plt.close(fig)
+            # 轉換為 Base64
+            buf = io.BytesIO()
+            plt.savefig(buf, format='png', bbox_inches='tight')
+            plt.close(fig)
         
         return base64.b64encode(buf.getvalue()).decode('utf-8')
 
@@ -228,9 +389,99 @@ def generate_local_shap_chart(shap_data: Dict[str, float], title: str) -> str:
         return ""
 
 
-# --- Service 實例化與全局資源載入 (保持不變) ---
-CUSTOMER_CHURN_BANK_SERVICE = None
-GLOBAL_SHAP_BASE64 = "" # 用於儲存預先載入的全局 SHAP 圖
+def render_local_shap_chart(chart_format: str, shap_data: Dict[str, float], title: str) -> Any:
+    """依圖表格式繪製局部 SHAP 圖：png (Matplotlib, Base64)、svg (字串模板) 或 json (前端繪圖資料)。"""
+    if chart_format == 'svg':
+        return render_shap_svg(shap_data, title)
+    if chart_format == 'json':
+        return build_shap_chart_data(shap_data, title) if shap_data else None
+    return generate_local_shap_chart(shap_data, title)
+
+
+def build_local_chart_payload(chart_format: str, rendered: Any, title: str) -> Dict[str, Any]:
+    """將已繪製的局部 SHAP 圖包裝成 /predict 回應中 charts 陣列的項目。"""
+    if chart_format == 'svg':
+        return {"type": CHART_MIME_TYPES['svg'], "svg_data": rendered, "title": title}
+    if chart_format == 'json':
+        return {"type": CHART_MIME_TYPES['json'], "chart_data": rendered, "title": title}
+    return {"type": CHART_MIME_TYPES['png'], "base64_data": rendered, "title": title}
+
+
+# --- Service 實例化與全局資源載入 ---
+# 各路由在請求開始時以 MODEL_REGISTRY.current 取得服務實例，模型熱抽換不影響進行中的請求
+MODEL_REGISTRY: ModelRegistry = None
+# 模型靜態工件 (全局 SHAP 圖等)：以內容雜湊 URL 提供，/predict 只回傳 URL
+STATIC_ARTIFACTS = StaticArtifactStore()
+GLOBAL_SHAP_ARTIFACT_NAME = os.path.basename(GLOBAL_SHAP_FILE)
+
+# 非同步局部 SHAP 圖表的背景繪製與短期儲存 (寫入所有 worker 共用的目錄；執行緒在第一次提交時才建立)
+CHART_STORE = AsyncChartStore(
+    root_dir=Config.CHART_STORE_DIR,
+    max_workers=Config.CHART_RENDER_WORKERS,
+    ttl_seconds=Config.CHART_STORE_TTL_SECONDS,
+    max_entries=Config.CHART_STORE_MAX_ENTRIES
+)
+
+# 大型批次的多核心分片評分 (CHURN_BATCH_PARALLEL_WORKERS > 1 時啟用；行程池在第一次使用時建立，跨模型抽換共用)
+PARALLEL_BATCH_SCORER = ParallelBatchScorer(
+    workers=Config.BATCH_PARALLEL_WORKERS,
+    min_rows=Config.BATCH_PARALLEL_MIN_ROWS
+) if Config.BATCH_PARALLEL_WORKERS > 1 else None
+
+# 模型載入後的 canary 預測樣本 (固定輸入，驗證 FE → 對齊 → 預測 → SHAP 整條路徑並完成暖機)
+CANARY_RECORD = {'id': 0, 'CreditScore': 650.0, 'Age': 40.0, 'Tenure': 5.0, 'Balance': 0.0, 'NumOfProducts': 1.0,
+                 'HasCrCard': 1.0, 'IsActiveMember': 1.0, 'EstimatedSalary': 100000.0, 'Geography': 0.0, 'Gender': 0.0}
+
+
+def build_churn_service() -> CustomerChurnBankService:
+    """依 Config 建立模型服務實例 (啟動時與每次熱抽換時呼叫)。"""
+    service = CustomerChurnBankService(
+        model_path=MODEL_PATH_FULL,
+        model_dir=MODEL_DIR,
+        inference_backend=Config.INFERENCE_BACKEND,
+        explainer_backend=Config.EXPLAINER_BACKEND,
+        bundle_dir=Config.MODEL_BUNDLE_DIR
+    )
+    logger.info(f"CustomerChurnBankService 成功初始化 (model_version={service.model_version})。")
+
+    if Config.MICRO_BATCH_ENABLED:
+        service.enable_micro_batching(
+            max_batch_size=Config.MICRO_BATCH_MAX_SIZE,
+            max_wait_ms=Config.MICRO_BATCH_MAX_WAIT_MS,
+            submit_timeout=Config.MICRO_BATCH_SUBMIT_TIMEOUT
+        )
+
+    if PARALLEL_BATCH_SCORER is not None:
+        service.enable_parallel_batch(PARALLEL_BATCH_SCORER)
+
+    if Config.PREDICTION_CACHE_SIZE > 0:
+        service.enable_result_cache(
+            max_entries=Config.PREDICTION_CACHE_SIZE,
+            ttl_seconds=Config.PREDICTION_CACHE_TTL_SECONDS
+        )
+    return service
+
+
+def canary_check(service: CustomerChurnBankService) -> None:
+    """新模型抽換前的 canary 預測：機率需落在 [0, 1] 且 SHAP 值完整，否則拋出例外 (保留舊模型)。"""
+    result = service.predict_records(
+        [(CANARY_RECORD, FeatureEngineerForAPI.run_v2_record, FeatureEngineerForAPI.CATEGORICAL_COLUMNS)]
+    )[0]
+    probability = result.get('probability')
+    if probability is None or not 0.0 <= probability <= 1.0:
+        raise ValueError(f"canary 預測機率異常: {probability}")
+    shap_values = result.get('local_shap_values') or {}
+    if not shap_values or not np.all(np.isfinite(list(shap_values.values()))):
+        raise ValueError("canary 預測的 SHAP 值為空或含非有限值。")
+
+
+def register_global_artifacts(service: CustomerChurnBankService) -> None:
+    """註冊 (或在模型抽換後重新讀取) 離線生成的全局 SHAP 圖表，以內容雜湊 URL 提供。"""
+    if STATIC_ARTIFACTS.register(GLOBAL_SHAP_ARTIFACT_NAME, GLOBAL_SHAP_FILE, 'image/png'):
+        logger.info(f"全局 SHAP 摘要圖 ({GLOBAL_SHAP_ARTIFACT_NAME}) 載入成功。")
+    else:
+        logger.warning(f"全局 SHAP 圖表檔案未找到: {GLOBAL_SHAP_FILE}。無法提供全局解釋圖。")
+
 
 try:
     # 打印路徑信息
@@ -238,20 +489,16 @@ try:
     logger.info(f"模型目錄: {MODEL_DIR}")
     logger.info(f"全局 SHAP 路徑: {GLOBAL_SHAP_FILE}")
 
-    # 1. 初始化模型服務
-    CUSTOMER_CHURN_BANK_SERVICE = CustomerChurnBankService(
-        model_path=MODEL_PATH_FULL,
-        model_dir=MODEL_DIR
+    # 1. 初始化模型服務 (經 canary 驗證；gunicorn preload 時延後到 worker fork 後) 並註冊全局 SHAP 圖表；之後可由 /admin/reload 或檔案監看熱抽換
+    MODEL_REGISTRY = ModelRegistry(
+        factory=build_churn_service,
+        canary=canary_check,
+        on_swap=register_global_artifacts,
+        watch_interval=Config.MODEL_WATCH_INTERVAL_SECONDS,
+        reload_signal_path=Config.MODEL_RELOAD_SIGNAL_FILE if Config.ADMIN_TOKEN else None,
+        signal_interval=Config.MODEL_RELOAD_SIGNAL_INTERVAL_SECONDS
     )
-    logger.info("CustomerChurnBankService 成功初始化。")
-
-    # 2. 載入離線生成的全局 SHAP 圖表
-    if os.path.exists(GLOBAL_SHAP_FILE):
-        with open(GLOBAL_SHAP_FILE, "rb") as f:
-            GLOBAL_SHAP_BASE64 = base64.b64encode(f.read()).decode('utf-8')
-        logger.info(f"全局 SHAP 摘要圖 ({os.path.basename(GLOBAL_SHAP_FILE)}) 載入成功。")
-    else:
-        logger.warning(f"全局 SHAP 圖表檔案未找到: {GLOBAL_SHAP_FILE}。無法提供全局解釋圖。")
+    MODEL_REGISTRY.load_initial(run_canary=not Config.DEFER_STARTUP_CANARY)
 
 except Exception as e:
     # 這裡是最關鍵的修正：不僅記錄錯誤，還將錯誤信息打印出來
@@ -269,6 +516,39 @@ except Exception as e:
     # 對其他錯誤也強制拋出
     raise RuntimeError(f"模型初始化失敗：{e}") from e
 
+
+def current_churn_service() -> CustomerChurnBankService:
+    """請求開始時取得目前的模型服務實例 (整個請求都使用這一個實例)，並惰性啟動模型工件監看。"""
+    if MODEL_REGISTRY is None:
+        return None
+    MODEL_REGISTRY.verify_initial()
+    MODEL_REGISTRY.start_watching()
+    return MODEL_REGISTRY.current
+
+
+def reinit_after_fork() -> None:
+    """
+    gunicorn preload_app 的 post_fork 掛鉤 (見 gunicorn.conf.py)。
+
+    模型、Explainer、全局 SHAP 圖等唯讀資源在 master 載入一次，由 fork 出的 worker 以寫入時複製方式共用；
+    這裡只重建不能跨 fork 的部分：背景執行緒 (微批次分派器、圖表執行緒池、批次工作行程池) 與各種鎖，
+    並執行 master 延後的啟動 canary (fork 前不預測，見 gunicorn.conf.py；失敗時 worker 啟動失敗)。
+    """
+    global _PYPLOT_LOCK
+    _PYPLOT_LOCK = threading.Lock()
+    CHART_STORE.reset_after_fork()
+    STATIC_ARTIFACTS.reset_after_fork()
+    if MODEL_REGISTRY is not None:
+        MODEL_REGISTRY.reset_after_fork()
+        MODEL_REGISTRY.verify_initial()
+        # 閒置的 worker 也要能收到 /admin/reload 的重新載入訊號，不等第一個請求才啟動監看
+        MODEL_REGISTRY.start_watching()
+    BATCH_JOBS.reset_after_fork()
+    BATCH_RESULTS.reset_after_fork()
+    if PARALLEL_BATCH_SCORER is not None:
+        PARALLEL_BATCH_SCORER.reset_after_fork()
+    logger.info(f"worker (pid={os.getpid()}) 已完成 fork 後重新初始化。")
+
 # --- Blueprint 定義 ---
 customer_churn_bank_blueprint = Blueprint('customer_churn_bank_blueprint', __name__)
 
@@ -285,6 +565,13 @@ def predict_churn():
         if not data:
             raise BadRequest("無效的 JSON 請求")
 
+        # 局部 SHAP 圖表格式 (?chart=png|svg|json，預設 png)
+        chart_format = request.args.get('chart', 'png').lower()
+        if chart_format not in CHART_FORMATS:
+            raise BadRequest(f"不支援的圖表格式: {chart_format}，可選: {', '.join(CHART_FORMATS)}")
+        # 是否改為背景繪製局部 SHAP 圖 (回應只帶 chart_id 與取圖 URL)；未啟用 CHURN_ASYNC_CHART 時忽略查詢參數
+        async_chart = Config.ASYNC_CHART_ENABLED and request.args.get('async_chart', '1') != '0'
+
         # 1. 整理輸入數據並使用預設值
         input_data = {
             'id': 0, 
@@ -303,45 +590,71 @@ def predict_churn():
             'RowNumber': 0
         }
 
-        input_df = pd.DataFrame([input_data])
-        
         proba_churn = 0.5
-        chart_base64_local = ""
         feature_importance_text = "模型未初始化，使用模擬預測，無法提供 AI 解釋。"
         final_charts = []
 
-        if CUSTOMER_CHURN_BANK_SERVICE and CUSTOMER_CHURN_BANK_SERVICE.model:
-            # 2. 呼叫服務層進行預處理、預測和 SHAP 分析
-            prediction_results = CUSTOMER_CHURN_BANK_SERVICE.preprocess_and_predict(
-                input_df=input_df, 
-                fe_pipeline_func=FeatureEngineerForAPI.run_v2_preprocessing
+        service = current_churn_service()
+        if service and service.model:
+            # 2. 呼叫服務層進行預處理、預測和 SHAP 分析 (單筆快速路徑，不建立 DataFrame；相同輸入命中結果快取)
+            cache_entry = service.predict_record_cached(
+                record=input_data,
+                fe_record_func=FeatureEngineerForAPI.run_v2_record,
+                categorical_cols=FeatureEngineerForAPI.CATEGORICAL_COLUMNS,
+                key_columns=REQUIRED_PREDICT_COLUMNS
             )
+            prediction_results = cache_entry['prediction']
             
             proba_churn = prediction_results['probability']
             feature_importance_text = prediction_results['feature_importance']
             local_shap_values = prediction_results['local_shap_values']
             
-            # 3. 繪製局部 SHAP 圖表
-            chart_base64_local = generate_local_shap_chart(
-                local_shap_values, 
-                f"Individual SHAP Local Influence (Churn Probability: {proba_churn:.4f})"
-            )
+            # 3. 依請求格式繪製局部 SHAP 圖表 (快取項目中已有該格式的圖表時直接重用)
+            chart_title_local = f"單筆客戶 SHAP 特徵分析 流失風險 : {proba_churn:.4f}"
+            render_title_local = f"Individual SHAP Local Influence (Churn Probability: {proba_churn:.4f})"
+            chart_local = cache_entry['charts'].get(chart_format)
+            local_chart_payload = None
+            if chart_local is None and async_chart:
+                # 背景繪製：完成後回填結果快取，前端從 /chart/<id> 取得
+                charts_cache = cache_entry['charts']
+                chart_id = CHART_STORE.submit(
+                    render_local_shap_chart,
+                    chart_format,
+                    local_shap_values,
+                    render_title_local,
+                    metadata={'format': chart_format},
+                    on_done=lambda rendered: charts_cache.__setitem__(chart_format, rendered)
+                )
+                local_chart_payload = {
+                    "type": CHART_MIME_TYPES[chart_format],
+                    "chart_id": chart_id,
+                    "url": url_for('customer_churn_bank_blueprint.get_chart', chart_id=chart_id),
+                    "title": chart_title_local
+                }
+            elif chart_local is None:
+                chart_local = render_local_shap_chart(
+                    chart_format,
+                    local_shap_values, 
+                    render_title_local
+                )
+                if chart_local:
+                    cache_entry['charts'][chart_format] = chart_local
             
-            # 4. 加入全局 SHAP 圖表 (如果已載入)
-            if GLOBAL_SHAP_BASE64:
+            # 4. 加入全局 SHAP 圖表 (如果已載入；只回傳內容雜湊 URL，由瀏覽器快取)
+            global_shap = STATIC_ARTIFACTS.get(GLOBAL_SHAP_ARTIFACT_NAME)
+            if global_shap:
                 final_charts.append({
-                    "type": "image/png", 
-                    "base64_data": GLOBAL_SHAP_BASE64,
+                    "type": global_shap.mimetype, 
+                    "url": url_for('customer_churn_bank_blueprint.get_static_artifact',
+                                   digest=global_shap.digest, name=global_shap.name),
                     "title": "模型全局 SHAP 特徵圖 (整體特徵重要性)"
                 })
 
             # 5. 組裝局部圖表結果
-            if chart_base64_local:
-                final_charts.append({
-                    "type": "image/png", 
-                    "base64_data": chart_base64_local,
-                    "title": f"單筆客戶 SHAP 特徵分析 流失風險 : {proba_churn:.4f}"
-                })
+            if local_chart_payload:
+                final_charts.append(local_chart_payload)
+            elif chart_local:
+                final_charts.append(build_local_chart_payload(chart_format, chart_local, chart_title_local))
                 
             # 6. 處理可讀性輸出
             geography_map = {0: "France", 1: "Spain", 2: "Germany"}
@@ -365,9 +678,11 @@ def predict_churn():
             return jsonify({
                 "status": "success",
                 "prediction": float(proba_churn),
+                "local_shap_values": local_shap_values,
                 "readable_features": readable_data, 
                 "explanation_prompt": explanation_prompt_snippet, 
-                "charts": final_charts
+                "charts": final_charts,
+                "model_version": service.model_version
             })
 
         # 模擬結果的返回
@@ -393,139 +708,558 @@ def predict_churn():
         logger.error(f"預測過程發生錯誤: {e}", exc_info=True)
         return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
 
+## 🖼️ 非同步局部 SHAP 圖表
+@customer_churn_bank_blueprint.route('/chart/<chart_id>', methods=['GET'])
+def get_chart(chart_id: str):
+    """
+    取得背景繪製的局部 SHAP 圖。預設最多等待 CHART_FETCH_WAIT_SECONDS 秒；?wait=0 時若尚未完成立即回傳 202。
+    """
+    wait = request.args.get('wait', '1') != '0'
+    status, rendered, metadata = CHART_STORE.get(chart_id, timeout=Config.CHART_FETCH_WAIT_SECONDS if wait else None)
+
+    if status == 'missing':
+        return jsonify({"error": "圖表不存在或已過期。"}), 404
+    if status == 'pending':
+        return jsonify({"status": "pending"}), 202
+    if status == 'failed':
+        return jsonify({"error": "圖表繪製失敗。"}), 500
+
+    chart_format = metadata.get('format', 'png')
+    if chart_format == 'json':
+        response = jsonify(rendered)
+    else:
+        body = base64.b64decode(rendered) if chart_format == 'png' else rendered
+        response = make_response(body)
+        response.headers['Content-Type'] = CHART_MIME_TYPES[chart_format]
+    response.headers['Cache-Control'] = f"private, max-age={int(Config.CHART_STORE_TTL_SECONDS)}"
+    return response
+
+## 🧾 模型靜態工件 (內容雜湊 URL)
+@customer_churn_bank_blueprint.route('/artifacts/<digest>/<name>', methods=['GET'])
+def get_static_artifact(digest: str, name: str):
+    """
+    提供以內容雜湊定址的模型靜態工件。URL 隨內容改變，因此可設定 immutable 長期快取；
+    並以 ETag 支援條件式請求 (If-None-Match 相符時回傳 304)。
+    """
+    artifact = STATIC_ARTIFACTS.lookup(digest, name)
+    if artifact is None:
+        return jsonify({"error": "工件不存在或版本已更新。"}), 404
+
+    response = make_response(artifact.content)
+    response.headers['Content-Type'] = artifact.mimetype
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(artifact.digest)
+    return response.make_conditional(request)
+
+## 🗃️ 單筆預測結果快取統計
+@customer_churn_bank_blueprint.route('/cache_stats', methods=['GET'])
+def prediction_cache_stats():
+    """返回 /predict 結果快取的命中/未命中/淘汰等計數。"""
+    service = current_churn_service()
+    if service is None or service.result_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **service.result_cache.stats()})
+
+## 🔄 模型熱抽換 (管理介面)
+@customer_churn_bank_blueprint.route('/model_status', methods=['GET'])
+def model_status():
+    """返回目前服務中的模型版本與最近一次重新載入的結果。"""
+    if MODEL_REGISTRY is None:
+        return jsonify({"error": "模型服務未啟動。"}), 503
+    return jsonify(MODEL_REGISTRY.status())
+
+
+@customer_churn_bank_blueprint.route('/admin/reload', methods=['POST'])
+def admin_reload_model():
+    """
+    在背景重新載入模型 (canary 驗證通過後原子抽換，進行中的請求不受影響)。
+    需以 X-Admin-Token 標頭提供 CHURN_ADMIN_TOKEN；未設定 token 時此介面停用。?wait=1 會等待本 worker 載入完成。
+
+    接收請求的 worker 直接重新載入，並寫入共用的重新載入世代 (CHURN_MODEL_RELOAD_SIGNAL_FILE)；
+    其他 gunicorn worker 在 CHURN_MODEL_RELOAD_SIGNAL_INTERVAL 秒內偵測到後各自重新載入。
+    """
+    token = request.headers.get('X-Admin-Token', '')
+    if not Config.ADMIN_TOKEN or not hmac.compare_digest(token.encode('utf-8'), Config.ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({"error": "未授權或管理介面未啟用。"}), 403
+    if MODEL_REGISTRY is None:
+        return jsonify({"error": "模型服務未啟動。"}), 503
+
+    wait = request.args.get('wait', '0') == '1'
+    try:
+        MODEL_REGISTRY.broadcast_reload()
+    except OSError as e:
+        logger.error(f"寫入模型重新載入訊號失敗: {e}")
+        return jsonify({"error": f"無法通知其他 worker 重新載入: {e}"}), 500
+    started = MODEL_REGISTRY.reload(wait=wait, timeout=Config.MODEL_RELOAD_TIMEOUT_SECONDS)
+    status = MODEL_REGISTRY.status()
+    if wait and status['last_reload'].get('status') == 'failed':
+        return jsonify({"started": started, **status}), 500
+    return jsonify({"started": started, **status}), (200 if wait else 202)
+
 ## 💾 批次客戶流失預測 API
+# 批次 CSV 中視為缺失值的字串
+BATCH_NA_VALUES = ['', 'NA', 'N/A']
+# 批次回應中回傳的原始特徵欄位 (10 個核心特徵 + id)
+BATCH_RESPONSE_COLUMNS = [
+    'id', 'CreditScore', 'Geography', 'Gender', 'Age', 'Tenure',
+    'Balance', 'NumOfProducts', 'HasCrCard', 'IsActiveMember', 'EstimatedSalary'
+]
+
+
+# 批次 CSV 的輸入結構 (由 REQUIRED_RAW_FEATURES 推導)：只解析下游會用到的欄位 (Surname、RowNumber 與使用者附帶的
+# 其他欄位在解析時即略過)，數值欄位宣告為 float64、Geography / Gender 為 category，解析同時完成關鍵欄位的檢查
+BATCH_INPUT_COLUMNS = [col for col in REQUIRED_RAW_FEATURES if col not in ('Surname', 'RowNumber')]
+BATCH_INPUT_SCHEMA = BatchInputSchema(
+    dtypes={col: 'category' if col in ('Geography', 'Gender') else 'float64' for col in BATCH_INPUT_COLUMNS},
+    required=CRITICAL_COLUMNS,
+    na_values=BATCH_NA_VALUES,
+    engine=Config.BATCH_CSV_ENGINE
+)
+
+
+def new_risk_summary() -> RiskSummary:
+    return RiskSummary(Config.RISK_SUMMARY_THRESHOLDS, max_groups=Config.RISK_SUMMARY_MAX_GROUPS)
+
+
+def risk_cohorts(input_df_processed: pd.DataFrame) -> Dict[str, pd.Categorical]:
+    """風險分布彙總的客群標籤：Geography 與 Age_bin 與 FE 相同 (正規化的國名、年齡分箱)，Gender 為上傳的原始值。"""
+    gender_codes, gender_uniques = factorize_column(input_df_processed['Gender'])
+    return {
+        'Geography': FeatureEngineerForAPI._normalize_geography(input_df_processed['Geography']),
+        'Gender': pd.Categorical.from_codes(gender_codes, categories=[str(u) for u in gender_uniques]),
+        'Age_bin': pd.cut(input_df_processed['Age'].to_numpy(), bins=FeatureEngineerForAPI.AGE_BINS,
+                          labels=FeatureEngineerForAPI.AGE_LABELS, right=False),
+    }
+
+
+def score_batch_frame(service: CustomerChurnBankService, input_df_original: pd.DataFrame, explain_top_k: int,
+                      risk_summary: Optional[RiskSummary] = None) -> Tuple[pd.DataFrame, PortfolioStats, RoiInputs]:
+    """
+    對一個已通過檢查的批次 (整個檔案或串流中的一個區塊) 進行預測，
+    回傳 (回應欄位 DataFrame, 投資組合統計, ROI 輸入)；投資組合統計可跨區塊 merge，
+    ROI 輸入保留未截斷的機率，供伺服器端 what-if 試算。
+    指定 risk_summary 時，同一次處理中將本區塊 (回應中截斷後) 的機率依客群累積進去。
+    """
+    # 補齊非核心欄位 ('CustomerId'；Surname、RowNumber 不參與預測，解析時已略過)
+    input_df_processed = ensure_required_columns(input_df_original, BATCH_INPUT_COLUMNS)
+    logger.info(f"批次預測 - 輔助數據補齊完成。數據筆數: {len(input_df_processed)}")
+
+    # 呼叫服務層進行批次預測與 ROI 計算 (零複製的向量化 FE；啟用分片評分時由多個子行程平行處理)
+    result_df, portfolio = service.predict_batch_with_portfolio(
+        input_df=input_df_processed,
+        fe_pipeline_func=FeatureEngineerForAPI.run_v2_batch,
+        explain_top_k=explain_top_k
+    )
+
+    roi_inputs = RoiInputs.from_frame(input_df_processed, result_df['Exited_Probability'].to_numpy())
+    result_df_full = format_batch_result(input_df_processed, result_df, explain_top_k)
+    if risk_summary is not None:
+        risk_summary.update(result_df_full['probability'].to_numpy(), risk_cohorts(input_df_processed))
+    return result_df_full, portfolio, roi_inputs
+
+
+def format_batch_result(input_df_processed: pd.DataFrame, result_df: pd.DataFrame, explain_top_k: int) -> pd.DataFrame:
+    """組成批次回應的結果表格 (原始特徵 + 截斷後的機率 + 可選的 SHAP 前 k 名)，供各種輸出格式直接編碼。"""
+    # 確保只有在 CSV 檔中存在的欄位被選取
+    available_cols = [col for col in BATCH_RESPONSE_COLUMNS if col in input_df_processed.columns]
+
+    # 合併原始特徵和預測結果：逐欄以 NumPy 陣列處理 NaN、四捨五入和資料類型轉換，避免序列化錯誤
+    columns: Dict[str, np.ndarray] = {}
+    for col in available_cols:
+        values = input_df_processed[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Geography / Gender：還原為上傳的原始值 (純數字的代碼仍輸出為數值)
+            columns[col] = decode_categorical(values)
+        elif col in ('id', 'NumOfProducts', 'HasCrCard', 'IsActiveMember'):
+            columns[col] = values.fillna(0).to_numpy().astype(int)
+        elif col in ('CreditScore', 'Age', 'Tenure', 'Balance', 'EstimatedSalary'):
+            # 一般數值欄位：保留兩位小數並四捨五入 (NaN 視為 0)
+            columns[col] = np.round(values.fillna(0.0).to_numpy(dtype=float), 2)
+        else:
+            columns[col] = values.to_numpy()
+
+    # 'probability' 截斷 (Truncation) 到小數點後四位 (例如 0.12345 -> 0.1234)，整欄向量化計算
+    columns['probability'] = truncate_decimals(result_df['Exited_Probability'].to_numpy(), 4)
+
+    # (可選) SHAP 驅動因子：特徵位置 (對應 shap_feature_names) 與 SHAP 值 (四捨五入至小數點後四位)
+    for rank in range(1, explain_top_k + 1):
+        columns[f'shap_top{rank}_feature'] = result_df[f'SHAP_Top{rank}_Feature'].to_numpy(dtype=int)
+        columns[f'shap_top{rank}_value'] = result_df[f'SHAP_Top{rank}_Value'].to_numpy(dtype=float).round(4)
+
+    return pd.DataFrame(columns)
+
+
+def stream_batch_predictions(service: CustomerChurnBankService, csv_source: Any, stream_format: str,
+                             chunk_rows: int, explain_top_k: int) -> Response:
+    """
+    以固定筆數的區塊解析上傳串流，每個區塊檢查、預測後立即寫出 (NDJSON 或 CSV)，記憶體只與區塊大小有關。
+
+    - 第一個區塊在回應開始前解析與檢查，欄位缺失等錯誤仍以 HTTP 400 回傳。
+    - 之後的區塊若檢查或預測失敗，已送出的結果無法收回：串流以錯誤記錄結束
+      (NDJSON: {"event": "error", ...}；CSV: "# error: ..." 註解行)，並停止處理後續資料。
+    - 結尾附上彙總 (筆數、ROI)：NDJSON 為 {"event": "summary", ...}；CSV 為 "# summary: {...}" 註解行
+      (pandas 可用 comment='#' 略過)。
+    """
+    # 每個區塊在解析時即依 BATCH_INPUT_SCHEMA 檢查；第一個區塊的錯誤 (BatchSchemaError) 由呼叫端以 400 回傳
+    chunks = BATCH_INPUT_SCHEMA.iter_chunks(csv_source, chunk_rows)
+    first_chunk = next(chunks)
+
+    def generate():
+        rows = 0
+        portfolio = PortfolioStats()
+        risk_summary = new_risk_summary()
+        if stream_format == 'ndjson':
+            header = {"event": "start", "model_version": service.model_version, "chunk_rows": chunk_rows}
+            if explain_top_k:
+                header["shap_feature_names"] = list(service.feature_cols)
+            yield json.dumps(header, ensure_ascii=False) + "\n"
+
+        chunk_index = 0
+        chunk = first_chunk
+        try:
+            while chunk is not None:
+                result_df_full, chunk_portfolio, _ = score_batch_frame(service, chunk, explain_top_k, risk_summary)
+                portfolio.merge(chunk_portfolio)
+
+                if stream_format == 'ndjson':
+                    # 不同 pandas 版本的 lines=True 輸出不一定以換行結尾，統一補上一個
+                    yield result_df_full.to_json(orient='records', lines=True, force_ascii=False).rstrip("\n") + "\n"
+                else:
+                    yield result_df_full.to_csv(index=False, header=(chunk_index == 0))
+
+                rows += len(result_df_full)
+                chunk_index += 1
+                chunk = next(chunks, None)
+        except Exception as e:
+            logger.error(f"串流批次預測中止 (已輸出 {rows} 筆): {e}")
+            if stream_format == 'ndjson':
+                yield json.dumps({"event": "error", "error": str(e), "rows": rows}, ensure_ascii=False) + "\n"
+            else:
+                yield f"# error: {e}\n"
+            return
+
+        summary = {"rows": rows, "chunks": chunk_index, "roi": portfolio.roi(), "portfolio": portfolio.to_dict(),
+                   "risk_summary": risk_summary.to_dict(), "model_version": service.model_version}
+        if stream_format == 'ndjson':
+            yield json.dumps({"event": "summary", **summary}, ensure_ascii=False, default=float) + "\n"
+        else:
+            yield f"# summary: {json.dumps(summary, ensure_ascii=False, default=float)}\n"
+
+    mimetype = 'application/x-ndjson' if stream_format == 'ndjson' else 'text/csv'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['X-Model-Version'] = service.model_version
+    response.headers['X-Accel-Buffering'] = 'no'  # 反向代理 (nginx) 不緩衝，逐區塊送達用戶端
+    return response
+
+
+def preflight_batch_job(input_path: str) -> str:
+    """工作排入佇列前，以前 1000 筆檢查關鍵欄位與型別 (完整檢查在工作執行時逐區塊進行)。"""
+    try:
+        BATCH_INPUT_SCHEMA.read_head(input_path, 1000)
+    except BatchSchemaError as e:
+        return str(e)
+    return ""
+
+
+def execute_batch_job(job_dir: str, attempt: int) -> Dict[str, Any]:
+    """
+    在批次工作子行程中執行 (由 BATCH_JOBS 的行程池呼叫；子行程匯入本模組時載入自己的模型服務實例)。
+
+    逐區塊讀取 input.csv、檢查並預測，結果附加寫入暫存檔並於每個區塊後回報進度；全部成功後才以 os.replace
+    發佈為 result.csv，任一區塊失敗則整個工作失敗 (與一次性 /predict_batch 拒絕整個檔案的行為一致)。
+    """
+    service = MODEL_REGISTRY.current
+    options = (read_status(job_dir) or {}).get('options', {})
+    chunk_rows = int(options.get('chunk_rows', Config.BATCH_STREAM_CHUNK_ROWS))
+    explain_top_k = int(options.get('explain_top_k', 0))
+    update_status(job_dir, expected_attempt=attempt, state='running', started_at=time.time(), pid=os.getpid(),
+                  model_version=service.model_version)
+
+    partial_path = partial_result_path(job_dir, attempt)
+    rows = 0
+    portfolio = PortfolioStats()
+    risk_summary = new_risk_summary()
+    try:
+        chunks = BATCH_INPUT_SCHEMA.iter_chunks(os.path.join(job_dir, INPUT_FILE), chunk_rows)
+        with open(partial_path, 'w', encoding='utf-8', newline='') as out:
+            for chunk_index, chunk in enumerate(chunks):
+                result_df_full, chunk_portfolio, _ = score_batch_frame(service, chunk, explain_top_k, risk_summary)
+                result_df_full.to_csv(out, index=False, header=(chunk_index == 0))
+                portfolio.merge(chunk_portfolio)
+                rows += len(result_df_full)
+                update_status(job_dir, expected_attempt=attempt, rows_done=rows)
+        if rows == 0:
+            raise ValueError("CSV 檔案為空。")
+
+        os.replace(partial_path, os.path.join(job_dir, RESULT_FILE))
+        summary = {"rows": rows, "roi": portfolio.roi(), "portfolio": portfolio.to_dict(),
+                   "risk_summary": risk_summary.to_dict()}
+        if explain_top_k:
+            summary["shap_feature_names"] = list(service.feature_cols)
+        return update_status(job_dir, expected_attempt=attempt, state='succeeded', rows_done=rows, total_rows=rows,
+                             finished_at=time.time(), **summary)
+    except JobAttemptSuperseded:
+        logger.warning(f"批次工作 {os.path.basename(job_dir)} 第 {attempt} 次執行已被取代，停止處理。")
+        raise
+    except Exception as e:
+        logger.error(f"批次工作 {os.path.basename(job_dir)} 失敗 (已處理 {rows} 筆): {e}")
+        return update_status(job_dir, expected_attempt=attempt, state='failed', error=str(e), finished_at=time.time())
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+# 非同步批次工作 (/predict_batch?mode=job)：上傳內容與結果保存在磁碟，於低優先權的子行程池中評分
+BATCH_JOBS = BatchJobStore(
+    root_dir=Config.BATCH_JOB_DIR,
+    runner=execute_batch_job,
+    max_workers=Config.BATCH_JOB_WORKERS,
+    max_pending=Config.BATCH_JOB_MAX_PENDING,
+    ttl_seconds=Config.BATCH_JOB_TTL_SECONDS,
+    nice=Config.BATCH_JOB_NICE,
+    threads=Config.BATCH_JOB_THREADS
+)
+
+
+def submit_batch_job(csv_source: Any, chunk_rows: int, explain_top_k: int) -> Tuple[Response, int]:
+    """將上傳內容寫入磁碟並排入批次工作佇列，回傳 202 與查詢進度、取得結果的 URL。"""
+    status = BATCH_JOBS.create_job(
+        csv_source,
+        options={"chunk_rows": chunk_rows, "explain_top_k": explain_top_k},
+        preflight=preflight_batch_job
+    )
+    job_id = status['job_id']
+    response = jsonify({
+        "job_id": job_id,
+        "state": status['state'],
+        "total_rows": status['total_rows'],
+        "status_url": url_for('.get_batch_job', job_id=job_id),
+        "result_url": url_for('.get_batch_job_result', job_id=job_id)
+    })
+    response.headers['Location'] = url_for('.get_batch_job', job_id=job_id)
+    return response, 202
+
+
+def build_batch_response(service: CustomerChurnBankService, result_df_full: pd.DataFrame, roi_stats: Dict[str, Any],
+                         result_format: str, explain_top_k: int, risk_summary: Dict[str, Any] = None) -> Response:
+    """
+    一次性批次回應。records (前端使用的逐筆 JSON) 與 columnar 把 ROI、風險分布等彙總放在 JSON 本體；
+    csv / parquet / arrow 的本體只有結果表格，彙總放在 X-Batch-ROI 等回應標頭 (parquet / arrow 另寫入 schema metadata；
+    標頭只放整體的風險分布，各客群的彙總請使用 JSON 格式)。
+    """
+    metadata = {"roi": roi_stats, "model_version": service.model_version}
+    if risk_summary:
+        metadata["risk_summary"] = risk_summary
+    if explain_top_k:
+        metadata["shap_feature_names"] = list(service.feature_cols)
+    if result_format in ('records', 'columnar'):
+        metadata = {"status": "success", "message": f"成功預測 {len(result_df_full)} 筆資料。", **metadata}
+
+    body, mimetype = encode_batch_result(result_df_full, result_format, metadata)
+    if isinstance(body, dict):
+        return jsonify(body)
+
+    response = Response(body, mimetype=mimetype)
+    response.headers['X-Model-Version'] = service.model_version
+    response.headers['X-Batch-Rows'] = str(len(result_df_full))
+    response.headers['X-Batch-ROI'] = json.dumps(roi_stats, default=float)
+    if risk_summary:
+        response.headers['X-Batch-Risk-Summary'] = json.dumps(
+            {key: risk_summary[key] for key in ('histogram_edges', 'thresholds', 'overall')}, default=float)
+    if explain_top_k:
+        response.headers['X-Shap-Feature-Names'] = json.dumps(metadata["shap_feature_names"])
+    if result_format != 'csv':
+        response.headers['Content-Disposition'] = f'attachment; filename=predictions.{result_format}'
+    return response
+
+
+# 伺服器端批次結果 (/predict_batch?paginate=1)：寫入所有 worker 共用的目錄，查詢時以 mmap 開啟
+BATCH_RESULTS = BatchResultStore(
+    root_dir=Config.BATCH_RESULT_DIR,
+    ttl_seconds=Config.BATCH_RESULT_TTL_SECONDS,
+    max_bytes=Config.BATCH_RESULT_MAX_BYTES,
+    max_entries=Config.BATCH_RESULT_MAX_ENTRIES
+)
+DEFAULT_PAGE_SIZE = 10
+
+
+def parse_page_size(value: Any) -> int:
+    try:
+        page_size = int(value) if value not in (None, '') else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise BadRequest("page_size 必須為整數。")
+    if not 1 <= page_size <= Config.BATCH_RESULT_MAX_PAGE_SIZE:
+        raise BadRequest(f"page_size 必須介於 1 到 {Config.BATCH_RESULT_MAX_PAGE_SIZE} 之間。")
+    return page_size
+
+
+def parse_result_query(values: Any) -> Dict[str, Any]:
+    """解析伺服器端結果查詢的排序與篩選參數 (sort、order、min_probability、q、page_size)。"""
+    sort = values.get('sort', 'none').lower()
+    order = values.get('order', 'asc').lower()
+    if sort not in SORT_KEYS:
+        raise BadRequest(f"不支援的排序鍵: {sort}，可選: {', '.join(SORT_KEYS)}")
+    if order not in SORT_ORDERS:
+        raise BadRequest(f"不支援的排序方向: {order}，可選: {', '.join(SORT_ORDERS)}")
+    try:
+        min_probability = float(values.get('min_probability', 0) or 0)
+    except ValueError:
+        raise BadRequest("min_probability 必須為數值。")
+    if not 0.0 <= min_probability <= 1.0:
+        raise BadRequest("min_probability 必須介於 0 到 1 之間。")
+    return {"sort": sort, "order": order, "min_probability": min_probability, "id_search": values.get('q', ''),
+            "page_size": parse_page_size(values.get('page_size'))}
+
+
+def build_paged_batch_response(service: CustomerChurnBankService, result_df_full: pd.DataFrame,
+                               roi_stats: Dict[str, Any], explain_top_k: int, query: Dict[str, Any],
+                               roi_inputs: RoiInputs, risk_summary: Dict[str, Any] = None) -> Response:
+    """
+    保存結果 (連同 ROI 輸入，供 /roi_sweep 試算) 並回傳 result_id、查詢 URL 與第一頁 (依 query 的排序與篩選條件)；
+    結果超過儲存上限時退回一次回傳全部資料的 records 格式。
+    """
+    metadata = {"roi": roi_stats, "model_version": service.model_version}
+    if risk_summary:
+        metadata["risk_summary"] = risk_summary
+    if explain_top_k:
+        metadata["shap_feature_names"] = list(service.feature_cols)
+    result_id = BATCH_RESULTS.put(result_df_full, metadata, extra_arrays=roi_inputs.to_arrays())
+    if result_id is None:
+        return build_batch_response(service, result_df_full, roi_stats, 'records', explain_top_k, risk_summary)
+
+    first_page = BATCH_RESULTS.get(result_id).query(page=1, **query)
+    return jsonify({
+        "status": "success",
+        "message": f"成功預測 {len(result_df_full)} 筆資料。",
+        "result_id": result_id,
+        "query_url": url_for('.query_batch_result', result_id=result_id),
+        "roi_sweep_url": url_for('.sweep_batch_result_roi', result_id=result_id),
+        "targets_url": url_for('.select_batch_result_targets', result_id=result_id),
+        "expires_in": int(Config.BATCH_RESULT_TTL_SECONDS),
+        "page": first_page,
+        **metadata
+    })
+
+
 @customer_churn_bank_blueprint.route('/predict_batch', methods=['POST'])
 def predict_batch():
     """
     接收 CSV 檔案上傳，進行批次流失預測，並返回結果 JSON 數據。
     - 嚴格檢查 CRITICAL_COLUMNS (id + 10核心特徵) 是否存在且數據無任何缺失。
     - 只要有任何缺失，即拒絕整個 CSV 檔案導入。
+    - ?mode=job 時改為非同步批次工作：立即回傳 202 與 job_id，評分在子行程中進行 (見 /jobs/<job_id>)。
+    - ?format= (或 Accept 標頭) 選擇一次性回應的格式：records (預設)、columnar、csv、parquet、arrow。
+    - ?paginate=1 時結果保存在伺服器端，只回傳 result_id 與第一頁 (見 /batch_results/<result_id>)。
     """
     logger.info("接收到批次預測請求。")
-    if CUSTOMER_CHURN_BANK_SERVICE is None or CUSTOMER_CHURN_BANK_SERVICE.model is None:
+    service = current_churn_service()
+    if service is None or service.model is None:
         logger.error("模型服務未啟動，無法進行批次預測。")
         return jsonify({"error": "模型服務未啟動，無法進行批次預測。"}), 503
 
-    # 1. 檔案檢查
-    if 'file' not in request.files:
-        raise BadRequest("請求中未包含檔案。請上傳 CSV 檔案。")
-    
-    file = request.files['file']
+    # 1. 檔案檢查：multipart 上傳的 file 欄位，或 Content-Type: text/csv 的原始請求本體 (邊上傳邊解析)
+    if request.mimetype == 'text/csv':
+        csv_source = request.stream
+    else:
+        if 'file' not in request.files:
+            raise BadRequest("請求中未包含檔案。請上傳 CSV 檔案。")
+
+        file = request.files['file']
 
-    if not file.filename:
-        raise BadRequest("未選擇檔案或檔案名無效。")
+        if not file.filename:
+            raise BadRequest("未選擇檔案或檔案名無效。")
 
-    if not file.filename.lower().endswith('.csv'):
-        raise BadRequest("檔案格式錯誤。請上傳 CSV 檔案。")
+        if not file.filename.lower().endswith('.csv'):
+            raise BadRequest("檔案格式錯誤。請上傳 CSV 檔案。")
+        csv_source = file.stream
+
+    # (可選) ?mode=job：非同步批次工作，立即回傳工作 ID，之後以 /jobs/<id> 查詢進度並取得結果
+    batch_mode = request.args.get('mode', request.form.get('mode', 'sync')).lower()
+    if batch_mode not in ('sync', 'job'):
+        return jsonify({"error": f"不支援的批次模式: {batch_mode}，可選: sync, job"}), 400
+
+    # (可選) ?stream=ndjson|csv：逐區塊解析與預測，結果以串流回傳 (?chunk_rows= 調整區塊筆數)
+    stream_format = request.args.get('stream', '').lower()
+    if stream_format not in ('', 'ndjson', 'csv'):
+        return jsonify({"error": f"不支援的串流格式: {stream_format}，可選: ndjson, csv"}), 400
+    try:
+        chunk_rows = int(request.args.get('chunk_rows', Config.BATCH_STREAM_CHUNK_ROWS))
+    except ValueError:
+        return jsonify({"error": "chunk_rows 必須為整數。"}), 400
+    if chunk_rows < 1:
+        return jsonify({"error": "chunk_rows 必須 >= 1。"}), 400
+
+    # (可選) ?explain=topk&top_k=7：附上每位客戶前 k 個 SHAP 驅動因子
+    explain_mode = request.args.get('explain', request.form.get('explain', 'none')).lower()
+    if explain_mode not in ('none', 'topk'):
+        return jsonify({"error": f"不支援的 explain 模式: {explain_mode}，可選: none, topk"}), 400
+    try:
+        explain_top_k = int(request.args.get('top_k', request.form.get('top_k', 7))) if explain_mode == 'topk' else 0
+    except ValueError:
+        return jsonify({"error": "top_k 必須為整數。"}), 400
+    if explain_mode == 'topk' and not 1 <= explain_top_k <= len(service.feature_cols):
+        return jsonify({"error": f"top_k 必須介於 1 到 {len(service.feature_cols)} 之間。"}), 400
+
+    # (可選) ?format=records|columnar|csv|parquet|arrow 或 Accept 標頭：一次性回應的結果格式 (預設 records)
+    try:
+        result_format = negotiate_result_format(request.args.get('format', request.form.get('format', '')),
+                                                request.accept_mimetypes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if result_format != 'records' and (stream_format or batch_mode == 'job'):
+        return jsonify({"error": "format 只適用於一次性回應；串流請使用 stream=ndjson|csv，"
+                                 "批次工作結果請見 /jobs/<job_id>/result。"}), 400
+    try:
+        ensure_format_available(result_format)
+    except ResultFormatUnavailable as e:
+        return jsonify({"error": str(e)}), 406
+
+    # (可選) ?paginate=1&page_size=10：結果保存在伺服器端，只回傳 result_id 與第一頁 (見 /batch_results/<result_id>)；
+    # 第一頁可帶與查詢介面相同的 sort / order / min_probability / q 參數
+    paginate = request.values.get('paginate', '0') == '1'
+    try:
+        result_query = parse_result_query(request.values) if paginate else {}
+        if paginate and (result_format != 'records' or stream_format or batch_mode == 'job'):
+            raise BadRequest("paginate 只適用於一次性的 records 回應。")
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
         # 2. 讀取 CSV 檔案至 DataFrame
         # keep_default_na=True 確保標準缺失值被讀取為 NaN
-        data_io = io.StringIO(file.read().decode('utf-8'))
-        input_df_original = pd.read_csv(data_io, keep_default_na=True, na_values=['', 'NA', 'N/A'])
-        
-        if input_df_original.empty:
-            raise ValueError("CSV 檔案為空。")
-            
-        # ------------------------------------------------------------------
-        # ★★★ 結構性檢查：檢查核心欄位是否存在 (Fail Fast) ★★★
-        # ------------------------------------------------------------------
-        missing_cols = [col for col in CRITICAL_COLUMNS if col not in input_df_original.columns]
-        if missing_cols:
-            error_msg = f"CSV 檔案中缺少關鍵欄位，無法導入。缺失欄位: {', '.join(missing_cols)}"
-            logger.error(f"結構性檢查失敗: {error_msg}")
-            return jsonify({"error": error_msg}), 400
-        
-        # --------------------------------------------------------------
-        # ★★★ 數據檢查：檢查關鍵欄位中是否存在任何 NaN 值 (Fail Fast) ★★★
-        # --------------------------------------------------------------
-        # 篩選出關鍵欄位的子集
-        df_critical = input_df_original[CRITICAL_COLUMNS]
-        
-        # 檢查是否有任何 NaN 值
-        if df_critical.isnull().values.any():
-            # 定位缺失值所在的欄位
-            missing_data_cols = df_critical.columns[df_critical.isnull().any()].tolist()
-            
-            error_msg = f"CSV 檔案在關鍵欄位中發現缺失值，無法導入。包含缺失值的欄位: {', '.join(missing_data_cols)}"
-            logger.error(f"數據缺失檢查失敗: {error_msg}")
-            return jsonify({"error": error_msg}), 400
-        
+        # 直接從上傳串流解析，避免同時持有原始 bytes、解碼後字串與 DataFrame 三份資料
+        if batch_mode == 'job':
+            return submit_batch_job(csv_source, chunk_rows, explain_top_k)
+        if stream_format:
+            return stream_batch_predictions(service, csv_source, stream_format, chunk_rows, explain_top_k)
+
+        # 依 BATCH_INPUT_SCHEMA 解析 (只讀需要的欄位、明確的 dtype)，同時完成結構性檢查 (核心欄位是否存在)、
+        # 數據檢查 (關鍵欄位是否有缺失值) 與型別檢查，任一失敗即拒絕整個檔案 (Fail Fast)
+        input_df_original = BATCH_INPUT_SCHEMA.read(csv_source)
+
         logger.info("結構和數據缺失性檢查通過。")
+
+        # 3~5. 補齊輔助欄位、預測、ROI 與回應欄位格式化
+        risk_summary = new_risk_summary()
+        result_df_full, portfolio, roi_inputs = score_batch_frame(service, input_df_original, explain_top_k,
+                                                                  risk_summary)
+        roi_stats = portfolio.roi()
         
-        # 3. 補齊非核心欄位 ('CustomerId', 'RowNumber', 'Surname')
-        input_df_processed = ensure_required_columns(input_df_original, REQUIRED_RAW_FEATURES)
-        
-        logger.info(f"批次預測 - 輔助數據補齊完成。數據筆數: {len(input_df_processed)}")
-        
-        # 4. 呼叫服務層進行批次預測
-        result_df = CUSTOMER_CHURN_BANK_SERVICE.predict_batch_csv(
-            input_df=input_df_processed, 
-            fe_pipeline_func=FeatureEngineerForAPI.run_v2_preprocessing
-        )
-        
-        # --- 🌟 新增：計算 ROI ---
-        # 將 id 補回 result_df 以便 ROI 函式能回傳 ID
-        result_df['id'] = input_df_processed['id'] if 'id' in input_df_processed.columns else result_df.index
-        # 合併需要的計算欄位 (Balance, etc.) 到 result_df
-        cols_needed = ['Balance', 'NumOfProducts', 'HasCrCard', 'IsActiveMember']
-        for col in cols_needed:
-            result_df[col] = input_df_processed[col]
-
-        roi_stats = CUSTOMER_CHURN_BANK_SERVICE.calculate_roi_batch(result_df)
-        # -----------------------
-
-        # 5. 準備 JSON 回應
-        
-        # 選擇要返回的原始特徵欄位
-        # 包含 10 個核心特徵 + id (共 11 個欄位)
-        feature_cols_to_return = [
-            'id', 'CreditScore', 'Geography', 'Gender', 'Age', 'Tenure', 
-            'Balance', 'NumOfProducts', 'HasCrCard', 'IsActiveMember', 'EstimatedSalary'
-        ]
-        
-        # 確保只有在 CSV 檔中存在的欄位被選取
-        available_cols = [col for col in feature_cols_to_return if col in input_df_processed.columns]
-        
-        # 合併原始特徵和預測結果
-        result_df_full = input_df_processed[available_cols].copy()
-        result_df_full['probability'] = result_df['Exited_Probability']
-        
-        # 關鍵：處理 NaN 值、四捨五入和資料類型轉換，避免 JSON 序列化錯誤
-        for col in ['id', 'NumOfProducts', 'HasCrCard', 'IsActiveMember']:
-             if col in result_df_full.columns:
-                 result_df_full[col] = result_df_full[col].fillna(0).astype(int)
-
-        # 處理一般數值欄位 (保留兩位小數並四捨五入，除了 probability)
-        for col in ['CreditScore', 'Age', 'Tenure', 'Balance', 'EstimatedSalary']:
-             if col in result_df_full.columns:
-                 # 保留小數點後兩位，並處理 NaN (使用四捨五入)
-                 result_df_full[col] = result_df_full[col].fillna(0.0).astype(float).round(2)
-        
-        # --- 【關鍵修改】處理 'probability'，使用截斷 (Truncation) 到小數點後四位 ---
-        if 'probability' in result_df_full.columns:
-            n_decimals = 4 # ✅ 修改為截斷到四位小數 (例如 0.12345 -> 0.1234)
-            # 實施截斷: (P * 10^4) 的地板函數 / 10^4
-            result_df_full['probability'] = (
-                result_df_full['probability'].fillna(0.0) * (10**n_decimals)
-            ).apply(np.floor) / (10**n_decimals)
-            result_df_full['probability'] = result_df_full['probability'].astype(float) # 確保資料類型正確
-        # -------------------------------------------------------------------
-        
-        # 轉換為前端所需的 JSON 列表格式
-        result_list = result_df_full.to_dict('records')
-        
-        # 6. 返回結果
-        return jsonify({
-            "status": "success",
-            "message": f"成功預測 {len(result_list)} 筆資料。",
-            "data": result_list,
-            "roi": roi_stats  # <--- 將 ROI 統計數據傳回前端
-        })
+        # 6. 依協商的格式返回結果 (由欄位陣列直接編碼，不逐列建立 dict)；分頁模式只回傳 result_id 與第一頁
+        if paginate:
+            return build_paged_batch_response(service, result_df_full, roi_stats, explain_top_k, result_query,
+                                              roi_inputs, risk_summary.to_dict())
+        return build_batch_response(service, result_df_full, roi_stats, result_format, explain_top_k,
+                                    risk_summary.to_dict())
 
+    except OverflowError as e:
+        logger.warning(f"批次工作佇列已滿: {e}")
+        return jsonify({"error": str(e)}), 429
     except BadRequest as e:
         logger.error(f"批次 API 請求錯誤: {e}")
         return jsonify({"error": str(e)}), 400
+    except BatchSchemaError as e:
+        return jsonify({"error": str(e)}), 400
     except ValueError as e:
         # 捕獲 ensure_required_columns 拋出的 id 缺失錯誤 或 CSV 為空錯誤
         logger.error(f"批次數據處理錯誤 (CSV 內容): {e}")
@@ -535,4 +1269,167 @@ def predict_batch():
         return jsonify({"error": str(e)}), 503
     except Exception as e:
         logger.error(f"批次預測過程發生錯誤: {e}", exc_info=True)
-        return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
\ No newline at end of file
+        return jsonify({"error": f"伺服器內部錯誤: {e}"}), 500
+
+
+## ⏳ 非同步批次工作 (/predict_batch?mode=job)
+@customer_churn_bank_blueprint.route('/jobs/<job_id>', methods=['GET'])
+def get_batch_job(job_id: str):
+    """返回批次工作的狀態 (queued / running / succeeded / failed)、進度與完成後的 ROI 彙總。"""
+    status = BATCH_JOBS.get_status(job_id)
+    if status is None:
+        return jsonify({"error": "批次工作不存在或已過期。"}), 404
+    status.pop('options', None)
+    if status.get('state') == 'succeeded':
+        status['result_url'] = url_for('.get_batch_job_result', job_id=job_id)
+    return jsonify(status)
+
+
+@customer_churn_bank_blueprint.route('/jobs/<job_id>/result', methods=['GET'])
+def get_batch_job_result(job_id: str):
+    """
+    下載已完成工作的結果：預設為 CSV 檔案 (與 /predict_batch?stream=csv 欄位相同)；
+    ?format=ndjson 以串流逐區塊轉換為每行一筆 JSON。工作尚未完成時回傳 409。
+    """
+    status = BATCH_JOBS.get_status(job_id)
+    if status is None:
+        return jsonify({"error": "批次工作不存在或已過期。"}), 404
+    result_path = BATCH_JOBS.result_path(job_id)
+    if result_path is None:
+        return jsonify({"error": f"批次工作尚未完成 (state={status.get('state')})。",
+                        "state": status.get('state'), "error_detail": status.get('error')}), 409
+
+    result_format = request.args.get('format', 'csv').lower()
+    if result_format == 'csv':
+        return send_file(result_path, mimetype='text/csv', as_attachment=True, download_name=f'{job_id}.csv')
+    if result_format != 'ndjson':
+        return jsonify({"error": f"不支援的結果格式: {result_format}，可選: csv, ndjson"}), 400
+
+    def generate():
+        for chunk in pd.read_csv(result_path, chunksize=Config.BATCH_STREAM_CHUNK_ROWS, float_precision='round_trip'):
+            yield chunk.to_json(orient='records', lines=True, force_ascii=False).rstrip("\n") + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Model-Version'] = status.get('model_version', '')
+    return response
+
+
+## 📑 伺服器端批次結果查詢 (/predict_batch?paginate=1)
+@customer_churn_bank_blueprint.route('/batch_results/<result_id>', methods=['GET'])
+def query_batch_result(result_id: str):
+    """
+    分頁查詢已保存的批次結果，排序與篩選都在伺服器端完成：
+    ?page=1&page_size=10&sort=none|id|probability|risk&order=asc|desc&min_probability=0.5&q=<ID 片段>
+    """
+    stored = BATCH_RESULTS.get(result_id)
+    if stored is None:
+        return jsonify({"error": "批次結果不存在或已過期，請重新上傳。"}), 404
+    try:
+        try:
+            page = int(request.args.get('page', 1))
+        except ValueError:
+            raise BadRequest("page 必須為整數。")
+        query = parse_result_query(request.args)
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(stored.query(page=page, **query))
+
+
+@customer_churn_bank_blueprint.route('/batch_results/<result_id>/roi_sweep', methods=['POST'])
+def sweep_batch_result_roi(result_id: str):
+    """
+    以保存的機率 (不需重新評分) 試算業務參數網格的 ROI 曲面 (what-if)。
+    請求本體為 {參數: 值或值的串列}，例如 {"retention_cost": [200, 500, 800], "success_rate": [0.1, 0.2, 0.3]}；
+    可用參數見 DEFAULT_ROI_PARAMS，未指定者使用預設值，所有組合一次計算。
+    """
+    stored = BATCH_RESULTS.get(result_id)
+    if stored is None:
+        return jsonify({"error": "批次結果不存在或已過期，請重新上傳。"}), 404
+    extra_arrays = stored.extra_arrays()
+    if 'roi_probability' not in extra_arrays:
+        return jsonify({"error": "此批次結果未保存 ROI 輸入，無法試算，請重新上傳。"}), 404
+
+    grid = request.get_json(silent=True)
+    if not isinstance(grid, dict):
+        return jsonify({"error": "請求本體必須為 JSON 物件，例如 {\"retention_cost\": [200, 500], \"success_rate\": [0.1, 0.2]}。"}), 400
+    try:
+        axes, scenarios = build_parameter_grid(grid, Config.ROI_SWEEP_MAX_SCENARIOS, Config.ROI_SWEEP_MAX_PROFILES)
+    except ValueError as e:
+        logger.error(f"ROI 試算參數錯誤: {e}")
+        return jsonify({"error": str(e)}), 400
+
+    start = time.perf_counter()
+    surface = calculate_roi_surface(RoiInputs.from_arrays(extra_arrays), scenarios)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    shape = [len(values) for _, values in axes]
+    best = int(np.argmax(surface['total_net_enr']))
+    logger.info(f"ROI 試算 {result_id}: {stored.rows} 筆 x {len(scenarios['retention_cost'])} 個情境，耗時 {elapsed_ms:.1f} ms")
+    return jsonify({
+        "result_id": result_id,
+        "rows": stored.rows,
+        "scenarios": len(scenarios['retention_cost']),
+        # 曲面的維度依 axes 排列 (surface[metric][i][j]... 對應 axes[0].values[i]、axes[1].values[j]...)
+        "axes": [{"name": name, "values": values.tolist()} for name, values in axes],
+        "defaults": {name: value for name, value in DEFAULT_ROI_PARAMS.items() if name not in grid},
+        "surface": {metric: surface[metric].reshape(shape).tolist() for metric in ROI_SURFACE_METRICS},
+        # 總淨 ENR 最高的情境
+        "best": {
+            "parameters": {name: float(scenarios[name][best]) for name in DEFAULT_ROI_PARAMS},
+            **{metric: surface[metric][best].item() for metric in ROI_SURFACE_METRICS}
+        },
+        "elapsed_ms": round(elapsed_ms, 2)
+    })
+
+
+def iter_stored_roi_chunks(stored: Any, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    """逐區塊產生已保存結果的 (ROI 輸入, id)；陣列以 mmap 開啟，每次只讀入一個區塊。"""
+    inputs = RoiInputs.from_arrays(stored.extra_arrays())
+    ids = stored.columns['id']
+    for start in range(0, len(inputs), chunk_rows):
+        stop = min(start + chunk_rows, len(inputs))
+        yield inputs.slice(start, stop), ids[start:stop]
+
+
+@customer_churn_bank_blueprint.route('/batch_results/<result_id>/targets', methods=['POST'])
+def select_batch_result_targets(result_id: str):
+    """
+    固定預算的挽留名單：以保存的機率選出 ENR 最高的客戶 (不需重新評分)。
+    請求本體：{"budget": 100000} 或 {"max_contacts": 200} (可同時指定，取較嚴者)，
+    可另外覆寫單一 ROI 參數 (例如 "retention_cost": 300) 與 "curve_points" (邊際 ROI 曲線的點數)。
+    """
+    stored = BATCH_RESULTS.get(result_id)
+    if stored is None:
+        return jsonify({"error": "批次結果不存在或已過期，請重新上傳。"}), 404
+    if 'roi_probability' not in stored.meta.get('extra_arrays', []):
+        return jsonify({"error": "此批次結果未保存 ROI 輸入，無法選取名單，請重新上傳。"}), 404
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "請求本體必須為 JSON 物件，例如 {\"budget\": 100000}。"}), 400
+    try:
+        unknown = sorted(set(body) - set(DEFAULT_ROI_PARAMS) - {'budget', 'max_contacts', 'curve_points'})
+        if unknown:
+            raise ValueError(f"未知的參數: {', '.join(unknown)}")
+        # ROI 參數的檢查與 /roi_sweep 相同 (此處每個參數只能有一個值)
+        _, scenarios = build_parameter_grid({name: body[name] for name in DEFAULT_ROI_PARAMS if name in body},
+                                            max_scenarios=1)
+        params = {name: float(values[0]) for name, values in scenarios.items()}
+        budget = float(body['budget']) if body.get('budget') is not None else None
+        max_contacts = int(body['max_contacts']) if body.get('max_contacts') is not None else None
+        curve_points = int(body.get('curve_points', DEFAULT_CURVE_POINTS))
+        if curve_points < 1:
+            raise ValueError("curve_points 必須 >= 1。")
+        limit = contact_limit(params['retention_cost'], budget, max_contacts)
+    except (TypeError, ValueError) as e:
+        logger.error(f"挽留名單參數錯誤: {e}")
+        return jsonify({"error": f"參數錯誤: {e}"}), 400
+
+    # 回傳的名單長度上限 (預算足以聯絡更多人時，只回傳 ENR 最高的 TARGETING_MAX_CONTACTS 位)
+    capped = limit > Config.TARGETING_MAX_CONTACTS
+    start = time.perf_counter()
+    plan = plan_retention_targets(iter_stored_roi_chunks(stored), max_contacts=min(limit, Config.TARGETING_MAX_CONTACTS),
+                                  params=params, curve_points=curve_points)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    logger.info(f"挽留名單 {result_id}: {stored.rows} 筆中選出 {plan['selected_count']} 位，耗時 {elapsed_ms:.1f} ms")
+    return jsonify({**plan, "result_id": result_id, "budget": budget, "max_contacts": max_contacts, "capped": capped,
+                    "elapsed_ms": round(elapsed_ms, 2)})
@@ -0,0 +1,207 @@
+# services\async_chart_store.py
+import threading
+import logging
+import json
+import time
+import uuid
+import re
+import os
+
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('AsyncChartStore')
+logger.setLevel(logging.INFO)
+
+CHART_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# 其他 worker 提交的圖表尚未完成時，檢查共用目錄的間隔 (秒)
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class AsyncChartStore:
+    """
+    在背景執行緒池中繪製圖表，並以短期的共用目錄儲存區提供查詢。
+
+    - submit() 立即回傳 chart_id，繪製工作交由 ThreadPoolExecutor 執行 (執行緒在第一次提交時才建立)。
+    - 每張圖表寫入 root_dir/<chart_id>.json (state 為 pending / ready / failed，寫入暫存檔後以 os.replace 發佈)，
+      所有 gunicorn worker 共用：由任何一個 worker 提交的圖表，都可以從其他 worker 取得。
+    - 每筆圖表在 ttl_seconds 後過期；超過 max_entries 時淘汰最舊的項目。
+    - get() 可選擇等待繪製完成 (timeout)，回傳 (狀態, 結果, metadata)；狀態為 'ready' / 'pending' / 'failed' / 'missing'。
+      本 worker 提交的圖表直接等待 Future，其他 worker 的圖表則輪詢共用目錄。
+    """
+
+    def __init__(self, root_dir: str, max_workers: int = 2, ttl_seconds: float = 120.0, max_entries: int = 512):
+        self.root_dir = root_dir
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.evictions = 0
+
+    def submit(self, render_func: Callable[..., Any], *args: Any, metadata: Optional[Dict[str, Any]] = None,
+               on_done: Optional[Callable[[Any], None]] = None) -> str:
+        """
+        提交繪圖工作並立即回傳 chart_id。
+
+        Args:
+            render_func: 繪圖函式，回傳可 JSON 序列化的圖表內容 (空值視為失敗)。
+            metadata: 與圖表一併保存的資訊 (例如格式)，get() 時原樣回傳。
+            on_done: 繪製成功後以結果呼叫 (例如回填結果快取)。
+        """
+        chart_id = uuid.uuid4().hex
+        entry = {'state': 'pending', 'created_at': time.time(), 'metadata': metadata or {}}
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._write(chart_id, entry)
+        with self._lock:
+            self._pending[chart_id] = self._get_executor().submit(self._run, chart_id, entry, render_func, args,
+                                                                  on_done)
+            self.submitted += 1
+        self.enforce_limits(keep=chart_id)
+        return chart_id
+
+    def get(self, chart_id: str, timeout: Optional[float] = None) -> Tuple[str, Any, Dict[str, Any]]:
+        """回傳 (狀態, 圖表內容, metadata)；timeout 為等待繪製完成的秒數 (None/0 表示不等待)。"""
+        if not CHART_ID_PATTERN.match(chart_id or ''):
+            return 'missing', None, {}
+        deadline = time.monotonic() + (timeout or 0)
+        with self._lock:
+            future = self._pending.get(chart_id)
+        if future is not None and timeout:
+            try:
+                future.exception(timeout=timeout)
+            except FutureTimeoutError:
+                pass
+
+        while True:
+            entry = self._read(chart_id)
+            if entry is None:
+                return 'missing', None, {}
+            if time.time() - entry.get('created_at', 0.0) > self.ttl_seconds:
+                self._remove(chart_id)
+                return 'missing', None, {}
+            if entry['state'] != 'pending' or time.monotonic() >= deadline:
+                break
+            time.sleep(min(POLL_INTERVAL_SECONDS, max(deadline - time.monotonic(), 0)))
+
+        if entry['state'] == 'ready':
+            return 'ready', entry.get('result'), entry['metadata']
+        return entry['state'], None, entry['metadata']
+
+    def enforce_limits(self, keep: str = '') -> None:
+        """移除過期的圖表，再依建立時間由舊到新淘汰，直到份數在 max_entries 以內 (keep 指定的圖表不淘汰)。"""
+        entries: List[Tuple[float, str]] = []
+        now = time.time()
+        for name in os.listdir(self.root_dir) if os.path.isdir(self.root_dir) else []:
+            path = os.path.join(self.root_dir, name)
+            try:
+                modified = os.path.getmtime(path)
+            except OSError:
+                continue
+            chart_id, ext = os.path.splitext(name)
+            if ext != '.json' or not CHART_ID_PATTERN.match(chart_id):
+                # 寫入途中當機留下的暫存檔 (其他 worker 可能正在寫入，只清理超過 TTL 的)
+                if name.endswith('.tmp') and now - modified > self.ttl_seconds:
+                    self._unlink(path)
+                continue
+            if now - modified > self.ttl_seconds and chart_id != keep:
+                self._remove(chart_id)
+                continue
+            entries.append((modified, chart_id))
+
+        entries.sort()
+        excess = len(entries) - self.max_entries
+        for _, chart_id in entries:
+            if excess <= 0:
+                break
+            if chart_id == keep:
+                continue
+            self._remove(chart_id)
+            self.evictions += 1
+            excess -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        size = sum(1 for name in os.listdir(self.root_dir) if name.endswith('.json')) \
+            if os.path.isdir(self.root_dir) else 0
+        return {'size': size, 'pending': pending, 'submitted': self.submitted, 'evictions': self.evictions,
+                'max_entries': self.max_entries, 'ttl_seconds': self.ttl_seconds}
+
+    def shutdown(self, wait: bool = True) -> None:
+        """關閉執行緒池 (尚未完成的繪製工作會先完成)。"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def reset_after_fork(self) -> None:
+        """
+        在 fork 出的子行程中捨棄父行程的執行緒池、鎖與未完成的 Future (其執行緒不存在於子行程，永遠不會完成)。
+        執行緒池會在子行程第一次 submit 時重新建立；共用目錄中的圖表不受影響。
+        """
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.submitted = 0
+        self.evictions = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='chart-render')
+        return self._executor
+
+    def _run(self, chart_id: str, entry: Dict[str, Any], render_func: Callable[..., Any], args: tuple,
+             on_done: Optional[Callable[[Any], None]]) -> Any:
+        result = None
+        try:
+            result = render_func(*args)
+        except Exception as e:
+            logger.error(f"圖表 {chart_id} 繪製失敗: {e}")
+        try:
+            self._write(chart_id, {**entry, 'state': 'ready' if result else 'failed', 'result': result or None})
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"圖表 {chart_id} 寫入共用目錄失敗: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(chart_id, None)
+        if result and on_done is not None:
+            try:
+                on_done(result)
+            except Exception as e:
+                logger.warning(f"圖表繪製完成回呼失敗: {e}")
+        return result
+
+    def _path(self, chart_id: str) -> str:
+        return os.path.join(self.root_dir, f'{chart_id}.json')
+
+    def _write(self, chart_id: str, entry: Dict[str, Any]) -> None:
+        """寫入暫存檔後以 os.replace 發佈，其他 worker 不會讀到寫到一半的內容。"""
+        tmp_path = os.path.join(self.root_dir, f'.{chart_id}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, default=float)
+            os.replace(tmp_path, self._path(chart_id))
+        except Exception:
+            self._unlink(tmp_path)
+            raise
+
+    def _read(self, chart_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(chart_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove(self, chart_id: str) -> None:
+        self._unlink(self._path(chart_id))
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,217 @@
+# services\batch_input_schema.py
+# 批次 CSV 的宣告式輸入結構：只解析需要的欄位 (usecols)、明確的 dtype (數值為 float64，Geography / Gender 為 category)，
+# 解析同時完成欄位缺失、缺失值與型別錯誤的檢查；可選用 pyarrow 的多執行緒 CSV 讀取器
+import logging
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+from typing import Any, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger('BatchInputSchema')
+logger.setLevel(logging.INFO)
+
+CSV_ENGINES = ('c', 'pyarrow')
+
+
+class BatchSchemaError(ValueError):
+    """上傳的 CSV 不符合輸入結構 (缺少關鍵欄位、關鍵欄位有缺失值或數值無法解析)，訊息可直接回傳給用戶端。"""
+
+
+def factorize_column(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    回傳 (代碼, 不重複值)，缺失值的代碼為 -1。
+
+    類別 (category) 欄位直接使用既有的類別代碼；read_csv 的類別一律為字串，若所有類別都能解析為數字
+    則轉為數值 (int64 或 float64)，與未宣告 dtype 時 read_csv 對純數字欄位的型別推斷一致
+    (例如以 0/1/2 編碼的 Geography)。
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories
+        if categories.dtype == object and len(categories):
+            numeric = pd.to_numeric(categories, errors='coerce')
+            if not np.isnan(numeric.to_numpy(dtype=float)).any():
+                categories = numeric
+        return values.cat.codes.to_numpy(), categories.to_numpy()
+    codes, uniques = pd.factorize(values)
+    return codes, np.asarray(uniques)
+
+
+def decode_categorical(values: pd.Series) -> np.ndarray:
+    """將類別欄位還原為原始值陣列 (純數字的類別還原為數值)，供回應輸出；缺失值為 NaN。"""
+    codes, uniques = factorize_column(values)
+    decoded = uniques[codes]
+    missing = codes < 0
+    if missing.any():
+        decoded = np.where(missing, np.nan, decoded)
+    return decoded
+
+
+class _PrefixedStream(io.RawIOBase):
+    """先讀出已消耗的標頭列，再接續原本的串流 (上傳串流無法倒帶)。"""
+
+    def __init__(self, prefix: bytes, stream: Any):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if self._prefix:
+            data, self._prefix = self._prefix[:len(buffer)], self._prefix[len(buffer):]
+        else:
+            data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class BatchInputSchema:
+    """
+    批次上傳的輸入結構。
+
+    - dtypes: {欄位: dtype}，只有列出的欄位會被解析 (其他欄位如 Surname 或使用者附帶的欄位在解析時即略過)；
+      dtype 為 'float64' 或 'category'。
+    - required: 必須存在且不可有缺失值的欄位。
+    - engine: 'c' (pandas 內建) 或 'pyarrow' (整份檔案讀取時使用；未安裝 pyarrow 時退回 'c')。
+      分塊讀取 (串流、批次工作) 一律使用 'c'。
+    """
+
+    def __init__(self, dtypes: Dict[str, str], required: List[str], na_values: List[str], engine: str = 'c'):
+        if engine not in CSV_ENGINES:
+            raise ValueError(f"不支援的 CSV 解析引擎: {engine}，可選: {', '.join(CSV_ENGINES)}")
+        if engine == 'pyarrow':
+            try:
+                import pyarrow.csv  # noqa: F401
+            except ImportError:
+                logger.warning("未安裝 pyarrow，批次 CSV 改用 pandas 內建的 C 解析器。")
+                engine = 'c'
+        self.dtypes = dict(dtypes)
+        self.required = list(required)
+        self.na_values = list(na_values)
+        self.engine = engine
+
+    # ------------------------------------------------------------------
+    # 讀取
+    # ------------------------------------------------------------------
+    def read(self, source: Any) -> pd.DataFrame:
+        """解析並檢查整份 CSV；不符合結構時拋出 BatchSchemaError。"""
+        if self.engine == 'pyarrow':
+            df = self._parse(self._read_arrow, source)
+        else:
+            df = self._parse(pd.read_csv, source, **self._read_csv_options())
+        if df.empty:
+            raise BatchSchemaError("CSV 檔案為空。")
+        self.validate(df)
+        return df
+
+    def read_head(self, source: Any, nrows: int) -> pd.DataFrame:
+        """只解析並檢查前 nrows 筆 (例如批次工作排入佇列前的快速檢查)。"""
+        df = self._parse(pd.read_csv, source, nrows=nrows, **self._read_csv_options())
+        if df.empty:
+            raise BatchSchemaError("CSV 檔案為空。")
+        self.validate(df)
+        return df
+
+    def iter_chunks(self, source: Any, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """
+        以固定筆數的區塊解析，每個區塊產出前完成檢查；第二個區塊起的錯誤訊息附上區塊編號與起始筆數。
+        檔案為空時於第一個區塊拋出 BatchSchemaError。
+        """
+        reader = self._parse(pd.read_csv, source, chunksize=chunk_rows, **self._read_csv_options())
+        chunk_index = 0
+        rows = 0
+        while True:
+            try:
+                chunk = self._parse(next, reader, None)
+                if chunk is None or (chunk_index == 0 and chunk.empty):
+                    if chunk_index == 0:
+                        raise BatchSchemaError("CSV 檔案為空。")
+                    return
+                self.validate(chunk)
+            except BatchSchemaError as e:
+                if chunk_index == 0:
+                    raise
+                raise BatchSchemaError(f"第 {chunk_index + 1} 個區塊 (第 {rows + 1} 筆起): {e}") from e
+            yield chunk
+            chunk_index += 1
+            rows += len(chunk)
+
+    def _read_csv_options(self) -> Dict[str, Any]:
+        columns = self.dtypes
+        return dict(encoding='utf-8', usecols=lambda col: col in columns, dtype=self.dtypes,
+                    keep_default_na=True, na_values=self.na_values)
+
+    def _read_arrow(self, source: Any) -> pd.DataFrame:
+        """
+        pyarrow.csv 讀取：先讀標頭列得知實際存在的欄位，只解析其中宣告過的欄位並依宣告型別轉換
+        (category 對應 dictionary<int32, string>)；缺少的欄位留給 validate 回報。
+        """
+        import pyarrow as pa
+        import pyarrow.csv
+
+        stream = open(source, 'rb') if isinstance(source, str) else source
+        try:
+            header = stream.readline()
+            names = next(csv.reader([header.decode('utf-8-sig')]), [])
+            if not names:
+                raise BatchSchemaError("CSV 檔案為空。")
+            columns = [col for col in self.dtypes if col in names]
+            convert_options = pa.csv.ConvertOptions(
+                column_types={col: pa.dictionary(pa.int32(), pa.string()) if self.dtypes[col] == 'category'
+                              else pa.float64() for col in columns},
+                include_columns=columns,
+                null_values=sorted(set(pa.csv.ConvertOptions().null_values) | set(self.na_values)),
+                strings_can_be_null=True
+            )
+            # 只有標頭且沒有結尾換行時補上換行，讓 pyarrow 解析為 0 筆 (而非無法判斷欄位數)
+            prefix = header if header.endswith(b'\n') else header + b'\n'
+            table = pa.csv.read_csv(io.BufferedReader(_PrefixedStream(prefix, stream)),
+                                    convert_options=convert_options)
+        finally:
+            if stream is not source:
+                stream.close()
+        return table.to_pandas()
+
+    @staticmethod
+    def _parse(func: Any, *args: Any, **kwargs: Any) -> Any:
+        """呼叫解析函式，將解析器的錯誤 (型別轉換失敗、格式錯誤、空檔案) 轉為 BatchSchemaError。"""
+        try:
+            return func(*args, **kwargs)
+        except BatchSchemaError:
+            raise
+        except pd.errors.EmptyDataError as e:
+            raise BatchSchemaError("CSV 檔案為空。") from e
+        except ValueError as e:
+            logger.error(f"CSV 解析失敗: {e}")
+            raise BatchSchemaError(f"CSV 欄位值無法依宣告的型別解析 (數值欄位含非數字內容或格式錯誤): {e}") from e
+
+    # ------------------------------------------------------------------
+    # 檢查
+    # ------------------------------------------------------------------
+    def validate(self, df: pd.DataFrame) -> None:
+        """
+        檢查 required 欄位是否存在且無缺失值，不符合時拋出 BatchSchemaError。
+        各欄位型別已由解析器確定，缺失值檢查逐欄在 float64 陣列 / 類別代碼上進行，不建立混合型別的物件矩陣。
+        """
+        # ★★★ 結構性檢查：檢查核心欄位是否存在 ★★★
+        missing_cols = [col for col in self.required if col not in df.columns]
+        if missing_cols:
+            error_msg = f"CSV 檔案中缺少關鍵欄位，無法導入。缺失欄位: {', '.join(missing_cols)}"
+            logger.error(f"結構性檢查失敗: {error_msg}")
+            raise BatchSchemaError(error_msg)
+
+        # ★★★ 數據檢查：檢查關鍵欄位中是否存在任何 NaN 值 ★★★
+        missing_data_cols = [col for col in self.required if self._has_missing(df[col])]
+        if missing_data_cols:
+            error_msg = f"CSV 檔案在關鍵欄位中發現缺失值，無法導入。包含缺失值的欄位: {', '.join(missing_data_cols)}"
+            logger.error(f"數據缺失檢查失敗: {error_msg}")
+            raise BatchSchemaError(error_msg)
+
+    @staticmethod
+    def _has_missing(values: pd.Series) -> bool:
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return bool((values.cat.codes.to_numpy() < 0).any())
+        return bool(values.isna().to_numpy().any())
@@ -0,0 +1,309 @@
+# services\batch_job_store.py
+import concurrent.futures
+import multiprocessing
+import threading
+import logging
+import shutil
+import json
+import time
+import uuid
+import os
+import re
+
+from typing import Any, Callable, Dict, IO, Optional
+
+try:
+    import fcntl  # 僅 POSIX：以檔案鎖判斷工作是否仍有行程負責
+except ImportError:  # pragma: no cover - Windows 開發環境
+    fcntl = None
+
+logger = logging.getLogger('BatchJobStore')
+logger.setLevel(logging.INFO)
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+INPUT_FILE = 'input.csv'
+RESULT_FILE = 'result.csv'
+STATUS_FILE = 'status.json'
+LOCK_FILE = '.lock'
+ACTIVE_STATES = ('queued', 'running')
+
+
+class JobAttemptSuperseded(RuntimeError):
+    """工作已被重新排程 (例如原 worker 當機後由其他行程接手)，舊的執行應停止寫入。"""
+
+
+def read_status(job_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(job_dir, STATUS_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def update_status(job_dir: str, expected_attempt: Optional[int] = None, **fields: Any) -> Dict[str, Any]:
+    """
+    合併欄位後以 tmp + os.replace 原子寫回 status.json。
+    指定 expected_attempt 時，若磁碟上的 attempt 已不同 (工作被重新排程) 則拋出 JobAttemptSuperseded。
+    """
+    status = read_status(job_dir) or {}
+    if expected_attempt is not None and status.get('attempt') != expected_attempt:
+        raise JobAttemptSuperseded(f"工作 {status.get('job_id')} 已進入第 {status.get('attempt')} 次執行。")
+    status.update(fields)
+    status['updated_at'] = time.time()
+    tmp_path = os.path.join(job_dir, f'{STATUS_FILE}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False, default=float)
+    os.replace(tmp_path, os.path.join(job_dir, STATUS_FILE))
+    return status
+
+
+def partial_result_path(job_dir: str, attempt: int) -> str:
+    """第 attempt 次執行寫入中的結果暫存檔 (完成後以 os.replace 發佈為 result.csv)。"""
+    return os.path.join(job_dir, f'{RESULT_FILE}.{attempt}.partial')
+
+
+def _init_job_process(nice: int, threads: int) -> None:
+    """工作子行程初始化：降低排程優先權並限制 OpenMP 執行緒數 (需在匯入 xgboost 之前設定)，避免影響即時 /predict。"""
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+    if threads > 0:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+
+    # 行程池的子行程在父行程 (gunicorn worker) 被強制結束時不會自行退出；監看父行程，結束時立即跟著退出，
+    # 未完成的工作由其他 worker 在 recover_orphans 中重新排程
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=lambda: (parent.join(), os._exit(1)), name='job-parent-watch', daemon=True).start()
+
+
+class BatchJobStore:
+    """
+    以本機磁碟保存的非同步批次評分工作，於獨立的行程池中執行。
+
+    - 每個工作一個目錄：input.csv (上傳內容)、status.json (狀態與進度)、result.csv (完成後才出現)。
+    - runner(job_dir, attempt) 在子行程 (spawn) 中執行實際評分，並透過 update_status 回報進度。
+    - 負責執行的 worker 在工作進行期間持有該工作目錄的檔案鎖；worker 當機或重啟時鎖由作業系統釋放，
+      其他 (或重啟後的) worker 在 recover_orphans 中取得鎖後以新的 attempt 重新排程，舊的執行在下次回報進度時自行停止。
+    """
+
+    def __init__(self, root_dir: str, runner: Callable[[str, int], Any], max_workers: int = 1,
+                 max_pending: int = 8, ttl_seconds: float = 86400.0, nice: int = 10, threads: int = 1,
+                 recovery_interval: float = 30.0):
+        self.root_dir = root_dir
+        self.runner = runner
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.nice = nice
+        self.threads = threads
+        self.recovery_interval = recovery_interval
+
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._held_locks: Dict[str, Any] = {}
+        self._next_recovery = 0.0
+
+    # ------------------------------------------------------------------
+    # 建立與查詢
+    # ------------------------------------------------------------------
+    def create_job(self, source: IO[bytes], options: Dict[str, Any],
+                   preflight: Optional[Callable[[str], str]] = None) -> Dict[str, Any]:
+        """
+        將上傳串流寫入磁碟並排入佇列，回傳初始狀態；排隊中的工作已達上限時拋出 OverflowError。
+        preflight(input_path) 可在排入佇列前快速檢查 (例如欄位)，回傳非空錯誤訊息時刪除工作並拋出 ValueError。
+        """
+        self.recover_orphans()
+        if self.pending_count() >= self.max_pending:
+            raise OverflowError(f"排隊中的批次工作已達上限 ({self.max_pending})，請稍後再試。")
+
+        job_id = uuid.uuid4().hex
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir)
+        input_path = os.path.join(job_dir, INPUT_FILE)
+        with open(input_path, 'wb') as f:
+            shutil.copyfileobj(source, f, length=1 << 20)
+
+        try:
+            error_msg = preflight(input_path) if preflight is not None else ''
+            if error_msg:
+                raise ValueError(error_msg)
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        status = update_status(
+            job_dir, job_id=job_id, state='queued', attempt=1, options=options,
+            total_rows=self._count_rows(input_path), rows_done=0, created_at=time.time(),
+            input_bytes=os.path.getsize(input_path)
+        )
+        self._submit(job_id, attempt=1)
+        logger.info(f"批次工作 {job_id} 已排入佇列 ({status['total_rows']} 筆，{status['input_bytes']} bytes)。")
+        return status
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        self.recover_orphans()
+        status = read_status(self._job_dir(job_id))
+        if status is not None and status.get('total_rows'):
+            status['progress'] = round(min(status.get('rows_done', 0) / status['total_rows'], 1.0), 4)
+        return status
+
+    def result_path(self, job_id: str) -> Optional[str]:
+        """已完成工作的結果 CSV 路徑 (尚未完成或不存在時回傳 None)。"""
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        path = os.path.join(self._job_dir(job_id), RESULT_FILE)
+        status = read_status(self._job_dir(job_id))
+        return path if status and status.get('state') == 'succeeded' and os.path.exists(path) else None
+
+    def pending_count(self) -> int:
+        count = 0
+        for job_id in self._job_ids():
+            status = read_status(self._job_dir(job_id))
+            if status and status.get('state') in ACTIVE_STATES:
+                count += 1
+        return count
+
+    # ------------------------------------------------------------------
+    # 執行
+    # ------------------------------------------------------------------
+    def _submit(self, job_id: str, attempt: int, lock_held: bool = False) -> None:
+        """將工作交給行程池；lock_held=True 表示呼叫端已取得 (並轉交) 該工作的檔案鎖。"""
+        if not lock_held and not self._acquire_job_lock(job_id):
+            raise RuntimeError(f"無法取得批次工作 {job_id} 的檔案鎖。")
+        try:
+            future = self._get_executor().submit(self.runner, self._job_dir(job_id), attempt)
+        except Exception:
+            self._release_job_lock(job_id)
+            raise
+        future.add_done_callback(lambda f: self._on_done(job_id, attempt, f))
+
+    def _on_done(self, job_id: str, attempt: int, future: concurrent.futures.Future) -> None:
+        try:
+            error = future.exception()
+            if error is not None and not isinstance(error, JobAttemptSuperseded):
+                # runner 自身會記錄失敗；這裡處理子行程當機 (BrokenProcessPool) 等 runner 來不及記錄的情況
+                status = read_status(self._job_dir(job_id)) or {}
+                if status.get('attempt') == attempt and status.get('state') in ACTIVE_STATES:
+                    update_status(self._job_dir(job_id), state='failed', error=str(error) or type(error).__name__,
+                                  finished_at=time.time())
+                logger.error(f"批次工作 {job_id} 失敗: {error!r}")
+                if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+                    with self._lock:
+                        self._executor = None
+        finally:
+            self._release_job_lock(job_id)
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn：子行程不繼承 worker 的執行緒與鎖狀態 (fork 一個多執行緒行程並不安全)
+                    self._executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_job_process,
+                        initargs=(self.nice, self.threads)
+                    )
+                    logger.info(f"批次工作行程池已啟動 (max_workers={self.max_workers}, nice={self.nice})。")
+        return self._executor
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def reset_after_fork(self) -> None:
+        """在 fork 出的子行程中捨棄父行程的行程池與鎖 (master 不會持有工作，只需重建)。"""
+        self._executor = None
+        self._lock = threading.Lock()
+        self._held_locks = {}
+        self._next_recovery = 0.0
+
+    # ------------------------------------------------------------------
+    # 復原與清理
+    # ------------------------------------------------------------------
+    def recover_orphans(self, force: bool = False) -> int:
+        """
+        重新排程無人負責的工作 (負責的 worker 已結束，檔案鎖已釋放)，並刪除超過 ttl_seconds 的已結束工作。
+        每 recovery_interval 秒最多執行一次 (force=True 時立即執行)；回傳重新排程的數量。
+        """
+        now = time.monotonic()
+        if fcntl is None or (not force and now < self._next_recovery):
+            return 0
+        self._next_recovery = now + self.recovery_interval
+
+        recovered = 0
+        for job_id in self._job_ids():
+            job_dir = self._job_dir(job_id)
+            status = read_status(job_dir)
+            if status is None or job_id in self._held_locks:
+                continue
+            if status.get('state') in ACTIVE_STATES:
+                if not self._acquire_job_lock(job_id):
+                    continue  # 仍有行程負責，或其他 worker 正在接手
+                # 持有鎖直到轉交給 _submit，其他 worker 無法在中間搶先重新排程；
+                # 取得鎖後重新讀取狀態：工作可能在檢查與取得鎖之間已完成或已被其他 worker 接手
+                status = read_status(job_dir)
+                if status is None or status.get('state') not in ACTIVE_STATES:
+                    self._release_job_lock(job_id)
+                    continue
+                try:
+                    for name in os.listdir(job_dir):
+                        if name.endswith('.partial'):  # 已結束的執行留下的結果暫存檔
+                            os.remove(os.path.join(job_dir, name))
+                    attempt = int(status.get('attempt', 1)) + 1
+                    update_status(job_dir, state='queued', attempt=attempt, rows_done=0, recovered_at=time.time())
+                    self._submit(job_id, attempt, lock_held=True)
+                except Exception as e:
+                    self._release_job_lock(job_id)
+                    logger.error(f"重新排程批次工作 {job_id} 失敗: {e}")
+                    continue
+                recovered += 1
+                logger.warning(f"批次工作 {job_id} 的負責行程已結束，以第 {attempt} 次執行重新排程。")
+            elif time.time() - status.get('finished_at', status.get('created_at', time.time())) > self.ttl_seconds:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                logger.info(f"批次工作 {job_id} 已過期並刪除。")
+        return recovered
+
+    def _acquire_job_lock(self, job_id: str) -> bool:
+        if fcntl is None:
+            return True
+        handle = open(os.path.join(self._job_dir(job_id), LOCK_FILE), 'a+')
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._held_locks[job_id] = handle
+        return True
+
+    def _release_job_lock(self, job_id: str) -> None:
+        handle = self._held_locks.pop(job_id, None)
+        if handle is not None:
+            handle.close()  # 關閉檔案即釋放 flock
+
+    # ------------------------------------------------------------------
+    # 工具
+    # ------------------------------------------------------------------
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.root_dir, job_id)
+
+    def _job_ids(self):
+        if not os.path.isdir(self.root_dir):
+            return []
+        return [name for name in os.listdir(self.root_dir) if JOB_ID_PATTERN.match(name)]
+
+    @staticmethod
+    def _count_rows(path: str) -> int:
+        """以換行數估計資料筆數 (扣除標頭)，用於進度百分比。"""
+        lines = 0
+        last = b'\n'
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                lines += block.count(b'\n')
+                last = block[-1:]
+        if last != b'\n':
+            lines += 1
+        return max(lines - 1, 0)
@@ -0,0 +1,130 @@
+# services\batch_result_encoder.py
+# /predict_batch 的回應格式：直接由 NumPy 欄位陣列輸出逐筆 JSON、欄式 JSON、CSV、Parquet 與 Arrow IPC
+import json
+import io
+
+import numpy as np
+import pandas as pd
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# /predict_batch 可選的結果格式 (?format=...；未指定時依 Accept 標頭協商，預設 records)
+BATCH_RESULT_FORMATS = ('records', 'columnar', 'csv', 'parquet', 'arrow')
+BATCH_RESULT_MIME_TYPES = {
+    'records': 'application/json',
+    'columnar': 'application/json',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+# 需要 pyarrow (選用套件) 的格式
+ARROW_RESULT_FORMATS = ('parquet', 'arrow')
+
+
+class ResultFormatUnavailable(RuntimeError):
+    """請求的結果格式需要尚未安裝的選用套件 (pyarrow)。"""
+
+
+def negotiate_result_format(requested: str, accept: Any) -> str:
+    """
+    決定結果格式：明確指定的 ?format= 優先，否則依 Accept 標頭 (werkzeug MIMEAccept) 選擇；
+    application/json 或 */* 時為 records (與既有回應相同)。不支援的格式拋出 ValueError。
+    """
+    if requested:
+        result_format = requested.lower()
+        if result_format not in BATCH_RESULT_FORMATS:
+            raise ValueError(f"不支援的結果格式: {result_format}，可選: {', '.join(BATCH_RESULT_FORMATS)}")
+        return result_format
+    mimetypes = ['application/json', 'text/csv', BATCH_RESULT_MIME_TYPES['parquet'], BATCH_RESULT_MIME_TYPES['arrow']]
+    best = accept.best_match(mimetypes, default='application/json') if accept else 'application/json'
+    return {'text/csv': 'csv', BATCH_RESULT_MIME_TYPES['parquet']: 'parquet',
+            BATCH_RESULT_MIME_TYPES['arrow']: 'arrow'}.get(best, 'records')
+
+
+def ensure_format_available(result_format: str) -> None:
+    """在評分前確認格式所需的套件已安裝，避免算完整個批次才失敗。"""
+    if result_format in ARROW_RESULT_FORMATS:
+        _import_pyarrow()
+
+
+def _import_pyarrow() -> Any:
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ResultFormatUnavailable("Parquet / Arrow 結果格式需要安裝 pyarrow。") from e
+    return pyarrow
+
+
+def truncate_decimals(values: np.ndarray, decimals: int) -> np.ndarray:
+    """
+    向量化截斷至小數點後 decimals 位 (例如 0.12345 -> 0.1234)，NaN 視為 0。
+
+    乘法與取整保留輸入的 dtype (模型輸出為 float32)，截斷位置與逐筆 np.floor 相同；除法改在 float64 中進行，
+    輸出為乾淨的四位小數 (在 float32 中除回會得到 0.11069999635219574 之類的值)。
+    """
+    scale = 10 ** decimals
+    return np.floor(np.nan_to_num(values, nan=0.0) * scale).astype(np.float64) / scale
+
+
+def to_records(result_df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    逐筆 JSON 的 [{欄位: 值}, ...]：每個欄位以 ndarray.tolist() 一次轉為 Python 原生型別後再組合，
+    取代 DataFrame.to_dict('records') 的逐格型別轉換 (輸出相同)。
+    """
+    names = list(result_df.columns)
+    columns = [result_df[name].to_numpy().tolist() for name in names]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def to_columnar(result_df: pd.DataFrame) -> Dict[str, Any]:
+    """欄式 JSON：{'columns': [欄位順序], 'data': {欄位: [值, ...]}}，每個欄位只產生一個串列。"""
+    names = list(result_df.columns)
+    return {'columns': names, 'data': {name: result_df[name].to_numpy().tolist() for name in names}}
+
+
+def to_csv(result_df: pd.DataFrame) -> str:
+    return result_df.to_csv(index=False)
+
+
+def to_arrow_bytes(result_df: pd.DataFrame, result_format: str, metadata: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    Parquet 檔案或 Arrow IPC 串流。數值欄位由 NumPy 陣列零複製轉為 Arrow 陣列；
+    metadata (ROI、model_version 等) 以 JSON 字串寫入 schema metadata，檔案本身即可自我描述。
+    """
+    pa = _import_pyarrow()
+    names = list(result_df.columns)
+    table = pa.Table.from_arrays([pa.array(result_df[name].to_numpy()) for name in names], names=names)
+    if metadata:
+        table = table.replace_schema_metadata(
+            {key: json.dumps(value, ensure_ascii=False, default=float) for key, value in metadata.items()}
+        )
+
+    sink = pa.BufferOutputStream()
+    if result_format == 'parquet':
+        pa.parquet.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_batch_result(result_df: pd.DataFrame, result_format: str,
+                        metadata: Dict[str, Any]) -> Tuple[Any, str]:
+    """
+    將批次結果編碼為指定格式，回傳 (內容, MIME 類型)。
+
+    - records / columnar: 回傳 dict (由呼叫端以 jsonify 輸出)，metadata 併入最上層欄位。
+    - csv: 純 CSV 文字；metadata 由呼叫端放在回應標頭。
+    - parquet / arrow: bytes；metadata 同時寫入 schema metadata。
+    """
+    if result_format == 'records':
+        return {**metadata, 'data': to_records(result_df)}, BATCH_RESULT_MIME_TYPES['records']
+    if result_format == 'columnar':
+        return {**metadata, 'format': 'columnar', **to_columnar(result_df)}, BATCH_RESULT_MIME_TYPES['columnar']
+    if result_format == 'csv':
+        return to_csv(result_df), BATCH_RESULT_MIME_TYPES['csv']
+    if result_format in ARROW_RESULT_FORMATS:
+        return to_arrow_bytes(result_df, result_format, metadata), BATCH_RESULT_MIME_TYPES[result_format]
+    raise ValueError(f"不支援的結果格式: {result_format}")
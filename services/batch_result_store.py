@@ -0,0 +1,293 @@
+# services\batch_result_store.py
+import threading
+import logging
+import shutil
+import json
+import time
+import uuid
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.batch_result_encoder import to_records
+
+logger = logging.getLogger('BatchResultStore')
+logger.setLevel(logging.INFO)
+
+RESULT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+META_FILE = 'meta.json'
+# 可供伺服器端排序的鍵 ('none' = 原始上傳順序；'risk' = probability > 0.5 的高/低風險，同級再依 id)
+SORT_KEYS = ('none', 'id', 'probability', 'risk')
+SORT_ORDERS = ('asc', 'desc')
+
+
+class StoredBatchResult:
+    """
+    一份已寫入磁碟的批次結果：每個欄位一個 .npy (以 mmap 開啟，只有被查詢到的頁面會進入記憶體)，
+    另有寫入時預先計算好的排序索引 (升冪；降冪時反向讀取)。
+    """
+
+    def __init__(self, result_dir: str, meta: Dict[str, Any]):
+        self.result_dir = result_dir
+        self.meta = meta
+        self.columns = {name: np.load(os.path.join(result_dir, f'col_{i}.npy'), mmap_mode='r')
+                        for i, name in enumerate(meta['columns'])}
+        self._indexes: Dict[str, np.ndarray] = {}
+
+    @property
+    def rows(self) -> int:
+        return int(self.meta['rows'])
+
+    def extra_arrays(self) -> Dict[str, np.ndarray]:
+        """put 時隨結果保存、不屬於回應欄位的陣列 (例如 ROI 試算用的原始機率)，以 mmap 開啟。"""
+        return {name: np.load(os.path.join(self.result_dir, f'extra_{name}.npy'), mmap_mode='r')
+                for name in self.meta.get('extra_arrays', [])}
+
+    def query(self, sort: str = 'none', order: str = 'asc', min_probability: float = 0.0, id_search: str = '',
+              page: int = 1, page_size: int = 10) -> Dict[str, Any]:
+        """
+        依 (probability >= min_probability) 且 (id 字串包含 id_search，不分大小寫) 篩選、排序後回傳指定頁。
+        頁碼超出範圍時夾在 [1, total_pages] 之間 (與前端既有的分頁行為相同)。
+        """
+        rows = self._matching_rows(sort, order, min_probability, id_search.strip().lower())
+        matched = len(rows)
+        total_pages = -(-matched // page_size)
+        page = min(max(page, 1), max(total_pages, 1))
+        page_rows = np.asarray(rows[(page - 1) * page_size:page * page_size])
+
+        page_df = pd.DataFrame({name: column[page_rows] for name, column in self.columns.items()})
+        return {
+            "result_id": self.meta['result_id'],
+            "total_rows": self.rows,
+            "matched_rows": matched,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": total_pages,
+            "sort": sort,
+            "order": order,
+            "data": to_records(page_df)
+        }
+
+    def _matching_rows(self, sort: str, order: str, min_probability: float, id_search: str) -> np.ndarray:
+        """回傳符合條件的列位置 (已依排序排列)。"""
+        probability = self.columns['probability']
+        if sort == 'probability' and not id_search:
+            # 依機率排序時，門檻篩選的結果就是排序索引的一段後綴：二分搜尋即可，不需逐列比較
+            cut = int(np.searchsorted(self._index('sorted_probability'), min_probability, side='left'))
+            rows = self._index('order_probability')[cut:]
+            return rows[::-1] if order == 'desc' else rows
+
+        mask = probability >= min_probability
+        if id_search:
+            mask &= contains_substring(self._index('id_text'), id_search)
+        if sort == 'none':
+            return np.flatnonzero(mask)
+        ordered = self._index(f'order_{sort}')
+        rows = ordered[mask[ordered]]
+        return rows[::-1] if order == 'desc' else rows
+
+    def _index(self, name: str) -> np.ndarray:
+        index = self._indexes.get(name)
+        if index is None:
+            index = np.load(os.path.join(self.result_dir, f'{name}.npy'), mmap_mode='r')
+            self._indexes[name] = index
+        return index
+
+
+def contains_substring(text: np.ndarray, term: str) -> np.ndarray:
+    """
+    固定寬度 Unicode 陣列中每個字串是否包含 term。把陣列視為 (n, 寬度) 的 UTF-32 碼位矩陣，對每個起始位置
+    逐字元整欄比較，取代 np.char.find 的逐元素呼叫 (100 萬筆由約 0.8 秒降至數十毫秒)。
+    """
+    width = text.dtype.itemsize // 4
+    needle = np.frombuffer(term.encode('utf-32-le'), dtype=np.uint32)
+    if len(needle) > width:
+        return np.zeros(len(text), dtype=bool)
+    codes = text.view(np.uint32).reshape(len(text), width)
+    found = np.zeros(len(text), dtype=bool)
+    for offset in range(width - len(needle) + 1):
+        window = codes[:, offset] == needle[0]
+        for j in range(1, len(needle)):
+            window &= codes[:, offset + j] == needle[j]
+        found |= window
+    return found
+
+
+def build_sort_indexes(result_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    預先計算排序索引 (全部為升冪、同值依 id 升冪，降冪查詢時反向讀取即與前端的同值依 id 降冪一致)。
+    另存排序後的機率 (門檻查詢用二分搜尋) 與小寫的 id 字串 (ID 搜尋用)。
+    """
+    probability = result_df['probability'].to_numpy()
+    ids = result_df['id'] if 'id' in result_df.columns else pd.Series(np.arange(len(result_df)))
+    # 列位置以 int32 保存 (< 2^31 筆)，索引大小減半
+    index_dtype = np.int32 if len(result_df) < 2 ** 31 else np.int64
+    order_probability = np.lexsort((ids.to_numpy(), probability)).astype(index_dtype)
+    return {
+        'order_id': np.argsort(ids.to_numpy(), kind='stable').astype(index_dtype),
+        'order_probability': order_probability,
+        'order_risk': np.lexsort((ids.to_numpy(), probability > 0.5)).astype(index_dtype),
+        'sorted_probability': probability[order_probability],
+        # 經由 Python 字串轉換，固定寬度只取最長的 id 長度 (int64 直接 astype(str) 會是 21 個字元寬)
+        'id_text': ids.astype(str).str.lower().to_numpy().astype(str),
+    }
+
+
+class BatchResultStore:
+    """
+    伺服器端的批次結果儲存區：/predict_batch 只回傳 result_id 與第一頁，之後的排序、門檻篩選、ID 搜尋與分頁
+    都在伺服器端以預先計算的排序索引完成，瀏覽器不必持有與複製整份結果。
+
+    - 結果寫入 root_dir/<result_id>/ (每欄一個 .npy + 排序索引 + meta.json)，所有 gunicorn worker 共用；
+      查詢時以 mmap 開啟，每個 worker 只保留最近使用的 max_open 份開啟中的結果。
+    - 每份結果在 ttl_seconds 後過期；磁碟總量超過 max_bytes 或份數超過 max_entries 時淘汰最舊的結果。
+    """
+
+    def __init__(self, root_dir: str, ttl_seconds: float = 1800.0, max_bytes: int = 512 * 1024 * 1024,
+                 max_entries: int = 32, max_open: int = 8):
+        self.root_dir = root_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_open = max_open
+
+        self._open: 'OrderedDict[str, StoredBatchResult]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stored = 0
+        self.rejected = 0
+
+    def put(self, result_df: pd.DataFrame, metadata: Optional[Dict[str, Any]] = None,
+            extra_arrays: Optional[Dict[str, np.ndarray]] = None) -> Optional[str]:
+        """
+        保存一份批次結果 (需含 'probability' 與 'id' 欄位) 並回傳 result_id；
+        extra_arrays 為一併保存、但不出現在查詢結果中的數值陣列 (見 StoredBatchResult.extra_arrays)。
+        單份結果就超過 max_bytes 時不保存並回傳 None (呼叫端改為一次回傳全部資料)。
+        """
+        extra_arrays = extra_arrays or {}
+        arrays: List[np.ndarray] = []
+        for name in result_df.columns:
+            values = result_df[name].to_numpy()
+            # 字串欄位 (Geography、Gender) 轉為固定寬度 Unicode，才能以 mmap 開啟 (不使用 pickle)
+            arrays.append(values.astype(str) if values.dtype == object else values)
+        indexes = build_sort_indexes(result_df)
+        nbytes = sum(array.nbytes for array in arrays) + sum(index.nbytes for index in indexes.values()) \
+            + sum(np.asarray(array).nbytes for array in extra_arrays.values())
+        if nbytes > self.max_bytes:
+            self.rejected += 1
+            logger.warning(f"批次結果 ({nbytes / 1e6:.1f} MB) 超過儲存上限 {self.max_bytes / 1e6:.1f} MB，不保存。")
+            return None
+
+        result_id = uuid.uuid4().hex
+        os.makedirs(self.root_dir, exist_ok=True)
+        tmp_dir = os.path.join(self.root_dir, f'.{result_id}.tmp')
+        os.makedirs(tmp_dir)
+        try:
+            for i, array in enumerate(arrays):
+                np.save(os.path.join(tmp_dir, f'col_{i}.npy'), array)
+            for name, index in indexes.items():
+                np.save(os.path.join(tmp_dir, f'{name}.npy'), index)
+            for name, array in extra_arrays.items():
+                np.save(os.path.join(tmp_dir, f'extra_{name}.npy'), np.asarray(array))
+            meta = {**(metadata or {}), 'result_id': result_id, 'created_at': time.time(), 'rows': len(result_df),
+                    'columns': list(result_df.columns), 'extra_arrays': list(extra_arrays), 'nbytes': nbytes}
+            with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, default=float)
+            # 整個目錄寫完才改名發佈，其他 worker 不會讀到寫到一半的結果
+            os.rename(tmp_dir, os.path.join(self.root_dir, result_id))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self.stored += 1
+        self.enforce_limits(keep=result_id)
+        return result_id
+
+    def get(self, result_id: str) -> Optional[StoredBatchResult]:
+        """取得 (以 mmap 開啟) 一份結果；不存在、已過期或已被其他 worker 淘汰時回傳 None。"""
+        if not RESULT_ID_PATTERN.match(result_id or ''):
+            return None
+        result_dir = os.path.join(self.root_dir, result_id)
+        with self._lock:
+            stored = self._open.get(result_id)
+            if stored is not None:
+                self._open.move_to_end(result_id)
+        if stored is None:
+            meta = self._read_meta(result_dir)
+            if meta is None:
+                return None
+            stored = StoredBatchResult(result_dir, meta)
+            with self._lock:
+                self._open[result_id] = stored
+                while len(self._open) > self.max_open:
+                    self._open.popitem(last=False)
+
+        if self._expired(stored.meta) or not os.path.isdir(result_dir):
+            with self._lock:
+                self._open.pop(result_id, None)
+            if os.path.isdir(result_dir):
+                shutil.rmtree(result_dir, ignore_errors=True)
+            return None
+        return stored
+
+    def enforce_limits(self, keep: str = '') -> None:
+        """移除過期的結果，再依建立時間由舊到新淘汰，直到磁碟總量與份數都在上限內 (keep 指定的結果不淘汰)。"""
+        entries: List[Tuple[float, int, str]] = []
+        for name in os.listdir(self.root_dir) if os.path.isdir(self.root_dir) else []:
+            result_dir = os.path.join(self.root_dir, name)
+            if name.endswith('.tmp'):
+                # 寫入途中當機留下的暫存目錄 (其他 worker 可能正好在寫入或已移除，只清理超過 TTL 的)
+                try:
+                    if time.time() - os.path.getmtime(result_dir) > self.ttl_seconds:
+                        shutil.rmtree(result_dir, ignore_errors=True)
+                except OSError:
+                    pass
+                continue
+            meta = self._read_meta(result_dir) if RESULT_ID_PATTERN.match(name) else None
+            if meta is None:
+                continue
+            if self._expired(meta) and name != keep:
+                shutil.rmtree(result_dir, ignore_errors=True)
+                continue
+            entries.append((meta.get('created_at', 0.0), int(meta.get('nbytes', 0)), name))
+
+        entries.sort()
+        total_bytes = sum(nbytes for _, nbytes, _ in entries)
+        count = len(entries)
+        for _, nbytes, name in entries:
+            if total_bytes <= self.max_bytes and count <= self.max_entries:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root_dir, name), ignore_errors=True)
+            total_bytes -= nbytes
+            count -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            open_count = len(self._open)
+        return {'open': open_count, 'stored': self.stored, 'rejected': self.rejected,
+                'max_bytes': self.max_bytes, 'max_entries': self.max_entries, 'ttl_seconds': self.ttl_seconds}
+
+    def reset_after_fork(self) -> None:
+        """在 fork 出的子行程中捨棄父行程的鎖與已開啟的結果 (下次查詢時重新以 mmap 開啟)。"""
+        self._lock = threading.Lock()
+        self._open = OrderedDict()
+        self.stored = 0
+        self.rejected = 0
+
+    def _expired(self, meta: Dict[str, Any]) -> bool:
+        return time.time() - meta.get('created_at', 0.0) > self.ttl_seconds
+
+    @staticmethod
+    def _read_meta(result_dir: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(result_dir, META_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -3,11 +3,18 @@ import pandas as pd
 import numpy as np
 import logging
 import joblib
-import shap
 import os
 import sys  # 🚨 導入 sys 用於強制打印到 stderr
 
-from typing import Dict, Any, List, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from services.tree_inference_engine import ArrayTreeEnsemble
+from services.native_contrib_explainer import NativeContribExplainer
+from services.feature_alignment_plan import FeatureAlignmentPlan
+from services.micro_batch_dispatcher import MicroBatchDispatcher
+from services.prediction_cache import PredictionResultCache, compute_artifact_version
+from services.model_bundle import ModelBundle, bundle_exists, trim_to_best_iteration
+from services.roi_kernel import RoiInputs, PortfolioStats
+from services.retention_targeting import plan_retention_targets
 
 # 🚨 為了讓服務能獨立運行，我們不直接從 train.py 導入 FeatureEngineer，而是假設
 # 外部會提供 FE 函數（例如 routes.py 中的 FeatureEngineerForAPI）
@@ -16,23 +23,94 @@ logger = logging.getLogger('CustomerChurnBankService')
 logger.setLevel(logging.INFO)
 
 class CustomerChurnBankService:
-    def __init__(self, model_path: str, model_dir: str):
-        # 🚨 _load_model 裡面現在有強制錯誤處理
-        self.model = self._load_model(model_path)
+    # 可選的推論後端：
+    # - 'xgboost': 透過 XGBClassifier.predict_proba (sklearn wrapper + DMatrix)
+    # - 'native':  啟動時將 Booster 攤平為 NumPy 陣列，以向量化逐層走訪推論 (見 tree_inference_engine.py)
+    INFERENCE_BACKENDS = ('xgboost', 'native')
+
+    # 可選的 SHAP 解釋後端：
+    # - 'shap':          shap.TreeExplainer (僅在選用時才匯入 shap)
+    # - 'native':        Booster 原生 pred_contribs (精確 TreeSHAP，不需 shap 套件)
+    # - 'native_approx': Booster 原生 approx_contribs (近似值，速度較快)
+    EXPLAINER_BACKENDS = ('shap', 'native', 'native_approx')
+
+    def __init__(self, model_path: str, model_dir: str, inference_backend: str = 'xgboost',
+                 explainer_backend: str = 'shap', bundle_dir: str = None):
+        if inference_backend not in self.INFERENCE_BACKENDS:
+            raise ValueError(f"未知的推論後端: {inference_backend}，可選: {self.INFERENCE_BACKENDS}")
+        if explainer_backend not in self.EXPLAINER_BACKENDS:
+            raise ValueError(f"未知的 SHAP 解釋後端: {explainer_backend}，可選: {self.EXPLAINER_BACKENDS}")
+        # 建構參數 (分片批次評分的子行程以相同參數各自載入模型)
+        self.init_kwargs = {'model_path': model_path, 'model_dir': model_dir, 'inference_backend': inference_backend,
+                            'explainer_backend': explainer_backend, 'bundle_dir': bundle_dir}
+
+        # 優先從版本化工件包載入 (UBJSON Booster + JSON 特徵列表 + 預先攤平的樹陣列)，
+        # 工件包不存在、或不是由目前的 joblib 模型產生 (重新訓練後未更新) 時退回舊的 joblib 工件
+        self.bundle = ModelBundle(bundle_dir) if bundle_exists(bundle_dir) else None
+        if self.bundle is not None and not self.bundle.matches_source_model(model_path):
+            logger.error(f"!!! 工件包 {bundle_dir} (model_version={self.bundle.model_version}) 與 joblib 模型 {model_path} "
+                         f"不一致 (重新訓練後未更新工件包？)，改為載入 joblib 模型。請以 python -m services.model_bundle 重新產生工件包。")
+            self.bundle = None
+        if self.bundle is not None:
+            self.model = self.bundle.model
+            logger.info(f"從工件包載入模型: {bundle_dir} (model_version={self.bundle.model_version})")
+        else:
+            # 🚨 _load_model 裡面現在有強制錯誤處理
+            self.model = self._load_model(model_path)
+        # 只保留 Early Stopping 的最佳輪數，預測與 SHAP 都不再走訪其後的樹
+        self.model, self.best_iteration = trim_to_best_iteration(self.model)
         # 🚨 [新增] 如果模型成功載入，打印成功訊息
         if self.model is not None:
             logger.info("模型載入成功，準備初始化 SHAP Explainer。") # 🚨 新增
         self.model_dir = model_dir
         
         # 載入訓練時保存的特徵列表和 FE 管道名稱
-        self.feature_cols, self.fe_pipeline_name = self._load_model_artifacts(model_dir)
+        if self.bundle is not None:
+            self.feature_cols, self.fe_pipeline_name = self.bundle.feature_cols, self.bundle.fe_pipeline_name
+        else:
+            self.feature_cols, self.fe_pipeline_name = self._load_model_artifacts(model_dir)
+
+        # 依特徵列表預先編譯特徵對齊計畫 (取代每次請求的 get_dummies + reindex)
+        self.alignment_plan = FeatureAlignmentPlan(self.feature_cols) if self.feature_cols else None
         
+        # 微批次分派器 (預設關閉，由 enable_micro_batching 啟用)
+        self.micro_batcher = None
+
+        # 模型版本 (模型與特徵工件內容的雜湊)，作為結果快取鍵的一部分
+        if self.bundle is not None:
+            # 一併監看 joblib 模型：重新訓練只更新 joblib 時，熱抽換會重新載入並改用 joblib (工件包已不一致)
+            self.artifact_paths = self.bundle.file_paths + ([model_path] if model_path and os.path.exists(model_path) else [])
+            self.model_version = self.bundle.model_version
+        else:
+            self.artifact_paths = [
+                model_path,
+                os.path.join(model_dir, 'feature_columns.joblib'),
+                os.path.join(model_dir, 'fe_pipeline_name.txt'),
+            ]
+            self.model_version = compute_artifact_version(self.artifact_paths)
+
+        # 單筆預測結果快取 (預設關閉，由 enable_result_cache 啟用)
+        self.result_cache = None
+
+        # 多核心分片批次評分 (預設關閉，由 enable_parallel_batch 啟用)
+        self.parallel_scorer = None
+
+        # 建立推論後端 (native 後端需在啟動時一次性攤平樹結構)
+        self.inference_backend = inference_backend
+        self.tree_engine = None
+        if self.model is not None and inference_backend == 'native':
+            if self.bundle is not None:
+                self.tree_engine = self.bundle.build_tree_engine()
+            else:
+                self.tree_engine = ArrayTreeEnsemble.from_xgb_model(self.model)
+            logger.info(f"推論後端: native ({self.tree_engine.num_trees} 棵樹)。")
+
         # 建立 SHAP Explainer (在服務啟動時一次性完成)
+        self.explainer_backend = explainer_backend
         if self.model:
             try:
-                # 🚨 [修改] 暫時註釋掉 SHAP 初始化，以確認載入是否成功
-                self.explainer = shap.TreeExplainer(self.model) 
-                logger.info("SHAP TreeExplainer 成功初始化。")
+                self.explainer = self._build_explainer(explainer_backend)
+                logger.info(f"SHAP 解釋後端 ({explainer_backend}) 成功初始化。")
                 
                 # # 🚨 [新增] 臨時設定 Explainer 為 None，並打印跳過訊息
                 # self.explainer = None
@@ -46,6 +124,13 @@ class CustomerChurnBankService:
             # 這應該在 _load_model 裡面已經處理，但作為最終保障
             raise RuntimeError("模型載入失敗，無法初始化服務。")
 
+    def _build_explainer(self, explainer_backend: str) -> Any:
+        """依設定建立 SHAP 解釋器；shap 套件只在選用 'shap' 後端時才匯入。"""
+        if explainer_backend == 'shap':
+            import shap
+            return shap.TreeExplainer(self.model)
+        return NativeContribExplainer(self.model, approximate=(explainer_backend == 'native_approx'))
+
     def _load_model_artifacts(self, model_dir: str) -> tuple[List[str], str]:
         """載入訓練腳本產生的特徵列表和 FE 管道名稱。"""
         feature_cols_path = os.path.join(model_dir, 'feature_columns.joblib')
@@ -90,74 +175,108 @@ class CustomerChurnBankService:
             raise RuntimeError(f"模型載入致命錯誤: {model_path} 載入失敗. 原因: {e}") from e
 
 
-    def _align_features(self, df_processed: pd.DataFrame) -> pd.DataFrame:
-        """根據訓練時的特徵列表進行 OHE 和欄位對齊。"""
-        if not self.feature_cols:
+    def _predict_positive_proba(self, X_predict: pd.DataFrame) -> np.ndarray:
+        """依照選定的推論後端，回傳流失 (類別 1) 的機率陣列。"""
+        if self.tree_engine is not None:
+            return self.tree_engine.predict_proba(X_predict.to_numpy(dtype=np.float32))[:, 1]
+        return self.model.predict_proba(X_predict)[:, 1]
+
+    def _align_features(self, df_processed: Any) -> pd.DataFrame:
+        """
+        根據訓練時的特徵列表進行 OHE 和欄位對齊。
+
+        使用啟動時建立的 FeatureAlignmentPlan 直接寫入 float32 矩陣，
+        結果與 get_dummies + 補 0 + 依 feature_cols 排序完全一致，但不產生中間 DataFrame。
+        """
+        if not self.feature_cols or self.alignment_plan is None:
             raise RuntimeError("特徵欄位列表未載入。")
 
-        # 找出類別欄位 (Geography, Age_bin 等)
-        # 'category' 類型是 pandas 推薦的 FE 輸出類型
-        cat_cols = [col for col in df_processed.columns if df_processed[col].dtype.name in ['object', 'str', 'category']]
-        
-        # 對數據進行 One-Hot Encoding
-        X_oh = pd.get_dummies(df_processed, columns=cat_cols, dummy_na=False)
-        
-        # 補齊訓練集缺少的欄位 (當前單一請求可能缺少某個 OHE 欄位)
-        missing_cols = set(self.feature_cols) - set(X_oh.columns)
-        for c in missing_cols:
-            X_oh[c] = 0.0
-        
-        # 移除多餘的欄位，並確保順序一致
-        # 這一步是關鍵：確保預測數據的欄位名稱和順序與訓練模型時完全相同
-        X_predict = X_oh[[col for col in self.feature_cols if col in X_oh.columns]]
-        X_predict = X_predict.astype(float)
-
-        if X_predict.shape[1] != len(self.feature_cols):
-            # 只有當缺失的欄位不在 X_oh.columns 也不在 feature_cols 中時才會出錯，但為了健壯性保留
-            raise ValueError(f"特徵數量不匹配。預期 {len(self.feature_cols)}，實際 {X_predict.shape[1]}")
-        
-        return X_predict
+        X_matrix = self.alignment_plan.transform(df_processed)
+
+        if X_matrix.shape[1] != len(self.feature_cols):
+            raise ValueError(f"特徵數量不匹配。預期 {len(self.feature_cols)}，實際 {X_matrix.shape[1]}")
+
+        # 包裝為帶欄位名稱的 DataFrame (零複製)，確保欄位名稱和順序與訓練模型時完全相同
+        return self.alignment_plan.to_frame(X_matrix)
 
     def get_local_shap(self, X_predict: pd.DataFrame) -> Dict[str, float]:
         """計算單一樣本的局部 SHAP 值，並轉換為可讀的字典。"""
+        return self.get_local_shap_batch(X_predict)[0]
+
+    def get_local_shap_batch(self, X_predict: pd.DataFrame) -> List[Dict[str, float]]:
+        """
+        一次計算多列樣本的局部 SHAP 值 (只呼叫一次 explainer)，回傳每列前 7 個最有影響力的特徵字典。
+        """
+        empty_result = [{} for _ in range(len(X_predict))]
         if not self.explainer:
-            return {} # Explainer 未初始化則返回空
+            return empty_result # Explainer 未初始化則返回空
 
         try:
-            # 計算 SHAP 值
-            # shap_values 可能是 (1, num_features) 的 numpy array
-            # 由於 X_predict 是一個單行 DataFrame，這裡的計算結果應該是單一樣本的
-            shap_values = self.explainer.shap_values(X_predict, check_additivity=False)
-            
-            # 由於 XGBoost 是二分類，shap_values 是兩個陣列的列表 (list of arrays)，取類別 1 的值
-            # 確保 shap_values_row 是一個一維陣列 (對於單行輸入)
-            shap_values_row = shap_values[1][0] if isinstance(shap_values, list) and len(shap_values) == 2 else shap_values[0]
-            
-            # 如果是單一樣本，確保是從二維陣列中取出一維數組
-            if len(shap_values_row.shape) > 1 and shap_values_row.shape[0] == 1:
-                shap_values_row = shap_values_row[0]
-
+            shap_matrix = self._shap_matrix(X_predict)
 
             feature_names = X_predict.columns
             # 確保長度匹配
-            if len(feature_names) != len(shap_values_row):
-                 logger.error(f"SHAP 值數量 ({len(shap_values_row)}) 與特徵數量 ({len(feature_names)}) 不匹配。")
-                 return {}
+            if len(feature_names) != shap_matrix.shape[1]:
+                 logger.error(f"SHAP 值數量 ({shap_matrix.shape[1]}) 與特徵數量 ({len(feature_names)}) 不匹配。")
+                 return empty_result
 
-
-            shap_dict = dict(zip(feature_names, shap_values_row))
-            
-            # 排序 (以 SHAP 值的絕對值降序排列)
-            sorted_shap = dict(sorted(shap_dict.items(), key=lambda item: abs(item[1]), reverse=True))
-            
-            # 為了簡化 API 輸出，我們只返回前 7 個最有影響力的特徵
-            top_n_shap = {k: float(v) for k, v in list(sorted_shap.items())[:7]}
-            
-            return top_n_shap
+            return [self._top_shap(feature_names, shap_values_row) for shap_values_row in shap_matrix]
         except Exception as e:
             logger.error(f"計算局部 SHAP 值失敗: {e}")
-            return {}
+            return empty_result
 
+    def _shap_matrix(self, X_predict: pd.DataFrame) -> np.ndarray:
+        """計算正類別 (流失) 的 SHAP 值矩陣，形狀 (n_samples, n_features)。"""
+        # shap_values 可能是 (n_samples, num_features) 的 numpy array
+        shap_values = self.explainer.shap_values(X_predict, check_additivity=False)
+
+        # 由於 XGBoost 是二分類，shap_values 可能是兩個陣列的列表 (list of arrays)，取類別 1 的值
+        shap_matrix = shap_values[1] if isinstance(shap_values, list) and len(shap_values) == 2 else shap_values
+        return np.asarray(shap_matrix).reshape(len(X_predict), -1)
+
+    def top_k_shap(self, X_predict: pd.DataFrame, k: int = 7, chunk_size: int = 8192) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批次計算每列影響力最大的 k 個特徵 (依 SHAP 絕對值降序)。
+
+        SHAP 值以 chunk_size 列為單位分段計算，避免一次配置整份 (n_samples, n_features) 矩陣；
+        每段以 np.argpartition 取出前 k 名後只對這 k 個值排序 (同值時依特徵順序，與 _top_shap 一致)。
+
+        Returns:
+            (indices, values)：形狀皆為 (n_samples, k)；indices 為 X_predict.columns 中的位置 (int16)，values 為 float32。
+        """
+        n_rows, n_features = X_predict.shape
+        k = min(k, n_features)
+        indices = np.empty((n_rows, k), dtype=np.int16)
+        values = np.empty((n_rows, k), dtype=np.float32)
+
+        for start in range(0, n_rows, chunk_size):
+            stop = min(start + chunk_size, n_rows)
+            shap_block = self._shap_matrix(X_predict.iloc[start:stop])
+            magnitude = np.abs(shap_block)
+
+            if k < n_features:
+                candidates = np.argpartition(-magnitude, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.broadcast_to(np.arange(n_features), (stop - start, n_features))
+            # 依 |SHAP| 降序、同值時依特徵位置升序排列這 k 個候選
+            order = np.lexsort((candidates, -np.take_along_axis(magnitude, candidates, axis=1)), axis=1)
+            top_idx = np.take_along_axis(candidates, order, axis=1)
+
+            indices[start:stop] = top_idx
+            values[start:stop] = np.take_along_axis(shap_block, top_idx, axis=1)
+
+        return indices, values
+
+    @staticmethod
+    def _top_shap(feature_names: Any, shap_values_row: np.ndarray, top_n: int = 7) -> Dict[str, float]:
+        """將單列 SHAP 值依絕對值降序排列，只保留前 top_n 個特徵。"""
+        shap_dict = dict(zip(feature_names, shap_values_row))
+        
+        # 排序 (以 SHAP 值的絕對值降序排列)
+        sorted_shap = dict(sorted(shap_dict.items(), key=lambda item: abs(item[1]), reverse=True))
+        
+        # 為了簡化 API 輸出，我們只返回前 7 個最有影響力的特徵
+        return {k: float(v) for k, v in list(sorted_shap.items())[:top_n]}
 
     def preprocess_and_predict(self, input_df: pd.DataFrame, fe_pipeline_func: Callable) -> Dict[str, Any]:
         """
@@ -172,13 +291,7 @@ class CustomerChurnBankService:
         """
         
         if self.model is None:
-            # 返回模擬結果
-            return {
-                "prediction": 0,
-                "probability": 0.5,
-                "feature_importance": "模型服務未啟動，使用模擬預測。",
-                "local_shap_values": {}
-            }
+            return self._mock_prediction()
         
         # 1. 特徵工程 (使用 routes 層提供的 FE 函數)
         processed_df = fe_pipeline_func(input_df.copy())
@@ -186,38 +299,159 @@ class CustomerChurnBankService:
         # 2. OHE 和特徵對齊
         X_predict = self._align_features(processed_df)
 
-        # 3. 進行預測
-        # predict_proba 返回的是 (n_samples, n_classes)，取第二個類別 (流失) 的風險
-        probability_class_1 = self.model.predict_proba(X_predict)[:, 1][0]
-        prediction = int(probability_class_1 >= 0.5)
+        return self._predict_single(X_predict)
 
-        # 4. 進行局部 SHAP 分析
-        local_shap_values = self.get_local_shap(X_predict)
-        
-        # 5. 轉換為可讀的特徵重要性文本 (用於 AI 解釋)
-        feature_importance_text = "主要影響因素 (局部 SHAP 值):\n"
-        if local_shap_values:
-            for feature, shap_value in local_shap_values.items():
-                # SHAP 值 > 0 表示推高流失風險
-                sign = "推高流失風險 (+)" if shap_value > 0 else "推低流失風險 (-)"
-                feature_importance_text += f"- {feature}: {sign} (影響值: {abs(shap_value):.4f})\n"
-        else:
-            feature_importance_text = "SHAP 分析工具未成功初始化或計算失敗。"
+    def preprocess_and_predict_record(self, record: Dict[str, Any], fe_record_func: Callable,
+                                      categorical_cols: Any) -> Dict[str, Any]:
+        """
+        單筆預測的快速路徑：FE 與特徵對齊都直接在 dict 上完成，不建立任何中間 DataFrame。
+
+        若已啟用微批次 (enable_micro_batching)，請求會交由分派器與其他併發請求合併處理。
+
+        Args:
+            record: 單一客戶的原始特徵 dict。
+            fe_record_func: 逐筆 FE 函數 (e.g., FeatureEngineerForAPI.run_v2_record)。
+            categorical_cols: FE 輸出中需 One-Hot 展開的類別欄位。
+
+        Returns:
+            與 preprocess_and_predict 相同格式的結果字典。
+        """
+        if self.model is None:
+            return self._mock_prediction()
+
+        if self.micro_batcher is not None:
+            return self.micro_batcher.submit((record, fe_record_func, categorical_cols))
+
+        return self.predict_records([(record, fe_record_func, categorical_cols)])[0]
 
+    def predict_record_cached(self, record: Dict[str, Any], fe_record_func: Callable,
+                              categorical_cols: Any, key_columns: List[str]) -> Dict[str, Any]:
+        """
+        帶結果快取的單筆預測。
+
+        Returns:
+            快取項目 {'prediction': preprocess_and_predict_record 的結果, 'charts': {圖表格式: 已繪製內容}}。
+            'charts' 由呼叫端在未命中時填入，之後相同輸入的請求即可直接重用已繪製的圖表。
+        """
+        if self.result_cache is None or self.model is None:
+            return {'prediction': self.preprocess_and_predict_record(record, fe_record_func, categorical_cols),
+                    'charts': {}}
+
+        key = self.result_cache.make_key(record, key_columns)
+        entry = self.result_cache.get(key)
+        if entry is None:
+            entry = {'prediction': self.preprocess_and_predict_record(record, fe_record_func, categorical_cols),
+                     'charts': {}}
+            self.result_cache.put(key, entry)
+        return entry
+
+    def enable_result_cache(self, max_entries: int = 1024, ttl_seconds: float = 600.0) -> None:
+        """啟用單筆預測結果快取；模型工件檔案變更時快取會自動清空。"""
+        self.result_cache = PredictionResultCache(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            model_version=self.model_version,
+            artifact_paths=self.artifact_paths
+        )
+        logger.info(f"預測結果快取已啟用 (max_entries={max_entries}, ttl={ttl_seconds}s, model_version={self.model_version})。")
+
+    def predict_records(self, items: List[tuple]) -> List[Dict[str, Any]]:
+        """
+        批次處理多筆單一請求：逐筆 FE 後堆疊成一個矩陣，predict_proba 與 SHAP 各只呼叫一次。
+
+        Args:
+            items: [(record, fe_record_func, categorical_cols), ...]，同一服務中 categorical_cols 皆相同。
+
+        Returns:
+            與輸入順序相同的結果字典列表。
+        """
+        if self.alignment_plan is None:
+            raise RuntimeError("特徵欄位列表未載入。")
+
+        features = [fe_record_func(record) for record, fe_record_func, _ in items]
+        X_matrix = self.alignment_plan.transform_records(features, items[0][2])
+        return self._predict_rows(self.alignment_plan.to_frame(X_matrix))
+
+    def enable_micro_batching(self, max_batch_size: int = 64, max_wait_ms: float = 2.0,
+                              submit_timeout: Optional[float] = 30.0) -> None:
+        """啟用單筆請求的微批次合併 (在 max_wait_ms 時間窗內或累積 max_batch_size 筆即送出；每筆最多等待 submit_timeout 秒)。"""
+        self.micro_batcher = MicroBatchDispatcher(
+            handler=self.predict_records,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name='churn-predict-micro-batch',
+            submit_timeout=submit_timeout
+        )
+        logger.info(f"已啟用微批次預測 (max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})。")
+
+    def enable_parallel_batch(self, scorer: Any) -> None:
+        """啟用多核心分片批次評分 (scorer 為 ParallelBatchScorer，可由多個服務實例共用同一個行程池)。"""
+        self.parallel_scorer = scorer
+        logger.info(f"已啟用分片批次評分 (workers={scorer.workers}, min_rows={scorer.min_rows})。")
+
+    def reset_after_fork(self) -> None:
+        """
+        gunicorn preload 模式下於每個 worker fork 後呼叫：模型、Explainer 與特徵對齊計畫為唯讀，
+        直接與 master 以寫入時複製方式共用；只需重建執行緒與鎖等不能跨 fork 的狀態。
+        """
+        if self.micro_batcher is not None:
+            self.micro_batcher.reset_after_fork()
+        if self.result_cache is not None:
+            self.result_cache.reset_after_fork()
+
+    @staticmethod
+    def _mock_prediction() -> Dict[str, Any]:
+        """模型未載入時的模擬結果。"""
         return {
-            "prediction": prediction,
-            "probability": float(probability_class_1),
-            "feature_importance": feature_importance_text,
-            "local_shap_values": local_shap_values
+            "prediction": 0,
+            "probability": 0.5,
+            "feature_importance": "模型服務未啟動，使用模擬預測。",
+            "local_shap_values": {}
         }
+
+    def _predict_single(self, X_predict: pd.DataFrame) -> Dict[str, Any]:
+        """對已對齊的單行特徵進行預測與局部 SHAP 分析。"""
+        return self._predict_rows(X_predict)[0]
+
+    def _predict_rows(self, X_predict: pd.DataFrame) -> List[Dict[str, Any]]:
+        """對已對齊的特徵矩陣逐列產生預測、風險與局部 SHAP 結果 (預測與 SHAP 皆為一次性批次計算)。"""
+        # 3. 進行預測
+        # predict_proba 返回的是 (n_samples, n_classes)，取第二個類別 (流失) 的風險
+        probabilities = self._predict_positive_proba(X_predict)
+
+        # 4. 進行局部 SHAP 分析
+        local_shap_list = self.get_local_shap_batch(X_predict)
+
+        results = []
+        for probability_class_1, local_shap_values in zip(probabilities, local_shap_list):
+            # 5. 轉換為可讀的特徵重要性文本 (用於 AI 解釋)
+            feature_importance_text = "主要影響因素 (局部 SHAP 值):\n"
+            if local_shap_values:
+                for feature, shap_value in local_shap_values.items():
+                    # SHAP 值 > 0 表示推高流失風險
+                    sign = "推高流失風險 (+)" if shap_value > 0 else "推低流失風險 (-)"
+                    feature_importance_text += f"- {feature}: {sign} (影響值: {abs(shap_value):.4f})\n"
+            else:
+                feature_importance_text = "SHAP 分析工具未成功初始化或計算失敗。"
+
+            results.append({
+                "prediction": int(probability_class_1 >= 0.5),
+                "probability": float(probability_class_1),
+                "feature_importance": feature_importance_text,
+                "local_shap_values": local_shap_values
+            })
+        return results
     
-    def predict_batch_csv(self, input_df: pd.DataFrame, fe_pipeline_func: Callable) -> pd.DataFrame:
+    def predict_batch_csv(self, input_df: pd.DataFrame, fe_pipeline_func: Callable,
+                          explain_top_k: int = 0) -> pd.DataFrame:
         """
         對批次 CSV 數據進行預測，並返回帶有預測結果的 DataFrame。
         
         Args:
             input_df: 原始客戶數據的 DataFrame。
-            fe_pipeline_func: 來自 routes 層的特徵工程函數。
+            fe_pipeline_func: 來自 routes 層的特徵工程函數，回傳 DataFrame 或 {欄位: 陣列} 映射。
+            explain_top_k: 大於 0 時，額外附上每列前 k 個 SHAP 驅動因子
+                (欄位 SHAP_Top{r}_Feature 為特徵在 feature_cols 中的位置，SHAP_Top{r}_Value 為 SHAP 值，r = 1..k)。
             
         Returns:
             DataFrame: 包含原始數據和 'Exited_Prediction', 'Exited_Probability' 兩欄的結果。
@@ -230,94 +464,119 @@ class CustomerChurnBankService:
         # 1. 保存原始的 CustomerId (用於最終結果)
         customer_ids = input_df['CustomerId'] if 'CustomerId' in input_df.columns else range(len(input_df))
         
-        # 2. 特徵工程
-        processed_df = fe_pipeline_func(input_df.copy())
+        # 2. 特徵工程 (FE 函數不會修改輸入，這裡不再額外複製整份批次資料)
+        processed_df = fe_pipeline_func(input_df)
         
         # 3. OHE 和特徵對齊
         X_predict = self._align_features(processed_df)
         
         logger.info(f"特徵對齊後，預測數據形狀: {X_predict.shape}")
         # 4. 進行預測
-        probabilities = self.model.predict_proba(X_predict)[:, 1]
-        
-        predictions = (probabilities >= 0.5).astype(int)
+        probabilities = self._predict_positive_proba(X_predict)
 
-        # 5. 構建結果 DataFrame (保持原始數據，並添加結果)
-        result_df = pd.DataFrame({
-        'CustomerId': customer_ids, # 使用 CustomerId (大寫 D)
-        'Exited_Prediction': predictions,
-        'Exited_Probability': probabilities
-    })
+        # 5. (可選) 每列前 k 個 SHAP 驅動因子
+        top_idx = top_values = None
+        if explain_top_k > 0 and self.explainer:
+            top_idx, top_values = self.top_k_shap(X_predict, k=explain_top_k)
 
-        
-        # 確保 Column 命名清晰
-        result_df['Exited_Probability'] = probabilities
-        result_df['Exited_Prediction'] = predictions 
-        
+        result_df = self._build_batch_result(customer_ids, probabilities, top_idx, top_values)
         logger.info(f"Service: 批次預測完成，返回筆數: {len(result_df)}")
         return result_df
-    
 
-    def calculate_roi_batch(self, df_with_prob: pd.DataFrame) -> Dict[str, Any]:
+    def predict_batch_with_roi(self, input_df: pd.DataFrame, fe_pipeline_func: Callable,
+                               explain_top_k: int = 0) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """predict_batch_csv 加上 calculate_roi_batch，回傳 (結果 DataFrame, ROI 統計)。"""
+        result_df, portfolio = self.predict_batch_with_portfolio(input_df, fe_pipeline_func, explain_top_k)
+        return result_df, portfolio.roi()
+
+    def predict_batch_with_portfolio(self, input_df: pd.DataFrame, fe_pipeline_func: Callable,
+                                     explain_top_k: int = 0) -> Tuple[pd.DataFrame, PortfolioStats]:
         """
-        基於預測結果計算 LTV 與 ROI (邏輯來自 customer_churn_bank_roi.ipynb)
+        predict_batch_csv 加上投資組合統計，回傳 (結果 DataFrame, PortfolioStats)；
+        分塊處理 (串流、批次工作) 時各區塊的 PortfolioStats 以 merge 合併為整體 ROI。
+
+        啟用分片批次評分且筆數達門檻時，FE 與對齊在本行程完成並直接寫入共享記憶體，預測、SHAP 與 ROI
+        由各分片的子行程平行計算；行程池無法使用時自動退回單行程路徑。
         """
-        df = df_with_prob.copy()
-        
-        # --- 1. 定義常數 (來自 Notebook) ---
-        NIM_RATE = 0.02
-        PRODUCT_PROFIT = 50.0
-        ACTIVE_CARD_PROFIT = 30.0
-        L_MAX = 10.0
-        USER_RETENTION_COST = 500.0
-        USER_SUCCESS_RATE = 0.20
-
-        # --- 2. LTV 計算 ---
-        # 確保風險欄位存在 (Route 層傳入時應為 'Exited_Probability' 或 'probability')
-        prob_col = 'Exited_Probability' if 'Exited_Probability' in df.columns else 'probability'
-        if prob_col not in df.columns:
-            return {} # 無法計算
+        if self.model is None:
+            raise RuntimeError("模型服務未啟動，無法進行批次預測。")
 
-        df['Churn_Prob'] = df[prob_col]
-        
-        # 計算 ActiveCard_Flag
-        df['ActiveCard_Flag'] = ((df['HasCrCard'] == 1) & (df['IsActiveMember'] == 1)).astype(int)
-
-        # 計算年利潤
-        df['Annual_Profit'] = (
-            (df['Balance'] * NIM_RATE) +
-            (df['NumOfProducts'] * PRODUCT_PROFIT) +
-            (df['ActiveCard_Flag'] * ACTIVE_CARD_PROFIT)
+        if self.parallel_scorer is not None and self.parallel_scorer.should_parallelize(len(input_df)):
+            try:
+                return self._predict_batch_parallel(input_df, fe_pipeline_func, explain_top_k)
+            except Exception as e:
+                logger.error(f"分片批次評分失敗，改以單行程處理: {e}", exc_info=True)
+
+        result_df = self.predict_batch_csv(input_df, fe_pipeline_func, explain_top_k=explain_top_k)
+        roi_inputs = RoiInputs.from_frame(input_df, result_df['Exited_Probability'].to_numpy())
+        return result_df, PortfolioStats().update(roi_inputs)
+
+    def _predict_batch_parallel(self, input_df: pd.DataFrame, fe_pipeline_func: Callable,
+                                explain_top_k: int) -> Tuple[pd.DataFrame, PortfolioStats]:
+        """分片批次評分路徑 (見 ParallelBatchScorer)；輸出與 predict_batch_csv + portfolio_stats 相同。"""
+        logger.info(f"開始分片批次預測，共 {len(input_df)} 筆資料 ({self.parallel_scorer.workers} 個分片)。")
+        if self.alignment_plan is None:
+            raise RuntimeError("特徵欄位列表未載入。")
+
+        customer_ids = input_df['CustomerId'] if 'CustomerId' in input_df.columns else range(len(input_df))
+        processed = fe_pipeline_func(input_df)
+        probabilities, top_idx, top_values, portfolio = self.parallel_scorer.score(
+            self, processed, input_df, explain_top_k=explain_top_k
         )
+        result_df = self._build_batch_result(customer_ids, probabilities, top_idx, top_values)
+        logger.info(f"Service: 分片批次預測完成，返回筆數: {len(result_df)}")
+        return result_df, portfolio
+
+    @staticmethod
+    def _build_batch_result(customer_ids: Any, probabilities: np.ndarray, top_idx: Any = None,
+                            top_values: Any = None) -> pd.DataFrame:
+        """組成批次預測結果 DataFrame (CustomerId、Exited_Prediction、Exited_Probability 與可選的 SHAP 前 k 名)。"""
+        predictions = (probabilities >= 0.5).astype(int)
 
-        # 計算預期壽命 (防止除以 0)
-        df['Expected_Lifespan'] = np.minimum(1 / np.maximum(df['Churn_Prob'], 1e-6), L_MAX)
-        
-        # 計算 LTV
-        df['LTV'] = df['Annual_Profit'] * df['Expected_Lifespan']
+        # 構建結果 DataFrame (保持原始數據，並添加結果)
+        result_df = pd.DataFrame({
+            'CustomerId': customer_ids, # 使用 CustomerId (大寫 D)
+            'Exited_Prediction': predictions,
+            'Exited_Probability': probabilities
+        })
+
+        if top_idx is not None:
+            for rank in range(top_idx.shape[1]):
+                result_df[f'SHAP_Top{rank + 1}_Feature'] = top_idx[:, rank]
+                result_df[f'SHAP_Top{rank + 1}_Value'] = top_values[:, rank]
+        return result_df
 
-        # --- 3. ROI 最佳化模型 (Profit Ranking) ---
-        # ENR = LTV * P(churn) * SR - RC
-        df['ENR'] = (df['LTV'] * df['Churn_Prob'] * USER_SUCCESS_RATE) - USER_RETENTION_COST
-        
-        # 篩選出值得挽留的客戶 (ENR > 0)
-        actionable = df[df['ENR'] > 0].copy()
-        actionable = actionable.sort_values(by='ENR', ascending=False)
-
-        # --- 4. 統計結果 ---
-        total_ltv_all = df['LTV'].sum()
-        actionable_count = len(actionable)
-        total_enr = actionable['ENR'].sum() if not actionable.empty else 0.0
-        total_cost = actionable_count * USER_RETENTION_COST
-        
-        # 計算整體 ROI
-        total_roi = (total_enr / total_cost) if total_cost > 0 else 0.0
 
-        return {
-            'total_ltv': total_ltv_all,
-            'actionable_count': actionable_count,
-            'total_net_enr': total_enr,
-            'retention_cost': total_cost,
-            'total_roi': total_roi,
-            # 這裡不回傳 top_targets，讓前端純顯示統計
-        }
\ No newline at end of file
+    def calculate_roi_batch(self, df_with_prob: pd.DataFrame, params: Dict[str, float] = None) -> Dict[str, Any]:
+        """
+        基於預測結果計算 LTV 與 ROI (邏輯來自 customer_churn_bank_roi.ipynb，計算見 roi_kernel.PortfolioStats)。
+        params 可覆寫業務參數 (DEFAULT_ROI_PARAMS：nim_rate、retention_cost、success_rate 等)。
+        """
+        portfolio = self.portfolio_stats(df_with_prob, params)
+        # 這裡不回傳 top_targets，讓前端純顯示統計
+        return portfolio.roi() if portfolio is not None else {}  # 缺少機率欄位時無法計算
+
+    def portfolio_stats(self, df_with_prob: pd.DataFrame, params: Dict[str, float] = None) -> Optional[PortfolioStats]:
+        """
+        以一個區塊 (整份結果、串流區塊或分片) 建立可合併的投資組合統計；缺少機率欄位時回傳 None。
+        各區塊的結果以 PortfolioStats.merge 合併即為整體 ROI，不需要集中所有資料列。
+        """
+        # 確保風險欄位存在 (Route 層傳入時應為 'Exited_Probability' 或 'probability')
+        prob_col = 'Exited_Probability' if 'Exited_Probability' in df_with_prob.columns else 'probability'
+        if prob_col not in df_with_prob.columns:
+            return None
+
+        # 直接以欄位陣列計算，不複製 DataFrame、不新增中間欄位，也不排序 (統計只需要加總)
+        return PortfolioStats(params).update(RoiInputs.from_frame(df_with_prob, df_with_prob[prob_col].to_numpy()))
+
+    def select_retention_targets(self, df_with_prob: pd.DataFrame, budget: float = None, max_contacts: int = None,
+                                 params: Dict[str, float] = None, id_col: str = 'id') -> Dict[str, Any]:
+        """
+        固定預算的挽留名單：在 budget (可聯絡 floor(budget / 挽留成本) 位) 或 max_contacts 的限制下，
+        以部分選取 (argpartition) 選出 ENR 最高的客戶，回傳入選 ID、邊際 ROI 曲線與門檻 ENR
+        (見 retention_targeting.plan_retention_targets；分塊或串流輸入請直接傳入區塊序列)。
+        """
+        prob_col = 'Exited_Probability' if 'Exited_Probability' in df_with_prob.columns else 'probability'
+        inputs = RoiInputs.from_frame(df_with_prob, df_with_prob[prob_col].to_numpy())
+        ids = df_with_prob[id_col].to_numpy() if id_col in df_with_prob.columns else np.arange(len(df_with_prob))
+        return plan_retention_targets([(inputs, ids)], budget=budget, max_contacts=max_contacts, params=params)
@@ -0,0 +1,160 @@
+# services\feature_alignment_plan.py
+import pandas as pd
+import numpy as np
+import threading
+import logging
+
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('FeatureAlignmentPlan')
+logger.setLevel(logging.INFO)
+
+# 與 CustomerChurnBankService._align_features 原本的判斷一致：這些 dtype 的欄位會被 One-Hot 展開
+CATEGORICAL_DTYPE_NAMES = ('object', 'str', 'category')
+
+
+class _SchemaBinding:
+    """特定 FE 輸出結構 (欄位名稱 + 是否為類別) 所對應的寫入計畫。"""
+
+    def __init__(self, numeric: List[Tuple[str, int]], onehot: List[Tuple[str, Dict[str, int]]], zero_filled: List[str]):
+        self.numeric = numeric        # [(來源欄位, 輸出索引)]
+        self.onehot = onehot          # [(來源類別欄位, {類別值字串: 輸出索引})]
+        self.zero_filled = zero_filled
+
+
+class FeatureAlignmentPlan:
+    """
+    以訓練時保存的 feature_columns 預先編譯的「特徵對齊計畫」，取代每次請求的 pd.get_dummies + reindex。
+
+    - 啟動時解析每個輸出欄位：可能是直接沿用的數值欄位，或是 `<類別欄位>_<類別值>` 形式的 One-Hot 欄位。
+    - 第一次看到某種 FE 輸出結構時綁定為 _SchemaBinding 並快取，之後的請求只做陣列寫入。
+    - 輸出為預先配置的 float32 矩陣 (XGBoost 內部即以 float32 比較門檻，結果與 float64 相同)。
+
+    輸出結果與原本 get_dummies(dummy_na=False) + 補 0 + 依 feature_cols 排序的行為逐位一致。
+    """
+
+    def __init__(self, feature_cols: List[str]):
+        self.feature_cols = list(feature_cols)
+        self.n_features = len(self.feature_cols)
+        self.column_index = {name: i for i, name in enumerate(self.feature_cols)}
+
+        # 所有可能的 One-Hot 來源：欄位名稱在任一 '_' 處切開，前段為類別欄位、後段為類別值
+        self.onehot_candidates: Dict[str, Dict[str, int]] = {}
+        for i, name in enumerate(self.feature_cols):
+            parts = name.split('_')
+            for k in range(1, len(parts)):
+                prefix, level = '_'.join(parts[:k]), '_'.join(parts[k:])
+                self.onehot_candidates.setdefault(prefix, {})[level] = i
+
+        self._bindings: Dict[Tuple[Tuple[str, bool], ...], _SchemaBinding] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_categorical(values: Any) -> bool:
+        dtype = getattr(values, 'dtype', None)
+        return dtype is not None and dtype.name in CATEGORICAL_DTYPE_NAMES
+
+    def bind(self, schema: Tuple[Tuple[str, bool], ...]) -> _SchemaBinding:
+        """取得 (或建立並快取) 某個 FE 輸出結構的寫入計畫。schema 為 ((欄位名稱, 是否為類別), ...)。"""
+        binding = self._bindings.get(schema)
+        if binding is not None:
+            return binding
+
+        numeric, onehot = [], []
+        covered = set()
+        for col, categorical in schema:
+            if categorical:
+                levels = self.onehot_candidates.get(col)
+                if levels:
+                    onehot.append((col, levels))
+                    covered.update(levels.values())
+            elif col in self.column_index:
+                numeric.append((col, self.column_index[col]))
+                covered.add(self.column_index[col])
+
+        zero_filled = [name for i, name in enumerate(self.feature_cols) if i not in covered]
+        binding = _SchemaBinding(numeric, onehot, zero_filled)
+
+        with self._lock:
+            self._bindings.setdefault(schema, binding)
+
+        if zero_filled:
+            logger.warning(f"特徵對齊：FE 輸出中沒有以下訓練特徵，將固定補 0: {zero_filled}")
+        return binding
+
+    def transform(self, frame: Any, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        將 FE 輸出 (DataFrame 或 {欄位: 陣列} 映射) 寫入 (n_rows, n_features) 的 float32 矩陣。
+
+        out 可傳入預先配置的 float32 矩陣 (例如共享記憶體上的陣列)，結果直接寫入其中而不另外配置。
+        """
+        if isinstance(frame, pd.DataFrame):
+            # 一次取得所有 dtype，避免逐欄建立 Series
+            schema = tuple((col, dtype.name in CATEGORICAL_DTYPE_NAMES) for col, dtype in frame.dtypes.items())
+            n_rows = len(frame)
+        else:
+            schema = tuple((col, self.is_categorical(values)) for col, values in frame.items())
+            n_rows = len(next(iter(frame.values()))) if frame else 0
+        binding = self.bind(schema)
+
+        if out is None:
+            out = np.zeros((n_rows, self.n_features), dtype=np.float32)
+        else:
+            if out.shape != (n_rows, self.n_features) or out.dtype != np.float32:
+                raise ValueError(f"out 必須為 ({n_rows}, {self.n_features}) 的 float32 矩陣，實際 {out.shape} {out.dtype}")
+            out[...] = 0.0
+
+        for col, idx in binding.numeric:
+            out[:, idx] = np.asarray(frame[col], dtype=np.float32)
+
+        for col, levels in binding.onehot:
+            codes, categories = self._factorize(frame[col])
+            # lut[code] -> 輸出索引；最後一格保留給缺失值 (code = -1)，對應 dummy_na=False 的全 0
+            lut = np.full(len(categories) + 1, -1, dtype=np.intp)
+            for code, category in enumerate(categories):
+                lut[code] = levels.get(str(category), -1)
+            target = lut[codes]
+            rows = np.flatnonzero(target >= 0)
+            out[rows, target[rows]] = 1.0
+
+        return out
+
+    def transform_records(self, records: List[Dict[str, Any]], categorical_cols: Any) -> np.ndarray:
+        """
+        單筆/少量請求的快速路徑：直接將 FE 輸出的 dict 寫入 float32 矩陣，不經過 DataFrame。
+
+        categorical_cols 中的欄位視為類別值 (以 str(值) 對應 One-Hot 欄位，None / NaN 視為缺失)，
+        其餘欄位視為數值，行為與 transform() 對 DataFrame 的處理一致。
+        """
+        out = np.zeros((len(records), self.n_features), dtype=np.float32)
+        if not records:
+            return out
+
+        categorical_cols = set(categorical_cols)
+        binding = self.bind(tuple((col, col in categorical_cols) for col in records[0]))
+
+        for row, record in enumerate(records):
+            for col, idx in binding.numeric:
+                out[row, idx] = record[col]
+            for col, levels in binding.onehot:
+                value = record[col]
+                if value is None or (isinstance(value, float) and np.isnan(value)):
+                    continue
+                idx = levels.get(str(value))
+                if idx is not None:
+                    out[row, idx] = 1.0
+
+        return out
+
+    @staticmethod
+    def _factorize(values: Any) -> Tuple[np.ndarray, List[Any]]:
+        """回傳 (類別代碼, 類別值列表)；category dtype 直接使用既有代碼，不重新掃描資料。"""
+        if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+            categorical = values.cat if isinstance(values, pd.Series) else values
+            return np.asarray(categorical.codes, dtype=np.intp), list(categorical.categories)
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        return codes.astype(np.intp, copy=False), list(uniques)
+
+    def to_frame(self, matrix: np.ndarray) -> pd.DataFrame:
+        """以零複製方式將對齊後矩陣包裝為帶欄位名稱的 DataFrame (供 XGBoost / SHAP 使用)。"""
+        return pd.DataFrame(matrix, columns=self.feature_cols, copy=False)
@@ -0,0 +1,150 @@
+# services\micro_batch_dispatcher.py
+import threading
+import logging
+import queue
+import time
+
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger('MicroBatchDispatcher')
+logger.setLevel(logging.INFO)
+
+
+class MicroBatchDispatcher:
+    """
+    將併發的單筆請求在短時間窗內合併成一個批次處理，再把結果分送回各個等待中的請求。
+
+    - 第一筆請求到達後最多等待 max_wait_ms，或累積到 max_batch_size 筆就立即送出。
+    - handler 接收 List[item] 並回傳等長的 List[result]；若 handler 拋出例外，該批次所有請求都會收到同一個例外。
+    - 背景執行緒在第一次 submit 時才啟動 (daemon)，不影響服務啟動時間。
+    - shutdown() 之後 (例如模型熱重載換下的舊服務) 仍送達的請求直接在呼叫端執行緒以單筆批次處理，不會卡在佇列中。
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], List[Any]], max_batch_size: int = 64,
+                 max_wait_ms: float = 2.0, name: str = 'micro-batch', submit_timeout: Optional[float] = 30.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size 必須 >= 1")
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        # submit 等待結果的預設上限 (秒)；None 表示不限
+        self.submit_timeout = submit_timeout
+
+        self._queue: 'queue.Queue[Optional[Tuple[Any, Future]]]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        # 簡單統計：處理過的批次數與請求數 (平均批次大小 = requests / batches)
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """
+        送出單筆請求並阻塞等待結果 (timeout 未指定時使用 submit_timeout，逾時拋出 concurrent.futures.TimeoutError)。
+        分派器已關閉時直接在呼叫端執行緒處理。
+        """
+        future: Future = Future()
+        with self._start_lock:
+            # 檢查與放入佇列在同一把鎖內完成：shutdown 放入停止訊號之後，不會再有請求排在它後面
+            closed = self._closed
+            if not closed:
+                self._ensure_started_locked()
+                self._queue.put((item, future))
+        if closed:
+            return self.handler([item])[0]
+        return future.result(timeout=self.submit_timeout if timeout is None else timeout)
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """停止背景執行緒 (已在佇列中的請求會先處理完)；之後的 submit 改為在呼叫端直接處理。"""
+        with self._start_lock:
+            self._closed = True
+            thread = self._thread
+            if thread is not None and thread.is_alive():
+                self._queue.put(None)
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    def reset_after_fork(self) -> None:
+        """
+        在 fork 出的子行程 (gunicorn worker) 中重建佇列與鎖。
+
+        背景執行緒不會隨 fork 複製，父行程的佇列與鎖也可能停在被持有的狀態；
+        重建後第一次 submit 會在子行程內重新啟動執行緒。
+        """
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_started_locked(self) -> None:
+        """在持有 _start_lock 時呼叫：背景執行緒尚未啟動 (或已意外結束) 時啟動。"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            logger.info(f"微批次分派器已啟動 (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000:.1f})。")
+
+    def _collect_batch(self, first: Tuple[Any, Future]) -> Tuple[List[Tuple[Any, Future]], bool]:
+        """以第一筆請求為起點收集批次，回傳 (批次, 是否收到停止訊號)。"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._collect_batch(first)
+            self._dispatch(batch)
+            if stop:
+                break
+        self._drain()
+
+    def _drain(self) -> None:
+        """收到停止訊號後，處理仍留在佇列中的請求再結束，避免等待中的呼叫端永遠收不到結果。"""
+        batch: List[Tuple[Any, Future]] = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                continue
+            batch.append(entry)
+            if len(batch) >= self.max_batch_size:
+                self._dispatch(batch)
+                batch = []
+        if batch:
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[Any, Future]]) -> None:
+        items = [item for item, _ in batch]
+        try:
+            results = self.handler(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"批次處理結果數量不符：輸入 {len(items)} 筆，輸出 {len(results)} 筆。")
+        except Exception as e:
+            logger.error(f"微批次處理失敗 ({len(items)} 筆): {e}", exc_info=True)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.requests += len(items)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,232 @@
+# services\model_bundle.py
+# 版本化模型工件包：原生 Booster (UBJSON)、特徵列表、FE 管道名稱、best_iteration、
+# 預先攤平的樹陣列 (.npy，可 mmap) 與解釋器資料，並以 manifest.json 記錄 SHA-256 校驗碼。
+#
+# 轉換既有 joblib 工件：
+#   python -m services.model_bundle --model_path projects/customer_churn_bank_code/customer_churn_bank_model.joblib
+import argparse
+import datetime
+import hashlib
+import logging
+import json
+import os
+import tempfile
+
+import numpy as np
+import xgboost as xgb
+
+from typing import Any, Dict, List, Optional, Tuple
+from services.tree_inference_engine import ArrayTreeEnsemble
+
+logger = logging.getLogger('ModelBundle')
+logger.setLevel(logging.INFO)
+
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+BOOSTER_FILE = 'booster.ubj'
+FEATURE_COLUMNS_FILE = 'feature_columns.json'
+TREE_ARRAYS_DIR = 'tree_arrays'
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def trim_to_best_iteration(model: Any) -> Tuple[Any, Optional[int]]:
+    """
+    若 Booster 帶有 best_iteration (Early Stopping)，回傳只保留前 best_iteration + 1 輪的模型與 best_iteration。
+
+    XGBClassifier.predict_proba 本身會依 best_iteration 限制樹數，但並非所有下游 (舊版 shap、
+    直接使用 Booster 的工具) 都會遵守；切片後所有推論與解釋後端看到的都是同一組樹，也省下多餘樹的記憶體。
+    傳入的模型不會被修改：切片後的 Booster 經由公開的 save_model / load_model 重建為新的模型物件，
+    並保留 scikit-learn 包裝器的中繼資料 (classes_、參數等) 與 Booster 屬性。
+    """
+    if model is None or not hasattr(model, 'get_booster'):
+        return model, None
+    booster = model.get_booster()
+    best_iteration = booster.attr('best_iteration')
+    if best_iteration is None:
+        return model, None
+
+    best_iteration = int(best_iteration)
+    total_rounds = booster.num_boosted_rounds()
+    if total_rounds <= best_iteration + 1:
+        return model, best_iteration
+
+    # save_model 會把 scikit-learn 中繼資料寫入 Booster 的 scikit_learn 屬性；切片不保留屬性，需要逐一複製
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        full_path = os.path.join(tmp_dir, BOOSTER_FILE)
+        model.save_model(full_path)
+        full_booster = xgb.Booster(model_file=full_path)
+    trimmed = full_booster[:best_iteration + 1]
+    trimmed.set_attr(**full_booster.attributes())
+
+    trimmed_model = type(model)()
+    trimmed_model.load_model(bytearray(trimmed.save_raw('ubj')))
+    logger.info(f"Booster 已依 best_iteration={best_iteration} 切片：{total_rounds} -> {best_iteration + 1} 輪。")
+    return trimmed_model, best_iteration
+
+
+def write_model_bundle(model: Any, feature_cols: List[str], fe_pipeline_name: str, bundle_dir: str,
+                       source_model_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    將模型與其工件寫成一個版本化工件包，回傳 manifest。
+
+    Booster 若仍帶有 best_iteration 之後的多餘樹，先以 trim_to_best_iteration 切片再保存 (不修改傳入的模型)。
+    source_model_path 為工件包來源的 joblib 模型，其 SHA-256 記入 manifest，
+    服務載入時據此拒絕與目前 joblib 模型不一致 (過期) 的工件包。
+    """
+    os.makedirs(os.path.join(bundle_dir, TREE_ARRAYS_DIR), exist_ok=True)
+
+    # 1. 原生 Booster (UBJSON，保留 scikit-learn 包裝器的中繼資料)
+    model, best_iteration = trim_to_best_iteration(model)
+    booster = model.get_booster()
+    model.save_model(os.path.join(bundle_dir, BOOSTER_FILE))
+
+    # 2. 特徵列表
+    with open(os.path.join(bundle_dir, FEATURE_COLUMNS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(list(feature_cols), f, ensure_ascii=False)
+
+    # 3. 預先攤平的樹陣列 (native 推論後端直接 mmap 使用，免去啟動時解析 JSON 樹)
+    engine = ArrayTreeEnsemble.from_xgb_model(model)
+    files = [BOOSTER_FILE, FEATURE_COLUMNS_FILE]
+    for field in ArrayTreeEnsemble.ARRAY_FIELDS:
+        relative_path = os.path.join(TREE_ARRAYS_DIR, f'{field}.npy')
+        np.save(os.path.join(bundle_dir, relative_path), getattr(engine, field))
+        files.append(relative_path)
+
+    # 4. 解釋器資料：SHAP 的期望值 (偏差項)，與特徵無關
+    probe = xgb.DMatrix(np.zeros((1, len(feature_cols)), dtype=np.float32), feature_names=booster.feature_names)
+    expected_value = float(booster.predict(probe, pred_contribs=True)[0, -1])
+
+    manifest = {
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'model_version': _sha256_file(os.path.join(bundle_dir, BOOSTER_FILE))[:12],
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'xgboost_version': xgb.__version__,
+        'fe_pipeline_name': fe_pipeline_name,
+        'source_model_sha256': _sha256_file(source_model_path) if source_model_path else None,
+        'best_iteration': best_iteration,
+        'num_trees': engine.num_trees,
+        'tree_engine': {
+            'max_depth': engine.max_depth,
+            'base_margin': engine.base_margin,
+            'num_features': engine.num_features,
+        },
+        'explainer': {'expected_value': expected_value},
+        'files': {
+            relative_path.replace(os.sep, '/'): {
+                'sha256': _sha256_file(os.path.join(bundle_dir, relative_path)),
+                'bytes': os.path.getsize(os.path.join(bundle_dir, relative_path)),
+            }
+            for relative_path in files
+        },
+    }
+    with open(os.path.join(bundle_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"模型工件包已寫入 {bundle_dir} (model_version={manifest['model_version']}, {engine.num_trees} 棵樹)。")
+    return manifest
+
+
+class ModelBundle:
+    """
+    從工件包載入的模型與相關資料。
+
+    - model: XGBClassifier (由 UBJSON 載入)
+    - tree_engine_arrays: 以 mmap 開啟的攤平樹陣列 (唯讀，跨 fork 的 worker 共用同一份頁面快取)
+    """
+
+    def __init__(self, bundle_dir: str, verify: bool = True):
+        self.bundle_dir = bundle_dir
+        manifest_path = os.path.join(bundle_dir, MANIFEST_FILE)
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+
+        if self.manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"不支援的工件包格式版本: {self.manifest.get('format_version')} (預期 {BUNDLE_FORMAT_VERSION})")
+        if verify:
+            self.verify()
+
+        with open(self.path(BOOSTER_FILE), 'rb') as f:
+            raw_booster = bytearray(f.read())
+        self.model = xgb.XGBClassifier()
+        self.model.load_model(raw_booster)
+
+        with open(self.path(FEATURE_COLUMNS_FILE), 'r', encoding='utf-8') as f:
+            self.feature_cols: List[str] = json.load(f)
+
+        self.fe_pipeline_name: str = self.manifest['fe_pipeline_name']
+        self.best_iteration: Optional[int] = self.manifest.get('best_iteration')
+        self.model_version: str = self.manifest['model_version']
+        self.expected_value: float = self.manifest['explainer']['expected_value']
+
+    @property
+    def file_paths(self) -> List[str]:
+        """工件包內所有檔案的絕對路徑 (含 manifest)，供結果快取偵測變更。"""
+        return [self.path(MANIFEST_FILE)] + [self.path(name) for name in self.manifest['files']]
+
+    def path(self, relative_path: str) -> str:
+        return os.path.join(self.bundle_dir, *relative_path.split('/'))
+
+    def matches_source_model(self, model_path: Optional[str]) -> bool:
+        """
+        工件包是否由 model_path 的 joblib 模型產生 (比對 manifest 中的 source_model_sha256)。
+        joblib 模型不存在 (只部署工件包) 時視為一致；manifest 未記錄來源時無法確認，視為不一致。
+        """
+        if not model_path or not os.path.exists(model_path):
+            return True
+        expected = self.manifest.get('source_model_sha256')
+        return bool(expected) and _sha256_file(model_path) == expected
+
+    def verify(self) -> None:
+        """以 manifest 中的 SHA-256 校驗所有檔案，不符時拋出 ValueError。"""
+        for relative_path, info in self.manifest['files'].items():
+            actual = _sha256_file(self.path(relative_path))
+            if actual != info['sha256']:
+                raise ValueError(f"工件包檔案校驗失敗: {relative_path} (預期 {info['sha256'][:12]}，實際 {actual[:12]})")
+
+    def build_tree_engine(self) -> ArrayTreeEnsemble:
+        """以 mmap 載入預先攤平的樹陣列建立 native 推論引擎 (不需重新解析 Booster JSON)。"""
+        arrays = {
+            field: np.load(self.path(f'{TREE_ARRAYS_DIR}/{field}.npy'), mmap_mode='r')
+            for field in ArrayTreeEnsemble.ARRAY_FIELDS
+        }
+        params = self.manifest['tree_engine']
+        return ArrayTreeEnsemble(**arrays, max_depth=params['max_depth'], base_margin=params['base_margin'],
+                                 num_features=params['num_features'])
+
+
+def bundle_exists(bundle_dir: Optional[str]) -> bool:
+    return bool(bundle_dir) and os.path.exists(os.path.join(bundle_dir, MANIFEST_FILE))
+
+
+def main():
+    """將既有的 joblib 模型工件轉換為工件包。"""
+    import joblib
+
+    parser = argparse.ArgumentParser(description="將 joblib 模型工件轉換為版本化工件包")
+    parser.add_argument("--model_path", type=str, required=True, help="customer_churn_bank_model.joblib 路徑")
+    parser.add_argument("--model_dir", type=str, default=None, help="feature_columns.joblib / fe_pipeline_name.txt 所在目錄 (預設與模型相同)")
+    parser.add_argument("--output", type=str, default=None, help="工件包輸出目錄 (預設 <model_dir>/model_bundle)")
+    args = parser.parse_args()
+
+    model_dir = args.model_dir or os.path.dirname(os.path.abspath(args.model_path))
+    output = args.output or os.path.join(model_dir, 'model_bundle')
+
+    model = joblib.load(args.model_path)
+    feature_cols = joblib.load(os.path.join(model_dir, 'feature_columns.joblib'))
+    with open(os.path.join(model_dir, 'fe_pipeline_name.txt'), 'r') as f:
+        fe_pipeline_name = f.read().strip()
+
+    manifest = write_model_bundle(model, feature_cols, fe_pipeline_name, output, source_model_path=args.model_path)
+    print(json.dumps({k: manifest[k] for k in ('model_version', 'best_iteration', 'num_trees')}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,259 @@
+# services\model_registry.py
+import threading
+import logging
+import time
+import os
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('ModelRegistry')
+logger.setLevel(logging.INFO)
+
+
+class ModelRegistry:
+    """
+    持有目前服務中的模型服務實例，支援不中斷服務的熱抽換 (hot-swap)。
+
+    - current：請求開始時讀取一次並在整個請求中使用同一個實例；抽換只替換參照 (原子操作)，
+      進行中的請求繼續使用舊實例直到完成。
+    - reload()：在背景執行緒以 factory 建立新實例，執行 canary 預測 (同時完成暖機) 驗證無誤後才抽換；
+      載入或驗證失敗時保留舊實例。同一時間只會有一個重新載入在進行。
+    - 可選的檔案監看：每 watch_interval 秒檢查目前實例的工件檔案 (mtime/大小)，變更時自動 reload()。
+    - 可選的跨行程重新載入訊號 (reload_signal_path)：broadcast_reload() 將新的世代寫入共用檔案，
+      每個 gunicorn worker 的監看執行緒每 signal_interval 秒檢查一次，世代變更時各自 reload()。
+    """
+
+    def __init__(self, factory: Callable[[], Any], canary: Optional[Callable[[Any], None]] = None,
+                 on_swap: Optional[Callable[[Any], None]] = None, watch_interval: float = 0.0,
+                 reload_signal_path: Optional[str] = None, signal_interval: float = 1.0):
+        self.factory = factory
+        self.canary = canary
+        self.on_swap = on_swap
+        self.watch_interval = watch_interval
+        self.reload_signal_path = reload_signal_path
+        self.signal_interval = signal_interval
+
+        self._current: Any = None
+        self._lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+        self._watch_thread: Optional[threading.Thread] = None
+        self._watch_stop = threading.Event()
+        self._artifact_signature: List[Tuple[str, int, int]] = []
+        # 本行程已處理過的重新載入世代 (讀自 reload_signal_path)
+        self._reload_generation = ''
+        # load_initial(run_canary=False) 後尚未執行的 canary (由 verify_initial 補做)
+        self._canary_pending = False
+
+        self.loaded_at: Optional[float] = None
+        self.swaps = 0
+        self.failures = 0
+        self.last_reload: Dict[str, Any] = {}
+
+    # ------------------------------------------------------------------
+    # 讀取
+    # ------------------------------------------------------------------
+    @property
+    def current(self) -> Any:
+        return self._current
+
+    @property
+    def model_version(self) -> str:
+        service = self._current
+        return getattr(service, 'model_version', '') if service is not None else ''
+
+    # ------------------------------------------------------------------
+    # 載入與抽換
+    # ------------------------------------------------------------------
+    def load_initial(self, run_canary: bool = True) -> Any:
+        """
+        同步建立第一個實例 (服務啟動時呼叫；失敗時直接拋出例外)。
+
+        run_canary=False 時 (gunicorn preload 的 master，fork 前不執行預測) 先不驗證，
+        由每個 worker 在 fork 後呼叫 verify_initial() 補做。
+        """
+        # 先記下目前的世代：之前留下的訊號檔不會觸發重新載入，載入之後才寫入的世代則會 (包含 fork 前的 preload)
+        self._reload_generation = self._read_generation()
+        service = self.factory()
+        if self.canary is not None:
+            if run_canary:
+                self.canary(service)
+            else:
+                self._canary_pending = True
+        self._swap(service)
+        return service
+
+    def verify_initial(self) -> None:
+        """執行 load_initial(run_canary=False) 延後的 canary (失敗時拋出例外)；已驗證時為 no-op。"""
+        if not self._canary_pending:
+            return
+        with self._lock:
+            if not self._canary_pending:
+                return
+            self.canary(self._current)
+            self._canary_pending = False
+        logger.info(f"啟動 canary 驗證通過 (pid={os.getpid()}，model_version={self.model_version})。")
+
+    def reload(self, wait: bool = False, timeout: Optional[float] = None) -> bool:
+        """
+        在背景執行緒重新載入模型；回傳是否啟動了新的載入 (已有載入進行中時回傳 False)。
+        wait=True 時等待載入結束 (測試與管理工具使用)。
+        """
+        with self._lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                started = False
+            else:
+                self._reload_thread = threading.Thread(target=self._reload, name='model-reload', daemon=True)
+                self._reload_thread.start()
+                started = True
+            thread = self._reload_thread
+        if wait:
+            thread.join(timeout)
+        return started
+
+    def broadcast_reload(self) -> str:
+        """
+        寫入新的重新載入世代，通知共用訊號檔的所有行程 (各 worker 的監看執行緒會在 signal_interval 秒內各自 reload())；
+        本行程記為已處理，由呼叫端直接 reload()。未設定 reload_signal_path 時回傳空字串。
+        """
+        if not self.reload_signal_path:
+            return ''
+        generation = f"{time.time_ns()}-{os.getpid()}"
+        directory = os.path.dirname(self.reload_signal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.reload_signal_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(generation)
+        os.replace(tmp_path, self.reload_signal_path)
+        self._reload_generation = generation
+        logger.info(f"已寫入模型重新載入世代 {generation}。")
+        return generation
+
+    def status(self) -> Dict[str, Any]:
+        reloading = self._reload_thread is not None and self._reload_thread.is_alive()
+        return {
+            "model_version": self.model_version,
+            "loaded_at": self.loaded_at,
+            "swaps": self.swaps,
+            "failures": self.failures,
+            "reloading": reloading,
+            "watching": self._watch_thread is not None and self._watch_thread.is_alive(),
+            "reload_generation": self._reload_generation,
+            "last_reload": dict(self.last_reload),
+        }
+
+    def _reload(self) -> None:
+        start = time.monotonic()
+        previous_version = self.model_version
+        try:
+            service = self.factory()
+            if self.canary is not None:
+                self.canary(service)
+        except Exception as e:
+            self.failures += 1
+            self.last_reload = {"status": "failed", "error": str(e), "seconds": round(time.monotonic() - start, 3),
+                                "finished_at": time.time()}
+            logger.error(f"模型重新載入失敗，繼續使用版本 {previous_version}: {e}", exc_info=True)
+            return
+
+        old = self._swap(service)
+        self.last_reload = {"status": "swapped", "from_version": previous_version,
+                            "to_version": self.model_version, "seconds": round(time.monotonic() - start, 3),
+                            "finished_at": time.time()}
+        logger.info(f"模型已熱抽換：{previous_version} -> {self.model_version} ({time.monotonic() - start:.2f}s)。")
+
+        # 舊實例的微批次執行緒處理完佇列中的請求後停止 (仍持有舊實例的請求之後改為在請求執行緒直接處理)
+        if old is not None and getattr(old, 'micro_batcher', None) is not None:
+            old.micro_batcher.shutdown(timeout=5.0)
+
+    def _swap(self, service: Any) -> Any:
+        with self._lock:
+            old, self._current = self._current, service
+            self._artifact_signature = self._stat_artifacts(service)
+            self.loaded_at = time.time()
+            self.swaps += 1
+        if self.on_swap is not None:
+            try:
+                self.on_swap(service)
+            except Exception as e:
+                logger.warning(f"on_swap 回呼失敗: {e}")
+        return old
+
+    # ------------------------------------------------------------------
+    # 檔案監看
+    # ------------------------------------------------------------------
+    def start_watching(self) -> None:
+        """
+        啟動工件檔案 / 重新載入訊號監看執行緒 (兩者皆未啟用時不啟動；已啟動時為 no-op，可在每個請求呼叫)。
+
+        只在處理請求的行程啟動 (惰性啟動，或 gunicorn preload 模式下於 worker 的 post_fork)：master 不處理請求，不會監看。
+        """
+        interval = self._poll_interval()
+        if interval <= 0 or (self._watch_thread is not None and self._watch_thread.is_alive()):
+            return
+        with self._lock:
+            if self._watch_thread is not None and self._watch_thread.is_alive():
+                return
+            self._watch_stop.clear()
+            self._watch_thread = threading.Thread(target=self._watch, name='model-watch', daemon=True)
+            self._watch_thread.start()
+        logger.info(f"模型工件監看已啟動 (pid={os.getpid()}，每 {interval}s 檢查一次)。")
+
+    def stop_watching(self) -> None:
+        self._watch_stop.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join(timeout=self._poll_interval() + 1)
+        self._watch_thread = None
+
+    def reset_after_fork(self) -> None:
+        """在 fork 出的子行程中重建鎖與執行緒狀態 (監看執行緒會在 worker 處理第一個請求時啟動)。"""
+        self._lock = threading.Lock()
+        self._reload_thread = None
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+        if self._current is not None and hasattr(self._current, 'reset_after_fork'):
+            self._current.reset_after_fork()
+
+    def _poll_interval(self) -> float:
+        if self.watch_interval > 0:
+            return min(self.watch_interval, self.signal_interval) if self.reload_signal_path else self.watch_interval
+        return self.signal_interval if self.reload_signal_path else 0.0
+
+    def _read_generation(self) -> str:
+        if not self.reload_signal_path:
+            return ''
+        try:
+            with open(self.reload_signal_path, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+
+    def _watch(self) -> None:
+        while not self._watch_stop.wait(self._poll_interval()):
+            service = self._current
+            if service is None:
+                continue
+            generation = self._read_generation()
+            if generation and generation != self._reload_generation and self.reload():
+                self._reload_generation = generation
+                logger.info(f"收到模型重新載入訊號 (世代 {generation})，開始背景重新載入。")
+                continue
+            if self.watch_interval <= 0:
+                continue
+            signature = self._stat_artifacts(service)
+            if signature != self._artifact_signature and self.reload():
+                # 記下新的簽章：載入失敗 (例如檔案寫到一半) 時等下一次變更再重試，不會反覆載入同一份壞檔；
+                # 已有載入進行中時不記錄，下一輪再檢查
+                self._artifact_signature = signature
+                logger.info("偵測到模型工件變更，開始背景重新載入。")
+
+    @staticmethod
+    def _stat_artifacts(service: Any) -> List[Tuple[str, int, int]]:
+        signature = []
+        for path in getattr(service, 'artifact_paths', []):
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((path, -1, -1))
+        return signature
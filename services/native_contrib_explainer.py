@@ -0,0 +1,57 @@
+# services\native_contrib_explainer.py
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+import logging
+
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger('NativeContribExplainer')
+logger.setLevel(logging.INFO)
+
+
+class NativeContribExplainer:
+    """
+    以 XGBoost Booster 原生的 pred_contribs 計算局部 SHAP 值，取代服務端的 shap.TreeExplainer。
+
+    - approximate=False：精確 TreeSHAP (與 shap.TreeExplainer 相同的演算法，結果一致至 float32 誤差)。
+    - approximate=True：approx_contribs (Saabas 近似法)，速度更快，但數值與精確 SHAP 不同。
+    - 不需要 shap 套件，也不需解析 base_score (偏差項由 Booster 直接給出)。
+
+    介面與 shap.TreeExplainer.shap_values 相容：回傳 (n_samples, n_features) 的矩陣 (不含偏差欄)。
+    """
+
+    def __init__(self, model: Any, approximate: bool = False, iteration_range: Optional[Tuple[int, int]] = None):
+        self.booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        self.approximate = approximate
+        # 未指定時與 predict_proba / shap.TreeExplainer 一致：若有 best_iteration (Early Stopping)，只使用前 best_iteration + 1 輪
+        if iteration_range is None:
+            best_iteration = self.booster.attr('best_iteration')
+            iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+        self.iteration_range = iteration_range
+        self.feature_names = self.booster.feature_names
+
+    def shap_values(self, X: Any, check_additivity: bool = False) -> np.ndarray:
+        """回傳正類別 (流失) 的 SHAP 值矩陣；check_additivity 僅為與 shap 介面相容而保留。"""
+        contribs = self._predict_contribs(X)
+        return contribs[:, :-1]
+
+    def expected_value(self, X: Any) -> np.ndarray:
+        """偏差項 (所有特徵貢獻為 0 時的 margin)。"""
+        return self._predict_contribs(X)[:, -1]
+
+    def _predict_contribs(self, X: Any) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            feature_names = list(X.columns)
+            data = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+        else:
+            feature_names = self.feature_names
+            data = np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+        dmatrix = xgb.DMatrix(data, feature_names=feature_names, missing=np.nan)
+        return self.booster.predict(
+            dmatrix,
+            pred_contribs=True,
+            approx_contribs=self.approximate,
+            iteration_range=self.iteration_range,
+            validate_features=True
+        )
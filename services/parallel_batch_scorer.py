@@ -0,0 +1,209 @@
+# services\parallel_batch_scorer.py
+import concurrent.futures
+import multiprocessing
+import threading
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Tuple
+
+from services.roi_kernel import PortfolioStats
+
+logger = logging.getLogger('ParallelBatchScorer')
+logger.setLevel(logging.INFO)
+
+# portfolio_stats 需要的原始欄位 (以 float64 放入共享記憶體，分片各自計算 ROI)
+ROI_INPUT_COLUMNS = ('Balance', 'NumOfProducts', 'HasCrCard', 'IsActiveMember')
+
+# 子行程內的模型服務實例 (依建構參數快取；模型版本不同時重新載入)
+_WORKER_SERVICES: Dict[Tuple, Any] = {}
+
+
+class SharedArray:
+    """
+    配置在 multiprocessing.shared_memory 上的 NumPy 陣列。
+
+    只有 spec = (名稱, 形狀, dtype) 會被傳給子行程，子行程以 attach() 直接映射同一塊記憶體，不序列化任何資料列。
+    建立者負責 unlink()；附掛者只 close()。
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype: Any):
+        self.shm = shm
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.spec = (shm.name, tuple(shape), np.dtype(dtype).str)
+
+    @classmethod
+    def create(cls, shape: Tuple[int, ...], dtype: Any) -> 'SharedArray':
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        return cls(shared_memory.SharedMemory(create=True, size=nbytes), shape, dtype)
+
+    @classmethod
+    def attach(cls, spec: Tuple[str, Tuple[int, ...], str]) -> 'SharedArray':
+        name, shape, dtype = spec
+        # spawn 出的子行程與建立者共用同一個 resource_tracker，附掛時的重複登記不會造成提早回收
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype)
+
+    def close(self) -> None:
+        self.array = None
+        self.shm.close()
+
+    def unlink(self) -> None:
+        try:
+            self.close()
+        except BufferError:
+            pass  # 例外追蹤仍持有陣列視圖時無法 close，但名稱仍須移除，待視圖釋放後記憶體即回收
+        self.shm.unlink()
+
+
+def _init_shard_worker(threads: int) -> None:
+    """分片子行程初始化：限制每個行程的 OpenMP 執行緒數 (需在匯入 xgboost 之前)，並在父行程結束時跟著退出。"""
+    if threads > 0:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=lambda: (parent.join(), os._exit(1)), name='shard-parent-watch', daemon=True).start()
+
+
+def _worker_service(service_kwargs: Dict[str, Any], model_version: str) -> Any:
+    """取得 (或建立) 子行程內的模型服務實例；磁碟上的工件已不是父行程使用的版本時拋出 RuntimeError。"""
+    from services.customer_churn_bank_service import CustomerChurnBankService
+
+    key = tuple(sorted(service_kwargs.items()))
+    service = _WORKER_SERVICES.get(key)
+    if service is None or service.model_version != model_version:
+        service = CustomerChurnBankService(**service_kwargs)
+        _WORKER_SERVICES.clear()
+        _WORKER_SERVICES[key] = service
+    if service.model_version != model_version:
+        raise RuntimeError(f"分片子行程載入的模型版本 {service.model_version} 與請求的 {model_version} 不一致。")
+    return service
+
+
+def _score_shard(task: Dict[str, Any]) -> Any:
+    """在子行程中對 [start, stop) 列進行預測、(可選) SHAP 前 k 名與 ROI，結果直接寫回共享記憶體。"""
+    service = _worker_service(task['service_kwargs'], task['model_version'])
+    start, stop = task['start'], task['stop']
+    attached = {name: SharedArray.attach(spec) for name, spec in task['arrays'].items()}
+    try:
+        X_predict = service.alignment_plan.to_frame(attached['features'].array[start:stop])
+        probabilities = service._predict_positive_proba(X_predict)
+        attached['probability'].array[start:stop] = probabilities
+
+        if task['explain_top_k'] > 0:
+            top_idx, top_values = service.top_k_shap(X_predict, k=task['explain_top_k'])
+            attached['top_idx'].array[start:stop] = top_idx
+            attached['top_values'].array[start:stop] = top_values
+
+        roi_df = pd.DataFrame(attached['roi_inputs'].array[start:stop], columns=list(ROI_INPUT_COLUMNS), copy=True)
+        roi_df['Exited_Probability'] = probabilities
+        return service.portfolio_stats(roi_df)
+    finally:
+        X_predict = None  # 釋放指向共享記憶體的視圖後才能 close
+        for shared in attached.values():
+            shared.close()
+
+
+class ParallelBatchScorer:
+    """
+    多核心分片批次評分：對齊後的 float32 特徵矩陣放在共享記憶體，切成連續的列區段交給行程池，
+    各分片完成預測、(可選) SHAP 前 k 名與 ROI 後依列位置寫回共享的輸出陣列，因此合併結果自然保持原始順序。
+
+    - 行程池 (spawn) 在第一次使用時建立並常駐；子行程各自載入一次模型服務 (依 model_version 快取)，
+      與服務實例無關，模型熱抽換後不需重建行程池。
+    - 只有共享記憶體名稱與列區段會被序列化；各分片回傳 PortfolioStats，以 merge 合併為整體 ROI。
+    """
+
+    def __init__(self, workers: int, min_rows: int = 50000, threads_per_worker: int = 1):
+        self.workers = workers
+        self.min_rows = min_rows
+        self.threads_per_worker = threads_per_worker
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def should_parallelize(self, n_rows: int) -> bool:
+        return self.workers > 0 and n_rows >= self.min_rows
+
+    def score(self, service: Any, processed: Any, roi_inputs: pd.DataFrame,
+              explain_top_k: int = 0) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray], PortfolioStats]:
+        """
+        Args:
+            service: 父行程中的 CustomerChurnBankService (提供對齊計畫、建構參數與 model_version)。
+            processed: FE 輸出 (DataFrame 或 {欄位: 陣列} 映射)。
+            roi_inputs: 含 ROI_INPUT_COLUMNS 的原始欄位。
+
+        Returns:
+            (probabilities, top_idx, top_values, portfolio)；未要求 SHAP 時 top_idx / top_values 為 None。
+        """
+        n_rows = len(roi_inputs)
+        n_features = service.alignment_plan.n_features
+        k = min(explain_top_k, n_features) if explain_top_k > 0 and service.explainer else 0
+
+        # 機率的 dtype 依推論後端而定 (xgboost 為 float32)，先以一列探測，確保與單行程路徑完全相同
+        probe = service._predict_positive_proba(service.alignment_plan.to_frame(np.zeros((1, n_features), np.float32)))
+
+        arrays: Dict[str, SharedArray] = {}
+        try:
+            arrays['features'] = SharedArray.create((n_rows, n_features), np.float32)
+            service.alignment_plan.transform(processed, out=arrays['features'].array)
+            arrays['roi_inputs'] = SharedArray.create((n_rows, len(ROI_INPUT_COLUMNS)), np.float64)
+            arrays['roi_inputs'].array[:] = roi_inputs[list(ROI_INPUT_COLUMNS)].to_numpy(dtype=np.float64)
+            arrays['probability'] = SharedArray.create((n_rows,), probe.dtype)
+            if k:
+                arrays['top_idx'] = SharedArray.create((n_rows, k), np.int16)
+                arrays['top_values'] = SharedArray.create((n_rows, k), np.float32)
+
+            bounds = np.linspace(0, n_rows, self.workers + 1).astype(int)
+            tasks = [{
+                'service_kwargs': service.init_kwargs,
+                'model_version': service.model_version,
+                'arrays': {name: shared.spec for name, shared in arrays.items()},
+                'start': int(start), 'stop': int(stop), 'explain_top_k': k,
+            } for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+            executor = self._get_executor()
+            try:
+                portfolio_parts = list(executor.map(_score_shard, tasks))
+            except concurrent.futures.process.BrokenProcessPool:
+                # 子行程異常結束 (例如被 OOM killer 終止) 後行程池無法再使用；捨棄它，下一次評分時重新建立
+                logger.error("分片批次評分行程池已損壞，將於下次評分時重新建立。")
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                executor.shutdown(wait=False)
+                raise
+
+            probabilities = arrays['probability'].array.copy()
+            top_idx = arrays['top_idx'].array.copy() if k else None
+            top_values = arrays['top_values'].array.copy() if k else None
+        finally:
+            for shared in arrays.values():
+                shared.unlink()
+
+        return probabilities, top_idx, top_values, PortfolioStats.combine(portfolio_parts)
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_shard_worker,
+                        initargs=(self.threads_per_worker,)
+                    )
+                    logger.info(f"分片批次評分行程池已啟動 (workers={self.workers})。")
+        return self._executor
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def reset_after_fork(self) -> None:
+        """在 fork 出的子行程中捨棄父行程的行程池與鎖 (第一次使用時重新建立)。"""
+        self._executor = None
+        self._lock = threading.Lock()
@@ -0,0 +1,157 @@
+# services\prediction_cache.py
+import threading
+import hashlib
+import logging
+import time
+import json
+import os
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger('PredictionResultCache')
+logger.setLevel(logging.INFO)
+
+
+def compute_artifact_version(paths: Sequence[str]) -> str:
+    """以模型工件內容的 SHA-256 (前 12 碼) 作為模型版本；不存在的檔案會被略過。"""
+    digest = hashlib.sha256()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class PredictionResultCache:
+    """
+    /predict 結果的有界 LRU + TTL 快取。
+
+    - 鍵：核心輸入特徵的正規化雜湊 + 模型版本，相同客戶資料重送時可直接重用機率、SHAP 與已繪製的圖表。
+    - 容量上限 max_entries (LRU 淘汰)，每筆在 ttl_seconds 後過期。
+    - 監看模型工件檔案 (mtime / size)，一旦變更即清空快取，避免回傳舊模型的結果。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0, model_version: str = '',
+                 artifact_paths: Sequence[str] = (), artifact_check_interval: float = 1.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.model_version = model_version
+        self.artifact_paths = list(artifact_paths)
+        self.artifact_check_interval = artifact_check_interval
+
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._artifact_signature = self._stat_artifacts()
+        self._next_artifact_check = time.monotonic() + artifact_check_interval
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # ------------------------------------------------------------------
+    # 鍵
+    # ------------------------------------------------------------------
+    def make_key(self, features: Dict[str, Any], columns: Sequence[str]) -> str:
+        """
+        依 columns 的順序將特徵值正規化 (數值統一為 float，-0.0 視為 0.0；其他值取去空白的字串) 後雜湊。
+        """
+        canonical = []
+        for col in columns:
+            value = features.get(col)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                canonical.append(float(value) + 0.0)
+            else:
+                canonical.append(str(value).strip())
+        payload = json.dumps([self.model_version, canonical], separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------
+    # 存取
+    # ------------------------------------------------------------------
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        self._check_artifacts()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def reset_after_fork(self) -> None:
+        """在 fork 出的子行程中重建鎖；已快取的項目保留 (與父行程以寫入時複製方式共用)，統計歸零。"""
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'model_version': self.model_version,
+        }
+
+    # ------------------------------------------------------------------
+    # 模型工件變更偵測
+    # ------------------------------------------------------------------
+    def _stat_artifacts(self) -> List[Tuple[str, int, int]]:
+        signature = []
+        for path in self.artifact_paths:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((path, -1, -1))
+        return signature
+
+    def _check_artifacts(self) -> None:
+        """節流檢查 (每 artifact_check_interval 秒最多一次 os.stat)，工件變更時清空快取。"""
+        now = time.monotonic()
+        if now < self._next_artifact_check:
+            return
+        self._next_artifact_check = now + self.artifact_check_interval
+        signature = self._stat_artifacts()
+        if signature != self._artifact_signature:
+            self._artifact_signature = signature
+            self.clear()
+            self.invalidations += 1
+            logger.warning("偵測到模型工件變更，已清空預測結果快取。")
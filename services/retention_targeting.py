@@ -0,0 +1,150 @@
+# services\retention_targeting.py
+# 固定預算的挽留名單：從 ENR > 0 的客戶中選出 ENR 最高的 K 位 (K 由預算 / 挽留成本或聯絡人數上限決定)，
+# 以 argpartition 部分選取取代整個名單排序；分塊輸入時只保留大小為 K 的候選集合，記憶體與客戶總數無關
+import numpy as np
+
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from services.roi_kernel import DEFAULT_ROI_PARAMS, RoiInputs, customer_enr
+
+# 邊際 ROI 曲線回傳的最多點數 (等距取樣，一定包含最後一位)
+DEFAULT_CURVE_POINTS = 100
+# 分塊處理已保存結果時每個區塊的列數
+DEFAULT_CHUNK_ROWS = 1 << 16
+
+
+def contact_limit(retention_cost: float, budget: Optional[float] = None, max_contacts: Optional[int] = None) -> int:
+    """可聯絡的客戶數上限 K = min(floor(預算 / 挽留成本), max_contacts)；兩者皆未指定時拋出 ValueError。"""
+    if budget is None and max_contacts is None:
+        raise ValueError("必須指定 budget 或 max_contacts。")
+    limits = []
+    if budget is not None:
+        if not np.isfinite(budget) or budget < 0:
+            raise ValueError("budget 必須為 >= 0 的數值。")
+        # 挽留成本為 0 時預算不構成限制
+        limits.append(int(budget // retention_cost) if retention_cost > 0 else np.iinfo(np.int64).max)
+    if max_contacts is not None:
+        if max_contacts < 0:
+            raise ValueError("max_contacts 必須 >= 0。")
+        limits.append(int(max_contacts))
+    return min(limits)
+
+
+def _select_top(enr: np.ndarray, positions: np.ndarray, k: int) -> np.ndarray:
+    """
+    回傳 ENR 最高的 k 個元素的索引 (未排序)。以 argpartition 找出第 k 名的 ENR 作為門檻，
+    門檻上的同分者依 positions (原始列位置) 由小到大取，使結果與分塊方式無關。
+    """
+    if len(enr) <= k:
+        return np.arange(len(enr))
+    cutoff = enr[np.argpartition(-enr, k - 1)[k - 1]]
+    above = np.flatnonzero(enr > cutoff)
+    ties = np.flatnonzero(enr == cutoff)
+    ties = ties[np.argsort(positions[ties], kind='stable')[:k - len(above)]]
+    return np.concatenate([above, ties])
+
+
+class TopKTargetAccumulator:
+    """
+    分塊累積 ENR 最高的 k 位客戶 (只考慮 ENR > 0)：只保留目前的 k 個候選，
+    每個區塊先以目前第 k 名的 ENR 過濾 (名單已滿時，大多數列在這一步就被排除)，
+    再與候選合併後以 argpartition 取前 k 名，相當於向量化的有界 top-k 堆積。
+    merge 可合併在其他行程 / 節點累積的結果 (列位置需為全域位置)。
+    """
+
+    def __init__(self, k: int):
+        self.k = int(k)
+        self.enr = np.empty(0, dtype=np.float64)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.positions = np.empty(0, dtype=np.int64)
+        self.rows = 0
+        self.actionable_count = 0
+
+    def update(self, enr: np.ndarray, ids: np.ndarray, start_position: Optional[int] = None) -> None:
+        """加入一個區塊；start_position 為該區塊第一列的全域位置 (預設接續已處理的列數)。"""
+        start_position = self.rows if start_position is None else start_position
+        candidates = np.flatnonzero(enr > 0)
+        self.rows += len(enr)
+        self.actionable_count += len(candidates)
+        if self.k == 0 or len(candidates) == 0:
+            return
+        if len(self.enr) == self.k:
+            # 同分時較早的列優先，因此之後的列必須嚴格大於目前第 k 名才可能入選
+            candidates = candidates[enr[candidates] > self.enr.min()]
+        self._keep(np.concatenate([self.enr, enr[candidates]]),
+                   np.concatenate([self.ids, np.asarray(ids)[candidates]]),
+                   np.concatenate([self.positions, candidates + start_position]))
+
+    def merge(self, other: 'TopKTargetAccumulator') -> 'TopKTargetAccumulator':
+        """合併另一個累積器 (k 取兩者較小者)，回傳 self。"""
+        self.k = min(self.k, other.k)
+        self.rows += other.rows
+        self.actionable_count += other.actionable_count
+        self._keep(np.concatenate([self.enr, other.enr]), np.concatenate([self.ids, other.ids]),
+                   np.concatenate([self.positions, other.positions]))
+        return self
+
+    def _keep(self, enr: np.ndarray, ids: np.ndarray, positions: np.ndarray) -> None:
+        keep = _select_top(enr, positions, self.k)
+        self.enr, self.ids, self.positions = enr[keep], ids[keep], positions[keep]
+
+    def ranked(self) -> Tuple[np.ndarray, np.ndarray]:
+        """依 ENR 由高到低 (同分依列位置) 排列的 (ENR, ids)；只排序入選的 k 位。"""
+        order = np.lexsort((self.positions, -self.enr))
+        return self.enr[order], self.ids[order]
+
+
+def build_target_plan(accumulator: TopKTargetAccumulator, retention_cost: float,
+                      curve_points: int = DEFAULT_CURVE_POINTS) -> Dict[str, Any]:
+    """
+    由累積結果組成挽留名單：入選 ids (ENR 由高到低)、門檻 ENR (最後一位入選者)、總計，
+    以及邊際 ROI 曲線 (第 n 位的 ENR / 挽留成本，與前 n 位的累計淨 ENR、成本、ROI)。
+    """
+    enr, ids = accumulator.ranked()
+    count = len(enr)
+    cumulative_enr = np.cumsum(enr)
+    cumulative_cost = np.arange(1, count + 1) * retention_cost
+    total_enr = float(cumulative_enr[-1]) if count else 0.0
+    total_cost = count * retention_cost
+
+    points = np.unique(np.linspace(0, count - 1, num=min(curve_points, count)).round().astype(np.int64)) \
+        if count else np.empty(0, dtype=np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        marginal_roi = enr[points] / retention_cost if retention_cost > 0 else np.zeros(len(points))
+        cumulative_roi = cumulative_enr[points] / cumulative_cost[points] if retention_cost > 0 \
+            else np.zeros(len(points))
+    return {
+        'rows': accumulator.rows,
+        'actionable_count': accumulator.actionable_count,
+        'contact_limit': accumulator.k,
+        'selected_count': count,
+        'cutoff_enr': float(enr[-1]) if count else None,
+        'total_net_enr': total_enr,
+        'retention_cost': total_cost,
+        'total_roi': (total_enr / total_cost) if total_cost > 0 else 0.0,
+        'ids': ids.tolist(),
+        'curve': {
+            'contacts': (points + 1).tolist(),
+            'marginal_enr': enr[points].tolist(),
+            'marginal_roi': marginal_roi.tolist(),
+            'cumulative_net_enr': cumulative_enr[points].tolist(),
+            'cumulative_cost': cumulative_cost[points].tolist(),
+            'cumulative_roi': cumulative_roi.tolist(),
+        },
+    }
+
+
+def plan_retention_targets(chunks: Iterable[Tuple[RoiInputs, np.ndarray]], budget: Optional[float] = None,
+                           max_contacts: Optional[int] = None, params: Dict[str, float] = None,
+                           curve_points: int = DEFAULT_CURVE_POINTS) -> Dict[str, Any]:
+    """
+    在預算 (budget) 或聯絡人數上限 (max_contacts) 下選出 ENR 最高的客戶。
+    chunks 為 (ROI 輸入, 客戶 ID) 的序列，可為整份資料 (單一區塊) 或逐區塊產生的串流；
+    記憶體只與區塊大小和 K 有關。params 可覆寫 DEFAULT_ROI_PARAMS。
+    """
+    p = {**DEFAULT_ROI_PARAMS, **(params or {})}
+    accumulator = TopKTargetAccumulator(contact_limit(p['retention_cost'], budget, max_contacts))
+    for inputs, ids in chunks:
+        accumulator.update(customer_enr(inputs, p), ids)
+    return {**build_target_plan(accumulator, p['retention_cost'], curve_points), 'budget': budget,
+            'max_contacts': max_contacts, 'parameters': p}
@@ -0,0 +1,148 @@
+# services\risk_distribution.py
+# 批次結果的風險分布彙總：整體與各客群 (Geography、Gender、Age_bin) 的流失機率分位數、直方圖與門檻以上人數，
+# 在評分時逐區塊累積 (記憶體固定，與筆數無關)，可跨區塊 / 分片合併，前端不需下載所有資料列即可繪製儀表板
+import numpy as np
+import pandas as pd
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# 回應中的機率截斷到小數點後四位，以 1e-4 為一格累計人數時，分位數與門檻人數與逐列計算完全相同
+PROBABILITY_RESOLUTION = 10000
+DEFAULT_QUANTILES = (0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+HISTOGRAM_BINS = 20
+RISK_COHORT_DIMENSIONS = ('Geography', 'Gender', 'Age_bin')
+# 超過每個維度客群數上限的值合併為此客群 (避免使用者上傳的任意字串讓記憶體無上限成長)
+OTHER_COHORT = '__other__'
+
+
+def probability_grid_index(probability: np.ndarray) -> np.ndarray:
+    """機率在 1e-4 格線上的位置 (0 ~ PROBABILITY_RESOLUTION)；輸入為截斷後的機率，四捨五入只修正浮點表示誤差。"""
+    index = np.rint(np.asarray(probability, dtype=np.float64) * PROBABILITY_RESOLUTION)
+    return np.clip(index, 0, PROBABILITY_RESOLUTION).astype(np.int64)
+
+
+def threshold_grid_index(threshold: float) -> int:
+    """機率 >= threshold 的最小格線位置 (與前端 row.probability >= threshold 的篩選一致)。"""
+    return int(np.ceil(round(threshold * PROBABILITY_RESOLUTION, 6)))
+
+
+class ProbabilityDistribution:
+    """
+    單一群體的流失機率分布：以 1e-4 為一格的固定大小計數陣列 (約 80 KB)。
+    分位數採最近秩 (nearest-rank) 定義，對截斷到四位小數的機率是精確值而非近似；
+    直方圖與門檻人數皆由同一組計數求出，merge 只需相加。
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(PROBABILITY_RESOLUTION + 1, dtype=np.int64)
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def update(self, probability: np.ndarray) -> 'ProbabilityDistribution':
+        self.counts += np.bincount(probability_grid_index(probability), minlength=PROBABILITY_RESOLUTION + 1)
+        return self
+
+    def merge(self, other: 'ProbabilityDistribution') -> 'ProbabilityDistribution':
+        self.counts += other.counts
+        return self
+
+    def mean(self) -> Optional[float]:
+        total = self.count
+        if not total:
+            return None
+        return float(self.counts @ np.arange(PROBABILITY_RESOLUTION + 1)) / PROBABILITY_RESOLUTION / total
+
+    def quantiles(self, qs: Sequence[float] = DEFAULT_QUANTILES) -> Dict[str, Optional[float]]:
+        """{'p50': 中位數, ...}：第 q 分位數為排序後第 ceil(q * n) 位 (至少第 1 位) 的機率。"""
+        total = self.count
+        keys = [f"p{round(q * 100, 2):g}" for q in qs]
+        if not total:
+            return dict.fromkeys(keys)
+        ranks = np.maximum(np.ceil(np.asarray(qs, dtype=np.float64) * total), 1)
+        positions = np.searchsorted(np.cumsum(self.counts), ranks, side='left')
+        return {key: float(position) / PROBABILITY_RESOLUTION for key, position in zip(keys, positions)}
+
+    def histogram(self, bins: int = HISTOGRAM_BINS) -> List[int]:
+        """[0, 1] 等分為 bins 個左閉右開區間的人數 (機率為 1 歸入最後一個區間)。"""
+        starts = np.unique(np.array([threshold_grid_index(i / bins) for i in range(bins)], dtype=np.int64))
+        return np.add.reduceat(self.counts, starts).tolist()
+
+    def count_at_least(self, thresholds: Iterable[float]) -> List[int]:
+        """機率 >= 各門檻的人數。"""
+        at_least = np.cumsum(self.counts[::-1])[::-1]
+        return [int(at_least[max(threshold_grid_index(t), 0)]) if t <= 1 else 0 for t in thresholds]
+
+    def summary(self, thresholds: Sequence[float], quantiles: Sequence[float] = DEFAULT_QUANTILES,
+                bins: int = HISTOGRAM_BINS) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'quantiles': self.quantiles(quantiles),
+            'histogram': self.histogram(bins),
+            'at_least': {f"{t:g}": n for t, n in zip(thresholds, self.count_at_least(thresholds))},
+        }
+
+
+class RiskSummary:
+    """
+    整體與各客群維度的 ProbabilityDistribution。update 在評分時以每個區塊的機率與客群標籤累積
+    (同一維度的所有客群以一次 bincount 完成)，merge 合併其他區塊 / 分片的結果。
+    每個維度最多 max_groups 個客群，其餘值合併為 OTHER_COHORT。
+    """
+
+    def __init__(self, thresholds: Sequence[float], dimensions: Sequence[str] = RISK_COHORT_DIMENSIONS,
+                 max_groups: int = 32):
+        self.thresholds = [float(t) for t in thresholds]
+        self.dimensions = tuple(dimensions)
+        self.max_groups = int(max_groups)
+        self.overall = ProbabilityDistribution()
+        self.cohorts: Dict[str, Dict[str, ProbabilityDistribution]] = {dim: {} for dim in self.dimensions}
+
+    def update(self, probability: np.ndarray, cohorts: Dict[str, pd.Categorical]) -> 'RiskSummary':
+        """probability 為回應中 (截斷後) 的機率；cohorts 為 {維度: 與機率等長的類別標籤}，缺失值 (代碼 -1) 只計入整體。"""
+        grid = probability_grid_index(probability)
+        width = PROBABILITY_RESOLUTION + 1
+        self.overall.counts += np.bincount(grid, minlength=width)
+        for dim in self.dimensions:
+            labels = cohorts[dim]
+            groups = [self._group(dim, str(label)) for label in labels.categories]
+            codes = np.asarray(labels.codes, dtype=np.int64)
+            present = codes >= 0
+            counts = np.bincount(codes[present] * width + grid[present],
+                                 minlength=len(groups) * width).reshape(len(groups), width)
+            for group, group_counts in zip(groups, counts):
+                group.counts += group_counts
+        return self
+
+    def merge(self, other: 'RiskSummary') -> 'RiskSummary':
+        self.overall.merge(other.overall)
+        for dim in self.dimensions:
+            for label, distribution in other.cohorts.get(dim, {}).items():
+                self._group(dim, label).merge(distribution)
+        return self
+
+    def _group(self, dim: str, label: str) -> ProbabilityDistribution:
+        groups = self.cohorts[dim]
+        if label not in groups and len(groups) >= self.max_groups:
+            label = OTHER_COHORT
+        if label not in groups:
+            groups[label] = ProbabilityDistribution()
+        return groups[label]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        回應用的彙總：整體 (另附 at_least_percent：門檻為 0%、1%、...、100% 時的人數，對應前端的 thresholdInput)
+        與各客群的人數、平均、分位數、直方圖 (區間見 histogram_edges) 與 at_least (設定的門檻以上人數)。
+        """
+        overall = self.overall.summary(self.thresholds)
+        overall['at_least_percent'] = self.overall.count_at_least([p / 100 for p in range(101)])
+        return {
+            'histogram_edges': [round(i / HISTOGRAM_BINS, 6) for i in range(HISTOGRAM_BINS + 1)],
+            'thresholds': self.thresholds,
+            'overall': overall,
+            'cohorts': {dim: {label: distribution.summary(self.thresholds)
+                              for label, distribution in groups.items() if distribution.count}
+                        for dim, groups in self.cohorts.items()},
+        }
@@ -0,0 +1,309 @@
+# services\roi_kernel.py
+# LTV / ENR / ROI 的 NumPy 計算核心 (邏輯來自 customer_churn_bank_roi.ipynb)：不建立中間 DataFrame 欄位，
+# 並可對一組業務參數網格 (挽留成本、成功率、淨利差...) 的所有組合一次以廣播計算，得到 ROI 曲面 (what-if 試算)
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from typing import Any, Dict, List, Tuple
+
+# 業務參數與預設值 (來自 Notebook)
+DEFAULT_ROI_PARAMS = {
+    'nim_rate': 0.02,             # 存款淨利差 (NIM)
+    'product_profit': 50.0,       # 每個產品的年利潤
+    'active_card_profit': 30.0,   # 持卡且活躍的年利潤
+    'l_max': 10.0,                # 預期壽命上限 (年)
+    'retention_cost': 500.0,      # 每位客戶的挽留成本
+    'success_rate': 0.20,         # 挽留成功率
+}
+ROI_PARAMETERS = tuple(DEFAULT_ROI_PARAMS)
+# 決定每位客戶 LTV 的參數；其餘 (retention_cost、success_rate) 只影響是否值得挽留的門檻
+VALUE_PARAMETERS = ('nim_rate', 'product_profit', 'active_card_profit', 'l_max')
+ROI_SURFACE_METRICS = ('total_ltv', 'actionable_count', 'total_net_enr', 'retention_cost', 'total_roi')
+
+# 同一組價值參數 (nim_rate、product_profit、active_card_profit、l_max) 下的情境數超過此值時，
+# 改為排序一次後以 searchsorted 一次求出所有 (挽留成本, 成功率) 組合，否則逐情境掃描
+SURFACE_DIRECT_SCENARIOS = 8
+# PortfolioStats 流失機率直方圖的等寬區間數 ([0, 1] 切成 20 段，每段 0.05)
+PROBABILITY_BINS = 20
+
+
+class RoiInputs:
+    """
+    ROI 計算所需的每位客戶輸入 (皆為一維陣列，不複製呼叫端資料)：
+    流失機率 (保留模型輸出的 dtype，通常為 float32)、Balance、NumOfProducts 與 ActiveCard_Flag (持卡且活躍)。
+    """
+
+    def __init__(self, probability: np.ndarray, balance: np.ndarray, num_products: np.ndarray,
+                 active_card: np.ndarray):
+        self.probability = np.asarray(probability)
+        self.balance = np.asarray(balance)
+        self.num_products = np.asarray(num_products)
+        self.active_card = np.asarray(active_card)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, probability: np.ndarray) -> 'RoiInputs':
+        """由流失機率與含 Balance、NumOfProducts、HasCrCard、IsActiveMember 的 DataFrame 建立。"""
+        active_card = (df['HasCrCard'].to_numpy() == 1) & (df['IsActiveMember'].to_numpy() == 1)
+        return cls(probability, df['Balance'].to_numpy(), df['NumOfProducts'].to_numpy(), active_card.astype(np.int8))
+
+    def __len__(self) -> int:
+        return len(self.probability)
+
+    def slice(self, start: int, stop: int) -> 'RoiInputs':
+        """[start, stop) 列的檢視 (不複製)，供分塊處理。"""
+        return RoiInputs(self.probability[start:stop], self.balance[start:stop], self.num_products[start:stop],
+                         self.active_card[start:stop])
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """{名稱: 陣列}，供儲存 (例如伺服器端批次結果) 後以 from_arrays 還原。"""
+        return {'roi_probability': self.probability, 'roi_balance': self.balance,
+                'roi_num_products': self.num_products, 'roi_active_card': self.active_card}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'RoiInputs':
+        return cls(arrays['roi_probability'], arrays['roi_balance'], arrays['roi_num_products'],
+                   arrays['roi_active_card'])
+
+
+def expected_lifespan_inverse(probability: np.ndarray) -> np.ndarray:
+    """1 / max(P(churn), 1e-6)，以機率本身的 dtype 計算 (與原本逐欄計算的數值相同)；與 l_max 取小即為預期壽命。"""
+    return 1 / np.maximum(probability, 1e-6)
+
+
+def _profile_values(inputs: RoiInputs, inverse_probability: np.ndarray, nim_rate: float, product_profit: float,
+                    active_card_profit: float, l_max: float) -> Tuple[float, np.ndarray]:
+    """
+    一組價值參數下的 (LTV 總和, LTV * P(churn))：
+
+        Annual_Profit = Balance * NIM + NumOfProducts * 產品利潤 + ActiveCard_Flag * 活躍卡利潤
+        LTV = Annual_Profit * min(1 / P(churn), L_max)
+    """
+    annual_profit = (inputs.balance * nim_rate + inputs.num_products * product_profit
+                     + inputs.active_card * active_card_profit)
+    ltv = annual_profit * np.minimum(inverse_probability, l_max)
+    return float(ltv.sum()), ltv * inputs.probability
+
+
+def customer_enr(inputs: RoiInputs, params: Dict[str, float] = None) -> np.ndarray:
+    """每位客戶的 ENR = LTV * P(churn) * 成功率 - 挽留成本 (與 calculate_roi 的逐客戶數值相同)。"""
+    p = {**DEFAULT_ROI_PARAMS, **(params or {})}
+    _, value = _profile_values(inputs, expected_lifespan_inverse(inputs.probability), p['nim_rate'],
+                               p['product_profit'], p['active_card_profit'], p['l_max'])
+    return value * p['success_rate'] - p['retention_cost']
+
+
+class PortfolioStats:
+    """
+    可合併的投資組合統計：客戶數、LTV 總和、值得挽留 (ENR > 0) 的人數與淨 ENR 總和、流失機率總和，
+    以及流失機率的固定區間直方圖 (每個區間的客戶數與值得挽留的人數)。
+
+    update(inputs) 加入一個區塊，merge(other) 合併在其他區塊 / 分片 / 節點累積的結果；兩者皆只做加總，
+    因此任意切分與合併順序得到相同的人數與直方圖，金額只有浮點捨入層級的差異，不需要集中所有列。
+    to_dict / from_dict 提供可 JSON 序列化的形式 (跨行程或跨節點傳遞)。
+    """
+
+    def __init__(self, params: Dict[str, float] = None, probability_bins: int = PROBABILITY_BINS):
+        self.params = {**DEFAULT_ROI_PARAMS, **(params or {})}
+        self.probability_bins = int(probability_bins)
+        self.rows = 0
+        self.total_ltv = 0.0
+        self.actionable_count = 0
+        self.total_net_enr = 0.0
+        self.probability_sum = 0.0
+        self.probability_hist = np.zeros(self.probability_bins, dtype=np.int64)
+        self.actionable_hist = np.zeros(self.probability_bins, dtype=np.int64)
+
+    def update(self, inputs: RoiInputs) -> 'PortfolioStats':
+        """加入一個區塊的客戶 (運算順序與原本的 DataFrame 版本相同，逐客戶的 LTV / ENR 逐位相同)，回傳 self。"""
+        p = self.params
+        ltv_sum, value = _profile_values(inputs, expected_lifespan_inverse(inputs.probability), p['nim_rate'],
+                                         p['product_profit'], p['active_card_profit'], p['l_max'])
+        enr = value * p['success_rate'] - p['retention_cost']
+        positive = enr > 0
+        actionable_count = int(np.count_nonzero(positive))
+
+        self.rows += len(inputs)
+        self.total_ltv += ltv_sum
+        self.actionable_count += actionable_count
+        self.total_net_enr += float(enr[positive].sum()) if actionable_count else 0.0
+        if self.probability_bins:
+            self.probability_sum += float(inputs.probability.sum(dtype=np.float64))
+            bins = probability_bin_index(inputs.probability, self.probability_bins)
+            self.probability_hist += np.bincount(bins, minlength=self.probability_bins)
+            self.actionable_hist += np.bincount(bins[positive], minlength=self.probability_bins)
+        return self
+
+    def merge(self, other: 'PortfolioStats') -> 'PortfolioStats':
+        """合併另一個以相同業務參數與直方圖區間累積的結果，回傳 self；參數或區間不同時拋出 ValueError。"""
+        if other.params != self.params or other.probability_bins != self.probability_bins:
+            raise ValueError("只能合併相同業務參數與機率區間數的投資組合統計。")
+        self.rows += other.rows
+        self.total_ltv += other.total_ltv
+        self.actionable_count += other.actionable_count
+        self.total_net_enr += other.total_net_enr
+        self.probability_sum += other.probability_sum
+        self.probability_hist += other.probability_hist
+        self.actionable_hist += other.actionable_hist
+        return self
+
+    @classmethod
+    def combine(cls, parts: List['PortfolioStats']) -> 'PortfolioStats':
+        """合併多個區塊的結果 (至少一個)，不修改傳入的物件。"""
+        combined = cls(parts[0].params, parts[0].probability_bins)
+        for part in parts:
+            combined.merge(part)
+        return combined
+
+    def roi(self) -> Dict[str, Any]:
+        """整體 ROI 統計 (/predict_batch 回應的 roi)；整體 ROI 以合併後的淨 ENR / 成本計算，而非平均各區塊的 ROI。"""
+        total_cost = self.actionable_count * self.params['retention_cost']
+        return {
+            'total_ltv': self.total_ltv,
+            'actionable_count': self.actionable_count,
+            'total_net_enr': self.total_net_enr,
+            'retention_cost': total_cost,
+            'total_roi': (self.total_net_enr / total_cost) if total_cost > 0 else 0.0,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """可 JSON 序列化的完整狀態 (含 ROI 統計、平均流失機率與直方圖)，可由 from_dict 還原後繼續合併。"""
+        return {
+            **self.roi(),
+            'rows': self.rows,
+            'mean_probability': (self.probability_sum / self.rows) if self.rows and self.probability_bins else None,
+            'probability_sum': self.probability_sum,
+            'probability_bins': self.probability_bins,
+            'probability_hist': self.probability_hist.tolist(),
+            'actionable_hist': self.actionable_hist.tolist(),
+            'parameters': dict(self.params),
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'PortfolioStats':
+        stats = cls(state['parameters'], state['probability_bins'])
+        stats.rows = int(state['rows'])
+        stats.total_ltv = float(state['total_ltv'])
+        stats.actionable_count = int(state['actionable_count'])
+        stats.total_net_enr = float(state['total_net_enr'])
+        stats.probability_sum = float(state['probability_sum'])
+        stats.probability_hist = np.asarray(state['probability_hist'], dtype=np.int64)
+        stats.actionable_hist = np.asarray(state['actionable_hist'], dtype=np.int64)
+        return stats
+
+
+def probability_bin_index(probability: np.ndarray, bins: int) -> np.ndarray:
+    """流失機率所屬的等寬區間 [i / bins, (i + 1) / bins)，機率為 1 歸入最後一個區間。"""
+    return np.clip((np.asarray(probability, dtype=np.float64) * bins).astype(np.int64), 0, bins - 1)
+
+
+def calculate_roi(inputs: RoiInputs, params: Dict[str, float] = None) -> Dict[str, Any]:
+    """
+    單一參數組合的 ROI 統計：ENR = LTV * P(churn) * 成功率 - 挽留成本，ENR > 0 的客戶值得挽留。
+
+    只需要加總，不需排序；運算順序與原本的 DataFrame 版本相同，逐客戶的 LTV / ENR 逐位相同
+    (總和的加總順序不同，僅有浮點捨入層級的差異)。分塊或分片計算請使用 PortfolioStats 再合併。
+    """
+    return PortfolioStats(params, probability_bins=0).update(inputs).roi()
+
+
+def build_parameter_grid(grid: Dict[str, Any], max_scenarios: int,
+                         max_profiles: int = 0) -> Tuple[List[Tuple[str, np.ndarray]], Dict[str, np.ndarray]]:
+    """
+    將 {參數: 值或值的串列} 展開為所有組合 (笛卡兒積)，未指定的參數使用預設值。
+
+    回傳 (axes, scenarios)：axes 為 [(參數, 值陣列), ...] (依 ROI_PARAMETERS 的順序，曲面依此維度排列)；
+    scenarios 為 {參數: 長度 = 情境數的陣列}。參數名稱或數值不合法、組合數超過 max_scenarios、
+    或價值參數 (VALUE_PARAMETERS，每組需掃描一次所有客戶) 的組合數超過 max_profiles (> 0 時) 時拋出 ValueError。
+    """
+    unknown = sorted(set(grid) - set(ROI_PARAMETERS))
+    if unknown:
+        raise ValueError(f"未知的 ROI 參數: {', '.join(unknown)}，可選: {', '.join(ROI_PARAMETERS)}")
+
+    axes = []
+    for name in ROI_PARAMETERS:
+        if name not in grid:
+            continue
+        try:
+            values = np.atleast_1d(np.asarray(grid[name], dtype=np.float64)).ravel()
+        except (TypeError, ValueError):
+            raise ValueError(f"ROI 參數 {name} 必須為數值或數值串列。")
+        if values.size == 0 or not np.isfinite(values).all():
+            raise ValueError(f"ROI 參數 {name} 必須為非空的有限數值。")
+        if name == 'success_rate' and ((values < 0) | (values > 1)).any():
+            raise ValueError("success_rate 必須介於 0 到 1 之間。")
+        if name == 'l_max' and (values <= 0).any():
+            raise ValueError("l_max 必須 > 0。")
+        if name != 'l_max' and (values < 0).any():
+            raise ValueError(f"ROI 參數 {name} 不可為負數。")
+        axes.append((name, values))
+
+    n_scenarios = int(np.prod([len(values) for _, values in axes], dtype=np.int64))
+    if n_scenarios > max_scenarios:
+        raise ValueError(f"參數組合數 {n_scenarios} 超過上限 {max_scenarios}。")
+    n_profiles = int(np.prod([len(values) for name, values in axes if name in VALUE_PARAMETERS], dtype=np.int64))
+    if max_profiles and n_profiles > max_profiles:
+        raise ValueError(f"{', '.join(VALUE_PARAMETERS)} 的組合數 {n_profiles} 超過上限 {max_profiles}。")
+
+    combos = list(itertools.product(*[values for _, values in axes]))
+    scenarios = {name: np.full(n_scenarios, default, dtype=np.float64) for name, default in DEFAULT_ROI_PARAMS.items()}
+    for position, (name, _) in enumerate(axes):
+        scenarios[name] = np.array([combo[position] for combo in combos], dtype=np.float64)
+    return axes, scenarios
+
+
+def calculate_roi_surface(inputs: RoiInputs, scenarios: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    對所有情境計算 ROI 統計，回傳 {ROI_SURFACE_METRICS: 長度 = 情境數的陣列}。
+
+    挽留成本 (rc) 與成功率 (sr) 不影響每位客戶的 v = LTV * P(churn)，只決定門檻：ENR > 0 等同 v > rc / sr。
+    因此情境依價值參數 (nim_rate、product_profit、active_card_profit、l_max) 分組，每組只掃描客戶一次求出 v；
+    組內情境較多時將 v 排序一次並由大到小累加，所有 (rc, sr) 組合再以 searchsorted 向量化求出
+    挽留人數 k 與前 k 名的 v 總和 (總 ENR = sr * 總和 - rc * k)，成本與情境數幾乎無關。
+    預設參數的情境與 /predict_batch 回傳的 ROI 一致 (僅有浮點捨入層級的差異)。
+    """
+    nim, product_profit, active_card_profit, l_max, retention_cost, success_rate = (
+        np.asarray(scenarios[name], dtype=np.float64) for name in ROI_PARAMETERS
+    )
+    n_scenarios = len(retention_cost)
+    total_ltv = np.zeros(n_scenarios)
+    total_enr = np.zeros(n_scenarios)
+    actionable_count = np.zeros(n_scenarios, dtype=np.int64)
+
+    inverse_probability = expected_lifespan_inverse(inputs.probability)
+    profiles, profile_of = np.unique(np.stack([nim, product_profit, active_card_profit, l_max], axis=1),  # VALUE_PARAMETERS
+                                     axis=0, return_inverse=True)
+    for profile_index, profile in enumerate(profiles):
+        members = np.flatnonzero(profile_of.ravel() == profile_index)
+        ltv_sum, value = _profile_values(inputs, inverse_probability, *profile)
+        total_ltv[members] = ltv_sum
+        cost, rate = retention_cost[members], success_rate[members]
+
+        if len(members) <= SURFACE_DIRECT_SCENARIOS:
+            for member, rc, sr in zip(members, cost, rate):
+                enr = value * sr - rc
+                positive = enr > 0
+                actionable_count[member] = np.count_nonzero(positive)
+                total_enr[member] = enr[positive].sum()
+            continue
+
+        ascending = np.sort(value)
+        top_sums = np.cumsum(ascending[::-1])  # 由大到小累加：前 k 名的總和不受其餘客戶的捨入誤差影響
+        with np.errstate(divide='ignore', invalid='ignore'):
+            thresholds = np.where(rate > 0, cost / rate, np.inf)
+        counts = len(value) - np.searchsorted(ascending, thresholds, side='right')
+        sums = np.where(counts > 0, top_sums[np.maximum(counts - 1, 0)], 0.0)
+        actionable_count[members] = counts
+        total_enr[members] = rate * sums - cost * counts
+
+    total_cost = actionable_count * retention_cost
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_roi = np.where(total_cost > 0, total_enr / total_cost, 0.0)
+    return {
+        'total_ltv': total_ltv,
+        'actionable_count': actionable_count,
+        'total_net_enr': total_enr,
+        'retention_cost': total_cost,
+        'total_roi': total_roi,
+    }
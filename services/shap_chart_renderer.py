@@ -0,0 +1,91 @@
+# services\shap_chart_renderer.py
+# 不依賴 Matplotlib 的局部 SHAP 水平柱狀圖輸出：SVG 字串模板或前端繪圖用的 JSON 圖表資料
+from html import escape
+from typing import Any, Dict, List, Tuple
+
+# /predict 可選的圖表格式 (?chart=...)
+CHART_FORMATS = ('png', 'svg', 'json')
+CHART_MIME_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml', 'json': 'application/json'}
+
+# 與 generate_local_shap_chart (Matplotlib) 相同的配色：紅色推高流失，綠色推低流失
+POSITIVE_COLOR = '#EF5350'
+NEGATIVE_COLOR = '#66BB6A'
+X_LABEL = "SHAP Impact (Positive Pushes for Churn / Negative Against)"
+
+# SVG 版面 (px)
+SVG_WIDTH = 720
+LABEL_WIDTH = 210
+RIGHT_PADDING = 70
+TITLE_HEIGHT = 36
+AXIS_HEIGHT = 40
+BAR_HEIGHT = 22
+BAR_GAP = 10
+
+
+def _sorted_items(shap_data: Dict[str, float]) -> List[Tuple[str, float]]:
+    """依 SHAP 絕對值降序排列 (與 Matplotlib 版本相同的順序)。"""
+    return sorted(((name, float(value)) for name, value in shap_data.items()),
+                  key=lambda item: abs(item[1]), reverse=True)
+
+
+def build_shap_chart_data(shap_data: Dict[str, float], title: str) -> Dict[str, Any]:
+    """
+    輸出前端自行繪製用的精簡圖表資料。
+
+    Returns:
+        {'title', 'x_label', 'features', 'values', 'colors'}；features/values 依 SHAP 絕對值降序。
+    """
+    items = _sorted_items(shap_data)
+    return {
+        'title': title,
+        'x_label': X_LABEL,
+        'features': [name for name, _ in items],
+        'values': [round(value, 6) for _, value in items],
+        'colors': [POSITIVE_COLOR if value > 0 else NEGATIVE_COLOR for _, value in items],
+    }
+
+
+def render_shap_svg(shap_data: Dict[str, float], title: str) -> str:
+    """以字串模板輸出局部 SHAP 水平柱狀圖 (SVG)；SHAP 資料為空時回傳空字串。"""
+    items = _sorted_items(shap_data)
+    if not items:
+        return ""
+
+    values = [value for _, value in items]
+    x_min = min(0.0, min(values))
+    x_max = max(0.0, max(values))
+    span = (x_max - x_min) or 1.0
+    x_min -= span * 0.05
+    x_max += span * 0.05
+    span = x_max - x_min
+
+    plot_width = SVG_WIDTH - LABEL_WIDTH - RIGHT_PADDING
+    height = TITLE_HEIGHT + len(items) * (BAR_HEIGHT + BAR_GAP) + AXIS_HEIGHT
+
+    def x_of(value: float) -> float:
+        return LABEL_WIDTH + (value - x_min) / span * plot_width
+
+    zero_x = x_of(0.0)
+    plot_bottom = TITLE_HEIGHT + len(items) * (BAR_HEIGHT + BAR_GAP)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{height}" '
+        f'viewBox="0 0 {SVG_WIDTH} {height}" font-family="sans-serif" font-size="12">',
+        f'<rect width="{SVG_WIDTH}" height="{height}" fill="#ffffff"/>',
+        f'<text x="{SVG_WIDTH / 2:.1f}" y="22" text-anchor="middle" font-size="13">{escape(title)}</text>',
+    ]
+    for i, (name, value) in enumerate(items):
+        y = TITLE_HEIGHT + i * (BAR_HEIGHT + BAR_GAP)
+        x0, x1 = sorted((zero_x, x_of(value)))
+        color = POSITIVE_COLOR if value > 0 else NEGATIVE_COLOR
+        text_y = y + BAR_HEIGHT / 2 + 4
+        parts.append(f'<text x="{LABEL_WIDTH - 8}" y="{text_y:.1f}" text-anchor="end">{escape(name)}</text>')
+        parts.append(f'<rect x="{x0:.1f}" y="{y}" width="{max(x1 - x0, 0.5):.1f}" height="{BAR_HEIGHT}" fill="{color}"/>')
+        parts.append(f'<text x="{x1 + 4:.1f}" y="{text_y:.1f}" fill="#555555">{value:+.4f}</text>')
+
+    parts.append(f'<line x1="{zero_x:.1f}" y1="{TITLE_HEIGHT - 4}" x2="{zero_x:.1f}" y2="{plot_bottom}" '
+                 f'stroke="grey" stroke-dasharray="4 3" stroke-width="0.8"/>')
+    parts.append(f'<line x1="{LABEL_WIDTH}" y1="{plot_bottom}" x2="{LABEL_WIDTH + plot_width}" y2="{plot_bottom}" stroke="#999999"/>')
+    parts.append(f'<text x="{LABEL_WIDTH + plot_width / 2:.1f}" y="{plot_bottom + 28}" text-anchor="middle">{escape(X_LABEL)}</text>')
+    parts.append('</svg>')
+    return ''.join(parts)
@@ -0,0 +1,60 @@
+# services\static_artifact_store.py
+import threading
+import hashlib
+import logging
+import os
+
+from typing import Dict, NamedTuple, Optional
+
+logger = logging.getLogger('StaticArtifactStore')
+logger.setLevel(logging.INFO)
+
+
+class StaticArtifact(NamedTuple):
+    name: str
+    digest: str      # 內容 SHA-256 前 16 碼，同時作為 URL 路徑片段與 ETag
+    mimetype: str
+    content: bytes
+
+
+class StaticArtifactStore:
+    """
+    以內容雜湊定址的模型靜態工件 (例如全局 SHAP 摘要圖)。
+
+    工件只在註冊時讀取一次；URL 內含內容雜湊，內容變更時 URL 隨之改變，
+    因此回應可標記為 immutable，瀏覽器與代理伺服器每個模型版本只需下載一次。
+    """
+
+    def __init__(self):
+        self._artifacts: Dict[str, StaticArtifact] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, path: str, mimetype: str) -> Optional[StaticArtifact]:
+        """讀取並註冊工件；檔案不存在時回傳 None (並移除同名的舊工件)。"""
+        if not os.path.exists(path):
+            with self._lock:
+                self._artifacts.pop(name, None)
+            logger.warning(f"靜態工件檔案未找到: {path}")
+            return None
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        artifact = StaticArtifact(name, hashlib.sha256(content).hexdigest()[:16], mimetype, content)
+        with self._lock:
+            self._artifacts[name] = artifact
+        logger.info(f"靜態工件 {name} 已註冊 (digest={artifact.digest}, {len(content)} bytes)。")
+        return artifact
+
+    def reset_after_fork(self) -> None:
+        """在 fork 出的子行程中重建鎖 (工件內容唯讀，與父行程共用)。"""
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[StaticArtifact]:
+        return self._artifacts.get(name)
+
+    def lookup(self, digest: str, name: str) -> Optional[StaticArtifact]:
+        """依 URL 中的 (digest, name) 取得工件；digest 不符 (舊版本) 時回傳 None。"""
+        artifact = self._artifacts.get(name)
+        if artifact is None or artifact.digest != digest:
+            return None
+        return artifact
@@ -0,0 +1,189 @@
+# services\tree_inference_engine.py
+import numpy as np
+import logging
+import json
+
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger('TreeInferenceEngine')
+logger.setLevel(logging.INFO)
+
+
+class ArrayTreeEnsemble:
+    """
+    將 XGBoost Booster 一次性攤平成連續的 NumPy 陣列，並以「逐層、全部樹同時前進」的向量化方式推論。
+
+    所有樹的節點被串接在同一組全域陣列中 (以 tree offset 區隔)：
+      - feature / threshold: 分裂特徵索引與門檻 (float32，與 XGBoost 內部比較精度一致)
+      - left / right / default: 左右子節點與缺失值預設方向 (已轉為全域索引)
+      - value: 葉節點輸出 (非葉節點為 0)
+
+    葉節點的左右子節點指向自己，因此固定走 max_depth 步即可讓每棵樹都停在葉節點，
+    不需要任何逐列的 Python 分支判斷。
+    """
+
+    SUPPORTED_OBJECTIVES = ('binary:logistic',)
+    # 攤平後的節點陣列欄位 (可個別保存為 .npy 並以 mmap 載入，見 model_bundle.py)
+    ARRAY_FIELDS = ('feature', 'threshold', 'left', 'right', 'default', 'value', 'roots')
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 default: np.ndarray, value: np.ndarray, roots: np.ndarray, max_depth: int,
+                 base_margin: float, num_features: int):
+        # 索引類陣列使用 intp：NumPy fancy indexing 在原生索引型別下不需額外轉型，速度最快
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float32)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.right = np.ascontiguousarray(right, dtype=np.intp)
+        self.default = np.ascontiguousarray(default, dtype=np.intp)
+        self.value = np.ascontiguousarray(value, dtype=np.float32)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.base_margin = float(base_margin)
+        self.num_features = int(num_features)
+
+    @property
+    def num_trees(self) -> int:
+        return len(self.roots)
+
+    # ------------------------------------------------------------------
+    # 建構
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_xgb_model(cls, model: Any, iteration_range: Optional[Tuple[int, int]] = None) -> 'ArrayTreeEnsemble':
+        """
+        從 XGBClassifier 或 xgboost.Booster 建立推論引擎。
+
+        iteration_range 未指定時，與 XGBClassifier.predict_proba 的預設行為一致：
+        若模型帶有 best_iteration (Early Stopping)，只使用前 best_iteration + 1 輪的樹。
+        """
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        raw = json.loads(booster.save_raw(raw_format='json'))
+        learner = raw['learner']
+
+        objective = learner['objective']['name']
+        if objective not in cls.SUPPORTED_OBJECTIVES:
+            raise ValueError(f"不支援的模型目標函數: {objective} (僅支援 {cls.SUPPORTED_OBJECTIVES})")
+
+        gbm = learner['gradient_booster']
+        if gbm['name'] != 'gbtree':
+            raise ValueError(f"不支援的 booster 類型: {gbm['name']} (僅支援 gbtree)")
+
+        trees = gbm['model']['trees']
+        num_parallel_tree = int(gbm['model']['gbtree_model_param'].get('num_parallel_tree', 1) or 1)
+
+        if iteration_range is None:
+            best_iteration = learner.get('attributes', {}).get('best_iteration')
+            iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+        start, end = iteration_range
+        end = end if end > 0 else len(trees) // num_parallel_tree
+        trees = trees[start * num_parallel_tree:end * num_parallel_tree]
+
+        # base_score 以機率形式保存 (例如 '5E-1')，binary:logistic 需轉回 logit 作為起始 margin
+        base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+        base_margin = float(np.log(base_score / (1.0 - base_score)))
+        num_features = int(learner['learner_model_param']['num_feature'])
+
+        engine = cls._flatten(trees, base_margin, num_features)
+        logger.info(f"樹模型已攤平為陣列：{engine.num_trees} 棵樹，共 {len(engine.value)} 個節點，最大深度 {engine.max_depth}。")
+        return engine
+
+    @classmethod
+    def _flatten(cls, trees: list, base_margin: float, num_features: int) -> 'ArrayTreeEnsemble':
+        """將 XGBoost JSON 樹結構串接成全域節點陣列。"""
+        sizes = [len(tree['left_children']) for tree in trees]
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64) if trees else np.zeros(0, np.int64)
+        total_nodes = int(sum(sizes))
+
+        feature = np.zeros(total_nodes, dtype=np.intp)
+        threshold = np.zeros(total_nodes, dtype=np.float32)
+        left = np.zeros(total_nodes, dtype=np.intp)
+        right = np.zeros(total_nodes, dtype=np.intp)
+        default = np.zeros(total_nodes, dtype=np.intp)
+        value = np.zeros(total_nodes, dtype=np.float32)
+        max_depth = 0
+
+        for tree, offset, size in zip(trees, offsets, sizes):
+            if any(split_type != 0 for split_type in tree.get('split_type', [])):
+                raise ValueError("不支援類別型 (categorical) 分裂節點。")
+
+            node_slice = slice(offset, offset + size)
+            local_ids = np.arange(size, dtype=np.int64)
+            tree_left = np.asarray(tree['left_children'], dtype=np.int64)
+            tree_right = np.asarray(tree['right_children'], dtype=np.int64)
+            is_leaf = tree_left == -1
+
+            # 葉節點：左右子節點都指向自己，門檻與特徵無意義
+            tree_left = np.where(is_leaf, local_ids, tree_left)
+            tree_right = np.where(is_leaf, local_ids, tree_right)
+            tree_default = np.where(np.asarray(tree['default_left'], dtype=bool), tree_left, tree_right)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+
+            feature[node_slice] = np.where(is_leaf, 0, np.asarray(tree['split_indices'], dtype=np.int64))
+            threshold[node_slice] = np.where(is_leaf, np.float32(0), conditions)
+            left[node_slice] = tree_left + offset
+            right[node_slice] = tree_right + offset
+            default[node_slice] = tree_default + offset
+            value[node_slice] = np.where(is_leaf, conditions, np.float32(0))
+
+            max_depth = max(max_depth, cls._tree_depth(tree_left, tree_right, is_leaf))
+
+        return cls(feature, threshold, left, right, default, value, offsets, max_depth, base_margin, num_features)
+
+    @staticmethod
+    def _tree_depth(left: np.ndarray, right: np.ndarray, is_leaf: np.ndarray) -> int:
+        """以 BFS 計算單棵樹的最大深度 (根節點深度為 0)。"""
+        depth = 0
+        frontier = np.array([0], dtype=np.int64)
+        while True:
+            frontier = frontier[~is_leaf[frontier]]
+            if frontier.size == 0:
+                return depth
+            frontier = np.concatenate([left[frontier], right[frontier]])
+            depth += 1
+
+    # ------------------------------------------------------------------
+    # 推論
+    # ------------------------------------------------------------------
+    def predict_margin(self, X: Any, chunk_size: int = 2048) -> np.ndarray:
+        """
+        回傳每列的原始 margin (log-odds)。
+
+        大批次會依 chunk_size 分段計算，避免 (n_rows, n_trees) 的節點矩陣佔用過多記憶體。
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.num_features:
+            raise ValueError(f"特徵數量不匹配。預期 {self.num_features}，實際 {X.shape[1]}")
+
+        if X.shape[0] <= chunk_size:
+            return self._predict_margin_block(X)
+
+        margin = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], chunk_size):
+            margin[start:start + chunk_size] = self._predict_margin_block(X[start:start + chunk_size])
+        return margin
+
+    def _predict_margin_block(self, X: np.ndarray) -> np.ndarray:
+        n_rows = X.shape[0]
+        X_flat = np.ascontiguousarray(X).ravel()
+        has_missing = bool(np.isnan(X_flat).any())
+        # row_base: 每列在攤平後 X 中的起始位置，用於一次取出所有 (列, 樹) 的特徵值
+        row_base = (np.arange(n_rows, dtype=np.intp) * X.shape[1])[:, None]
+        # nodes: (n_rows, n_trees)，每棵樹從根節點出發，逐層同時前進
+        nodes = np.broadcast_to(self.roots, (n_rows, self.num_trees)).copy()
+
+        for _ in range(self.max_depth):
+            fvalue = X_flat[row_base + self.feature[nodes]]
+            next_nodes = np.where(fvalue < self.threshold[nodes], self.left[nodes], self.right[nodes])
+            if has_missing:
+                # NaN 比較結果為 False，需改走缺失值預設方向
+                next_nodes = np.where(np.isnan(fvalue), self.default[nodes], next_nodes)
+            nodes = next_nodes
+
+        return self.value[nodes].sum(axis=1, dtype=np.float64) + self.base_margin
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        """回傳與 XGBClassifier.predict_proba 相同形狀的 (n_samples, 2) 機率陣列。"""
+        proba_class_1 = 1.0 / (1.0 + np.exp(-self.predict_margin(X)))
+        return np.column_stack([1.0 - proba_class_1, proba_class_1])
@@ -15,6 +15,10 @@ const API_BASE_URL = '';
 
 const API_PREDICT_ENDPOINT = '/api/customer_churn_bank/predict';
 const API_BATCH_ENDPOINT = '/api/customer_churn_bank/predict_batch';
+// 局部 SHAP 圖表格式：'svg' (後端字串模板，預設)、'json' (前端自行繪製) 或 'png' (Matplotlib)
+const API_CHART_FORMAT = 'svg';
+// 是否改由背景繪製局部 SHAP 圖 (預測結果先顯示，圖表再從回傳的 url 載入)；後端需啟用 CHURN_ASYNC_CHART=1
+const API_ASYNC_CHART = false;
 
 // 全域變數用來儲存批次資料和排序狀態
 let globalBatchData = [];       // 儲存當前篩選和排序後的數據 (用於渲染分頁)
@@ -30,6 +34,10 @@ let currentPage = 1;
 let totalPages = 0;
 let currentFilteredData = []; // 儲存當前篩選後、未分頁的數據 (用於計算分頁)
 
+// 伺服器端分頁模式 (/predict_batch?paginate=1)：結果保存在後端，排序、篩選與分頁都以查詢 URL 取得單頁資料
+let batchResultQueryUrl = null;
+let batchQuerySeq = 0;        // 只渲染最後一次查詢的回應 (ID 搜尋逐字觸發時，避免較慢的舊回應覆蓋新結果)
+
 
 // =========================================================================
 // DOMContentLoaded: 初始化與事件綁定
@@ -375,7 +383,7 @@ async function runPredictionAndExplain() {
     try {
         const inputData = collectInputData();
 
-        const predictResponse = await fetch(`${API_BASE_URL}${API_PREDICT_ENDPOINT}`, {
+        const predictResponse = await fetch(`${API_BASE_URL}${API_PREDICT_ENDPOINT}?chart=${API_CHART_FORMAT}&async_chart=${API_ASYNC_CHART ? 1 : 0}`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(inputData)
@@ -492,6 +500,10 @@ async function uploadAndPredictBatch() {
     const file = bankCsvFileInput.files[0];
     const formData = new FormData();
     formData.append('file', file);
+    // 結果保存在伺服器端，回應只帶結果 ID 與第一頁 (依目前的風險門檻篩選)
+    formData.append('paginate', '1');
+    formData.append('page_size', ITEMS_PER_PAGE);
+    formData.append('min_probability', readThresholdPercent() / 100);
 
     const originalText = uploadBatchBtn.innerHTML;
     uploadBatchBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> 處理中...';
@@ -534,11 +546,8 @@ async function uploadAndPredictBatch() {
                     throw new Error(result.error);
                 }
                 
-                if (batchData && Array.isArray(batchData) && batchData.length > 0) {
-                    
-                    // 儲存兩份數據並重設排序狀態
-                    globalBatchData = batchData; 
-                    originalBatchData = JSON.parse(JSON.stringify(batchData)); 
+                const isPaged = Boolean(result.result_id && result.page);
+                if (isPaged || (batchData && Array.isArray(batchData) && batchData.length > 0)) {
                     
                     // 重設排序狀態
                     currentSort = { key: 'none', order: 'none' };
@@ -554,9 +563,24 @@ async function uploadAndPredictBatch() {
                         renderRoiPanel(result.roi);
                         updateBatchROI(result.roi);
                     }
-                    // 渲染表格
-                    filterAndRenderBatchResults();
-                    alert(`批次分析成功！共處理 ${originalBatchData.length} 筆客戶資料。`);
+
+                    if (isPaged) {
+                        // 伺服器端分頁：直接渲染回應中的第一頁，之後的操作改向查詢 URL 取得
+                        batchResultQueryUrl = result.query_url;
+                        globalBatchData = [];
+                        originalBatchData = [];
+                        batchQuerySeq++;
+                        totalPages = result.page.total_pages;
+                        renderBatchPage(result.page.data, result.page.total_rows, result.page.matched_rows, readThresholdPercent());
+                        alert(`批次分析成功！共處理 ${result.page.total_rows} 筆客戶資料。`);
+                    } else {
+                        // 結果超過伺服器端儲存上限時，後端一次回傳全部資料：儲存兩份數據，在瀏覽器篩選與排序
+                        batchResultQueryUrl = null;
+                        globalBatchData = batchData; 
+                        originalBatchData = JSON.parse(JSON.stringify(batchData)); 
+                        filterAndRenderBatchResults();
+                        alert(`批次分析成功！共處理 ${originalBatchData.length} 筆客戶資料。`);
+                    }
 
                     
                 } else {
@@ -697,8 +721,28 @@ function sortBatchData(data) {
 // =========================================================================
 // 批次結果篩選、搜索與渲染邏輯
 // =========================================================================
-function filterAndRenderBatchResults() {
+/**
+ * 讀取風險門檻 (%)；超出 0~100 或無效時重設為 0
+ */
+function readThresholdPercent() {
     const thresholdInput = document.getElementById('thresholdInput');
+    let thresholdPercent = parseFloat(thresholdInput?.value) || 0;
+    
+    // 防呆機制
+    if (isNaN(thresholdPercent) || thresholdPercent < 0 || thresholdPercent > 100) {
+        thresholdPercent = 0;
+        if (thresholdInput) thresholdInput.value = 0;
+    }
+    return thresholdPercent;
+}
+
+function filterAndRenderBatchResults() {
+    // 伺服器端分頁模式：篩選、排序與分頁交給後端
+    if (batchResultQueryUrl) {
+        fetchBatchResultPage();
+        return;
+    }
+
     const idSearchInput = document.getElementById('idSearchInput');
     const tbody = document.getElementById('batchResultBody');
     const statsDiv = document.getElementById('filterStats');
@@ -718,14 +762,8 @@ function filterAndRenderBatchResults() {
     }
 
     // 1. 取得使用者輸入
-    let thresholdPercent = parseFloat(thresholdInput?.value) || 0;
+    const thresholdPercent = readThresholdPercent();
     const idSearchTerm = idSearchInput?.value.trim().toLowerCase() || '';
-    
-    // 防呆機制
-    if (isNaN(thresholdPercent) || thresholdPercent < 0 || thresholdPercent > 100) {
-        thresholdPercent = 0;
-        if (thresholdInput) thresholdInput.value = 0;
-    }
     const thresholdDecimal = thresholdPercent / 100;
 
     // 2. 進行篩選：找出 風險 >= 門檻值 **AND** ID 包含搜索詞 的客戶
@@ -757,22 +795,39 @@ function filterAndRenderBatchResults() {
     const endIndex = startIndex + ITEMS_PER_PAGE;
     const finalData = currentFilteredData.slice(startIndex, endIndex);
 
+    renderBatchPage(finalData, originalBatchData.length, currentFilteredData.length, thresholdPercent);
+}
+
+/**
+ * 渲染一頁批次結果與統計、分頁控制元件 (瀏覽器端篩選與伺服器端分頁共用)
+ * @param {Array} finalData - 當前頁的資料列
+ * @param {number} totalRows - 批次總筆數
+ * @param {number} totalCount - 篩選後符合條件的筆數
+ * @param {number} thresholdPercent - 風險門檻 (%)
+ */
+function renderBatchPage(finalData, totalRows, totalCount, thresholdPercent) {
+    const tbody = document.getElementById('batchResultBody');
+    const statsDiv = document.getElementById('filterStats');
+    const pageInput = document.getElementById('pageInput');
+    const pageInfo = document.getElementById('pageInfo');
+    const prevPageBtn = document.getElementById('prevPageBtn');
+    const nextPageBtn = document.getElementById('nextPageBtn');
+
     // 清空表格
     if (tbody) tbody.innerHTML = ''; 
 
     // 6. 更新統計文字
     if (statsDiv) {
         statsDiv.innerHTML = `
-            <strong>總筆數</strong>: ${originalBatchData.length} &nbsp; | &nbsp; 
+            <strong>總筆數</strong>: ${totalRows} &nbsp; | &nbsp; 
             <strong>篩選後符合條件客戶數</strong>: 
-            <span class="high-risk">${currentFilteredData.length}</span> 位
+            <span class="high-risk">${totalCount}</span> 位
             (風險 > ${thresholdPercent}%)
         `;
         statsDiv.style.fontWeight = '500';
     }
     
     // 7. 更新分頁控制元件狀態
-    const totalCount = currentFilteredData.length;
     if (pageInput) pageInput.value = currentPage;
     if (pageInfo) pageInfo.textContent = ` / ${totalPages}`;
     if (prevPageBtn) prevPageBtn.disabled = currentPage <= 1 || totalCount === 0;
@@ -860,6 +915,47 @@ function filterAndRenderBatchResults() {
     });
 }
 
+/**
+ * 伺服器端分頁模式：依目前的門檻、ID 搜尋、排序與頁碼向後端查詢單頁資料
+ */
+async function fetchBatchResultPage() {
+    const tbody = document.getElementById('batchResultBody');
+    const statsDiv = document.getElementById('filterStats');
+    const idSearchInput = document.getElementById('idSearchInput');
+    const thresholdPercent = readThresholdPercent();
+
+    const params = new URLSearchParams({
+        page: currentPage,
+        page_size: ITEMS_PER_PAGE,
+        min_probability: thresholdPercent / 100,
+        q: idSearchInput?.value.trim() || ''
+    });
+    if (currentSort.order !== 'none') {
+        params.set('sort', currentSort.key);
+        params.set('order', currentSort.order);
+    }
+
+    const querySeq = ++batchQuerySeq;
+    try {
+        const response = await fetch(`${API_BASE_URL}${batchResultQueryUrl}?${params.toString()}`);
+        const result = await response.json();
+        if (querySeq !== batchQuerySeq) return; // 已有更新的查詢
+
+        if (!response.ok) {
+            throw new Error(result.error || `伺服器返回錯誤 (Status: ${response.status})`);
+        }
+        currentPage = result.page;
+        totalPages = result.total_pages;
+        renderBatchPage(result.data, result.total_rows, result.matched_rows, thresholdPercent);
+    } catch (error) {
+        if (querySeq !== batchQuerySeq) return;
+        console.error("批次結果查詢失敗:", error);
+        if (tbody) tbody.innerHTML = 
+            `<tr><td colspan="3" class="bank-card-hint-hidden">❌ 批次結果查詢失敗: ${error.message}</td></tr>`;
+        if (statsDiv) statsDiv.innerHTML = `<div class="bank-card-hint-hidden">批次結果查詢失敗。</div>`;
+    }
+}
+
 // =========================================================================
 // 分頁控制邏輯
 // =========================================================================
@@ -951,7 +1047,7 @@ async function runPredictionOnly() {
     try {
         const inputData = collectInputData();
 
-        const predictResponse = await fetch(`${API_BASE_URL}${API_PREDICT_ENDPOINT}`, {
+        const predictResponse = await fetch(`${API_BASE_URL}${API_PREDICT_ENDPOINT}?chart=${API_CHART_FORMAT}&async_chart=${API_ASYNC_CHART ? 1 : 0}`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(inputData)
@@ -1043,33 +1139,115 @@ function renderChartsFromBase64(charts) {
 
     chartContainer.innerHTML = '';
 
-    const hasChartData = charts.some(chart => chart.base64_data);
+    const hasChartData = charts.some(chart => chart.base64_data || chart.svg_data || chart.chart_data || chart.url);
     if (charts.length === 0 || !hasChartData) {
         chartContainer.innerHTML = '<div class="initial-message">後端沒有產生圖表或圖表生成失敗。</div>';
         return;
     }
 
     charts.forEach((chart, index) => {
-        if (!chart.base64_data) return;
+        if (!chart.base64_data && !chart.svg_data && !chart.chart_data && !chart.url) return;
 
         const div = document.createElement('div');
         div.className = 'chart-result-item';
 
         const title = document.createElement('h4');
         title.textContent = chart.title || `圖表 ${index + 1}`;
+        div.appendChild(title);
 
-        const img = document.createElement('img');
-        img.src = `data:${chart.type || 'image/png'};base64,${chart.base64_data}`;
-        img.alt = chart.title || `模型輸出圖表 ${index + 1}`;
-        img.style.maxWidth = '100%';
-        img.style.height = 'auto';
+        if (chart.chart_data) {
+            // JSON 圖表資料：由前端繪製水平柱狀圖
+            div.appendChild(buildShapBarChart(chart.chart_data));
+        } else if (chart.url && chart.type === 'application/json') {
+            // 背景繪製的 JSON 圖表：取得後再繪製
+            fetch(`${API_BASE_URL}${chart.url}`)
+                .then(response => response.ok ? response.json() : Promise.reject(response.status))
+                .then(chartData => div.appendChild(buildShapBarChart(chartData)))
+                .catch(() => div.appendChild(document.createTextNode('圖表載入失敗。')));
+        } else {
+            const img = document.createElement('img');
+            if (chart.url) {
+                // 背景繪製或可快取的圖表資源：由瀏覽器直接載入
+                img.src = `${API_BASE_URL}${chart.url}`;
+            } else {
+                img.src = chart.svg_data
+                    ? `data:image/svg+xml;charset=utf-8,${encodeURIComponent(chart.svg_data)}`
+                    : `data:${chart.type || 'image/png'};base64,${chart.base64_data}`;
+            }
+            img.alt = chart.title || `模型輸出圖表 ${index + 1}`;
+            img.style.maxWidth = '100%';
+            img.style.height = 'auto';
+            div.appendChild(img);
+        }
 
-        div.appendChild(title);
-        div.appendChild(img);
         chartContainer.appendChild(div);
     });
 }
 
+/**
+ * 依後端回傳的 JSON 圖表資料 ({features, values, colors, x_label}) 繪製局部 SHAP 水平柱狀圖
+ * @param {Object} chartData - build_shap_chart_data 的輸出
+ * @returns {HTMLElement}
+ */
+function buildShapBarChart(chartData) {
+    const wrapper = document.createElement('div');
+    wrapper.style.fontSize = '12px';
+
+    const values = chartData.values || [];
+    const maxAbs = Math.max(...values.map(v => Math.abs(v)), 1e-9);
+
+    values.forEach((value, i) => {
+        const row = document.createElement('div');
+        row.style.display = 'flex';
+        row.style.alignItems = 'center';
+        row.style.margin = '4px 0';
+
+        const label = document.createElement('span');
+        label.textContent = chartData.features[i];
+        label.style.flex = '0 0 40%';
+        label.style.textAlign = 'right';
+        label.style.paddingRight = '8px';
+
+        // 以中線為 0：正值向右、負值向左
+        const track = document.createElement('div');
+        track.style.flex = '1';
+        track.style.position = 'relative';
+        track.style.height = '18px';
+
+        const zeroLine = document.createElement('div');
+        zeroLine.style.position = 'absolute';
+        zeroLine.style.left = '50%';
+        zeroLine.style.height = '100%';
+        zeroLine.style.borderLeft = '1px dashed grey';
+
+        const bar = document.createElement('div');
+        bar.style.position = 'absolute';
+        bar.style.top = '0';
+        bar.style.height = '100%';
+        bar.style.width = `${(Math.abs(value) / maxAbs) * 50}%`;
+        bar.style.background = chartData.colors[i];
+        if (value >= 0) {
+            bar.style.left = '50%';
+        } else {
+            bar.style.right = '50%';
+        }
+        bar.title = value.toFixed(4);
+        track.appendChild(bar);
+        track.appendChild(zeroLine);
+
+        row.appendChild(label);
+        row.appendChild(track);
+        wrapper.appendChild(row);
+    });
+
+    const axisLabel = document.createElement('div');
+    axisLabel.textContent = chartData.x_label || '';
+    axisLabel.style.textAlign = 'center';
+    axisLabel.style.color = '#555';
+    wrapper.appendChild(axisLabel);
+    return wrapper;
+}
+
 // --- 單筆特徵詳情相關變數和函式 ---
 
 
@@ -0,0 +1,24 @@
+# tests\conftest.py
+# 測試共用設定：讓 tests/ 下的測試可以直接導入 services / routes，並提供共用的模型服務實例
+import sys
+import os
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from config import Config  # noqa: E402
+
+MODEL_PATH = Config.MODEL_BANK_PATH
+MODEL_DIR = os.path.dirname(MODEL_PATH)
+TEST_CSV_PATH = os.path.join(MODEL_DIR, 'customer_churn_bank_test.csv')
+
+
+@pytest.fixture(scope='session')
+def churn_service():
+    """與線上服務相同工件 (工件包優先) 的模型服務；SHAP 使用 native 後端，不需匯入 shap。"""
+    from services.customer_churn_bank_service import CustomerChurnBankService
+    return CustomerChurnBankService(model_path=MODEL_PATH, model_dir=MODEL_DIR, explainer_backend='native',
+                                    bundle_dir=Config.MODEL_BUNDLE_DIR)
@@ -0,0 +1,74 @@
+# tests\test_native_contrib_explainer.py
+# 服務端的 native SHAP 解釋後端 (Booster pred_contribs) 與 shap.TreeExplainer 的一致性
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import Config
+from conftest import MODEL_PATH, MODEL_DIR, TEST_CSV_PATH
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI
+from services.customer_churn_bank_service import CustomerChurnBankService
+from services.native_contrib_explainer import NativeContribExplainer
+
+shap = pytest.importorskip('shap')
+
+# pred_contribs 與 shap 的 TreeSHAP 皆以 float32 累加，兩者的差異只來自累加順序
+ATOL = 1e-4
+
+
+@pytest.fixture(scope='module')
+def X_predict(churn_service):
+    """測試 CSV 前 500 筆的對齊後特徵，另加數列缺失值 (走訪預設方向) 的輸入。"""
+    df = pd.read_csv(TEST_CSV_PATH, nrows=500)
+    X = churn_service._align_features(FeatureEngineerForAPI.run_v2_preprocessing(df))
+    missing = X.iloc[:20].copy()
+    for i, col in enumerate(['Balance', 'CreditScore', 'Age', 'EstimatedSalary']):
+        if col in missing.columns:
+            missing.iloc[i::4, missing.columns.get_loc(col)] = np.nan
+    return pd.concat([X, missing], ignore_index=True)
+
+
+@pytest.fixture(scope='module')
+def tree_explainer(churn_service):
+    return shap.TreeExplainer(churn_service.model)
+
+
+def _positive_class(values):
+    return np.asarray(values[1] if isinstance(values, list) and len(values) == 2 else values)
+
+
+def test_native_shap_values_match_tree_explainer(churn_service, tree_explainer, X_predict):
+    expected = _positive_class(tree_explainer.shap_values(X_predict, check_additivity=False))
+    actual = NativeContribExplainer(churn_service.model).shap_values(X_predict)
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=ATOL)
+
+
+def test_native_base_value_matches_tree_explainer(churn_service, tree_explainer, X_predict):
+    base_value = float(np.ravel(tree_explainer.expected_value)[-1])
+    native_base = NativeContribExplainer(churn_service.model).expected_value(X_predict)
+    np.testing.assert_allclose(native_base, base_value, rtol=0, atol=ATOL)
+    if churn_service.bundle is not None:
+        # 工件包 manifest 中保存的期望值也必須與 TreeExplainer 一致
+        assert churn_service.bundle.expected_value == pytest.approx(base_value, abs=ATOL)
+
+
+def test_native_contributions_add_up_to_margin(churn_service, X_predict):
+    explainer = NativeContribExplainer(churn_service.model)
+    margin = churn_service.model.predict(X_predict, output_margin=True)
+    total = explainer.shap_values(X_predict).sum(axis=1) + explainer.expected_value(X_predict)
+    np.testing.assert_allclose(total, margin, rtol=0, atol=ATOL)
+
+
+def test_service_native_backend_matches_shap_backend(churn_service, X_predict):
+    """服務層的 _shap_matrix 與前 7 名驅動因子在兩個後端之間一致。"""
+    shap_service = CustomerChurnBankService(model_path=MODEL_PATH, model_dir=MODEL_DIR, explainer_backend='shap',
+                                            bundle_dir=Config.MODEL_BUNDLE_DIR)
+    expected = shap_service._shap_matrix(X_predict)
+    actual = churn_service._shap_matrix(X_predict)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=ATOL)
+
+    expected_top, _ = shap_service.top_k_shap(X_predict, k=7)
+    actual_top, _ = churn_service.top_k_shap(X_predict, k=7)
+    # 數值差異在 ATOL 以內時，排序只可能在幾乎相等的貢獻之間互換
+    assert np.mean(np.all(np.sort(actual_top, axis=1) == np.sort(expected_top, axis=1), axis=1)) >= 0.99
@@ -0,0 +1,89 @@
+# tests\test_single_record_fast_path.py
+# 單筆 /predict 快速路徑 (run_v2_record + FeatureAlignmentPlan.transform_records) 與
+# 原本 DataFrame 管道 (run_v2_preprocessing + get_dummies 對齊) 的一致性
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import TEST_CSV_PATH
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI
+
+CORE_COLUMNS = ['CreditScore', 'Age', 'Tenure', 'Balance', 'NumOfProducts', 'HasCrCard',
+                'IsActiveMember', 'EstimatedSalary', 'Geography', 'Gender']
+AUXILIARY_COLUMNS = {'id': 0, 'CustomerId': 0, 'Surname': 'A', 'RowNumber': 0}
+
+
+def legacy_align(feature_cols, df_processed: pd.DataFrame) -> pd.DataFrame:
+    """原本 CustomerChurnBankService._align_features 的實作：get_dummies + 補 0 + 依 feature_cols 排序。"""
+    cat_cols = [col for col in df_processed.columns if df_processed[col].dtype.name in ['object', 'str', 'category']]
+    X_oh = pd.get_dummies(df_processed, columns=cat_cols, dummy_na=False)
+    for c in set(feature_cols) - set(X_oh.columns):
+        X_oh[c] = 0.0
+    return X_oh[[col for col in feature_cols if col in X_oh.columns]].astype(float)
+
+
+def make_record(raw: dict, auxiliary: bool = True) -> dict:
+    record = {col: raw[col] for col in CORE_COLUMNS}
+    if auxiliary:
+        record.update(AUXILIARY_COLUMNS)
+    return record
+
+
+def edge_case_records() -> list:
+    """分箱邊界、大小寫與空白不一的 Gender / Geography、非整數旗標、缺失值，以及缺少輔助欄位的輸入。"""
+    ages = [0.0, 24.9, 25.0, 40.0, 40.5, 60.0, 95.0, -1.0, np.nan]
+    geographies = [0.0, 2.0, 3.0, 'germany', 'GERMANY', ' France ', 'sPAIN', 'Italy']
+    genders = [0.0, 1.0, 'Female', 'FEMALE', ' male ', 'Other', 2.0]
+    actives = [0.0, 1.0, 0.5, np.nan]
+    products = [1.0, 2.0, 2.7]
+    records = []
+    for i, (age, geo, gender) in enumerate(itertools.product(ages, geographies, genders)):
+        active, nprod = actives[i % len(actives)], products[i % len(products)]
+        records.append(make_record({
+            'CreditScore': 650.0, 'Age': age, 'Tenure': 3.0, 'Balance': 0.0 if i % 2 else 1234.5,
+            'NumOfProducts': nprod, 'HasCrCard': np.nan if i % 7 == 0 else 1.0, 'IsActiveMember': active,
+            'EstimatedSalary': 100000.0, 'Geography': geo, 'Gender': gender,
+        }, auxiliary=i % 3 != 0))
+    return records
+
+
+def csv_records(n_rows: int = 200) -> list:
+    df = pd.read_csv(TEST_CSV_PATH, nrows=n_rows)
+    return [make_record({col: (float(v) if col not in ('Geography', 'Gender') else v) for col, v in row.items()})
+            for row in df[CORE_COLUMNS].to_dict('records')]
+
+
+@pytest.fixture(scope='module')
+def records():
+    return csv_records() + edge_case_records()
+
+
+def test_fast_path_matches_legacy_dataframe_path(churn_service, records):
+    mismatches = []
+    legacy_rows, fast_rows = [], []
+    for record in records:
+        legacy = legacy_align(churn_service.feature_cols,
+                              FeatureEngineerForAPI.run_v2_preprocessing(pd.DataFrame([record])))
+        fast = churn_service.alignment_plan.transform_records([FeatureEngineerForAPI.run_v2_record(record)],
+                                                              FeatureEngineerForAPI.CATEGORICAL_COLUMNS)
+        # 模型以 float32 比較門檻，原本管道的 float64 特徵在預測前同樣會轉為 float32
+        if not np.array_equal(legacy.to_numpy(dtype=np.float32), fast, equal_nan=True):
+            mismatches.append(record)
+        legacy_rows.append(legacy)
+        fast_rows.append(fast)
+    assert not mismatches, f"{len(mismatches)} 筆輸入不一致，例如: {mismatches[:3]}"
+
+    legacy_probability = churn_service.model.predict_proba(pd.concat(legacy_rows, ignore_index=True))[:, 1]
+    fast_probability = churn_service._predict_positive_proba(churn_service.alignment_plan.to_frame(np.vstack(fast_rows)))
+    np.testing.assert_array_equal(fast_probability, legacy_probability)
+
+
+def test_record_prediction_matches_dataframe_prediction(churn_service, records):
+    """服務層的兩個入口 (preprocess_and_predict / preprocess_and_predict_record) 回傳相同的機率。"""
+    for record in records[:50] + records[-50:]:
+        expected = churn_service.preprocess_and_predict(pd.DataFrame([record]), FeatureEngineerForAPI.run_v2_preprocessing)
+        actual = churn_service.preprocess_and_predict_record(record, FeatureEngineerForAPI.run_v2_record,
+                                                             FeatureEngineerForAPI.CATEGORICAL_COLUMNS)
+        assert actual['probability'] == expected['probability']
@@ -0,0 +1,130 @@
+# tests\test_tree_inference_engine.py
+# native 推論後端 (ArrayTreeEnsemble) 與 XGBoost 原生預測的一致性：缺失值預設方向、best_iteration 切片、
+# 分段推論，以及不支援的模型類型
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+
+from conftest import TEST_CSV_PATH
+from routes.customer_churn_bank_routes import FeatureEngineerForAPI
+from services.tree_inference_engine import ArrayTreeEnsemble
+
+# margin 以 float64 累加 float32 葉值，XGBoost 以 float32 累加；差異只來自累加順序
+MARGIN_ATOL = 1e-5
+
+
+def synthetic_data(n_rows: int = 3000, n_features: int = 6, missing_rate: float = 0.2, seed: int = 0):
+    """部分特徵含缺失值的二元分類資料；缺失本身與標籤相關，訓練出的樹會同時有左、右兩種預設方向。"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features)).astype(np.float32)
+    missing = rng.random((n_rows, n_features)) < missing_rate
+    logits = X[:, 0] - 0.5 * X[:, 1] + np.where(missing[:, 2], 1.5, -0.5) + rng.normal(scale=1.0, size=n_rows)
+    X[missing] = np.nan
+    return X, (logits > 0).astype(int)
+
+
+def xgb_margin(model, X, iteration_range=None) -> np.ndarray:
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    kwargs = {'iteration_range': iteration_range} if iteration_range is not None else {}
+    return booster.predict(xgb.DMatrix(X, missing=np.nan), output_margin=True, **kwargs)
+
+
+@pytest.fixture(scope='module')
+def missing_value_model():
+    X, y = synthetic_data()
+    model = xgb.XGBClassifier(n_estimators=40, max_depth=4, learning_rate=0.3, tree_method='exact')
+    model.fit(X, y)
+    return model, X
+
+
+@pytest.fixture(scope='module')
+def early_stopped_model():
+    X, y = synthetic_data(n_rows=4000, seed=1)
+    model = xgb.XGBClassifier(n_estimators=300, max_depth=4, learning_rate=0.5, early_stopping_rounds=5)
+    model.fit(X[:3000], y[:3000], eval_set=[(X[3000:], y[3000:])], verbose=False)
+    return model, X
+
+
+def test_matches_production_model(churn_service):
+    df = pd.read_csv(TEST_CSV_PATH, nrows=2000)
+    X = churn_service._align_features(FeatureEngineerForAPI.run_v2_preprocessing(df))
+    engine = ArrayTreeEnsemble.from_xgb_model(churn_service.model)
+    np.testing.assert_allclose(engine.predict_margin(X.to_numpy()), xgb_margin(churn_service.model, X),
+                               rtol=0, atol=MARGIN_ATOL)
+    np.testing.assert_allclose(engine.predict_proba(X.to_numpy()), churn_service.model.predict_proba(X),
+                               rtol=0, atol=1e-6)
+
+
+def test_missing_values_follow_default_direction(missing_value_model):
+    model, X = missing_value_model
+    engine = ArrayTreeEnsemble.from_xgb_model(model)
+
+    # 訓練出的樹同時包含預設往左與預設往右的分裂節點，兩種走訪都會被驗證
+    internal = engine.left != np.arange(len(engine.left))
+    default_left = engine.default[internal] == engine.left[internal]
+    assert default_left.any() and (~default_left).any()
+
+    assert np.isnan(X).any()
+    np.testing.assert_allclose(engine.predict_margin(X), xgb_margin(model, X), rtol=0, atol=MARGIN_ATOL)
+
+    # 整列皆為缺失值：每棵樹都只沿預設方向走到葉節點
+    all_missing = np.full((4, X.shape[1]), np.nan, dtype=np.float32)
+    np.testing.assert_allclose(engine.predict_margin(all_missing), xgb_margin(model, all_missing),
+                               rtol=0, atol=MARGIN_ATOL)
+
+
+def test_best_iteration_slice(early_stopped_model):
+    model, X = early_stopped_model
+    booster = model.get_booster()
+    best_iteration = int(booster.attr('best_iteration'))
+    assert booster.num_boosted_rounds() > best_iteration + 1, "資料需讓 Early Stopping 提早停止"
+
+    # 預設只使用前 best_iteration + 1 輪，與 predict_proba 一致
+    engine = ArrayTreeEnsemble.from_xgb_model(model)
+    assert engine.num_trees == best_iteration + 1
+    np.testing.assert_allclose(engine.predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-6)
+
+    # 明確指定 iteration_range 時使用指定的輪數 (包含全部的樹)
+    engine_range = ArrayTreeEnsemble.from_xgb_model(model, iteration_range=(0, 3))
+    assert engine_range.num_trees == 3
+    np.testing.assert_allclose(engine_range.predict_margin(X), xgb_margin(model, X, iteration_range=(0, 3)),
+                               rtol=0, atol=MARGIN_ATOL)
+    all_rounds = booster.num_boosted_rounds()
+    engine_all = ArrayTreeEnsemble.from_xgb_model(model, iteration_range=(0, all_rounds))
+    np.testing.assert_allclose(engine_all.predict_margin(X), xgb_margin(model, X, iteration_range=(0, all_rounds)),
+                               rtol=0, atol=MARGIN_ATOL)
+
+
+def test_chunked_predict_margin_matches_single_block(missing_value_model):
+    model, X = missing_value_model
+    engine = ArrayTreeEnsemble.from_xgb_model(model)
+    chunk_size = 128
+    assert len(X) > chunk_size and len(X) % chunk_size != 0  # 包含不滿一段的最後一段
+
+    chunked = engine.predict_margin(X, chunk_size=chunk_size)
+    single = engine.predict_margin(X, chunk_size=len(X))
+    np.testing.assert_array_equal(chunked, single)
+    np.testing.assert_allclose(chunked, xgb_margin(model, X), rtol=0, atol=MARGIN_ATOL)
+
+
+def test_single_row_and_feature_count_check(missing_value_model):
+    model, X = missing_value_model
+    engine = ArrayTreeEnsemble.from_xgb_model(model)
+    np.testing.assert_allclose(engine.predict_margin(X[0]), xgb_margin(model, X[:1]), rtol=0, atol=MARGIN_ATOL)
+    with pytest.raises(ValueError):
+        engine.predict_margin(X[:, :-1])
+
+
+@pytest.mark.parametrize('estimator', [
+    xgb.XGBRegressor(n_estimators=3, objective='reg:squarederror'),
+    xgb.XGBClassifier(n_estimators=3, objective='multi:softprob'),
+    xgb.XGBClassifier(n_estimators=3, booster='gblinear'),
+], ids=['regression', 'multiclass', 'gblinear'])
+def test_rejects_unsupported_models(estimator):
+    X, y = synthetic_data(n_rows=300, missing_rate=0.0)
+    if estimator.get_params().get('objective') == 'multi:softprob':
+        y = np.arange(len(y)) % 3
+    estimator.fit(X, y)
+    with pytest.raises(ValueError):
+        ArrayTreeEnsemble.from_xgb_model(estimator)